@@ -0,0 +1,170 @@
+"""
+מאגר כתיבה דחויה (write-behind) למוני פעילות
+Write-behind buffer for activity counters
+
+כל עדכון טלגרם מייצר כמה upserts קטנים (users, user_interactions, service_activity).
+במקום לכתוב כל אחד מיד, העדכונים נצברים בזיכרון ומאוחדים לפי (יעד, מפתח):
+$inc מסוכם, $set/$setOnInsert לפי הערך האחרון/הראשון, $max לפי המקסימום ו-$addToSet
+כאיחוד. ת'רד רקע מבצע flush כל ACTIVITY_FLUSH_INTERVAL שניות — bulk_write אחד
+(unordered) לכל אוסף — ובסיום התהליך נעשה flush אחרון (atexit / stop של הבוט).
+
+המונים משמשים לסטטיסטיקה בלבד: אצווה שנכשלה נרשמת בלוג ולא נשלחת שוב, כדי לא
+לספור פעמיים עדכונים שכבר נכתבו חלקית.
+"""
+
+import atexit
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+try:
+    from pymongo import UpdateOne  # type: ignore
+except Exception:  # pymongo אינו זמין בסביבות בדיקה קלות
+    UpdateOne = None  # type: ignore[assignment]
+
+logger = logging.getLogger(__name__)
+
+try:
+    # מרווח בין flush-ים (שניות)
+    ACTIVITY_FLUSH_INTERVAL = max(0.1, float(os.getenv("ACTIVITY_FLUSH_INTERVAL", "5")))
+    # מספר מפתחות ממתינים שמעבר לו ה-flush מוקדם
+    ACTIVITY_MAX_PENDING = max(1, int(os.getenv("ACTIVITY_MAX_PENDING", "5000")))
+except Exception:
+    ACTIVITY_FLUSH_INTERVAL = 5.0
+    ACTIVITY_MAX_PENDING = 5000
+
+
+def _key_of(target: str, key: Dict[str, Any]) -> Tuple[Any, ...]:
+    return (target,) + tuple(sorted(key.items()))
+
+
+class WriteBehindBuffer:
+    """צבירה ואיחוד של upserts לפי מפתח, עם flush תקופתי ב-bulk_write"""
+
+    def __init__(self, interval: float = ACTIVITY_FLUSH_INTERVAL, max_pending: int = ACTIVITY_MAX_PENDING):
+        self.interval = interval
+        self.max_pending = max_pending
+        self._targets: Dict[str, Callable[[], Any]] = {}
+        self._pending: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.flushed_ops = 0
+
+    def register(self, target: str, get_collection: Callable[[], Any]) -> None:
+        """רישום יעד: פונקציה שמחזירה את האוסף בזמן ה-flush (None = לדלג, למשל DB כבוי)"""
+        self._targets[target] = get_collection
+
+    def upsert(self, target: str, key: Dict[str, Any], inc: Optional[Dict[str, int]] = None,
+               set_fields: Optional[Dict[str, Any]] = None, max_fields: Optional[Dict[str, Any]] = None,
+               add_to_set: Optional[Dict[str, Any]] = None,
+               set_on_insert: Optional[Dict[str, Any]] = None) -> None:
+        """צבירת upsert. אין לתת לאותו שדה יותר מאופרטור אחד (כמו ב-MongoDB)."""
+        if target not in self._targets:
+            logger.warning(f"יעד write-behind לא רשום: {target}")
+            return
+        with self._lock:
+            entry = self._pending.get(_key_of(target, key))
+            if entry is None:
+                entry = {"target": target, "key": dict(key), "inc": {}, "set": {}, "max": {},
+                         "add_to_set": {}, "set_on_insert": {}}
+                self._pending[_key_of(target, key)] = entry
+            for field, amount in (inc or {}).items():
+                entry["inc"][field] = entry["inc"].get(field, 0) + amount
+            entry["set"].update(set_fields or {})
+            for field, value in (max_fields or {}).items():
+                current = entry["max"].get(field)
+                entry["max"][field] = value if current is None or value > current else current
+            for field, value in (add_to_set or {}).items():
+                entry["add_to_set"].setdefault(field, {})[value] = None
+            for field, value in (set_on_insert or {}).items():
+                entry["set_on_insert"].setdefault(field, value)
+            pending = len(self._pending)
+        self._ensure_started()
+        if pending >= self.max_pending:
+            self._wake.set()
+
+    def pending_inc(self, target: str, key: Dict[str, Any], field: str) -> int:
+        """הגדלה שעדיין לא נכתבה (למשל כדי להשלים total_actions שנקרא מה-DB)"""
+        with self._lock:
+            entry = self._pending.get(_key_of(target, key))
+            return int(entry["inc"].get(field, 0)) if entry else 0
+
+    def _update_doc(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        update: Dict[str, Any] = {}
+        for op, name in (("$inc", "inc"), ("$set", "set"), ("$max", "max"), ("$setOnInsert", "set_on_insert")):
+            if entry[name]:
+                update[op] = dict(entry[name])
+        if entry["add_to_set"]:
+            update["$addToSet"] = {f: {"$each": list(values)} for f, values in entry["add_to_set"].items()}
+        return update
+
+    def flush(self) -> int:
+        """כתיבת כל הממתינים: bulk_write לא-מסודר אחד לכל יעד. מחזיר את מספר הפעולות שנשלחו."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            by_target: Dict[str, List[Dict[str, Any]]] = {}
+            for entry in batch.values():
+                by_target.setdefault(entry["target"], []).append(entry)
+            sent = 0
+            for target, entries in by_target.items():
+                sent += self._write(target, entries)
+            self.flushed_ops += sent
+            return sent
+
+    def _write(self, target: str, entries: Iterable[Dict[str, Any]]) -> int:
+        entries = list(entries)
+        try:
+            coll = self._targets[target]()
+        except Exception as e:
+            logger.warning(f"write-behind: אין גישה ליעד {target}: {e}")
+            return 0
+        if coll is None:
+            return 0
+        try:
+            if UpdateOne is not None and hasattr(coll, "bulk_write"):
+                ops = [UpdateOne(e["key"], self._update_doc(e), upsert=True) for e in entries]
+                coll.bulk_write(ops, ordered=False)
+            else:
+                for e in entries:
+                    coll.update_one(e["key"], self._update_doc(e), upsert=True)
+            return len(entries)
+        except Exception as e:
+            logger.error(f"write-behind: flush ל-{target} נכשל ({len(entries)} עדכונים): {e}")
+            return 0
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="activity-write-behind", daemon=True)
+            self._thread.start()
+        atexit.register(self.close)
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"write-behind: שגיאה ב-flush תקופתי: {e}")
+
+    def close(self) -> None:
+        """עצירת ת'רד הרקע ו-flush אחרון (נקרא גם מ-atexit)"""
+        self._stopped.set()
+        self._wake.set()
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"write-behind: flush בסגירה נכשל: {e}")
+
+
+# מופע גלובלי לכל התהליך
+activity_buffer = WriteBehindBuffer()
@@ -9,6 +9,12 @@ except Exception:
     _HAS_PYMONGO = False
 from datetime import datetime, timezone
 
+try:
+    # בבוט המרכזי הדיווחים נצברים ונכתבים ב-bulk_write תקופתי; בהעתק עצמאי — כתיבה ישירה
+    from activity_buffer import activity_buffer as _activity_buffer
+except Exception:
+    _activity_buffer = None
+
 
 class SimpleActivityReporter:
     def __init__(self, mongodb_uri, service_id, service_name=None):
@@ -25,6 +31,9 @@ class SimpleActivityReporter:
             self.service_id = service_id
             self.service_name = service_name or service_id
             self.connected = True
+            if _activity_buffer is not None:
+                _activity_buffer.register(f"{service_id}:user_interactions", lambda: self.db.user_interactions)
+                _activity_buffer.register(f"{service_id}:service_activity", lambda: self.db.service_activity)
         except Exception:
             self.connected = False
             # שקט בסביבת בדיקות/ללא pymongo
@@ -37,6 +46,9 @@ class SimpleActivityReporter:
         
         try:
             now = datetime.now(timezone.utc)
+            if _activity_buffer is not None:
+                self._report_buffered(user_id, now)
+                return
             
             # עדכון אינטראקציית המשתמש
             self.db.user_interactions.update_one(
@@ -72,6 +84,23 @@ class SimpleActivityReporter:
             # שקט - אל תיכשל את הבוט אם יש בעיה
             pass
 
+    def _report_buffered(self, user_id, now):
+        """אותם שני upserts, מאוחדים לפי מפתח ב-activity_buffer"""
+        _activity_buffer.upsert(
+            f"{self.service_id}:user_interactions",
+            {"service_id": self.service_id, "user_id": user_id},
+            inc={"interaction_count": 1},
+            max_fields={"last_interaction": now},
+            set_on_insert={"created_at": now},
+        )
+        _activity_buffer.upsert(
+            f"{self.service_id}:service_activity",
+            {"_id": self.service_id},
+            set_fields={"service_name": self.service_name},
+            max_fields={"last_user_activity": now, "updated_at": now},
+            set_on_insert={"created_at": now, "status": "active", "total_users": 0, "suspend_count": 0},
+        )
+
 # דוגמה לשימוש קל
 def create_reporter(mongodb_uri, service_id, service_name=None):
     """יצירת reporter פשוט"""
@@ -4,34 +4,8 @@ Autocomplete Manager for File Names and Tags
 """
 
 import logging
-from typing import List, Dict, Set
-try:
-    from fuzzywuzzy import fuzz, process  # type: ignore
-    _HAS_FUZZY = True
-except Exception:
-    _HAS_FUZZY = False
-    # Minimal fallbacks
-    class _Fuzz:
-        @staticmethod
-        def partial_ratio(a: str, b: str) -> int:
-            a = (a or "").lower()
-            b = (b or "").lower()
-            if not a or not b:
-                return 0
-            if a in b or b in a:
-                return int(100 * min(len(a), len(b)) / max(len(a), len(b)))
-            # crude overlap measure
-            common = sum(1 for ch in set(a) if ch in b)
-            return int(100 * common / max(len(set(a + b)), 1))
-    fuzz = _Fuzz()  # type: ignore
-    class _Process:
-        @staticmethod
-        def extract(query: str, choices, scorer=None, limit=5):
-            scorer = scorer or (lambda x, y: 0)
-            scored = [(c, int(scorer(query, c))) for c in choices]
-            scored.sort(key=lambda t: t[1], reverse=True)
-            return [(c, s) for c, s in scored[:limit]]
-    process = _Process()  # type: ignore
+from typing import Any, List, Dict, Set
+import fuzzy_matcher
 from database import db
 from cache_manager import cache, cached
 
@@ -47,7 +21,8 @@ class AutocompleteManager:
     def get_user_filenames(self, user_id: int) -> List[str]:
         """קבלת כל שמות הקבצים של משתמש לאוטו-השלמה"""
         try:
-            files = db.get_user_files(user_id, limit=1000)
+            # מטא-דאטה בלבד — התוכן לא נשלף
+            files = db.get_user_files(user_id, limit=1000, fields=["file_name"])
             return [file['file_name'] for file in files]
         except Exception as e:
             logger.error(f"שגיאה בקבלת שמות קבצים לאוטו-השלמה: {e}")
@@ -57,7 +32,7 @@ class AutocompleteManager:
     def get_user_tags(self, user_id: int) -> List[str]:
         """קבלת כל התגיות של משתמש לאוטו-השלמה"""
         try:
-            files = db.get_user_files(user_id, limit=1000)
+            files = db.get_user_files(user_id, limit=1000, fields=["tags"])
             all_tags = set()
             
             for file in files:
@@ -81,16 +56,11 @@ class AutocompleteManager:
             if not all_filenames:
                 return []
             
-            # חיפוש עם fuzzywuzzy
-            matches = process.extract(
-                partial_name, 
-                all_filenames, 
-                scorer=fuzz.partial_ratio,
-                limit=limit
-            )
+            # חיפוש מטושטש (rapidfuzz)
+            matches = fuzzy_matcher.extract(partial_name, all_filenames, limit=limit)
             
             # סינון תוצאות עם דמיון גבוה מספיק
-            suggestions = []
+            suggestions: List[Dict[str, Any]] = []
             for filename, score in matches:
                 if score >= self.min_similarity:
                     suggestions.append({
@@ -119,16 +89,11 @@ class AutocompleteManager:
             if not all_tags:
                 return []
             
-            # חיפוש עם fuzzywuzzy
-            matches = process.extract(
-                partial_tag, 
-                all_tags, 
-                scorer=fuzz.partial_ratio,
-                limit=limit
-            )
+            # חיפוש מטושטש (rapidfuzz)
+            matches = fuzzy_matcher.extract(partial_tag, all_tags, limit=limit)
             
             # סינון תוצאות
-            suggestions = []
+            suggestions: List[Dict[str, Any]] = []
             for tag, score in matches:
                 if score >= self.min_similarity:
                     suggestions.append({
@@ -155,7 +120,7 @@ class AutocompleteManager:
             
             last_word = words[-1]
             
-            suggestions = []
+            suggestions: List[str] = []
             
             if suggestion_type in ["auto", "filename"]:
                 # הצעות שמות קבצים
@@ -184,7 +149,8 @@ class AutocompleteManager:
     
     def invalidate_cache(self, user_id: int):
         """ביטול cache של אוטו-השלמה למשתמש"""
-        cache.delete_pattern(f"autocomplete_*:*:user:{user_id}:*")
+        # מפתחות האוטו-השלמה תלויים בדור ה-cache של המשתמש
+        cache.invalidate_user_cache(user_id)
 
 # יצירת instance גלובלי
 autocomplete = AutocompleteManager()
\ No newline at end of file
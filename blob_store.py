@@ -0,0 +1,262 @@
+"""
+מאגר תוכן לפי hash (code_blobs)
+Content-addressed blob store for code versions
+
+כל תוכן נשמר פעם אחת לפי sha256 שלו, דחוס. גרסאות עוקבות נשמרות כ-delta מול
+keyframe מלא תקופתי: ה-keyframe משמש כמילון (raw-content dictionary) לדחיסה, כך
+שגרסה שהשתנתה מעט תופסת מעט בתים, ופענוח דורש לכל היותר keyframe אחד נוסף.
+
+- zstd כשהחבילה zstandard מותקנת; אחרת zlib מהספרייה הסטנדרטית (עם zdict).
+- כל KEYFRAME_INTERVAL גרסאות בשרשרת נשמר keyframe מלא מחדש.
+- הכתיבה היא $setOnInsert לפי _id=hash — בטוח לכתיבה מקבילה של אותו תוכן.
+המודול לא תלוי בחבילת database ולכן משמש גם את ה-webapp: same_content ו-archive_versions
+הן מסלול השמירה המשותף לבוט (Repository) ולעריכה/העלאה מה-webapp.
+"""
+
+import hashlib
+import logging
+import os
+import zlib
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import zstandard as zstd  # type: ignore
+except Exception:  # zstandard אופציונלי; נשתמש ב-zlib
+    zstd = None  # type: ignore[assignment]
+
+from code_features import compute_code_features
+
+try:
+    from pymongo import UpdateOne  # type: ignore
+except Exception:  # pymongo אינו זמין בסביבות בדיקה קלות
+    UpdateOne = None  # type: ignore[assignment]
+
+logger = logging.getLogger(__name__)
+
+BLOB_COLLECTION_NAME = "code_blobs"
+
+try:
+    KEYFRAME_INTERVAL = max(1, int(os.getenv("BLOB_KEYFRAME_INTERVAL", "10")))
+except Exception:
+    KEYFRAME_INTERVAL = 10
+
+_ZSTD_LEVEL = 10
+_ZLIB_LEVEL = 6
+# חלון ה-zdict של zlib מוגבל ל-32KB (הסוף של ה-keyframe הוא הרלוונטי ביותר)
+_ZLIB_DICT_LIMIT = 32 * 1024
+
+
+def content_hash(code: str) -> str:
+    """sha256 של התוכן (UTF-8) — המזהה של ה-blob"""
+    return hashlib.sha256((code or "").encode("utf-8")).hexdigest()
+
+
+def same_content(existing: Dict[str, Any], code: str, programming_language: str,
+                 digest: Optional[str] = None) -> bool:
+    """האם הגרסה האחרונה כבר מכילה את התוכן הזה (אז אין צורך בגרסה חדשה)"""
+    if (existing.get("programming_language") or "") != (programming_language or ""):
+        return False
+    stored = existing.get("content_hash")
+    if stored:
+        return stored == (digest or content_hash(code))
+    current = existing.get("code")
+    return isinstance(current, str) and current == code
+
+
+def archive_versions(collection: Any, blobs: "BlobStore", superseded: List[Dict[str, Any]]) -> None:
+    """העברת התוכן של גרסאות שהוחלפו ל-code_blobs (delta מול הגרסה הקודמת להן) והסרת code מהמסמכים.
+
+    חריגות עוברות לקורא, שמחליט איך לדווח עליהן (הכתיבה של הגרסה החדשה כבר הצליחה).
+    """
+    docs = [d for d in superseded if isinstance(d, dict) and isinstance(d.get("code"), str)]
+    if not docs:
+        return
+    user_id = docs[0].get("user_id")
+    # הגרסה המאורכבת האחרונה של כל קובץ היא בסיס ה-delta (שאילתה אחת לכל האצווה)
+    bases = {
+        row.get("_id"): row.get("content_hash")
+        for row in collection.aggregate([
+            {"$match": {"user_id": user_id, "file_name": {"$in": [d.get("file_name") for d in docs]},
+                        "code": {"$exists": False}, "content_hash": {"$ne": None}}},
+            {"$sort": {"file_name": 1, "version": -1}},
+            {"$group": {"_id": "$file_name", "content_hash": {"$first": "$content_hash"}}},
+        ])
+    }
+    digests = blobs.put_many([(d["code"], bases.get(d.get("file_name"))) for d in docs])
+    updates = []
+    for doc, digest in zip(docs, digests):
+        update: Dict[str, Any] = {"content_hash": digest}
+        if doc.get("size_bytes") is None:
+            update.update(compute_code_features(doc["code"], doc.get("programming_language") or ""))
+        key = {"user_id": doc.get("user_id"), "file_name": doc.get("file_name"),
+               "version": doc.get("version"), "code": {"$exists": True}}
+        updates.append((key, {"$set": update, "$unset": {"code": ""}}))
+    if UpdateOne is not None and hasattr(collection, "bulk_write"):
+        collection.bulk_write([UpdateOne(k, u) for k, u in updates], ordered=False)
+    else:
+        for key, update in updates:
+            collection.update_one(key, update)
+
+
+def _compress(data: bytes, base: Optional[bytes]) -> Dict[str, Any]:
+    if zstd is not None:
+        if base:
+            dict_data = zstd.ZstdCompressionDict(base, dict_type=zstd.DICT_TYPE_RAWCONTENT)
+            payload = zstd.ZstdCompressor(level=_ZSTD_LEVEL, dict_data=dict_data).compress(data)
+        else:
+            payload = zstd.ZstdCompressor(level=_ZSTD_LEVEL).compress(data)
+        return {"codec": "zstd", "data": payload}
+    if base:
+        comp = zlib.compressobj(_ZLIB_LEVEL, zdict=base[-_ZLIB_DICT_LIMIT:])
+    else:
+        comp = zlib.compressobj(_ZLIB_LEVEL)
+    return {"codec": "zlib", "data": comp.compress(data) + comp.flush()}
+
+
+def _decompress(codec: str, payload: bytes, base: Optional[bytes]) -> bytes:
+    payload = bytes(payload)
+    if codec == "zstd":
+        if zstd is None:
+            raise RuntimeError("zstandard is required to read zstd blobs")
+        if base:
+            dict_data = zstd.ZstdCompressionDict(base, dict_type=zstd.DICT_TYPE_RAWCONTENT)
+            return zstd.ZstdDecompressor(dict_data=dict_data).decompress(payload)
+        return zstd.ZstdDecompressor().decompress(payload)
+    if codec == "zlib":
+        if base:
+            decomp = zlib.decompressobj(zdict=base[-_ZLIB_DICT_LIMIT:])
+        else:
+            decomp = zlib.decompressobj()
+        return decomp.decompress(payload) + decomp.flush()
+    if codec == "raw":
+        return payload
+    raise ValueError(f"unknown blob codec: {codec}")
+
+
+class BlobStore:
+    """גישה לאוסף code_blobs: put לפי hash ו-get/get_many עם פענוח delta"""
+
+    def __init__(self, collection: Any):
+        self.collection = collection
+
+    def _find(self, hashes: Iterable[str], projection: Optional[Dict[str, int]] = None) -> Dict[str, Dict[str, Any]]:
+        ids = [h for h in dict.fromkeys(hashes) if h]
+        if not ids:
+            return {}
+        docs = self.collection.find({"_id": {"$in": ids}}, projection) if projection else \
+            self.collection.find({"_id": {"$in": ids}})
+        return {d.get("_id"): d for d in docs if isinstance(d, dict)}
+
+    def put(self, code: str, base_hash: Optional[str] = None) -> str:
+        """שמירת תוכן (אם טרם נשמר) ומחזיר את ה-hash שלו.
+
+        `base_hash` הוא התוכן של הגרסה הקודמת: אם הוא שמור, הגרסה החדשה נדחסת מול
+        ה-keyframe של השרשרת שלו, עד KEYFRAME_INTERVAL גרסאות ואז keyframe חדש.
+        """
+        return self.put_many([(code, base_hash)])[0]
+
+    def put_many(self, entries: List[Tuple[str, Optional[str]]]) -> List[str]:
+        """put לאצווה של (code, base_hash): עד שלוש שאילתות $in וכתיבה אחת לכל האצווה"""
+        prepared = [((code or ""), content_hash(code or ""), base) for code, base in entries]
+        stored = set(self._find([digest for _, digest, _ in prepared], {"_id": 1}))
+        pending = [(code, digest, base) for code, digest, base in prepared if digest not in stored]
+        bases = self._find([base for _, digest, base in pending if base and base != digest],
+                           {"_id": 1, "keyframe": 1, "depth": 1})
+        keyframes = self._find(
+            (b.get("keyframe") or b_id) for b_id, b in bases.items()
+            if int(b.get("depth") or 0) + 1 < KEYFRAME_INTERVAL
+        )
+        keyframe_data: Dict[str, bytes] = {}
+        new_docs: Dict[str, Dict[str, Any]] = {}
+        for code, digest, base in pending:
+            if digest in new_docs:
+                continue
+            base_doc = bases.get(base) if base else None
+            keyframe_id = (base_doc.get("keyframe") or base) if base_doc else None
+            keyframe_doc = keyframes.get(keyframe_id) if keyframe_id else None
+            if keyframe_doc is not None and keyframe_doc.get("keyframe"):
+                keyframe_doc = None
+            if keyframe_doc is not None and keyframe_id not in keyframe_data:
+                keyframe_data[keyframe_id] = _decompress(keyframe_doc.get("codec"), keyframe_doc.get("data"), None)
+            new_docs[digest] = self._encode(code.encode("utf-8"),
+                                            keyframe_id if keyframe_doc is not None else None,
+                                            keyframe_data.get(keyframe_id) if keyframe_doc is not None else None,
+                                            int(base_doc.get("depth") or 0) + 1 if base_doc else 0)
+        if new_docs:
+            self._write(new_docs)
+        return [digest for _, digest, _ in prepared]
+
+    @staticmethod
+    def _encode(data: bytes, keyframe_id: Optional[str], keyframe_data: Optional[bytes], depth: int) -> Dict[str, Any]:
+        doc = _compress(data, keyframe_data)
+        if keyframe_data is not None:
+            full = _compress(data, None)
+            if len(doc["data"]) >= len(full["data"]):
+                # ה-delta לא חוסך — נשמור keyframe חדש
+                doc, keyframe_id, depth = full, None, 0
+        else:
+            keyframe_id, depth = None, 0
+        doc.update({
+            "size": len(data),
+            "keyframe": keyframe_id,
+            "depth": depth,
+            "created_at": datetime.now(timezone.utc),
+        })
+        return doc
+
+    def _write(self, docs: Dict[str, Dict[str, Any]]) -> None:
+        if UpdateOne is not None and hasattr(self.collection, "bulk_write"):
+            self.collection.bulk_write(
+                [UpdateOne({"_id": digest}, {"$setOnInsert": doc}, upsert=True) for digest, doc in docs.items()],
+                ordered=False,
+            )
+            return
+        for digest, doc in docs.items():
+            self.collection.update_one({"_id": digest}, {"$setOnInsert": doc}, upsert=True)
+
+    def get_many(self, hashes: Iterable[str]) -> Dict[str, str]:
+        """פענוח מספר blobs בשתי שאילתות לכל היותר (ה-blobs ואז ה-keyframes שלהם)"""
+        hashes = [h for h in dict.fromkeys(hashes) if h]
+        docs = self._find(hashes)
+        missing_keyframes = [d.get("keyframe") for d in docs.values() if d.get("keyframe") and d.get("keyframe") not in docs]
+        docs.update(self._find(missing_keyframes))
+        decoded: Dict[str, bytes] = {}
+
+        def _decode(digest: str) -> Optional[bytes]:
+            if digest in decoded:
+                return decoded[digest]
+            doc = docs.get(digest)
+            if doc is None:
+                return None
+            base = None
+            if doc.get("keyframe"):
+                base = _decode(doc["keyframe"])
+                if base is None:
+                    logger.error(f"keyframe {doc['keyframe']} חסר עבור blob {digest}")
+                    return None
+            decoded[digest] = _decompress(doc.get("codec"), doc.get("data"), base)
+            return decoded[digest]
+
+        result: Dict[str, str] = {}
+        for digest in hashes:
+            try:
+                data = _decode(digest)
+            except Exception as e:
+                logger.error(f"פענוח blob {digest} נכשל: {e}")
+                data = None
+            if data is not None:
+                result[digest] = data.decode("utf-8")
+        return result
+
+    def get(self, digest: str) -> Optional[str]:
+        return self.get_many([digest]).get(digest)
+
+    def hydrate(self, docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """השלמת code למסמכי גרסה ששמורים רק כ-content_hash (במקום, ומחזיר את הרשימה)"""
+        pending = [d for d in docs if isinstance(d, dict) and "code" not in d and d.get("content_hash")]
+        if pending:
+            contents = self.get_many(d["content_hash"] for d in pending)
+            for d in pending:
+                d["code"] = contents.get(d["content_hash"], "")
+        return docs
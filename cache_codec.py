@@ -0,0 +1,225 @@
+"""
+קידוד ערכי cache ומפתחות יציבים
+Typed cache value codec and stable key parts
+
+ערכים: dumps/loads שומרים על הטיפוסים — datetime חוזר כ-datetime (כולל אזור זמן),
+ObjectId כ-ObjectId, bytes כ-bytes ו-dataclass רשום (register_type) כמופע שלו — כך
+שקורא מקבל אותו טיפוס ב-hit וב-miss. msgpack משמש כשהוא מותקן (ExtType לטיפוסים
+המיוחדים), אחרת JSON מתויג ({"$date": ...}, {"$oid": ...}); ערכים גדולים מ-
+CACHE_COMPRESS_MIN_BYTES נדחסים ב-zlib. בית התג הראשון מזהה את הפורמט, ולכן גם ערכי
+JSON ישנים (ללא תג) עדיין נקראים. טיפוס שאינו נתמך מעלה UnsupportedType ולא נשמר.
+
+מפתחות: key_part מחזיר ייצוג קנוני של ארגומנט (מילונים ממוינים, datetime ב-ISO);
+ארגומנט ארוך מוחלף ב-hash, ואובייקט ללא ייצוג ערכי (למשל <obj at 0x...>) נדחה.
+"""
+
+import base64
+import hashlib
+import inspect
+import json
+import os
+import zlib
+from dataclasses import fields, is_dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, Type, Union
+
+try:
+    import msgpack  # type: ignore
+except Exception:  # msgpack אינו חובה — JSON מתויג במקומו
+    msgpack = None  # type: ignore[assignment]
+
+try:
+    from bson import ObjectId  # type: ignore
+except Exception:  # bson מגיע עם pymongo; בלעדיו ObjectId חוזר כמחרוזת hex
+    ObjectId = None  # type: ignore[assignment]
+
+try:
+    # ערך מקודד גדול מזה (בייטים) נדחס
+    CACHE_COMPRESS_MIN_BYTES = max(0, int(os.getenv("CACHE_COMPRESS_MIN_BYTES", "2048")))
+except Exception:
+    CACHE_COMPRESS_MIN_BYTES = 2048
+
+# בית ראשון של ערך מקודד; אף אחד מהם אינו תחילת JSON תקין
+TAG_MSGPACK = b"\x01"
+TAG_JSON = b"\x02"
+TAG_ZLIB = b"\x03"
+
+_EXT_DATETIME = 1
+_EXT_OBJECTID = 2
+_EXT_DATACLASS = 3
+
+# ארגומנט מפתח ארוך מזה מוחלף ב-hash
+MAX_KEY_PART = 64
+
+_registry: Dict[str, Type[Any]] = {}
+
+
+class UnsupportedType(TypeError):
+    """ערך שהקודק אינו יודע להחזיר באותו טיפוס"""
+
+
+def register_type(cls: Type[Any]) -> Type[Any]:
+    """רישום dataclass כך שיחזור מה-cache כמופע שלו (שימוש כדקורטור)"""
+    if not is_dataclass(cls):
+        raise TypeError(f"{cls!r} is not a dataclass")
+    _registry[_type_name(cls)] = cls
+    return cls
+
+
+def _type_name(cls: Type[Any]) -> str:
+    return f"{cls.__module__}.{cls.__qualname__}"
+
+
+def _is_object_id(value: Any) -> bool:
+    return type(value).__name__ == "ObjectId" and hasattr(value, "binary")
+
+
+def _object_id(raw: Union[bytes, str]) -> Any:
+    if ObjectId is None:
+        return raw.hex() if isinstance(raw, bytes) else raw
+    return ObjectId(raw)
+
+
+def _dataclass_fields(value: Any) -> Dict[str, Any]:
+    name = _type_name(type(value))
+    if _registry.get(name) is not type(value):
+        raise UnsupportedType(f"dataclass {name} is not registered for caching")
+    return {f.name: getattr(value, f.name) for f in fields(value)}
+
+
+def _build_dataclass(name: str, values: Dict[str, Any]) -> Any:
+    cls = _registry.get(name)
+    if cls is None:
+        raise UnsupportedType(f"unknown cached type {name}")
+    return cls(**values)
+
+
+# --- JSON מתויג ---
+
+def _to_tagged(value: Any) -> Any:
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    if isinstance(value, dict):
+        return {str(k): _to_tagged(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_tagged(v) for v in value]
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    if _is_object_id(value):
+        return {"$oid": str(value)}
+    if isinstance(value, (bytes, bytearray)):
+        return {"$bin": base64.b64encode(bytes(value)).decode("ascii")}
+    if isinstance(value, (set, frozenset)):
+        return sorted((_to_tagged(v) for v in value), key=repr)
+    if is_dataclass(value) and not isinstance(value, type):
+        return {"$type": _type_name(type(value)), "$fields": _to_tagged(_dataclass_fields(value))}
+    raise UnsupportedType(f"cannot cache value of type {type(value).__name__}")
+
+
+def _from_tagged(obj: Dict[str, Any]) -> Any:
+    if len(obj) == 1:
+        if "$date" in obj:
+            return datetime.fromisoformat(obj["$date"])
+        if "$oid" in obj:
+            return _object_id(obj["$oid"])
+        if "$bin" in obj:
+            return base64.b64decode(obj["$bin"])
+    elif len(obj) == 2 and "$type" in obj and "$fields" in obj:
+        return _build_dataclass(obj["$type"], obj["$fields"])
+    return obj
+
+
+# --- msgpack ---
+
+def _msgpack_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return msgpack.ExtType(_EXT_DATETIME, value.isoformat().encode("ascii"))
+    if _is_object_id(value):
+        return msgpack.ExtType(_EXT_OBJECTID, value.binary)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=repr)
+    if isinstance(value, tuple):
+        return list(value)
+    if is_dataclass(value) and not isinstance(value, type):
+        packed = _msgpack_dumps([_type_name(type(value)), _dataclass_fields(value)])
+        return msgpack.ExtType(_EXT_DATACLASS, packed)
+    raise UnsupportedType(f"cannot cache value of type {type(value).__name__}")
+
+
+def _msgpack_ext(code: int, data: bytes) -> Any:
+    if code == _EXT_DATETIME:
+        return datetime.fromisoformat(data.decode("ascii"))
+    if code == _EXT_OBJECTID:
+        return _object_id(data)
+    if code == _EXT_DATACLASS:
+        name, values = _msgpack_loads(data)
+        return _build_dataclass(name, values)
+    return msgpack.ExtType(code, data)
+
+
+def _msgpack_dumps(value: Any) -> bytes:
+    return msgpack.packb(value, default=_msgpack_default, use_bin_type=True, datetime=False)
+
+
+def _msgpack_loads(data: bytes) -> Any:
+    return msgpack.unpackb(data, ext_hook=_msgpack_ext, raw=False, strict_map_key=False)
+
+
+# --- API ---
+
+def dumps(value: Any) -> bytes:
+    """קידוד ערך לשמירה ב-cache (מעלה UnsupportedType לטיפוס לא נתמך)"""
+    if msgpack is not None:
+        try:
+            payload = TAG_MSGPACK + _msgpack_dumps(value)
+        except UnsupportedType:
+            raise
+        except (TypeError, ValueError) as e:
+            raise UnsupportedType(str(e)) from e
+    else:
+        payload = TAG_JSON + json.dumps(_to_tagged(value), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if CACHE_COMPRESS_MIN_BYTES and len(payload) > CACHE_COMPRESS_MIN_BYTES:
+        compressed = TAG_ZLIB + zlib.compress(payload, 1)
+        if len(compressed) < len(payload):
+            return compressed
+    return payload
+
+
+def loads(raw: Union[bytes, str]) -> Any:
+    """פענוח ערך מה-cache; מחרוזת/בייטים ללא תג הם JSON בפורמט הישן"""
+    if isinstance(raw, str):
+        return json.loads(raw)
+    tag, body = raw[:1], raw[1:]
+    if tag == TAG_ZLIB:
+        return loads(zlib.decompress(body))
+    if tag == TAG_MSGPACK:
+        if msgpack is None:
+            raise UnsupportedType("msgpack is required to decode this cache value")
+        return _msgpack_loads(body)
+    if tag == TAG_JSON:
+        return json.loads(body.decode("utf-8"), object_hook=_from_tagged)
+    return json.loads(raw.decode("utf-8"))
+
+
+def key_part(value: Any, max_length: int = MAX_KEY_PART) -> str:
+    """ייצוג יציב (בין תהליכים והפעלות) של ארגומנט במפתח cache"""
+    if isinstance(value, str):
+        text = value
+    elif value is None or isinstance(value, (bool, int, float)):
+        text = str(value)
+    else:
+        text = json.dumps(_to_tagged(value), sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    if len(text) > max_length:
+        return "#" + hashlib.sha256(text.encode("utf-8")).hexdigest()[:24]
+    return text
+
+
+def signature_tag(func: Callable[..., Any], extra: Any = None) -> str:
+    """hash קצר של שם הפונקציה ופרמטריה — שינוי חתימה מתחיל מרחב מפתחות חדש"""
+    try:
+        params = inspect.signature(func).parameters.values()
+        parts = [f"{p.name}/{p.kind.value}" for p in params]
+    except (TypeError, ValueError):
+        parts = []
+    text = f"{func.__module__}.{func.__name__}({','.join(parts)})|{extra!r}"
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:8]
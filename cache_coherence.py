@@ -0,0 +1,233 @@
+"""
+קוהרנטיות cache בין תהליכים לפי שינויים ב-MongoDB
+Cross-process cache coherence driven by MongoDB changes
+
+הבוט וה-webapp מחזיקים חיבורים נפרדים, וה-webapp כותב ל-code_snippets ישירות —
+בלי לעבור דרך ה-Repository של הבוט (cache.invalidate_user_cache ואינדקס החיפוש).
+ChangeListener מאזין לשינויים באוספים מכל תהליך והופך אותם לביטול ממוקד:
+
+- change stream (replica set / Atlas): db.watch עם resume token, כך שניתוק קצר לא מאבד אירועים.
+- polling (שרת בודד): שאילתה תקופתית על updated_at מעל watermark, עם זיכרון של
+  המזהים שכבר נראו באותו timestamp (כתיבות עם אותו updated_at לא מתפספסות).
+
+apply_changes מקדם את דור ה-cache של כל משתמש שהשתנה (פעם אחת לאצווה) ומעדכן את
+אינדקס החיפוש רק כשהרשומה שלו ישנה מהשינוי — כתיבות שהבוט עצמו כבר אינדקס לא
+מעובדות שוב. מחיקה קשיחה מזוהה רק כשיש pre-image (changeStreamPreAndPostImages).
+מצב: CACHE_COHERENCE=auto|stream|poll|off (ברירת מחדל auto: stream ואם אינו נתמך — poll).
+"""
+
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+try:
+    CACHE_COHERENCE_MODE = str(os.getenv("CACHE_COHERENCE", "auto")).lower()
+    # מרווח בין סבבי polling (שניות)
+    CACHE_COHERENCE_POLL_INTERVAL = max(0.5, float(os.getenv("CACHE_COHERENCE_POLL_INTERVAL", "5")))
+except Exception:
+    CACHE_COHERENCE_MODE = "auto"
+    CACHE_COHERENCE_POLL_INTERVAL = 5.0
+
+WATCHED_COLLECTIONS = ("code_snippets", "large_files")
+# שדות שנדרשים לביטול — change stream מקרין רק אותם (בלי code/content)
+_EVENT_FIELDS = ("user_id", "file_name", "is_active", "updated_at")
+_POLL_BATCH = 500
+# קודי שגיאה של שרת ללא תמיכה ב-change streams (לא replica set / לא מופעל)
+_UNSUPPORTED_CODES = {40573, 40324, 136}
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _event(collection: str, op: str, doc: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    doc = doc or {}
+    if doc.get("user_id") is None:
+        return None
+    return {
+        "collection": collection,
+        "op": op,
+        "user_id": doc.get("user_id"),
+        "file_name": doc.get("file_name"),
+        "is_active": doc.get("is_active", True),
+        "updated_at": doc.get("updated_at"),
+    }
+
+
+def event_from_change(change: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """אירוע change stream -> אירוע ביטול (None כשאין פרטי משתמש, למשל delete ללא pre-image)"""
+    collection = (change.get("ns") or {}).get("coll") or ""
+    op = change.get("operationType") or ""
+    doc = change.get("fullDocument") or change.get("fullDocumentBeforeChange")
+    event = _event(collection, op, doc)
+    if event is not None and op == "delete":
+        event["is_active"] = False
+    return event
+
+
+def _is_unsupported(error: Exception) -> bool:
+    code = getattr(error, "code", None)
+    text = str(error)
+    return code in _UNSUPPORTED_CODES or "replica set" in text or "changeStream" in text
+
+
+class ChangeListener:
+    """ת'רד רקע שממיר שינויים באוספים לקריאות on_change(events)"""
+
+    def __init__(self, db: Any, on_change: Callable[[List[Dict[str, Any]]], None],
+                 collections: Iterable[str] = WATCHED_COLLECTIONS, mode: str = CACHE_COHERENCE_MODE,
+                 poll_interval: float = CACHE_COHERENCE_POLL_INTERVAL):
+        self.db = db
+        self.on_change = on_change
+        self.collections = list(collections)
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.active_mode: Optional[str] = None
+        self.resume_token: Any = None
+        self._watermarks: Dict[str, datetime] = {}
+        self._seen_at_watermark: Dict[str, Set[Any]] = {}
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "ChangeListener":
+        if self.mode == "off" or self._thread is not None:
+            return self
+        started = _now()
+        for name in self.collections:
+            self._watermarks[name] = started
+            self._seen_at_watermark[name] = set()
+        self._thread = threading.Thread(target=self._run, name="cache-coherence", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def _run(self) -> None:
+        if self.mode in ("auto", "stream"):
+            try:
+                self._watch()
+                return
+            except Exception as e:
+                if self.mode == "stream" or not _is_unsupported(e):
+                    logger.error(f"מאזין השינויים נעצר: {e}")
+                    return
+                logger.info("change streams אינם נתמכים בשרת — מעבר ל-polling על updated_at")
+        self.active_mode = "poll"
+        while not self._stopped.wait(self.poll_interval):
+            try:
+                self.poll_once()
+            except Exception as e:
+                logger.warning(f"polling לשינויים נכשל: {e}")
+
+    def _watch(self) -> None:
+        pipeline = [
+            {"$match": {"ns.coll": {"$in": self.collections},
+                        "operationType": {"$in": ["insert", "update", "replace", "delete"]}}},
+            {"$project": dict(
+                {"operationType": 1, "ns": 1, "documentKey": 1},
+                **{f"fullDocument.{f}": 1 for f in _EVENT_FIELDS},
+                **{f"fullDocumentBeforeChange.{f}": 1 for f in _EVENT_FIELDS},
+            )},
+        ]
+        while not self._stopped.is_set():
+            try:
+                with self.db.watch(pipeline, full_document="updateLookup",
+                                   full_document_before_change="whenAvailable",
+                                   resume_after=self.resume_token, max_await_time_ms=1000) as stream:
+                    self.active_mode = "stream"
+                    while not self._stopped.is_set():
+                        change = stream.try_next()
+                        if change is None:
+                            continue
+                        self.resume_token = stream.resume_token
+                        event = event_from_change(change)
+                        if event is not None:
+                            self._dispatch([event])
+            except Exception as e:
+                if self.active_mode is None or _is_unsupported(e):
+                    raise
+                # ניתוק זמני: פתיחה מחדש מאותו resume token
+                logger.warning(f"change stream נותק, מתחבר מחדש: {e}")
+                self._stopped.wait(1)
+
+    def poll_once(self) -> int:
+        """סבב polling אחד על כל האוספים; מחזיר כמה אירועים נשלחו"""
+        events: List[Dict[str, Any]] = []
+        projection = dict.fromkeys(_EVENT_FIELDS, 1)
+        for name in self.collections:
+            watermark = self._watermarks.get(name) or _now()
+            seen = self._seen_at_watermark.setdefault(name, set())
+            docs = self.db[name].find({"updated_at": {"$gte": watermark}}, projection) \
+                .sort("updated_at", 1).limit(_POLL_BATCH)
+            for doc in docs:
+                updated_at = doc.get("updated_at")
+                if updated_at == watermark and doc.get("_id") in seen:
+                    continue
+                if updated_at is not None and updated_at > watermark:
+                    watermark, seen = updated_at, set()
+                seen.add(doc.get("_id"))
+                event = _event(name, "poll", doc)
+                if event is not None:
+                    events.append(event)
+            self._watermarks[name] = watermark
+            self._seen_at_watermark[name] = seen
+        if events:
+            self._dispatch(events)
+        return len(events)
+
+    def _dispatch(self, events: List[Dict[str, Any]]) -> None:
+        try:
+            self.on_change(events)
+        except Exception as e:
+            logger.warning(f"טיפול בשינויים נכשל: {e}")
+
+
+def apply_changes(events: List[Dict[str, Any]], cache: Any, search_engine: Any = None,
+                  db: Any = None) -> None:
+    """ביטול cache לכל משתמש שהשתנה ועדכון אינדקס החיפוש של קבצי code_snippets"""
+    for user_id in dict.fromkeys(e["user_id"] for e in events):
+        cache.invalidate_user_cache(user_id)
+    if search_engine is None or db is None:
+        return
+    latest: Dict[Any, Dict[str, Any]] = {}
+    for event in events:
+        if event["collection"] == "code_snippets" and event.get("file_name"):
+            latest[(event["user_id"], event["file_name"])] = event
+    for (user_id, file_name), event in latest.items():
+        try:
+            if not event.get("is_active", True):
+                search_engine.remove_file(user_id, file_name)
+                continue
+            if _index_is_fresh(db, user_id, file_name, event.get("updated_at")):
+                continue
+            doc = db.get_latest_version(user_id, file_name)
+            if doc:
+                search_engine.index_file(user_id, doc)
+        except Exception as e:
+            logger.warning(f"עדכון אינדקס חיפוש לשינוי חיצוני נכשל ({file_name}): {e}")
+
+
+def _index_is_fresh(db: Any, user_id: int, file_name: str, updated_at: Optional[datetime]) -> bool:
+    """האם רשומת האינדקס כבר מעודכנת לשינוי (למשל כתיבה של הבוט עצמו)"""
+    coll = getattr(db, "search_index_collection", None)
+    if coll is None or updated_at is None:
+        return False
+    entry = coll.find_one({"user_id": user_id, "file_name": file_name}, {"indexed_at": 1, "is_active": 1})
+    indexed_at = (entry or {}).get("indexed_at")
+    return bool(entry and entry.get("is_active", True) and indexed_at is not None and indexed_at >= updated_at)
+
+
+def start_cache_coherence(db: Any) -> Optional[ChangeListener]:
+    """הפעלת המאזין מעל DatabaseManager (None כשהמסד כבוי או המצב off)"""
+    if CACHE_COHERENCE_MODE == "off" or getattr(db, "client", None) is None:
+        return None
+    from cache_manager import cache
+    from search_engine import search_engine
+
+    listener = ChangeListener(db.db, lambda events: apply_changes(events, cache, search_engine, db))
+    return listener.start()
@@ -11,6 +11,20 @@ from html import escape as html_escape
 
 logger = logging.getLogger(__name__)
 
+def _format_prefix_stats(prefixes: dict, limit: int = 8) -> str:
+    """שורת סיכום לכל prefix: hits מקומיים/Redis, misses ו-evictions"""
+    if not prefixes:
+        return ""
+    rows = sorted(prefixes.items(), key=lambda kv: kv[1].get('local_hits', 0) + kv[1].get('redis_hits', 0), reverse=True)
+    lines = ["🗂️ <b>לפי prefix</b> (מקומי/Redis/miss/evict):"]
+    for prefix, st in rows[:limit]:
+        lines.append(
+            f"• <code>{html_escape(prefix)}</code>: "
+            f"{st.get('local_hits', 0)}/{st.get('redis_hits', 0)}/{st.get('misses', 0)}/{st.get('evictions', 0)} "
+            f"({st.get('hit_rate', 0)}%)"
+        )
+    return "\n".join(lines) + "\n\n"
+
 async def cache_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """הצגת סטטיסטיקות cache"""
     user_id = update.effective_user.id
@@ -26,7 +40,8 @@ async def cache_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE
         if not stats.get("enabled", False):
             await update.message.reply_text(
                 "📊 <b>סטטיסטיקות Cache</b>\n\n"
-                "❌ Redis Cache מושבת\n"
+                "❌ Redis Cache מושבת (פועל cache מקומי בזיכרון בלבד)\n\n"
+                f"{_format_prefix_stats(stats.get('prefixes') or {})}"
                 "💡 להפעלה: הגדר <code>REDIS_URL</code> במשתני הסביבה",
                 parse_mode='HTML'
             )
@@ -53,6 +68,7 @@ async def cache_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE
             f"{hit_emoji} <b>Hit Rate:</b> {hit_rate}%\n"
             f"✅ <b>Hits:</b> {stats.get('keyspace_hits', 0):,}\n"
             f"❌ <b>Misses:</b> {stats.get('keyspace_misses', 0):,}\n\n"
+            f"{_format_prefix_stats(stats.get('prefixes') or {})}"
             f"💡 <b>טיפ:</b> Hit Rate גבוה = ביצועים טובים יותר!"
         )
         
@@ -3,26 +3,204 @@
 Advanced Cache Manager with Redis
 """
 
-import json
+import fnmatch
+import inspect
 import logging
 import os
+import re
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
 from functools import wraps
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 try:
     import redis  # type: ignore
 except Exception:  # redis אינו חובה – נריץ במצב מושבת אם חסר
     redis = None  # type: ignore[assignment]
+try:
+    import redis.asyncio as redis_asyncio  # type: ignore
+except Exception:  # גרסת redis ישנה/חסרה – הנתיב האסינכרוני יריץ את הלקוח הסינכרוני ב-thread
+    redis_asyncio = None  # type: ignore[assignment]
 import asyncio
 from datetime import datetime, timedelta
 
+import cache_codec
+
 logger = logging.getLogger(__name__)
 
+# מונה דורות לכל משתמש: מפתחות cache של משתמש כוללים "u<id>.g<gen>", וביטול = INCR אחד
+_GENERATION_KEY_PREFIX = "cache_gen"
+# נעילת חישוב בין תהליכים (single-flight): SET NX PX על "cache_lock:<key>"
+_LOCK_KEY_PREFIX = "cache_lock"
+_LOCAL_LOCK = "local"
+# שחרור רק על ידי המחזיק (הנעילה אולי כבר פגה ונלקחה ע"י תהליך אחר)
+_RELEASE_LOCK_LUA = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+_NAMESPACE_RE = re.compile(r":u(-?\d+)\.g(\d+)(?=:|$)")
+
+
+def _generation_key(user_id: Any) -> str:
+    return f"{_GENERATION_KEY_PREFIX}:u{user_id}"
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, '') or default)
+    except ValueError:
+        return default
+
+
+def _parse_prefix_limits(spec: str) -> Dict[str, Tuple[int, int]]:
+    """פרסור "prefix=entries:bytes,..." (למשל "latest_version=500:2097152")"""
+    limits: Dict[str, Tuple[int, int]] = {}
+    for part in (spec or '').split(','):
+        try:
+            prefix, budget = part.strip().split('=', 1)
+            entries, size = budget.split(':', 1)
+            limits[prefix.strip()] = (int(entries), int(size))
+        except ValueError:
+            continue
+    return limits
+
+
+class LocalCache:
+    """שכבת cache בזיכרון התהליך: LRU עם TTL, ותקציב רשומות/בייטים נפרד לכל prefix.
+
+    הערכים נשמרים מקודדים (cache_codec, כפי שנשמרים ב-Redis), כך שכל קורא מקבל עותק משלו
+    ושינוי של תוצאה לא ידלוף לקוראים הבאים. מונים של hit/miss/eviction נשמרים לכל prefix.
+    """
+    
+    def __init__(self, max_entries: int = 2000, max_bytes: int = 16 * 1024 * 1024,
+                 prefix_limits: Optional[Dict[str, Tuple[int, int]]] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.prefix_limits: Dict[str, Tuple[int, int]] = dict(prefix_limits or {})
+        # prefix -> OrderedDict[key, (expires_at, raw)] (הסוף = בשימוש האחרון)
+        self._partitions: Dict[str, "OrderedDict[str, Tuple[float, Union[bytes, str]]]"] = {}
+        self._bytes: Dict[str, int] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def prefix_of(key: str) -> str:
+        return key.split(':', 1)[0]
+    
+    def _limits(self, prefix: str) -> Tuple[int, int]:
+        return self.prefix_limits.get(prefix, (self.max_entries, self.max_bytes))
+    
+    def _counter(self, prefix: str) -> Dict[str, int]:
+        stats = self._stats.get(prefix)
+        if stats is None:
+            stats = self._stats[prefix] = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+        return stats
+    
+    def _drop(self, prefix: str, key: str) -> None:
+        _expires, raw = self._partitions[prefix].pop(key)
+        self._bytes[prefix] -= len(raw)
+    
+    def get(self, key: str) -> Optional[Union[bytes, str]]:
+        prefix = self.prefix_of(key)
+        with self._lock:
+            stats = self._counter(prefix)
+            partition = self._partitions.get(prefix)
+            entry = partition.get(key) if partition is not None else None
+            if entry is None:
+                stats["misses"] += 1
+                return None
+            if entry[0] <= time.monotonic():
+                self._drop(prefix, key)
+                stats["expirations"] += 1
+                stats["misses"] += 1
+                return None
+            partition.move_to_end(key)
+            stats["hits"] += 1
+            return entry[1]
+    
+    def set(self, key: str, raw: Union[bytes, str], ttl_seconds: float) -> bool:
+        prefix = self.prefix_of(key)
+        max_entries, max_bytes = self._limits(prefix)
+        if ttl_seconds <= 0 or max_entries <= 0 or len(raw) > max_bytes:
+            return False
+        with self._lock:
+            partition = self._partitions.setdefault(prefix, OrderedDict())
+            self._bytes.setdefault(prefix, 0)
+            if key in partition:
+                self._drop(prefix, key)
+            partition[key] = (time.monotonic() + ttl_seconds, raw)
+            self._bytes[prefix] += len(raw)
+            stats = self._counter(prefix)
+            while len(partition) > max_entries or self._bytes[prefix] > max_bytes:
+                oldest = next(iter(partition))
+                self._drop(prefix, oldest)
+                stats["evictions"] += 1
+        return True
+    
+    def delete(self, key: str) -> bool:
+        prefix = self.prefix_of(key)
+        with self._lock:
+            partition = self._partitions.get(prefix)
+            if partition is None or key not in partition:
+                return False
+            self._drop(prefix, key)
+            return True
+    
+    def delete_pattern(self, pattern: str) -> int:
+        """מחיקה לפי תבנית glob (כמו KEYS ב-Redis)"""
+        deleted = 0
+        with self._lock:
+            for prefix, partition in self._partitions.items():
+                for key in [k for k in partition if fnmatch.fnmatchcase(k, pattern)]:
+                    self._drop(prefix, key)
+                    deleted += 1
+        return deleted
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._partitions.clear()
+            self._bytes.clear()
+    
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """מונים, מספר רשומות ובייטים לכל prefix"""
+        with self._lock:
+            out: Dict[str, Dict[str, int]] = {}
+            for prefix, counters in self._stats.items():
+                out[prefix] = dict(
+                    counters,
+                    entries=len(self._partitions.get(prefix) or ()),
+                    bytes=self._bytes.get(prefix, 0),
+                )
+            return out
+
+
 class CacheManager:
     """מנהל Cache מתקדם עם Redis"""
     
     def __init__(self):
         self.redis_client = None
         self.is_enabled = False
+        # שכבה ראשונה בזיכרון התהליך; משמשת גם כ-cache עצמאי כש-Redis אינו זמין
+        self.local = LocalCache(
+            max_entries=_env_int('CACHE_LOCAL_MAX_ENTRIES', 2000),
+            max_bytes=_env_int('CACHE_LOCAL_MAX_BYTES', 16 * 1024 * 1024),
+            prefix_limits=_parse_prefix_limits(os.getenv('CACHE_LOCAL_PREFIX_LIMITS', '')),
+        )
+        # כש-Redis פעיל, ערך מקומי חי לכל היותר כך (שניות) כדי לצמצם חוסר עקביות בין תהליכים
+        self.local_ttl_cap = _env_int('CACHE_LOCAL_TTL', 30)
+        # מונים לשכבת Redis לכל prefix (המונים המקומיים נשמרים ב-LocalCache)
+        self._redis_stats: Dict[str, Dict[str, int]] = {}
+        # דור נוכחי לכל משתמש: user_id -> (דור, נקרא מחדש מ-Redis אחרי). ביטול באותו תהליך מיידי;
+        # ביטול מתהליך אחר נראה תוך CACHE_GENERATION_TTL שניות לכל היותר
+        self._generations: Dict[str, Tuple[int, float]] = {}
+        self.generation_ttl = _env_int('CACHE_GENERATION_TTL', 2)
+        # מיקום ה-SCAN של sweep_stale_keys — כל ריצה ממשיכה מאיפה שהקודמת עצרה
+        self._sweep_cursor = 0
+        # נתיב asyncio (aget/aset/...): לקוח redis.asyncio עם pool לכל event loop, ו-timeout
+        # לכל קריאה — Redis איטי נחשב החטאה ולא עוצר את ה-event loop של הבוט
+        self.redis_url: Optional[str] = None
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = weakref.WeakKeyDictionary()
+        self.async_timeout = _env_int('CACHE_ASYNC_TIMEOUT_MS', 250) / 1000
+        self.async_pool_size = _env_int('CACHE_ASYNC_POOL_SIZE', 20)
         self.connect()
     
     def connect(self):
@@ -38,9 +216,10 @@ class CacheManager:
                 logger.info("Redis אינו מוגדר - Cache מושבת")
                 return
             
+            # ערכים בינאריים (cache_codec) — בלי פענוח תגובות למחרוזות
             self.redis_client = redis.from_url(
                 redis_url,
-                decode_responses=True,
+                decode_responses=False,
                 socket_connect_timeout=5,
                 socket_timeout=5,
                 retry_on_timeout=True,
@@ -49,6 +228,7 @@ class CacheManager:
             
             # בדיקת חיבור
             self.redis_client.ping()
+            self.redis_url = redis_url
             self.is_enabled = True
             
             logger.info("התחברות ל-Redis הצליחה - Cache מופעל")
@@ -58,25 +238,72 @@ class CacheManager:
             self.is_enabled = False
     
     def _make_key(self, prefix: str, *args, **kwargs) -> str:
-        """יוצר מפתח cache ייחודי"""
+        """יוצר מפתח cache ייחודי ויציב בין תהליכים (UnsupportedType לארגומנט ללא ייצוג ערכי)"""
         key_parts = [prefix]
-        key_parts.extend(str(arg) for arg in args)
+        key_parts.extend(cache_codec.key_part(arg) for arg in args)
         
         if kwargs:
             sorted_kwargs = sorted(kwargs.items())
-            key_parts.extend(f"{k}:{v}" for k, v in sorted_kwargs)
+            key_parts.extend(f"{k}={cache_codec.key_part(v)}" for k, v in sorted_kwargs)
         
         return ":".join(key_parts)
     
+    def acquire_lock(self, key: str, ttl_ms: int) -> Optional[str]:
+        """נעילת חישוב למפתח בין תהליכים; None אם תהליך אחר מחזיק בה.
+
+        בלי Redis (או בשגיאה) הנעילה מקומית בלבד — עדיף חישוב כפול מחסימה.
+        """
+        if not self.is_enabled:
+            return _LOCAL_LOCK
+        token = uuid.uuid4().hex
+        try:
+            if self.redis_client.set(f"{_LOCK_KEY_PREFIX}:{key}", token, nx=True, px=ttl_ms):
+                return token
+            return None
+        except Exception as e:
+            logger.warning(f"שגיאה בנעילת cache ({key}): {e}")
+            return _LOCAL_LOCK
+
+    def release_lock(self, key: str, token: Optional[str]) -> None:
+        if not token or token == _LOCAL_LOCK or not self.is_enabled:
+            return
+        try:
+            self.redis_client.eval(_RELEASE_LOCK_LUA, 1, f"{_LOCK_KEY_PREFIX}:{key}", token)
+        except Exception as e:
+            logger.warning(f"שגיאה בשחרור נעילת cache ({key}): {e}")
+    
+    def _local_ttl(self, key: str, expire_seconds: int) -> int:
+        if self.is_enabled:
+            return min(expire_seconds, self.local_ttl_cap)
+        # בלי Redis אין ביטול בין תהליכים (בוט/webapp): ערך של משתמש חי רק כמו הדור המקומי
+        if _NAMESPACE_RE.search(key):
+            return min(expire_seconds, self.generation_ttl)
+        return expire_seconds
+    
+    def _count_redis(self, key: str, outcome: str) -> None:
+        stats = self._redis_stats.setdefault(LocalCache.prefix_of(key), {"hits": 0, "misses": 0})
+        stats[outcome] = stats.get(outcome, 0) + 1
+    
     def get(self, key: str) -> Optional[Any]:
-        """קבלת ערך מה-cache"""
+        """קבלת ערך מה-cache (זיכרון מקומי ואז Redis)"""
+        try:
+            raw = self.local.get(key)
+            if raw is not None:
+                return cache_codec.loads(raw)
+        except Exception as e:
+            logger.error(f"שגיאה בקריאה מ-cache מקומי: {e}")
+        
         if not self.is_enabled:
             return None
             
         try:
             value = self.redis_client.get(key)
             if value:
-                return json.loads(value)
+                self._count_redis(key, "hits")
+                decoded = cache_codec.loads(value)
+                self.local.set(key, value, self.local_ttl_cap)
+                return decoded
+            self._count_redis(key, "misses")
         except Exception as e:
             logger.error(f"שגיאה בקריאה מ-cache: {e}")
         
@@ -84,71 +311,345 @@ class CacheManager:
     
     def set(self, key: str, value: Any, expire_seconds: int = 300) -> bool:
         """שמירת ערך ב-cache"""
-        if not self.is_enabled:
+        try:
+            serialized = cache_codec.dumps(value)
+        except cache_codec.UnsupportedType as e:
+            # עדיף לא לשמור מאשר להחזיר ב-hit טיפוס אחר מזה של ה-miss
+            logger.warning(f"ערך לא נשמר ב-cache ({key}): {e}")
             return False
+        except Exception as e:
+            logger.error(f"שגיאה בכתיבה ל-cache: {e}")
+            return False
+        stored_locally = self.local.set(key, serialized, self._local_ttl(key, expire_seconds))
+        
+        if not self.is_enabled:
+            return stored_locally
             
         try:
-            serialized = json.dumps(value, default=str, ensure_ascii=False)
             return self.redis_client.setex(key, expire_seconds, serialized)
         except Exception as e:
             logger.error(f"שגיאה בכתיבה ל-cache: {e}")
-            return False
+            return stored_locally
     
     def delete(self, key: str) -> bool:
         """מחיקת ערך מה-cache"""
+        deleted_locally = self.local.delete(key)
         if not self.is_enabled:
-            return False
+            return deleted_locally
             
         try:
-            return bool(self.redis_client.delete(key))
+            return bool(self.redis_client.delete(key)) or deleted_locally
         except Exception as e:
             logger.error(f"שגיאה במחיקה מ-cache: {e}")
-            return False
+            return deleted_locally
     
     def delete_pattern(self, pattern: str) -> int:
         """מחיקת כל המפתחות שמתאימים לתבנית"""
+        deleted_locally = self.local.delete_pattern(pattern)
         if not self.is_enabled:
-            return 0
+            return deleted_locally
             
         try:
             keys = self.redis_client.keys(pattern)
             if keys:
-                return self.redis_client.delete(*keys)
-            return 0
+                return max(int(self.redis_client.delete(*keys) or 0), deleted_locally)
+            return deleted_locally
         except Exception as e:
             logger.error(f"שגיאה במחיקת תבנית מ-cache: {e}")
+            return deleted_locally
+    
+    def get_generation(self, user_id: Any) -> int:
+        """הדור הנוכחי של ה-cache של משתמש (0 אם מעולם לא בוטל)"""
+        uid = str(user_id)
+        entry = self._generations.get(uid)
+        now = time.monotonic()
+        if entry is not None and (not self.is_enabled or entry[1] > now):
+            return entry[0]
+        if not self.is_enabled:
             return 0
+        try:
+            generation = int(self.redis_client.get(_generation_key(uid)) or 0)
+        except Exception as e:
+            logger.warning(f"שגיאה בקריאת דור cache למשתמש {uid}: {e}")
+            generation = entry[0] if entry is not None else 0
+        self._generations[uid] = (generation, now + self.generation_ttl)
+        return generation
+    
+    def user_namespace(self, user_id: Any) -> str:
+        """רכיב המפתח שמפריד בין דורות ה-cache של משתמש"""
+        return f"u{user_id}.g{self.get_generation(user_id)}"
     
     def invalidate_user_cache(self, user_id: int):
-        """מחיקת כל ה-cache של משתמש ספציפי"""
-        # התאמה רחבה יותר למפתחות כפי שהם נוצרים כיום ב-_make_key
-        # המפתחות נראים כך: "<prefix>:<func_name>:<self>:<user_id>:..."
-        # לכן נמחק לפי prefixes הרלוונטיים ולפי user_id גולמי.
-        total_deleted = 0
-        try:
-            patterns = [
-                f"*:user:{user_id}:*",                 # תמיכה לאחור אם יתווסף prefix "user:" בעתיד
-                f"user_files:*:{user_id}:*",           # רשימת קבצי משתמש
-                f"latest_version:*:{user_id}:*",       # גרסה אחרונה לקובץ
-                f"search_code:*:{user_id}:*",          # תוצאות חיפוש למשתמש
-                f"*:{user_id}:*",                      # נפילה לאחור: כל מפתח שמכיל את המזהה
-            ]
-            for p in patterns:
-                total_deleted += int(self.delete_pattern(p) or 0)
-        except Exception as e:
-            logger.warning(f"invalidate_user_cache failed for user {user_id}: {e}")
-        logger.info(f"נמחקו {total_deleted} ערכי cache עבור משתמש {user_id}")
-        return total_deleted
+        """ביטול כל ה-cache של משתמש ספציפי.
+
+        במקום סריקת KEYS, מקדמים את מונה הדור של המשתמש (INCR אחד): מפתחות הדור הקודם
+        כבר לא נקראים ופגים לפי ה-TTL שלהם (ואפשר לפנות אותם מוקדם עם sweep_stale_keys).
+        מחזיר את מספר הערכים שנמחקו מהשכבה המקומית.
+        """
+        uid = str(user_id)
+        generation: Optional[int] = None
+        if self.is_enabled:
+            try:
+                generation = int(self.redis_client.incr(_generation_key(uid)))
+            except Exception as e:
+                logger.warning(f"invalidate_user_cache failed for user {user_id}: {e}")
+        if generation is None:
+            # ללא Redis (או כשה-INCR נכשל) הדור נשמר ומקודם מקומית בלבד
+            current = self._generations.get(uid)
+            generation = (current[0] if current is not None else self.get_generation(uid)) + 1
+        expires = time.monotonic() + self.generation_ttl if self.is_enabled else float('inf')
+        self._generations[uid] = (generation, expires)
+        dropped = self.local.delete_pattern(f"*:u{uid}.g*")
+        logger.info(f"cache של משתמש {user_id} עבר לדור {generation} ({dropped} ערכים מקומיים נמחקו)")
+        return dropped
+    
+    def sweep_stale_keys(self, max_keys: int = 5000, batch_size: int = 500) -> int:
+        """פינוי מוקדם (SCAN, לא KEYS) של מפתחות Redis מדורות שכבר בוטלו; מחזיר כמה נמחקו.
+
+        כל ריצה בודקת עד max_keys מפתחות וממשיכה מה-cursor שבו הקודמת עצרה, כך שבמרחב
+        מפתחות גדול כל המפתחות נבדקים לאורך כמה ריצות (מתחילים מחדש רק כשה-SCAN חוזר ל-0).
+        """
+        if not self.is_enabled:
+            return 0
+        deleted = 0
+        scanned = 0
+        try:
+            cursor = self._sweep_cursor
+            while True:
+                cursor, keys = self.redis_client.scan(cursor=cursor, match="*:u*.g*", count=batch_size)
+                cursor = int(cursor)
+                if keys:
+                    deleted += self._delete_stale(list(keys))
+                    scanned += len(keys)
+                if cursor == 0 or scanned >= max_keys:
+                    break
+            self._sweep_cursor = cursor
+        except Exception as e:
+            self._sweep_cursor = 0
+            logger.warning(f"sweep_stale_keys failed: {e}")
+        if deleted:
+            logger.info(f"נמחקו {deleted} מפתחות cache מדורות ישנים")
+        return deleted
+    
+    def _delete_stale(self, keys: List[Union[str, bytes]]) -> int:
+        parsed: List[Tuple[Any, str, int]] = []
+        for key in keys:
+            match = _NAMESPACE_RE.search(key.decode("utf-8", "replace") if isinstance(key, bytes) else key)
+            if match:
+                parsed.append((key, match.group(1), int(match.group(2))))
+        if not parsed:
+            return 0
+        uids = sorted({uid for _key, uid, _gen in parsed})
+        current = dict(zip(uids, self.redis_client.mget([_generation_key(uid) for uid in uids])))
+        stale = [key for key, uid, gen in parsed if gen < int(current.get(uid) or 0)]
+        if not stale:
+            return 0
+        return int(self.redis_client.delete(*stale) or 0)
+    
+    # --- נתיב asyncio ---
+
+    def _async_client(self) -> Any:
+        """לקוח redis.asyncio של ה-event loop הנוכחי (None = להריץ את הלקוח הסינכרוני ב-thread)"""
+        if redis_asyncio is None or not self.redis_url:
+            return None
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = redis_asyncio.from_url(
+                self.redis_url,
+                decode_responses=False,
+                max_connections=self.async_pool_size,
+                socket_connect_timeout=5,
+                socket_timeout=5,
+                health_check_interval=30,
+            )
+            self._async_clients[loop] = client
+        return client
+
+    async def _acall(self, method: str, *args, **kwargs) -> Any:
+        """פקודת Redis עם timeout (asyncio.TimeoutError / שגיאת חיבור עולות לקורא)"""
+        client = self._async_client()
+        if client is not None:
+            call = getattr(client, method)(*args, **kwargs)
+        else:
+            call = asyncio.to_thread(getattr(self.redis_client, method), *args, **kwargs)
+        return await asyncio.wait_for(call, self.async_timeout)
+
+    async def _apipeline(self, commands: List[Tuple[str, tuple]]) -> List[Any]:
+        """כמה פקודות בסבב אחד (pipeline ללא טרנזקציה)"""
+        client = self._async_client()
+
+        def _queue(pipe: Any) -> Any:
+            for method, args in commands:
+                getattr(pipe, method)(*args)
+            return pipe
+
+        if client is not None:
+            call = _queue(client.pipeline(transaction=False)).execute()
+        else:
+            call = asyncio.to_thread(lambda: _queue(self.redis_client.pipeline(transaction=False)).execute())
+        return await asyncio.wait_for(call, self.async_timeout)
+
+    def _async_failed(self, keys: List[str], error: Exception) -> None:
+        for key in keys:
+            self._count_redis(key, "timeouts" if isinstance(error, asyncio.TimeoutError) else "misses")
+        logger.debug(f"Redis async נכשל/איטי ({len(keys)} מפתחות), החטאה: {error!r}")
+
+    async def aget(self, key: str) -> Optional[Any]:
+        """כמו get, בלי לחסום את ה-event loop"""
+        return (await self.aget_many([key])).get(key)
+
+    async def aget_many(self, keys: List[str]) -> Dict[str, Any]:
+        """קריאת כמה מפתחות: זיכרון מקומי, והשאר ב-MGET אחד. מפתח חסר לא מופיע בתוצאה."""
+        found: Dict[str, Any] = {}
+        remote: List[str] = []
+        for key in keys:
+            try:
+                raw = self.local.get(key)
+                if raw is not None:
+                    found[key] = cache_codec.loads(raw)
+                    continue
+            except Exception as e:
+                logger.error(f"שגיאה בקריאה מ-cache מקומי: {e}")
+            remote.append(key)
+        if not remote or not self.is_enabled:
+            return found
+        try:
+            values = await self._acall("mget", remote)
+        except Exception as e:
+            self._async_failed(remote, e)
+            return found
+        for key, value in zip(remote, values):
+            if not value:
+                self._count_redis(key, "misses")
+                continue
+            try:
+                found[key] = cache_codec.loads(value)
+            except Exception as e:
+                logger.error(f"שגיאה בקריאה מ-cache: {e}")
+                continue
+            self._count_redis(key, "hits")
+            self.local.set(key, value, self.local_ttl_cap)
+        return found
+
+    async def aset(self, key: str, value: Any, expire_seconds: int = 300) -> bool:
+        """כמו set, בלי לחסום את ה-event loop"""
+        return await self.aset_many({key: value}, expire_seconds)
+
+    async def aset_many(self, values: Dict[str, Any], expire_seconds: int = 300) -> bool:
+        """שמירת כמה ערכים: SETEX לכל אחד ב-pipeline אחד"""
+        commands: List[Tuple[str, tuple]] = []
+        stored_locally = True
+        for key, value in values.items():
+            try:
+                serialized = cache_codec.dumps(value)
+            except Exception as e:
+                logger.warning(f"ערך לא נשמר ב-cache ({key}): {e}")
+                stored_locally = False
+                continue
+            stored_locally = self.local.set(key, serialized, self._local_ttl(key, expire_seconds)) and stored_locally
+            commands.append(("setex", (key, expire_seconds, serialized)))
+        if not self.is_enabled or not commands:
+            return stored_locally and bool(commands)
+        try:
+            return all(await self._apipeline(commands))
+        except Exception as e:
+            self._async_failed([key for _method, (key, *_rest) in commands], e)
+            return stored_locally
+
+    async def adelete(self, key: str) -> bool:
+        deleted_locally = self.local.delete(key)
+        if not self.is_enabled:
+            return deleted_locally
+        try:
+            return bool(await self._acall("delete", key)) or deleted_locally
+        except Exception as e:
+            self._async_failed([key], e)
+            return deleted_locally
+
+    async def aget_generation(self, user_id: Any) -> int:
+        """כמו get_generation; ב-timeout נשאר הדור האחרון הידוע"""
+        uid = str(user_id)
+        entry = self._generations.get(uid)
+        now = time.monotonic()
+        if entry is not None and (not self.is_enabled or entry[1] > now):
+            return entry[0]
+        if not self.is_enabled:
+            return 0
+        try:
+            generation = int(await self._acall("get", _generation_key(uid)) or 0)
+        except Exception as e:
+            logger.warning(f"שגיאה בקריאת דור cache למשתמש {uid}: {e!r}")
+            generation = entry[0] if entry is not None else 0
+        self._generations[uid] = (generation, now + self.generation_ttl)
+        return generation
+
+    async def auser_namespace(self, user_id: Any) -> str:
+        return f"u{user_id}.g{await self.aget_generation(user_id)}"
+
+    async def aacquire_lock(self, key: str, ttl_ms: int) -> Optional[str]:
+        """כמו acquire_lock; ב-timeout הנעילה מקומית בלבד"""
+        if not self.is_enabled:
+            return _LOCAL_LOCK
+        token = uuid.uuid4().hex
+        try:
+            if await self._acall("set", f"{_LOCK_KEY_PREFIX}:{key}", token, nx=True, px=ttl_ms):
+                return token
+            return None
+        except Exception as e:
+            logger.warning(f"שגיאה בנעילת cache ({key}): {e!r}")
+            return _LOCAL_LOCK
+
+    async def arelease_lock(self, key: str, token: Optional[str]) -> None:
+        if not token or token == _LOCAL_LOCK or not self.is_enabled:
+            return
+        try:
+            await self._acall("eval", _RELEASE_LOCK_LUA, 1, f"{_LOCK_KEY_PREFIX}:{key}", token)
+        except Exception as e:
+            logger.warning(f"שגיאה בשחרור נעילת cache ({key}): {e!r}")
+
+    async def aclose(self) -> None:
+        """סגירת ה-pool של ה-event loop הנוכחי (בסיום הבוט)"""
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            try:
+                await client.aclose() if hasattr(client, "aclose") else await client.close()
+            except Exception as e:
+                logger.debug(f"סגירת לקוח Redis async נכשלה: {e}")
+
+    def get_prefix_stats(self) -> Dict[str, Dict[str, Any]]:
+        """מוני hit/miss/eviction לכל prefix, בשתי השכבות"""
+        out: Dict[str, Dict[str, Any]] = {}
+        for prefix, local_stats in self.local.stats().items():
+            redis_stats = self._redis_stats.get(prefix, {})
+            local_hits = local_stats["hits"]
+            redis_hits = redis_stats.get("hits", 0)
+            # החטאה מקומית שנענתה מ-Redis אינה החטאה סופית
+            misses = redis_stats.get("misses", 0) if self.is_enabled else local_stats["misses"]
+            lookups = local_hits + redis_hits + misses
+            out[prefix] = {
+                "local_hits": local_hits,
+                "redis_hits": redis_hits,
+                "misses": misses,
+                "redis_timeouts": redis_stats.get("timeouts", 0),
+                "evictions": local_stats["evictions"],
+                "expirations": local_stats["expirations"],
+                "entries": local_stats["entries"],
+                "bytes": local_stats["bytes"],
+                "hit_rate": round((local_hits + redis_hits) / max(lookups, 1) * 100, 2),
+            }
+        return out
     
     def get_stats(self) -> Dict[str, Any]:
         """סטטיסטיקות cache"""
         if not self.is_enabled:
-            return {"enabled": False}
+            return {"enabled": False, "prefixes": self.get_prefix_stats()}
             
         try:
             info = self.redis_client.info()
             return {
                 "enabled": True,
+                "prefixes": self.get_prefix_stats(),
                 "used_memory": info.get('used_memory_human', 'N/A'),
                 "connected_clients": info.get('connected_clients', 0),
                 "keyspace_hits": info.get('keyspace_hits', 0),
@@ -161,53 +662,348 @@ class CacheManager:
             }
         except Exception as e:
             logger.error(f"שגיאה בקבלת סטטיסטיקות cache: {e}")
-            return {"enabled": True, "error": str(e)}
+            return {"enabled": True, "error": str(e), "prefixes": self.get_prefix_stats()}
 
 # יצירת instance גלובלי
 cache = CacheManager()
 
-def cached(expire_seconds: int = 300, key_prefix: str = "default"):
-    """דקורטור לcaching פונקציות"""
+
+def _user_arg_index(func) -> Optional[int]:
+    """מיקום הפרמטר user_id בחתימת הפונקציה (None אם אין כזה)"""
+    try:
+        params = list(inspect.signature(func).parameters)
+    except (TypeError, ValueError):
+        return None
+    return params.index('user_id') if 'user_id' in params else None
+
+
+def _skips_self(func) -> bool:
+    """מתודה (self/cls): המופע אינו חלק מהמפתח, כדי שכל התהליכים ישתפו את אותם ערכים"""
+    try:
+        params = list(inspect.signature(func).parameters)
+    except (TypeError, ValueError):
+        return False
+    return bool(params) and params[0] in ('self', 'cls')
+
+
+def _cache_user_id(user_index: Optional[int], args, kwargs) -> Any:
+    if user_index is None:
+        return None
+    return args[user_index] if len(args) > user_index else kwargs.get('user_id')
+
+
+def _build_cache_key(key_prefix: str, func_tag: str, namespace: Optional[str], skip: int,
+                     args, kwargs) -> Optional[str]:
+    """מפתח cache; לפונקציות עם user_id המפתח כולל את דור ה-cache של המשתמש (namespace).
+
+    None כשאחד הארגומנטים אינו ניתן לייצוג יציב — הקריאה עוברת ישירות לפונקציה.
+    """
+    key_args = args[skip:]
+    try:
+        if namespace is not None:
+            return cache._make_key(key_prefix, func_tag, namespace, *key_args, **kwargs)
+        return cache._make_key(key_prefix, func_tag, *key_args, **kwargs)
+    except cache_codec.UnsupportedType as e:
+        logger.debug(f"ללא cache עבור {func_tag}: {e}")
+        return None
+
+
+def _key_spec(func, version: Any) -> Tuple[str, Optional[int], int]:
+    """(שם+גרסת חתימה, מיקום user_id, כמה ארגומנטים לדלג) — מחושב פעם אחת לכל פונקציה"""
+    func_tag = f"{func.__name__}.{cache_codec.signature_tag(func, version)}"
+    return func_tag, _user_arg_index(func), 1 if _skips_self(func) else 0
+
+
+# --- single-flight ו-stale-while-revalidate ---
+
+# כמה זמן (ms) תהליך ממתין לערך שתהליך אחר מחשב, ותוקף נעילת החישוב ב-Redis
+CACHE_LOCK_WAIT_MS = _env_int('CACHE_LOCK_WAIT_MS', 3000)
+CACHE_LOCK_TTL_MS = _env_int('CACHE_LOCK_TTL_MS', 10000)
+_LOCK_POLL_SECONDS = 0.05
+# במצב stale_ttl הערך נשמר עטוף: {_FRESH_UNTIL: epoch, "v": value}
+_FRESH_UNTIL = "__fresh_until"
+
+
+class _Flight:
+    """חישוב אחד שרץ למפתח בתהליך הזה; קוראים נוספים ממתינים לתוצאה שלו"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+_flights: Dict[str, _Flight] = {}
+_async_flights: Dict[Tuple[int, str], "asyncio.Future"] = {}
+_flights_lock = threading.Lock()
+_refreshing: set = set()
+_background_tasks: set = set()
+
+
+def _read(key: str, stale_ttl: int) -> Tuple[bool, Any, bool]:
+    """(נמצא, ערך, מתיישן) מתוך ה-cache"""
+    entry = cache.get(key)
+    if entry is None:
+        return False, None, False
+    if stale_ttl and isinstance(entry, dict) and _FRESH_UNTIL in entry:
+        return True, entry.get("v"), time.time() >= float(entry[_FRESH_UNTIL])
+    return True, entry, False
+
+
+def _store(key: str, value: Any, expire_seconds: int, stale_ttl: int) -> None:
+    if value is None:
+        return
+    if stale_ttl:
+        cache.set(key, {_FRESH_UNTIL: time.time() + expire_seconds, "v": value}, expire_seconds + stale_ttl)
+    else:
+        cache.set(key, value, expire_seconds)
+
+
+def _private_copy(value: Any) -> Any:
+    """עותק לממתינים, כמו שמקבל כל קורא מה-cache (שינוי אצל אחד לא דולף לאחרים)"""
+    try:
+        return cache_codec.loads(cache_codec.dumps(value))
+    except Exception:
+        return value
+
+
+def _may_block() -> bool:
+    """False בת'רד שמריץ event loop (פונקציית @cached סינכרונית שנקראת מ-handler):
+    המתנה שם עוצרת את כל ה-handlers, ולכן מחשבים מיד במקום להמתין"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return True
+    return False
+
+
+def _compute_locked(key: str, compute, expire_seconds: int, stale_ttl: int, wait: bool = True) -> Any:
+    """חישוב תחת נעילת Redis; אם תהליך אחר מחשב — המתנה לערך שלו עד CACHE_LOCK_WAIT_MS (רק כש-wait)"""
+    token = cache.acquire_lock(key, CACHE_LOCK_TTL_MS)
+    if token is None and wait:
+        deadline = time.monotonic() + CACHE_LOCK_WAIT_MS / 1000
+        while time.monotonic() < deadline:
+            time.sleep(_LOCK_POLL_SECONDS)
+            found, value, _stale = _read(key, stale_ttl)
+            if found:
+                return value
+        logger.debug(f"Cache lock wait timed out, computing: {key}")
+    try:
+        value = compute()
+        _store(key, value, expire_seconds, stale_ttl)
+        return value
+    finally:
+        cache.release_lock(key, token)
+
+
+def _single_flight(key: str, compute, expire_seconds: int, stale_ttl: int) -> Any:
+    wait = _may_block()
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+    if not leader:
+        if wait and flight.done.wait(CACHE_LOCK_TTL_MS / 1000) and flight.error is None:
+            return _private_copy(flight.value)
+        # המחשב נכשל או נתקע, או שאסור לחסום את ה-event loop — מחשבים בעצמנו
+        return _compute_locked(key, compute, expire_seconds, stale_ttl, wait=wait)
+    try:
+        flight.value = _compute_locked(key, compute, expire_seconds, stale_ttl, wait=wait)
+        return flight.value
+    except BaseException as e:
+        flight.error = e
+        raise
+    finally:
+        with _flights_lock:
+            _flights.pop(key, None)
+        flight.done.set()
+
+
+def _claim_refresh(key: str) -> bool:
+    """רענון רקע אחד למפתח בתהליך (בין תהליכים — נעילת Redis, ללא המתנה)"""
+    with _flights_lock:
+        if key in _refreshing or key in _flights:
+            return False
+        _refreshing.add(key)
+        return True
+
+
+def _end_refresh(key: str) -> None:
+    with _flights_lock:
+        _refreshing.discard(key)
+
+
+def _refresh_in_background(key: str, compute, expire_seconds: int, stale_ttl: int) -> None:
+    if not _claim_refresh(key):
+        return
+    token = cache.acquire_lock(key, CACHE_LOCK_TTL_MS)
+    if token is None:
+        _end_refresh(key)
+        return
+
+    def _run() -> None:
+        try:
+            _store(key, compute(), expire_seconds, stale_ttl)
+        except Exception as e:
+            logger.warning(f"רענון cache ברקע נכשל ({key}): {e}")
+        finally:
+            cache.release_lock(key, token)
+            _end_refresh(key)
+
+    threading.Thread(target=_run, name="cache-refresh", daemon=True).start()
+
+
+async def _read_async(key: str, stale_ttl: int) -> Tuple[bool, Any, bool]:
+    entry = await cache.aget(key)
+    if entry is None:
+        return False, None, False
+    if stale_ttl and isinstance(entry, dict) and _FRESH_UNTIL in entry:
+        return True, entry.get("v"), time.time() >= float(entry[_FRESH_UNTIL])
+    return True, entry, False
+
+
+async def _store_async(key: str, value: Any, expire_seconds: int, stale_ttl: int) -> None:
+    if value is None:
+        return
+    if stale_ttl:
+        await cache.aset(key, {_FRESH_UNTIL: time.time() + expire_seconds, "v": value}, expire_seconds + stale_ttl)
+    else:
+        await cache.aset(key, value, expire_seconds)
+
+
+async def _compute_locked_async(key: str, compute, expire_seconds: int, stale_ttl: int) -> Any:
+    token = await cache.aacquire_lock(key, CACHE_LOCK_TTL_MS)
+    if token is None:
+        deadline = time.monotonic() + CACHE_LOCK_WAIT_MS / 1000
+        while time.monotonic() < deadline:
+            await asyncio.sleep(_LOCK_POLL_SECONDS)
+            found, value, _stale = await _read_async(key, stale_ttl)
+            if found:
+                return value
+        logger.debug(f"Cache lock wait timed out, computing: {key}")
+    try:
+        value = await compute()
+        await _store_async(key, value, expire_seconds, stale_ttl)
+        return value
+    finally:
+        await cache.arelease_lock(key, token)
+
+
+async def _single_flight_async(key: str, compute, expire_seconds: int, stale_ttl: int) -> Any:
+    loop = asyncio.get_running_loop()
+    flight_key = (id(loop), key)
+    flight = _async_flights.get(flight_key)
+    if flight is not None:
+        try:
+            # shield: ביטול של ממתין לא מבטל את החישוב של האחרים
+            return _private_copy(await asyncio.shield(flight))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            return await _compute_locked_async(key, compute, expire_seconds, stale_ttl)
+    flight = _async_flights[flight_key] = loop.create_future()
+    try:
+        value = await _compute_locked_async(key, compute, expire_seconds, stale_ttl)
+        flight.set_result(value)
+        return value
+    except BaseException as e:
+        if isinstance(e, asyncio.CancelledError):
+            flight.cancel()
+        else:
+            flight.set_exception(e)
+            flight.exception()  # מסומן כנקרא — בלי אזהרת "exception was never retrieved"
+        raise
+    finally:
+        _async_flights.pop(flight_key, None)
+
+
+def _refresh_in_background_async(key: str, compute, expire_seconds: int, stale_ttl: int) -> None:
+    if not _claim_refresh(key):
+        return
+
+    async def _run() -> None:
+        token = None
+        try:
+            token = await cache.aacquire_lock(key, CACHE_LOCK_TTL_MS)
+            if token is not None:
+                await _store_async(key, await compute(), expire_seconds, stale_ttl)
+        except Exception as e:
+            logger.warning(f"רענון cache ברקע נכשל ({key}): {e}")
+        finally:
+            await cache.arelease_lock(key, token)
+            _end_refresh(key)
+
+    task = asyncio.get_running_loop().create_task(_run())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+def cached(expire_seconds: int = 300, key_prefix: str = "default", version: Any = None,
+           stale_ttl: int = 0):
+    """דקורטור לcaching פונקציות (version: להעלות כשמבנה הערך המוחזר משתנה).
+
+    בהחטאה רק קורא אחד מחשב (בתהליך, ובין תהליכים דרך נעילת Redis) והשאר מקבלים את
+    התוצאה שלו; קריאה מת'רד של event loop לא ממתינה אלא מחשבת בעצמה. stale_ttl>0: עוד stale_ttl שניות אחרי התפוגה הערך הקודם מוחזר מיד
+    ומרוענן בת'רד רקע.
+    """
     def decorator(func):
+        func_tag, user_index, skip = _key_spec(func, (version, bool(stale_ttl)))
+        
         @wraps(func)
         def wrapper(*args, **kwargs):
             # יצירת מפתח cache
-            cache_key = cache._make_key(key_prefix, func.__name__, *args, **kwargs)
+            user_id = _cache_user_id(user_index, args, kwargs)
+            namespace = cache.user_namespace(user_id) if user_id is not None else None
+            cache_key = _build_cache_key(key_prefix, func_tag, namespace, skip, args, kwargs)
+            if cache_key is None:
+                return func(*args, **kwargs)
+
+            def compute():
+                return func(*args, **kwargs)
             
             # בדיקה ב-cache
-            result = cache.get(cache_key)
-            if result is not None:
-                logger.debug(f"Cache hit: {cache_key}")
+            found, result, stale = _read(cache_key, stale_ttl)
+            if found:
+                logger.debug(f"Cache hit{' (stale)' if stale else ''}: {cache_key}")
+                if stale:
+                    _refresh_in_background(cache_key, compute, expire_seconds, stale_ttl)
                 return result
             
-            # הפעלת הפונקציה ושמירה ב-cache
-            result = func(*args, **kwargs)
-            cache.set(cache_key, result, expire_seconds)
-            logger.debug(f"Cache miss, stored: {cache_key}")
-            
-            return result
+            # הפעלת הפונקציה (קורא אחד לכל מפתח) ושמירה ב-cache
+            logger.debug(f"Cache miss: {cache_key}")
+            return _single_flight(cache_key, compute, expire_seconds, stale_ttl)
         return wrapper
     return decorator
 
-def async_cached(expire_seconds: int = 300, key_prefix: str = "default"):
-    """דקורטור לcaching פונקציות async"""
+def async_cached(expire_seconds: int = 300, key_prefix: str = "default", version: Any = None,
+                 stale_ttl: int = 0):
+    """דקורטור לcaching פונקציות async (אותה התנהגות כמו cached; הרענון הוא task ברקע)"""
     def decorator(func):
+        func_tag, user_index, skip = _key_spec(func, (version, bool(stale_ttl)))
+        
         @wraps(func)
         async def wrapper(*args, **kwargs):
-            # יצירת מפתח cache
-            cache_key = cache._make_key(key_prefix, func.__name__, *args, **kwargs)
+            # יצירת מפתח cache (קריאות Redis דרך הנתיב האסינכרוני — לא חוסמות את ה-loop)
+            user_id = _cache_user_id(user_index, args, kwargs)
+            namespace = await cache.auser_namespace(user_id) if user_id is not None else None
+            cache_key = _build_cache_key(key_prefix, func_tag, namespace, skip, args, kwargs)
+            if cache_key is None:
+                return await func(*args, **kwargs)
+
+            def compute():
+                return func(*args, **kwargs)
             
             # בדיקה ב-cache
-            result = cache.get(cache_key)
-            if result is not None:
-                logger.debug(f"Cache hit: {cache_key}")
+            found, result, stale = await _read_async(cache_key, stale_ttl)
+            if found:
+                logger.debug(f"Cache hit{' (stale)' if stale else ''}: {cache_key}")
+                if stale:
+                    _refresh_in_background_async(cache_key, compute, expire_seconds, stale_ttl)
                 return result
             
-            # הפעלת הפונקציה ושמירה ב-cache
-            result = await func(*args, **kwargs)
-            cache.set(cache_key, result, expire_seconds)
-            logger.debug(f"Cache miss, stored: {cache_key}")
-            
-            return result
+            # הפעלת הפונקציה (קורא אחד לכל מפתח) ושמירה ב-cache
+            logger.debug(f"Cache miss: {cache_key}")
+            return await _single_flight_async(cache_key, compute, expire_seconds, stale_ttl)
         return wrapper
-    return decorator
\ No newline at end of file
+    return decorator
@@ -0,0 +1,55 @@
+"""
+מאפייני קוד מחושבים מראש
+Precomputed per-document code features
+
+המאפיינים (גודל, שורות, פונקציות, מחלקות וסמלים) מחושבים פעם אחת בזמן השמירה
+ונשמרים על המסמך, כך שמסננים ומיון לפי גודל לא צריכים לטעון ולפרסר את הקוד.
+המודול משתמש בספרייה הסטנדרטית בלבד.
+"""
+
+import re
+from typing import Any, Dict, List, Mapping, Optional
+
+# תבניות זיהוי פונקציות לפי שפה (משותפות גם ל-CodeProcessor.extract_functions)
+FUNCTION_PATTERNS: Dict[str, str] = {
+    'python': r'def\s+(\w+)\s*\([^)]*\)\s*:',
+    'javascript': r'function\s+(\w+)\s*\([^)]*\)\s*{',
+    'java': r'(?:public|private|protected)?\s*(?:static)?\s*\w+\s+(\w+)\s*\([^)]*\)\s*{',
+    'cpp': r'\w+\s+(\w+)\s*\([^)]*\)\s*{',
+    'c': r'\w+\s+(\w+)\s*\([^)]*\)\s*{',
+    'php': r'function\s+(\w+)\s*\([^)]*\)\s*{'
+}
+
+_COMPILED_FUNCTIONS = {lang: re.compile(p, re.MULTILINE) for lang, p in FUNCTION_PATTERNS.items()}
+_CLASS_RE = re.compile(r'\bclass\s+(\w+)', re.IGNORECASE)
+
+# שדות המאפיינים כפי שהם נשמרים על מסמך הקוד
+FEATURE_FIELDS = ("size_bytes", "line_count", "function_count", "class_count", "symbols")
+
+# תקרה לרשימת הסמלים שנשמרת על מסמך (מניעת מסמכים מנופחים)
+MAX_SYMBOLS = 200
+
+
+def compute_code_features(code: str, programming_language: str) -> Dict[str, Any]:
+    """חישוב כל המאפיינים של קטע קוד במעבר אחד"""
+    code = code or ""
+    functions: List[str] = []
+    pattern = _COMPILED_FUNCTIONS.get((programming_language or "").lower())
+    if pattern is not None:
+        functions = [m.group(1) for m in pattern.finditer(code)]
+    classes = [m.group(1) for m in _CLASS_RE.finditer(code)]
+    symbols = list(dict.fromkeys(functions + classes))[:MAX_SYMBOLS]
+    return {
+        "size_bytes": len(code.encode("utf-8")),
+        "line_count": code.count("\n") + 1 if code else 0,
+        "function_count": len(functions),
+        "class_count": len(classes),
+        "symbols": symbols,
+    }
+
+
+def stored_features(doc: Mapping[str, Any]) -> Optional[Dict[str, Any]]:
+    """המאפיינים השמורים על מסמך, או None למסמך ישן שנשמר לפני שהמאפיינים נוספו"""
+    if doc.get("size_bytes") is None:
+        return None
+    return {name: doc.get(name) for name in FEATURE_FIELDS}
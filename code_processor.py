@@ -27,6 +27,8 @@ from pygments.util import ClassNotFound
 
 from config import config
 from cache_manager import cache, cached
+from render_cache import render_cache
+from code_features import FUNCTION_PATTERNS
 from utils import normalize_code
 
 logger = logging.getLogger(__name__)
@@ -474,58 +476,62 @@ class CodeProcessor:
         
         return 'text'
     
-    @cached(expire_seconds=1800, key_prefix="syntax_highlight")  # cache ל-30 דקות
     def highlight_code(self, code: str, programming_language: str, output_format: str = 'html') -> str:
-        """הדגשת תחביר מתקדמת עם caching"""
+        """הדגשת תחביר מתקדמת עם caching (render_cache: מפתח לפי hash של הקוד, לא הקוד עצמו)"""
+        # אם הקוד ריק או קצר מדי, אל תבצע highlighting
+        if not code or len(code.strip()) < 10:
+            return code
         try:
-            # אם הקוד ריק או קצר מדי, אל תבצע highlighting
-            if not code or len(code.strip()) < 10:
-                return code
-            
-            # בחירת lexer מתאים
-            lexer = None
-            try:
-                # נסה לפי שפה
-                if programming_language and programming_language != 'text':
-                    lexer = get_lexer_by_name(programming_language)
-            except ClassNotFound:
-                try:
-                    # נסה לפי תוכן
-                    lexer = guess_lexer(code)
-                except ClassNotFound:
-                    # ברירת מחדל
-                    lexer = get_lexer_by_name('text')
-            
-            if not lexer:
-                return code
-            
-            # בחירת formatter
-            if output_format == 'html':
-                formatter = HtmlFormatter(
-                    style=self.style,
-                    noclasses=True,
-                    nowrap=True,
-                    linenos=False
-                )
-            elif output_format == 'terminal':
-                formatter = TerminalFormatter()
-            else:
-                return code  # פורמט לא נתמך
-            
-            # ביצוע highlighting
-            highlighted = highlight(code, lexer, formatter)
-            
-            # ניקוי HTML אם נדרש
-            if output_format == 'html':
-                # הסרת tags מיותרים שעלולים לגרום לבעיות בטלגרם
-                highlighted = self._clean_html_for_telegram(highlighted)
-            
-            return highlighted
-            
+            return render_cache.get_or_render(
+                code, programming_language or '', f"telegram-{output_format}", self.style, None,
+                lambda: self._highlight_uncached(code, programming_language, output_format),
+            )
         except Exception as e:
             logger.error(f"שגיאה בהדגשת תחביר: {e}")
             # במקרה של שגיאה, החזר את הקוד המקורי
             return code
+
+    def _highlight_uncached(self, code: str, programming_language: str, output_format: str) -> str:
+        """הדגשה בפועל (Pygments); שגיאה עולה לקורא ולא נשמרת ב-cache"""
+        # בחירת lexer מתאים
+        lexer = None
+        try:
+            # נסה לפי שפה
+            if programming_language and programming_language != 'text':
+                lexer = get_lexer_by_name(programming_language)
+        except ClassNotFound:
+            try:
+                # נסה לפי תוכן
+                lexer = guess_lexer(code)
+            except ClassNotFound:
+                # ברירת מחדל
+                lexer = get_lexer_by_name('text')
+        
+        if not lexer:
+            return code
+        
+        # בחירת formatter
+        if output_format == 'html':
+            formatter = HtmlFormatter(
+                style=self.style,
+                noclasses=True,
+                nowrap=True,
+                linenos=False
+            )
+        elif output_format == 'terminal':
+            formatter = TerminalFormatter()
+        else:
+            return code  # פורמט לא נתמך
+        
+        # ביצוע highlighting
+        highlighted = highlight(code, lexer, formatter)
+        
+        # ניקוי HTML אם נדרש
+        if output_format == 'html':
+            # הסרת tags מיותרים שעלולים לגרום לבעיות בטלגרם
+            highlighted = self._clean_html_for_telegram(highlighted)
+        
+        return highlighted
     
     def _clean_html_for_telegram(self, html_code: str) -> str:
         """ניקוי HTML לתאימות עם Telegram"""
@@ -767,14 +773,7 @@ class CodeProcessor:
         
         functions: List[Dict[str, Any]] = []
         
-        patterns = {
-            'python': r'def\s+(\w+)\s*\([^)]*\)\s*:',
-            'javascript': r'function\s+(\w+)\s*\([^)]*\)\s*{',
-            'java': r'(?:public|private|protected)?\s*(?:static)?\s*\w+\s+(\w+)\s*\([^)]*\)\s*{',
-            'cpp': r'\w+\s+(\w+)\s*\([^)]*\)\s*{',
-            'c': r'\w+\s+(\w+)\s*\([^)]*\)\s*{',
-            'php': r'function\s+(\w+)\s*\([^)]*\)\s*{'
-        }
+        patterns = FUNCTION_PATTERNS
         
         if programming_language in patterns:
             matches = re.finditer(patterns[programming_language], code, re.MULTILINE)
@@ -63,6 +63,9 @@ class BotConfig:
     DRIVE_ADD_HASH: bool = False
     # נרמול קוד לפני שמירה (הסרה/ניקוי תווים נסתרים)
     NORMALIZE_CODE_ON_SAVE: bool = True
+    # שמירה מרובה (ייבוא ריפו/שחזור): גודל אצווה ל-bulk_write ומספר threads לנרמול
+    BULK_SAVE_BATCH_SIZE: int = 500
+    BULK_SAVE_WORKERS: int = 4
 
     # AI Code Review settings
     AI_PROVIDER: str = "ollama"  # ollama/openai/claude
@@ -114,6 +117,8 @@ def load_config() -> BotConfig:
         BOT_LABEL=os.getenv('BOT_LABEL', 'CodeBot'),
         DRIVE_ADD_HASH=os.getenv('DRIVE_ADD_HASH', 'false').lower() == 'true',
         NORMALIZE_CODE_ON_SAVE=os.getenv('NORMALIZE_CODE_ON_SAVE', 'true').lower() == 'true',
+        BULK_SAVE_BATCH_SIZE=int(os.getenv('BULK_SAVE_BATCH_SIZE', '500') or '500'),
+        BULK_SAVE_WORKERS=int(os.getenv('BULK_SAVE_WORKERS', '4') or '4'),
         MAINTENANCE_MODE=os.getenv('MAINTENANCE_MODE', 'false').lower() == 'true',
         MAINTENANCE_MESSAGE=os.getenv('MAINTENANCE_MESSAGE', "🚀 אנחנו מעלים עדכון חדש!\nהבוט יחזור לפעול ממש בקרוב (1 - 3 דקות)"),
         MAINTENANCE_AUTO_WARMUP_SECS=int(os.getenv('MAINTENANCE_AUTO_WARMUP_SECS', '180')),
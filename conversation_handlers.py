@@ -22,10 +22,10 @@ from utils import get_language_emoji as get_file_emoji
 from user_stats import user_stats
 from typing import List, Optional
 from html import escape as html_escape
-from utils import TelegramUtils
+from utils import AsyncUtils, TelegramUtils
 from services import code_service
 from i18n.strings_he import MAIN_MENU as MAIN_KEYBOARD
-from handlers.pagination import build_pagination_row
+from handlers.pagination import build_pagination_row, page_cursor, remember_page_cursor
 from config import config
 
 async def _safe_edit_message_text(query, text: str, reply_markup=None, parse_mode=None) -> None:
@@ -571,7 +571,7 @@ async def show_regular_files_callback(update: Update, context: ContextTypes.DEFA
     
     try:
         # עימוד אמיתי בצד ה-DB + ללא החזרת תוכן קוד
-        files, total_files = db.get_regular_files_paginated(user_id, page=1, per_page=FILES_PAGE_SIZE)
+        files, total_files = await AsyncUtils.aio_db(db).get_regular_files_paginated(user_id, page=1, per_page=FILES_PAGE_SIZE)
         if not files:
             await query.edit_message_text(
                 "📂 אין לך קבצים שמורים עדיין.\n"
@@ -590,6 +590,7 @@ async def show_regular_files_callback(update: Update, context: ContextTypes.DEFA
             page = 1
             context.user_data['files_last_page'] = page
             context.user_data['files_origin'] = { 'type': 'regular' }
+            remember_page_cursor(context.user_data, 'files_page_cursors', page, files)
             # אתחול מצב מחיקה מרובה
             context.user_data['rf_multi_delete'] = False
             context.user_data['rf_selected_ids'] = []
@@ -653,7 +654,16 @@ async def show_regular_files_page_callback(update: Update, context: ContextTypes
         except Exception:
             requested_page = context.user_data.get('files_last_page') or 1
         requested_page = max(1, requested_page)
-        files, total_files = db.get_regular_files_paginated(user_id, page=requested_page, per_page=FILES_PAGE_SIZE)
+        # מעבר לעמוד הבא ממשיך מה-cursor של העמוד הקודם (ללא skip); אחרת לפי מספר עמוד
+        after = page_cursor(context.user_data, 'files_page_cursors', requested_page)
+        files, total_files = [], 0
+        if after:
+            files, total_files = await AsyncUtils.aio_db(db).get_regular_files_paginated(
+                user_id, page=requested_page, per_page=FILES_PAGE_SIZE, after=after
+            )
+        if not files:
+            after = None
+            files, total_files = await AsyncUtils.aio_db(db).get_regular_files_paginated(user_id, page=requested_page, per_page=FILES_PAGE_SIZE)
         if total_files == 0:
             # אם אין קבצים, הצג הודעה וכפתור חזרה לתת־התפריט של הקבצים
             await query.edit_message_text(
@@ -666,9 +676,13 @@ async def show_regular_files_page_callback(update: Update, context: ContextTypes
 
         # חישוב מספר העמודים והידוק 'page_used' לעמוד חוקי, תואם לפריטים שחזרו מה-DB
         total_pages = (total_files + FILES_PAGE_SIZE - 1) // FILES_PAGE_SIZE if total_files > 0 else 1
+        if after:
+            # הסה"כ משוער — העמוד שהגענו אליו לפי cursor קיים בוודאות
+            total_pages = max(total_pages, requested_page)
         page_used = min(max(1, requested_page), total_pages)
         context.user_data['files_last_page'] = page_used
         context.user_data['files_origin'] = { 'type': 'regular' }
+        remember_page_cursor(context.user_data, 'files_page_cursors', page_used, files)
 
         # בנה מקלדת לדף המבוקש
         keyboard = []
@@ -759,8 +773,18 @@ async def show_recycle_bin(update: Update, context: ContextTypes.DEFAULT_TYPE) -
             page = 1
         from database import db
         page = max(1, page)
-        items, total = db._get_repo().list_deleted_files(user_id, page=page, per_page=RECYCLE_PAGE_SIZE)
+        repo = AsyncUtils.aio_db(db._get_repo())
+        after = page_cursor(context.user_data, 'recycle_page_cursors', page)
+        items, total = [], 0
+        if after:
+            items, total = await repo.list_deleted_files(user_id, page=page, per_page=RECYCLE_PAGE_SIZE, after=after)
+        if not items:
+            after = None
+            items, total = await repo.list_deleted_files(user_id, page=page, per_page=RECYCLE_PAGE_SIZE)
         total_pages = (total + RECYCLE_PAGE_SIZE - 1) // RECYCLE_PAGE_SIZE if total > 0 else 1
+        if after:
+            total_pages = max(total_pages, page)
+        remember_page_cursor(context.user_data, 'recycle_page_cursors', page, items, field='deleted_at')
         keyboard = []
         for it in items:
             fid = str(it.get('_id') or '')
@@ -2494,12 +2518,13 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
             context.user_data['files_origin'] = { 'type': 'by_repo', 'tag': tag }
             from database import db
             user_id = update.effective_user.id
-            files, total = db.get_user_files_by_repo(user_id, tag, page=1, per_page=FILES_PAGE_SIZE)
+            files, total = await AsyncUtils.aio_db(db).get_user_files_by_repo(user_id, tag, page=1, per_page=FILES_PAGE_SIZE)
             if not files:
                 await query.edit_message_text("ℹ️ אין קבצים עבור התגית הזו.")
                 return ConversationHandler.END
             # נשמור את מספר העמוד הנוכחי עבור ניווט חזרה
             context.user_data['files_last_page'] = 1
+            remember_page_cursor(context.user_data, 'by_repo_page_cursors', 1, files, scope=tag)
             keyboard = []
             context.user_data['files_cache'] = {}
             start_index = 0
@@ -2598,7 +2623,15 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
             context.user_data['files_last_page'] = page
             from database import db
             user_id = update.effective_user.id
-            files, total = db.get_user_files_by_repo(user_id, tag, page=page, per_page=FILES_PAGE_SIZE)
+            after = page_cursor(context.user_data, 'by_repo_page_cursors', page, scope=tag)
+            files, total = [], 0
+            if after:
+                files, total = await AsyncUtils.aio_db(db).get_user_files_by_repo(
+                    user_id, tag, page=page, per_page=FILES_PAGE_SIZE, after=after
+                )
+            if not files:
+                files, total = await AsyncUtils.aio_db(db).get_user_files_by_repo(user_id, tag, page=page, per_page=FILES_PAGE_SIZE)
+            remember_page_cursor(context.user_data, 'by_repo_page_cursors', page, files, scope=tag)
             keyboard = []
             context.user_data['files_cache'] = {}
             start_index = (page - 1) * FILES_PAGE_SIZE
@@ -0,0 +1,131 @@
+"""
+פעילות יומית של משתמשים (user_daily_activity)
+Day-bucketed user activity counters
+
+מסמך אחד לכל (user_id, day) עם מונה הפעולות של אותו יום, במקום מערך usage_days
+שגדל לנצח על מסמך המשתמש. סטטיסטיקות שבועיות/יומיות הן אגרגציה על טווח ימים
+באינדקס, והמסמכים הישנים נמחקים ב-TTL (DAILY_ACTIVITY_RETENTION_DAYS).
+
+- הכתיבה היא upsert עם $inc ל-(user_id, day) — עוברת דרך activity_buffer.
+- migrate_usage_days ממיר פעם אחת את מערכי usage_days הקיימים ומסיר אותם.
+אוסף time-series של MongoDB לא מתאים כאן: הוא אינו תומך ב-upsert/$inc על מסמך קיים.
+"""
+
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+try:
+    from pymongo import UpdateOne  # type: ignore
+except Exception:  # pymongo אינו זמין בסביבות בדיקה קלות
+    UpdateOne = None  # type: ignore[assignment]
+
+logger = logging.getLogger(__name__)
+
+DAILY_ACTIVITY_COLLECTION_NAME = "user_daily_activity"
+# מסמך ב-db.migrations שמסמן שמערכי usage_days הומרו
+MIGRATION_ID = "user_daily_activity"
+
+try:
+    # כמה ימים נשמר מסמך יומי (0 = ללא מחיקה)
+    DAILY_ACTIVITY_RETENTION_DAYS = max(0, int(os.getenv("DAILY_ACTIVITY_RETENTION_DAYS", "400")))
+except Exception:
+    DAILY_ACTIVITY_RETENTION_DAYS = 400
+
+
+def day_start(moment: Optional[datetime] = None) -> datetime:
+    """תחילת היום (UTC) — מפתח ה-day של המסמכים"""
+    moment = moment or datetime.now(timezone.utc)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    moment = moment.astimezone(timezone.utc)
+    return datetime(moment.year, moment.month, moment.day, tzinfo=timezone.utc)
+
+
+def activity_by_user(daily_collection: Any, since: datetime) -> List[Dict[str, Any]]:
+    """לכל משתמש שהיה פעיל מאז `since`: בכמה ימים ובכמה פעולות (אגרגציה על אינדקס day)"""
+    pipeline = [
+        {"$match": {"day": {"$gte": day_start(since)}}},
+        {"$group": {"_id": "$user_id", "days": {"$sum": 1}, "actions": {"$sum": "$actions"}}},
+    ]
+    return [
+        {"user_id": row.get("_id"), "days": int(row.get("days") or 0), "actions": int(row.get("actions") or 0)}
+        for row in daily_collection.aggregate(pipeline)
+        if isinstance(row, dict)
+    ]
+
+
+def count_active_users(daily_collection: Any, since: datetime) -> int:
+    """מספר המשתמשים הייחודיים שהיו פעילים מאז `since`"""
+    rows = list(daily_collection.aggregate([
+        {"$match": {"day": {"$gte": day_start(since)}}},
+        {"$group": {"_id": "$user_id"}},
+        {"$count": "n"},
+    ]))
+    return int(rows[0].get("n") or 0) if rows and isinstance(rows[0], dict) else 0
+
+
+def migrate_usage_days(users_collection: Any, daily_collection: Any, batch_size: int = 500) -> int:
+    """המרת מערכי usage_days למסמכים יומיים והסרתם ממסמכי המשתמשים; מחזיר כמה ימים נכתבו.
+
+    מספר הפעולות של יום ישן אינו ידוע ולכן נרשם כ-1 ($setOnInsert — יום שכבר נספר לא משתנה).
+    """
+    written = 0
+    ops: List[Any] = []
+    done_users: List[Any] = []
+    use_bulk = UpdateOne is not None and hasattr(daily_collection, "bulk_write")
+
+    def _flush() -> None:
+        nonlocal written
+        if ops:
+            if use_bulk:
+                daily_collection.bulk_write(ops, ordered=False)
+            else:
+                for flt, update in ops:
+                    daily_collection.update_one(flt, update, upsert=True)
+            written += len(ops)
+            ops.clear()
+        if done_users:
+            users_collection.update_many({"user_id": {"$in": list(done_users)}}, {"$unset": {"usage_days": ""}})
+            done_users.clear()
+
+    cursor = users_collection.find({"usage_days": {"$exists": True}}, {"user_id": 1, "usage_days": 1})
+    for user in cursor:
+        user_id = user.get("user_id")
+        for raw in user.get("usage_days") or []:
+            try:
+                day = datetime.strptime(str(raw), "%Y-%m-%d").replace(tzinfo=timezone.utc)
+            except ValueError:
+                continue
+            flt = {"user_id": user_id, "day": day}
+            update = {"$setOnInsert": {"actions": 1}}
+            ops.append(UpdateOne(flt, update, upsert=True) if use_bulk else (flt, update))
+        done_users.append(user_id)
+        if len(ops) >= batch_size or len(done_users) >= batch_size:
+            _flush()
+    _flush()
+    return written
+
+
+def is_migrated(db: Any) -> bool:
+    try:
+        return db.migrations.find_one({"_id": MIGRATION_ID}) is not None
+    except Exception as e:
+        logger.debug(f"daily activity migration check failed: {e}")
+        return False
+
+
+def mark_migrated(db: Any) -> None:
+    db.migrations.update_one(
+        {"_id": MIGRATION_ID},
+        {"$set": {"completed_at": datetime.now(timezone.utc)}},
+        upsert=True,
+    )
+
+
+def retention_seconds() -> Optional[int]:
+    """expireAfterSeconds לאינדקס ה-TTL על day (None = ללא מחיקה)"""
+    if not DAILY_ACTIVITY_RETENTION_DAYS:
+        return None
+    return int(timedelta(days=DAILY_ACTIVITY_RETENTION_DAYS).total_seconds())
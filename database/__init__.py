@@ -1,4 +1,4 @@
-from .models import CodeSnippet, LargeFile
+from .models import CodeSnippet, LargeFile, SnippetRef
 from .manager import DatabaseManager
 
 # יצירת אינסטנס גלובלי לשמירה על תאימות לאחור
@@ -0,0 +1,293 @@
+"""
+גישה אסינכרונית למסד הנתונים (Motor) עבור ה-handlers של הבוט
+Async data path backed by Motor
+
+ה-handlers רצים על לולאת asyncio של python-telegram-bot, וקריאה ל-PyMongo הסינכרוני
+בתוכם חוסמת את הלולאה (ואת כל שאר המשתמשים) לכל משך ה-round trip.
+
+- AsyncRepository: התאום של Repository. הקריאות החמות (צפייה בקובץ, גרסאות, רשימות
+  ועימוד, קבצים גדולים) ממומשות ישירות ב-Motor, עם אותם מפתחות cache ואותה
+  אינוולידציה לפי דור. כל מתודה אחרת (כתיבות עם טרנזקציות/code_blobs/latest,
+  אגרגציות ה-fallback) רצה על ה-Repository הסינכרוני ב-thread — הלוגיקה נשארת
+  במקום אחד והלולאה לא נחסמת.
+- AsyncDatabase: המתאם שמאחורי `db.aio` — `await db.aio.get_file(...)`; גם עטיפות
+  ה-DatabaseManager (כמו get_snippet) זמינות בו.
+בלי motor מותקן (או במצב no-op) הכל רץ דרך threads. ה-API הסינכרוני נשאר עבור
+ה-webapp והסקריפטים.
+"""
+
+import logging
+from datetime import timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    from motor.motor_asyncio import AsyncIOMotorClient  # type: ignore
+except Exception:  # motor אופציונלי; בלעדיו הקריאות רצות ב-thread
+    AsyncIOMotorClient = None  # type: ignore[assignment]
+
+from cache_manager import async_cached
+from config import config
+from pagination import keyset_sort, with_keyset
+from snippets_latest import LATEST_COLLECTION_NAME, as_listing_doc
+from utils import ThreadedProxy
+
+from .repository import _LISTING_FIELDS, _NON_REPO_TAGS, ObjectId
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncRepository:
+    """CRUD אסינכרוני מעל Motor, עם אותו ממשק כמו Repository."""
+
+    def __init__(self, manager: Any, motor_db: Any):
+        self.manager = manager
+        self.collection = motor_db.code_snippets
+        self.large_files_collection = motor_db.large_files
+        self.latest_collection = motor_db[LATEST_COLLECTION_NAME]
+        self._threaded = ThreadedProxy(manager._get_repo())
+
+    def __getattr__(self, name: str) -> Any:
+        # מתודה שאין לה מימוש Motor — Repository הסינכרוני ב-thread
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self._threaded, name)
+
+    def _latest(self) -> Any:
+        """אוסף הגרסה האחרונה כשה-backfill שלו הושלם (כמו Repository._latest)"""
+        return self.latest_collection if getattr(self.manager, "latest_ready", False) else None
+
+    async def _hydrate(self, docs: List[Dict]) -> List[Dict]:
+        """השלמת code מ-code_blobs (BlobStore סינכרוני — רק כשיש מה להשלים, ב-thread)"""
+        if any(isinstance(d, dict) and "code" not in d and d.get("content_hash") for d in docs):
+            await self._threaded._hydrate(docs)
+        return docs
+
+    async def _hydrate_one(self, doc: Optional[Dict]) -> Optional[Dict]:
+        if isinstance(doc, dict):
+            await self._hydrate([doc])
+        return doc
+
+    async def _versions_by_ids(self, ids: List[Any]) -> List[Dict]:
+        if not ids:
+            return []
+        docs = await self.collection.find({"_id": {"$in": list(ids)}}).to_list(length=None)
+        by_id = {d.get("_id"): d for d in docs}
+        return await self._hydrate([by_id[i] for i in ids if i in by_id])
+
+    async def _approx_count(self, user_id: int, name: str, collection: Any, match: Dict[str, Any]) -> int:
+        # אותו מפתח cache כמו ב-Repository; הספירה עצמה (כשחסרה) רצה ב-thread מול PyMongo
+        return await self._threaded._approx_count(user_id, name, lambda: collection.count_documents(match))
+
+    @async_cached(expire_seconds=180, key_prefix="latest_version")
+    async def get_latest_version(self, user_id: int, file_name: str) -> Optional[Dict]:
+        try:
+            return await self._hydrate_one(await self.collection.find_one(
+                {"user_id": user_id, "file_name": file_name, "is_active": True},
+                sort=[("version", -1)],
+            ))
+        except Exception as e:
+            logger.error(f"שגיאה בקבלת גרסה אחרונה: {e}")
+            return None
+
+    async def get_file(self, user_id: int, file_name: str) -> Optional[Dict]:
+        try:
+            return await self._hydrate_one(await self.collection.find_one(
+                {"user_id": user_id, "file_name": file_name, "is_active": True},
+                sort=[("version", -1)],
+            ))
+        except Exception as e:
+            logger.error(f"שגיאה בקבלת קובץ: {e}")
+            return None
+
+    async def get_all_versions(self, user_id: int, file_name: str) -> List[Dict]:
+        try:
+            return await self._hydrate(await self.collection.find(
+                {"user_id": user_id, "file_name": file_name, "is_active": True},
+                sort=[("version", -1)],
+            ).to_list(length=None))
+        except Exception as e:
+            logger.error(f"שגיאה בקבלת כל הגרסאות: {e}")
+            return []
+
+    async def get_version(self, user_id: int, file_name: str, version: int) -> Optional[Dict]:
+        try:
+            return await self._hydrate_one(await self.collection.find_one(
+                {"user_id": user_id, "file_name": file_name, "version": version, "is_active": True}
+            ))
+        except Exception as e:
+            logger.error(f"שגיאה בקבלת גרסה {version} עבור {file_name}: {e}")
+            return None
+
+    async def get_file_by_id(self, file_id: str) -> Optional[Dict]:
+        try:
+            return await self._hydrate_one(await self.collection.find_one({"_id": ObjectId(file_id)}))
+        except Exception as e:
+            logger.error(f"שגיאה בקבלת קובץ לפי _id: {e}")
+            return None
+
+    async def get_user_files(self, user_id: int, limit: int = 50, fields: Optional[List[str]] = None) -> List[Dict]:
+        if fields is not None:
+            # fields= מחזיר SnippetRef עם loader סינכרוני — נשאר במימוש הסינכרוני, שמחזיק
+            # ב-cache רק את המטא-דאטה ועוטף אותה מחדש בכל קריאה
+            return await self._threaded.get_user_files(user_id, limit, fields=fields)
+        return await self._user_file_docs(user_id, limit)
+
+    @async_cached(expire_seconds=120, key_prefix="user_files", stale_ttl=60)
+    async def _user_file_docs(self, user_id: int, limit: int = 50) -> List[Dict]:
+        latest = self._latest()
+        if latest is None:
+            return await self._threaded.get_user_files(user_id, limit)
+        try:
+            pointers = await latest.find(
+                {"user_id": user_id, "is_active": True}, {"_id": 0, "snippet_id": 1}
+            ).sort("updated_at", -1).limit(int(limit)).to_list(length=None)
+            return await self._versions_by_ids([d.get("snippet_id") for d in pointers])
+        except Exception as e:
+            logger.error(f"שגיאה בקבלת קבצי משתמש: {e}")
+            return []
+
+    @async_cached(expire_seconds=120, key_prefix="user_file_names")
+    async def get_user_file_names(self, user_id: int, limit: int = 1000) -> List[str]:
+        latest = self._latest()
+        if latest is None:
+            return await self._threaded.get_user_file_names(user_id, limit)
+        try:
+            docs = await latest.find(
+                {"user_id": user_id, "is_active": True}, {"_id": 0, "file_name": 1}
+            ).sort("updated_at", -1).limit(max(1, int(limit or 1000))).to_list(length=None)
+            return [d.get("file_name") for d in docs if isinstance(d, dict) and d.get("file_name")]
+        except Exception as e:
+            logger.error(f"get_user_file_names failed: {e}")
+            return []
+
+    async def _latest_page(self, latest: Any, user_id: int, count_name: str, match: Dict[str, Any],
+                           page: int, per_page: int, after: Optional[str]) -> Tuple[List[Dict], int]:
+        total = await self._approx_count(user_id, count_name, self.manager.latest_collection, match)
+        cursor = latest.find(with_keyset(match, after, id_field="snippet_id"), _LISTING_FIELDS) \
+            .sort(keyset_sort(id_field="snippet_id"))
+        if not after:
+            total_pages = (total + per_page - 1) // per_page if total > 0 else 1
+            cursor = cursor.skip((min(page, total_pages) - 1) * per_page)
+        docs = await cursor.limit(per_page).to_list(length=per_page)
+        return [as_listing_doc(d) for d in docs], total
+
+    @async_cached(expire_seconds=20, key_prefix="files_by_repo")
+    async def get_user_files_by_repo(self, user_id: int, repo_tag: str, page: int = 1, per_page: int = 50,
+                                     after: Optional[str] = None) -> Tuple[List[Dict], int]:
+        latest = self._latest()
+        if latest is None:
+            return await self._threaded.get_user_files_by_repo(user_id, repo_tag, page, per_page, after=after)
+        try:
+            match = {"user_id": user_id, "is_active": True, "tags": repo_tag}
+            return await self._latest_page(latest, user_id, f"repo:{repo_tag}", match,
+                                           max(1, int(page or 1)), per_page, after)
+        except Exception as e:
+            logger.error(f"שגיאה בקבלת קבצי ריפו: {e}")
+            return [], 0
+
+    @async_cached(expire_seconds=20, key_prefix="regular_files")
+    async def get_regular_files_paginated(self, user_id: int, page: int = 1, per_page: int = 10,
+                                          after: Optional[str] = None) -> Tuple[List[Dict], int]:
+        latest = self._latest()
+        if latest is None:
+            return await self._threaded.get_regular_files_paginated(user_id, page, per_page, after=after)
+        try:
+            match = dict(_NON_REPO_TAGS, user_id=user_id, is_active=True)
+            return await self._latest_page(latest, user_id, "regular", match,
+                                           max(1, int(page or 1)), max(1, int(per_page or 10)), after)
+        except Exception as e:
+            logger.error(f"get_regular_files_paginated failed: {e}")
+            return [], 0
+
+    async def get_large_file(self, user_id: int, file_name: str) -> Optional[Dict]:
+        try:
+            return await self.large_files_collection.find_one(
+                {"user_id": user_id, "file_name": file_name, "is_active": True}
+            )
+        except Exception as e:
+            logger.error(f"שגיאה בקבלת קובץ גדול: {e}")
+            return None
+
+    async def get_large_file_by_id(self, file_id: str) -> Optional[Dict]:
+        try:
+            return await self.large_files_collection.find_one({"_id": ObjectId(file_id)})
+        except Exception as e:
+            logger.error(f"שגיאה בקבלת קובץ גדול לפי ID: {e}")
+            return None
+
+    async def get_user_large_files(self, user_id: int, page: int = 1, per_page: int = 8,
+                                   after: Optional[str] = None,
+                                   fields: Optional[List[str]] = None) -> Tuple[List[Dict], int]:
+        if fields is not None:
+            return await self._threaded.get_user_large_files(user_id, page, per_page, after=after, fields=fields)
+        try:
+            match = {"user_id": user_id, "is_active": True}
+            if after:
+                skip = 0
+                total = await self._approx_count(user_id, "large_files", self.manager.large_files_collection, match)
+            else:
+                skip = (page - 1) * per_page
+                total = await self.large_files_collection.count_documents(match)
+            cursor = self.large_files_collection.find(
+                with_keyset(match, after, field="created_at"),
+                sort=keyset_sort("created_at"),
+            )
+            return await cursor.skip(skip).limit(per_page).to_list(length=per_page), int(total)
+        except Exception as e:
+            logger.error(f"שגיאה בקבלת קבצים גדולים: {e}")
+            return [], 0
+
+
+class AsyncDatabase:
+    """המתאם שמאחורי `db.aio`: מתודות Motor מ-AsyncRepository, וכל השאר מ-DatabaseManager ב-thread."""
+
+    is_async_facade = True
+
+    def __init__(self, manager: Any):
+        self._manager = manager
+        self._threaded = ThreadedProxy(manager)
+        self._client = None
+        self._repo: Optional[AsyncRepository] = None
+
+    def _get_repo(self) -> Optional[AsyncRepository]:
+        """AsyncRepository כשיש motor וחיבור PyMongo פעיל (לא no-op); אחרת None"""
+        if self._repo is not None:
+            return self._repo
+        if AsyncIOMotorClient is None or getattr(self._manager, "client", None) is None:
+            return None
+        try:
+            # הלקוח נוצר בעצמאות מלקוח PyMongo ונקשר ללולאה בשימוש הראשון (בתוך handler)
+            self._client = AsyncIOMotorClient(
+                config.MONGODB_URL,
+                maxPoolSize=50,
+                minPoolSize=5,
+                maxIdleTimeMS=30000,
+                waitQueueTimeoutMS=5000,
+                serverSelectionTimeoutMS=3000,
+                socketTimeoutMS=20000,
+                connectTimeoutMS=10000,
+                retryWrites=True,
+                retryReads=True,
+                tz_aware=True,
+                tzinfo=timezone.utc,
+            )
+            self._repo = AsyncRepository(self._manager, self._client[config.DATABASE_NAME])
+        except Exception as e:
+            logger.warning(f"יצירת לקוח Motor נכשלה — הקריאות ירוצו ב-thread: {e}")
+            self._client = None
+            return None
+        return self._repo
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        repo = self._get_repo()
+        if repo is not None and name in vars(AsyncRepository):
+            return getattr(repo, name)
+        return getattr(self._threaded, name)
+
+    def close(self) -> None:
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+            self._repo = None
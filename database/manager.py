@@ -1,5 +1,6 @@
 import logging
 import os
+import threading
 from types import SimpleNamespace
 from datetime import timezone
 from typing import Any, Dict, List, Optional, Tuple
@@ -14,7 +15,12 @@ except Exception:  # ModuleNotFoundError or any import-time error
     TEXT = "text"  # type: ignore
     _PYMONGO_AVAILABLE = False
 
+from blob_store import BLOB_COLLECTION_NAME, BlobStore
 from config import config
+from mongo_indexes import CODE_SNIPPETS_INDEXES, LARGE_FILES_INDEXES, index_models
+from .profiler import ProfiledCollection, QueryProfiler, profiling_enabled
+from daily_activity import DAILY_ACTIVITY_COLLECTION_NAME, is_migrated, mark_migrated, migrate_usage_days, retention_seconds
+from snippets_latest import LATEST_COLLECTION_NAME, backfill_latest, is_latest_ready, mark_latest_ready
 
 logger = logging.getLogger(__name__)
 
@@ -29,7 +35,19 @@ class DatabaseManager:
         self.large_files_collection = None
         self.backup_ratings_collection = None
         self.internal_shares_collection = None
+        self.search_index_collection = None
+        # גרסה אחרונה לכל קובץ (ראו snippets_latest); הרשימות קוראות ממנו רק אחרי שה-backfill הושלם
+        self.latest_collection = None
+        self.latest_ready = False
+        # מונה פעולות לכל (user_id, day) — ראו daily_activity
+        self.daily_activity_collection = None
+        # תוכן גרסאות שהוחלפו, לפי hash (ראו blob_store); None = הגרסאות שומרות code במלואו
+        self.blobs = None
         self._repo = None
+        # DB_PROFILING=1: זמני ריצה ו-explain לכל אתר קריאה (ראו database/profiler.py)
+        self.profiler = None
+        # גישה אסינכרונית (Motor) ל-handlers — נוצרת בשימוש הראשון, ראו aio
+        self._aio = None
         self.connect()
 
     def connect(self):
@@ -82,6 +100,9 @@ class DatabaseManager:
             self.collection = NoOpCollection()
             self.large_files_collection = NoOpCollection()
             self.backup_ratings_collection = NoOpCollection()
+            self.search_index_collection = NoOpCollection()
+            self.latest_collection = NoOpCollection()
+            self.daily_activity_collection = NoOpCollection()
             logger.info("DB disabled (docs/CI mode) — using no-op collections")
 
         # אם pymongo לא מותקן (למשל בסביבת בדיקות קלה) — עבור למצב no-op
@@ -114,8 +135,18 @@ class DatabaseManager:
             self.large_files_collection = self.db.large_files
             self.backup_ratings_collection = self.db.backup_ratings
             self.internal_shares_collection = self.db.internal_shares
+            # אינדקס חיפוש מתמשך (מילים/פונקציות לכל קובץ) — משותף לכל התהליכים
+            self.search_index_collection = self.db.search_index
+            self.latest_collection = self.db[LATEST_COLLECTION_NAME]
+            self.daily_activity_collection = self.db[DAILY_ACTIVITY_COLLECTION_NAME]
+            if str(os.getenv("CODE_BLOB_STORE", "true")).lower() in {"1", "true", "yes"}:
+                self.blobs = BlobStore(self.db[BLOB_COLLECTION_NAME])
             self.client.admin.command('ping')
             self._create_indexes()
+            self._ensure_latest_collection()
+            self._ensure_daily_activity()
+            if profiling_enabled():
+                self._enable_profiling()
             logger.info("התחברות למסד הנתונים הצליחה עם Connection Pooling מתקדם")
         except Exception as e:
             if disable_db:
@@ -132,80 +163,18 @@ class DatabaseManager:
             self._repo = Repository(self)
         return self._repo
 
-    def _create_indexes(self):
-        indexes = [
-            IndexModel([("user_id", ASCENDING)]),
-            IndexModel([("file_name", ASCENDING)]),
-            IndexModel([("programming_language", ASCENDING)]),
-            IndexModel([("tags", ASCENDING)]),
-            IndexModel([("created_at", DESCENDING)]),
-            IndexModel([("user_id", ASCENDING), ("file_name", ASCENDING), ("version", DESCENDING)]),
-            # אינדקס משופר לתמיכה במיון file_name, version לאחר match על user_id,is_active
-            IndexModel([
-                ("user_id", ASCENDING),
-                ("is_active", ASCENDING),
-                ("file_name", ASCENDING),
-                ("version", DESCENDING),
-            ], name="user_active_file_latest_idx"),
-            IndexModel([
-                ("user_id", ASCENDING),
-                ("programming_language", ASCENDING),
-                ("created_at", DESCENDING),
-            ], name="user_lang_date_idx"),
-            IndexModel([
-                ("user_id", ASCENDING),
-                ("tags", ASCENDING),
-                ("updated_at", DESCENDING),
-            ], name="user_tags_updated_idx"),
-            IndexModel([
-                ("user_id", ASCENDING),
-                ("is_active", ASCENDING),
-                ("programming_language", ASCENDING),
-            ], name="user_active_lang_idx"),
-            IndexModel([
-                ("user_id", ASCENDING),
-                ("is_active", ASCENDING),
-                ("updated_at", DESCENDING),
-            ], name="user_active_recent_idx"),
-            IndexModel([
-                ("programming_language", ASCENDING),
-                ("tags", ASCENDING),
-                ("created_at", DESCENDING),
-            ], name="lang_tags_date_idx"),
-            IndexModel([("code", TEXT), ("description", TEXT), ("file_name", TEXT)], name="full_text_search_idx"),
-            IndexModel([("deleted_expires_at", ASCENDING)], name="deleted_ttl", expireAfterSeconds=0),
-        ]
+    @property
+    def aio(self):
+        """גישה אסינכרונית ל-handlers: `await db.aio.get_file(...)` (Motor, ראו async_repository)"""
+        if self._aio is None:
+            from .async_repository import AsyncDatabase  # local import to avoid circular dependency
+            self._aio = AsyncDatabase(self)
+        return self._aio
 
-        large_files_indexes = [
-            IndexModel([("user_id", ASCENDING)]),
-            IndexModel([("file_name", ASCENDING)]),
-            IndexModel([("programming_language", ASCENDING)]),
-            IndexModel([("created_at", DESCENDING)]),
-            IndexModel([("file_size", ASCENDING)]),
-            IndexModel([("lines_count", ASCENDING)]),
-            IndexModel([("user_id", ASCENDING), ("file_name", ASCENDING)]),
-            IndexModel([
-                ("user_id", ASCENDING),
-                ("programming_language", ASCENDING),
-                ("file_size", ASCENDING),
-            ], name="user_lang_size_idx"),
-            IndexModel([
-                ("user_id", ASCENDING),
-                ("is_active", ASCENDING),
-                ("created_at", DESCENDING),
-            ], name="user_active_date_large_idx"),
-            IndexModel([
-                ("programming_language", ASCENDING),
-                ("file_size", ASCENDING),
-                ("lines_count", ASCENDING),
-            ], name="lang_size_lines_idx"),
-            IndexModel([
-                ("user_id", ASCENDING),
-                ("tags", ASCENDING),
-                ("file_size", DESCENDING),
-            ], name="user_tags_size_idx"),
-            IndexModel([("deleted_expires_at", ASCENDING)], name="deleted_ttl", expireAfterSeconds=0),
-        ]
+    def _create_indexes(self):
+        # הסט המומלץ (ראו mongo_indexes.py ו-scripts/index_advisor.py)
+        indexes = index_models(CODE_SNIPPETS_INDEXES)
+        large_files_indexes = index_models(LARGE_FILES_INDEXES)
 
         # backup_ratings indexes
         backup_ratings_indexes = [
@@ -227,6 +196,49 @@ class DatabaseManager:
                     IndexModel([("expires_at", ASCENDING)], name="expires_ttl", expireAfterSeconds=0),
                 ]
                 self.internal_shares_collection.create_indexes(internal_shares_indexes)
+            # אינדקס החיפוש: רשומה אחת לכל (user_id, file_name) + סנכרון דלתא לפי indexed_at
+            if self.search_index_collection is not None:
+                search_index_indexes = [
+                    IndexModel([("user_id", ASCENDING), ("file_name", ASCENDING)], name="user_file_unique", unique=True),
+                    IndexModel([("user_id", ASCENDING), ("indexed_at", ASCENDING)], name="user_indexed_at_idx"),
+                ]
+                self.search_index_collection.create_indexes(search_index_indexes)
+            # גרסה אחרונה לכל קובץ: רשימות לפי עדכון אחרון, תגית (repo:) ושפה.
+            # snippet_id בסוף המפתח — שובר שוויון יציב לעימוד לפי מפתח (updated_at, snippet_id)
+            if self.latest_collection is not None:
+                latest_indexes = [
+                    IndexModel([("user_id", ASCENDING), ("file_name", ASCENDING)], name="user_file_unique", unique=True),
+                    IndexModel([
+                        ("user_id", ASCENDING),
+                        ("is_active", ASCENDING),
+                        ("updated_at", DESCENDING),
+                        ("snippet_id", DESCENDING),
+                    ], name="user_active_updated_keyset_idx"),
+                    IndexModel([
+                        ("user_id", ASCENDING),
+                        ("is_active", ASCENDING),
+                        ("tags", ASCENDING),
+                        ("updated_at", DESCENDING),
+                        ("snippet_id", DESCENDING),
+                    ], name="user_active_tags_updated_keyset_idx"),
+                    IndexModel([
+                        ("user_id", ASCENDING),
+                        ("is_active", ASCENDING),
+                        ("programming_language", ASCENDING),
+                        ("updated_at", DESCENDING),
+                        ("snippet_id", DESCENDING),
+                    ], name="user_active_lang_updated_keyset_idx"),
+                ]
+                self.latest_collection.create_indexes(latest_indexes)
+            # פעילות יומית: מסמך אחד ל-(user_id, day); day משמש גם לטווחי הסטטיסטיקות וגם ל-TTL
+            if self.daily_activity_collection is not None:
+                ttl = retention_seconds()
+                daily_indexes = [
+                    IndexModel([("user_id", ASCENDING), ("day", ASCENDING)], name="user_day_unique", unique=True),
+                    IndexModel([("day", ASCENDING)], name="day_ttl", expireAfterSeconds=ttl)
+                    if ttl else IndexModel([("day", ASCENDING)], name="day_idx"),
+                ]
+                self.daily_activity_collection.create_indexes(daily_indexes)
         except Exception as e:
             msg = str(e)
             if 'IndexOptionsConflict' in msg or 'already exists with a different name' in msg:
@@ -264,7 +276,57 @@ class DatabaseManager:
             else:
                 logger.warning(f"שגיאה ביצירת אינדקסים: {e}")
 
+    def _ensure_latest_collection(self):
+        """מילוי חד-פעמי של code_snippets_latest ברקע; עד שיסתיים הרשימות משתמשות באגרגציה"""
+        if is_latest_ready(self.db):
+            self.latest_ready = True
+            return
+        if str(os.getenv("LATEST_BACKFILL_ON_START", "true")).lower() not in {"1", "true", "yes"}:
+            return
+
+        def _run():
+            try:
+                written = backfill_latest(self.collection, self.latest_collection)
+                mark_latest_ready(self.db)
+                self.latest_ready = True
+                logger.info(f"code_snippets_latest backfill הושלם ({written} מסמכים)")
+            except Exception as e:
+                logger.warning(f"code_snippets_latest backfill נכשל: {e}")
+
+        threading.Thread(target=_run, name="latest-backfill", daemon=True).start()
+
+    def _ensure_daily_activity(self):
+        """המרה חד-פעמית של מערכי usage_days הישנים ל-user_daily_activity, ברקע"""
+        if is_migrated(self.db):
+            return
+
+        def _run():
+            try:
+                written = migrate_usage_days(self.db.users, self.daily_activity_collection)
+                mark_migrated(self.db)
+                logger.info(f"user_daily_activity: הומרו {written} ימי פעילות מ-usage_days")
+            except Exception as e:
+                logger.warning(f"user_daily_activity migration נכשלה: {e}")
+
+        threading.Thread(target=_run, name="daily-activity-migration", daemon=True).start()
+
+    def _enable_profiling(self):
+        self.profiler = QueryProfiler()
+        for attr in ("collection", "large_files_collection", "latest_collection"):
+            coll = getattr(self, attr, None)
+            if coll is not None:
+                setattr(self, attr, ProfiledCollection(coll, self.profiler))
+        logger.info("DB profiling פעיל — זמני שאילתות ותוכניות explain נאספים לפי אתר קריאה")
+
+    def profiling_report(self) -> List[Dict[str, Any]]:
+        """דו"ח הפרופיילר (רשימה ריקה כשהמצב כבוי)"""
+        return self.profiler.report() if self.profiler is not None else []
+
     def close(self):
+        if self.profiler is not None:
+            report = self.profiler.format_report()
+            if report:
+                logger.info(f"DB profiling — אתרי הקריאה היקרים ביותר:\n{report}")
         if self.client:
             self.client.close()
 
@@ -335,9 +397,24 @@ class DatabaseManager:
     def save_file(self, user_id: int, file_name: str, code: str, programming_language: str, extra_tags: List[str] = None) -> bool:
         return self._get_repo().save_file(user_id, file_name, code, programming_language, extra_tags)
 
+    def save_files_bulk(self, user_id: int, items: List[Dict[str, Any]], extra_tags: List[str] = None) -> List[Dict[str, Any]]:
+        return self._get_repo().save_files_bulk(user_id, items, extra_tags)
+
     def get_latest_version(self, user_id: int, file_name: str) -> Optional[Dict]:
         return self._get_repo().get_latest_version(user_id, file_name)
 
+    def get_line_range(self, user_id: int, file_name: str, start_line: int, count: int) -> Optional[Dict]:
+        return self._get_repo().get_line_range(user_id, file_name, start_line, count)
+
+    def get_latest_versions(self, user_id: int, file_names: List[str], projection: Optional[Dict[str, int]] = None) -> Dict[str, Dict]:
+        return self._get_repo().get_latest_versions(user_id, file_names, projection)
+
+    def sync_latest_snippet(self, user_id: int, file_name: str) -> bool:
+        return self._get_repo().sync_latest_snippet(user_id, file_name)
+
+    def rebuild_latest_collection(self, user_id: Optional[int] = None) -> int:
+        return self._get_repo().rebuild_latest_collection(user_id)
+
     def get_file(self, user_id: int, file_name: str) -> Optional[Dict]:
         return self._get_repo().get_file(user_id, file_name)
 
@@ -347,18 +424,29 @@ class DatabaseManager:
     def get_version(self, user_id: int, file_name: str, version: int) -> Optional[Dict]:
         return self._get_repo().get_version(user_id, file_name, version)
 
-    def get_user_files(self, user_id: int, limit: int = 50) -> List[Dict]:
-        return self._get_repo().get_user_files(user_id, limit)
+    def get_user_files(self, user_id: int, limit: int = 50, fields: Optional[List[str]] = None) -> List[Dict]:
+        return self._get_repo().get_user_files(user_id, limit, fields=fields)
+
+    def find_file_names(self, user_id: int, languages: Optional[List[str]] = None, tags: Optional[List[str]] = None,
+                        date_from=None, date_to=None, min_size: Optional[int] = None, max_size: Optional[int] = None,
+                        has_functions: Optional[bool] = None, has_classes: Optional[bool] = None) -> List[str]:
+        return self._get_repo().find_file_names(user_id, languages, tags, date_from, date_to, min_size, max_size,
+                                                has_functions, has_classes)
+
+    def iter_user_files(self, user_id: int, projection: Optional[Dict[str, int]] = None, batch_size: int = 100):
+        return self._get_repo().iter_user_files(user_id, projection, batch_size)
 
     def search_code(self, user_id: int, query: str, programming_language: str = None, tags: List[str] = None, limit: int = 20) -> List[Dict]:
         return self._get_repo().search_code(user_id, query, programming_language, tags, limit)
 
-    def get_user_files_by_repo(self, user_id: int, repo_tag: str, page: int = 1, per_page: int = 50) -> Tuple[List[Dict], int]:
-        return self._get_repo().get_user_files_by_repo(user_id, repo_tag, page, per_page)
+    def get_user_files_by_repo(self, user_id: int, repo_tag: str, page: int = 1, per_page: int = 50,
+                               after: Optional[str] = None) -> Tuple[List[Dict], int]:
+        return self._get_repo().get_user_files_by_repo(user_id, repo_tag, page, per_page, after=after)
 
     # רשימת "שאר הקבצים" בעימוד אמיתי מה-DB (ללא repo:*)
-    def get_regular_files_paginated(self, user_id: int, page: int = 1, per_page: int = 10) -> Tuple[List[Dict], int]:
-        return self._get_repo().get_regular_files_paginated(user_id, page, per_page)
+    def get_regular_files_paginated(self, user_id: int, page: int = 1, per_page: int = 10,
+                                    after: Optional[str] = None) -> Tuple[List[Dict], int]:
+        return self._get_repo().get_regular_files_paginated(user_id, page, per_page, after=after)
 
     def delete_file(self, user_id: int, file_name: str) -> bool:
         return self._get_repo().delete_file(user_id, file_name)
@@ -388,8 +476,10 @@ class DatabaseManager:
     def get_large_file_by_id(self, file_id: str) -> Optional[Dict]:
         return self._get_repo().get_large_file_by_id(file_id)
 
-    def get_user_large_files(self, user_id: int, page: int = 1, per_page: int = 8) -> Tuple[List[Dict], int]:
-        return self._get_repo().get_user_large_files(user_id, page, per_page)
+    def get_user_large_files(self, user_id: int, page: int = 1, per_page: int = 8,
+                             after: Optional[str] = None,
+                             fields: Optional[List[str]] = None) -> Tuple[List[Dict], int]:
+        return self._get_repo().get_user_large_files(user_id, page, per_page, after=after, fields=fields)
 
     def delete_large_file(self, user_id: int, file_name: str) -> bool:
         return self._get_repo().delete_large_file(user_id, file_name)
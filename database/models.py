@@ -1,7 +1,7 @@
 import logging
 from dataclasses import dataclass
 from datetime import datetime, timezone
-from typing import List
+from typing import Any, Callable, Dict, List, Optional
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +22,16 @@ class CodeSnippet:
     # שדות סל מיחזור: מתי נמחק ומתי יפוג התוקף למחיקה סופית
     deleted_at: datetime = None
     deleted_expires_at: datetime = None
+    # מאפיינים מחושבים מראש בזמן השמירה (ראו code_features); None במסמכים ישנים
+    size_bytes: int = None
+    line_count: int = None
+    function_count: int = None
+    class_count: int = None
+    symbols: List[str] = None
+    # sha256 של code; גרסאות ישנות שומרות רק אותו והתוכן נמצא ב-code_blobs (ראו blob_store)
+    content_hash: str = None
+    # היסטי שורות דחוסים לקריאת טווחים (ראו line_index); None במסמכים ישנים
+    line_index: bytes = None
 
     def __post_init__(self):
         if self.tags is None:
@@ -61,3 +71,48 @@ class LargeFile:
             self.file_size = len(self.content.encode('utf-8'))
             self.lines_count = len(self.content.split('\n'))
 
+
+
+class SnippetRef(dict):
+    """מסמך מטא-דאטה של קובץ שהתוכן שלו נטען רק בגישה הראשונה אליו.
+
+    מתנהג כמו dict רגיל (תאימות לכל הקוראים הקיימים), אך `code` (או `content` בקבצים
+    גדולים) לא הגיע עם הרשימה: ref['code'] / ref.get('code') / ref.code טוענים אותו
+    פעם אחת דרך `loader` ושומרים אותו במסמך. `'code' in ref` נשאר False עד הטעינה.
+    """
+
+    def __init__(self, doc: Dict[str, Any], loader: Callable[[], Optional[str]], body_field: str = "code"):
+        super().__init__(doc)
+        self._loader = loader
+        self._body_field = body_field
+
+    @property
+    def loaded(self) -> bool:
+        return dict.__contains__(self, self._body_field)
+
+    def _load(self) -> Optional[str]:
+        try:
+            value = self._loader()
+        except Exception as e:
+            logger.error(f"שגיאה בטעינה עצלה של {self._body_field} עבור {self.get('file_name')}: {e}")
+            value = None
+        if value is not None:
+            dict.__setitem__(self, self._body_field, value)
+        return value
+
+    def __missing__(self, key: str) -> Any:
+        if key == self._body_field:
+            value = self._load()
+            if value is not None:
+                return value
+        raise KeyError(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key == self._body_field and not self.loaded:
+            value = self._load()
+            return default if value is None else value
+        return dict.get(self, key, default)
+
+    @property
+    def code(self) -> Optional[str]:
+        return self.get(self._body_field)
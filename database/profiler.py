@@ -0,0 +1,260 @@
+"""
+פרופיילר שאילתות ל-DatabaseManager (DB_PROFILING=1)
+Per-call-site query profiler
+
+כשהמצב פעיל, האוספים העיקריים עטופים ב-ProfiledCollection: כל קריאה נרשמת לפי
+(אוסף, פעולה, אתר הקריאה בקוד) עם זמן ריצה, ועבור קריאות קריאה גם explain()
+(עד DB_PROFILING_EXPLAIN פעמים לכל אתר) — האינדקס שנבחר (או COLLSCAN) ויחס
+המסמכים שנסרקו למסמכים שהוחזרו. הדו"ח מודפס ללוג בסגירת ה-DatabaseManager
+וזמין דרך db.profiling_report(); יחד עם mongo_indexes.advise הוא מראה אילו
+שאילתות חסרות אינדקס ואילו אינדקסים אף שאילתה לא צריכה.
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    # כמה קריאות לכל אתר קריאה מקבלות explain (0 = זמנים בלבד)
+    PROFILING_EXPLAIN_LIMIT = max(0, int(os.getenv("DB_PROFILING_EXPLAIN", "3")))
+except Exception:
+    PROFILING_EXPLAIN_LIMIT = 3
+
+_READ_OPS = ("find_one", "count_documents", "aggregate", "distinct")
+_WRITE_OPS = ("insert_one", "insert_many", "update_one", "update_many", "replace_one",
+              "delete_one", "delete_many", "bulk_write", "find_one_and_update")
+# כמה דגימות זמן נשמרות לכל אתר לחישוב p95
+_MAX_SAMPLES = 200
+
+
+def profiling_enabled() -> bool:
+    return str(os.getenv("DB_PROFILING", "")).lower() in {"1", "true", "yes"}
+
+
+def _call_site() -> str:
+    """המסגרת הראשונה מחוץ למודול הזה ול-pymongo: 'repository.py:645 get_user_files'"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename != __file__ and "pymongo" not in filename:
+            return f"{os.path.basename(filename)}:{frame.f_lineno} {frame.f_code.co_name}"
+        frame = frame.f_back
+    return "?"
+
+
+def _find_key(doc: Any, key: str) -> Optional[Any]:
+    """חיפוש רקורסיבי של מפתח במסמך explain (המבנה שונה בין find, aggregate וגרסאות שרת)"""
+    if isinstance(doc, dict):
+        if key in doc:
+            return doc[key]
+        values = doc.values()
+    elif isinstance(doc, list):
+        values = doc
+    else:
+        return None
+    for value in values:
+        found = _find_key(value, key)
+        if found is not None:
+            return found
+    return None
+
+
+def _plan_indexes(plan: Any, out: List[str]) -> List[str]:
+    if isinstance(plan, dict):
+        if plan.get("stage") == "COLLSCAN":
+            out.append("COLLSCAN")
+        if plan.get("indexName"):
+            out.append(plan["indexName"])
+        for value in plan.values():
+            _plan_indexes(value, out)
+    elif isinstance(plan, list):
+        for value in plan:
+            _plan_indexes(value, out)
+    return out
+
+
+def summarize_explain(explain: Dict[str, Any]) -> Dict[str, Any]:
+    """האינדקסים בתוכנית הזוכה ומוני executionStats (מסמכים/מפתחות שנסרקו, הוחזרו)"""
+    stats = _find_key(explain, "executionStats") or {}
+    plan = _find_key(explain, "winningPlan") or {}
+    return {
+        "indexes": list(dict.fromkeys(_plan_indexes(plan, []))),
+        "docs_examined": int(stats.get("totalDocsExamined") or 0),
+        "keys_examined": int(stats.get("totalKeysExamined") or 0),
+        "returned": int(stats.get("nReturned") or 0),
+    }
+
+
+class QueryProfiler:
+    """צבירת זמני ריצה ותוכניות explain לפי (אוסף, פעולה, אתר קריאה)"""
+
+    def __init__(self, explain_limit: int = PROFILING_EXPLAIN_LIMIT):
+        self.explain_limit = explain_limit
+        self._stats: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, key: Tuple[str, str, str]) -> Dict[str, Any]:
+        entry = self._stats.get(key)
+        if entry is None:
+            entry = {"calls": 0, "total_ms": 0.0, "max_ms": 0.0, "samples": [], "explained": 0,
+                     "docs_examined": 0, "keys_examined": 0, "returned": 0, "indexes": {}}
+            self._stats[key] = entry
+        return entry
+
+    def record(self, collection: str, op: str, site: str, elapsed_ms: float) -> None:
+        with self._lock:
+            entry = self._entry((collection, op, site))
+            entry["calls"] += 1
+            entry["total_ms"] += elapsed_ms
+            entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+            samples = entry["samples"]
+            if len(samples) >= _MAX_SAMPLES:
+                samples.pop(0)
+            samples.append(elapsed_ms)
+
+    def wants_explain(self, collection: str, op: str, site: str) -> bool:
+        with self._lock:
+            entry = self._stats.get((collection, op, site))
+            return (entry["explained"] if entry else 0) < self.explain_limit
+
+    def record_explain(self, collection: str, op: str, site: str, explain: Dict[str, Any]) -> None:
+        summary = summarize_explain(explain)
+        with self._lock:
+            entry = self._entry((collection, op, site))
+            entry["explained"] += 1
+            for field in ("docs_examined", "keys_examined", "returned"):
+                entry[field] += summary[field]
+            for name in summary["indexes"] or ["?"]:
+                entry["indexes"][name] = entry["indexes"].get(name, 0) + 1
+
+    def report(self) -> List[Dict[str, Any]]:
+        """שורה לכל אתר קריאה, מהיקר ביותר (זמן מצטבר)"""
+        rows = []
+        with self._lock:
+            for (collection, op, site), entry in self._stats.items():
+                samples = sorted(entry["samples"])
+                p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))] if samples else 0.0
+                rows.append({
+                    "collection": collection,
+                    "op": op,
+                    "site": site,
+                    "calls": entry["calls"],
+                    "total_ms": round(entry["total_ms"], 2),
+                    "mean_ms": round(entry["total_ms"] / max(1, entry["calls"]), 2),
+                    "p95_ms": round(p95, 2),
+                    "max_ms": round(entry["max_ms"], 2),
+                    "explained": entry["explained"],
+                    "indexes": sorted(entry["indexes"]),
+                    "docs_examined": entry["docs_examined"],
+                    "returned": entry["returned"],
+                    # יחס גבוה = סריקה רחבה ביחס לתוצאה (אינדקס חסר או לא סלקטיבי)
+                    "examined_per_returned": (round(entry["docs_examined"] / max(1, entry["returned"]), 2)
+                                              if entry["explained"] else None),
+                })
+        return sorted(rows, key=lambda r: r["total_ms"], reverse=True)
+
+    def format_report(self, limit: int = 20) -> str:
+        lines = []
+        for row in self.report()[:limit]:
+            plan = ",".join(row["indexes"]) or "-"
+            ratio = "-" if row["examined_per_returned"] is None else row["examined_per_returned"]
+            lines.append(
+                f"{row['collection']}.{row['op']} @ {row['site']}: calls={row['calls']} "
+                f"total={row['total_ms']}ms p95={row['p95_ms']}ms plan={plan} examined/returned={ratio}"
+            )
+        return "\n".join(lines)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+
+class _ProfiledCursor:
+    """Cursor של find: הזמן נמדד עד שהתוצאות נצרכו, ואחר כך explain לאותה שאילתה"""
+
+    def __init__(self, cursor: Any, owner: "ProfiledCollection", site: str):
+        self._cursor = cursor
+        self._owner = owner
+        self._site = site
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._cursor, name)
+        if not callable(attr):
+            return attr
+
+        def _chain(*args: Any, **kwargs: Any) -> Any:
+            result = attr(*args, **kwargs)
+            # sort/skip/limit/batch_size מחזירים את אותו cursor — נשארים עטופים
+            return self if result is self._cursor else result
+        return _chain
+
+    def __iter__(self) -> Iterator[Any]:
+        started = time.perf_counter()
+        try:
+            for doc in self._cursor:
+                yield doc
+        finally:
+            owner = self._owner
+            owner._profiler.record(owner._name, "find", self._site, (time.perf_counter() - started) * 1000)
+            owner._maybe_explain("find", self._site, lambda: self._cursor.explain())
+
+
+class ProfiledCollection:
+    """עטיפה שקופה לאוסף pymongo שמדווחת ל-QueryProfiler"""
+
+    def __init__(self, collection: Any, profiler: QueryProfiler):
+        self._collection = collection
+        self._profiler = profiler
+        self._name = getattr(collection, "name", "?")
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._collection, name)
+        if name == "find":
+            return lambda *args, **kwargs: _ProfiledCursor(attr(*args, **kwargs), self, _call_site())
+        if name not in _READ_OPS and name not in _WRITE_OPS:
+            return attr
+
+        def _timed(*args: Any, **kwargs: Any) -> Any:
+            site = _call_site()
+            started = time.perf_counter()
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                self._profiler.record(self._name, name, site, (time.perf_counter() - started) * 1000)
+                if name in _READ_OPS and args:
+                    self._maybe_explain(name, site, lambda: self._explain(name, args, kwargs))
+        return _timed
+
+    def _explain(self, op: str, args: Tuple[Any, ...], kwargs: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        coll = self._collection
+        if op == "find_one":
+            projection = args[1] if len(args) > 1 else kwargs.get("projection")
+            cursor = coll.find(args[0], projection)
+            # find_one עם sort (הגרסה האחרונה) נבחר בתוכנית אחרת מזו של find ללא מיון
+            if kwargs.get("sort"):
+                cursor = cursor.sort(kwargs["sort"])
+            return cursor.limit(1).explain()
+        if op == "count_documents":
+            pipeline = [{"$match": args[0]}, {"$group": {"_id": 1, "n": {"$sum": 1}}}]
+        elif op == "aggregate":
+            pipeline = list(args[0])
+        else:
+            return None
+        return coll.database.command(
+            {"explain": {"aggregate": coll.name, "pipeline": pipeline, "cursor": {}}, "verbosity": "executionStats"}
+        )
+
+    def _maybe_explain(self, op: str, site: str, run: Any) -> None:
+        if not self._profiler.wants_explain(self._name, op, site):
+            return
+        try:
+            explain = run()
+            if isinstance(explain, dict):
+                self._profiler.record_explain(self._name, op, site, explain)
+        except Exception as e:
+            logger.debug(f"explain נכשל עבור {self._name}.{op} @ {site}: {e}")
@@ -1,6 +1,7 @@
 import logging
 from dataclasses import asdict
 from datetime import datetime, timezone, timedelta
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, List, Optional, Tuple
 
 try:
@@ -9,21 +10,293 @@ except Exception:
     class ObjectId(str):  # minimal stub for tests without bson
         pass
 
+try:
+    from pymongo import InsertOne, UpdateOne  # type: ignore
+    from pymongo.errors import BulkWriteError  # type: ignore
+except Exception:  # pymongo אינו זמין בסביבות בדיקה קלות
+    InsertOne = UpdateOne = None  # type: ignore[assignment]
+
+    class BulkWriteError(Exception):  # type: ignore[no-redef]
+        details: Dict[str, Any] = {}
+
+from blob_store import archive_versions, content_hash, same_content
 from cache_manager import cache, cached
+from code_features import compute_code_features
+from line_index import build_line_index, byte_span, parse_line_index, take_lines, total_lines
+from pagination import approximate_count, decode_cursor, keyset_key, keyset_sort, with_keyset
+from snippets_latest import LATEST_FIELDS, as_listing_doc, backfill_latest, sync_latest, sync_latest_many
 from .manager import DatabaseManager
 from utils import normalize_code
 from config import config
-from .models import CodeSnippet, LargeFile
+from .models import CodeSnippet, LargeFile, SnippetRef
 
 logger = logging.getLogger(__name__)
 
+# שדות מטא-דאטה לתפריטי רשימות (ללא code)
+_LISTING_FIELDS = {
+    "_id": 0,
+    "snippet_id": 1,
+    "file_name": 1,
+    "programming_language": 1,
+    "updated_at": 1,
+    "description": 1,
+    "tags": 1,
+}
+
+# שדות לרשימה המשולבת (קבצים רגילים וגדולים)
+_COMBINED_FIELDS = ["file_name", "programming_language", "description", "tags", "version", "updated_at"]
+
+# "שאר הקבצים": ללא תגית repo:*
+_NON_REPO_TAGS = {
+    "$or": [
+        {"tags": {"$exists": False}},
+        {"tags": {"$eq": []}},
+        {"tags": {"$not": {"$elemMatch": {"$regex": "^repo:"}}}},
+    ]
+}
+
+
+def _close_cursor(cursor: Any) -> None:
+    """סגירת cursor של MongoDB כשהקורא הפסיק לצרוך מוקדם (משחרר את ה-cursor בשרת)"""
+    close = getattr(cursor, "close", None)
+    if close is not None:
+        try:
+            close()
+        except Exception:
+            pass
+
+
+def _session_kwargs(session: Any) -> Dict[str, Any]:
+    return {"session": session} if session is not None else {}
+
+
+def _merge_tags(prev_tags: Optional[List[str]], extra_tags: Optional[List[str]]) -> List[str]:
+    """מיזוג תגיות לגרסה חדשה עם טיפול מיוחד ב-repo:* —
+    keep exactly one repo tag: prefer the last from extra_tags if present, otherwise keep the existing one
+    """
+    try:
+        prev_list: List[str] = list(prev_tags or [])
+        extra_list: List[str] = list(extra_tags or [])
+
+        # Split previous tags
+        prev_non_repo: List[str] = []
+        prev_repo: List[str] = []
+        for tag in prev_list:
+            if not isinstance(tag, str):
+                continue
+            ts = tag.strip()
+            if not ts:
+                continue
+            if ts.lower().startswith('repo:'):
+                prev_repo.append(ts)
+            else:
+                if ts not in prev_non_repo:
+                    prev_non_repo.append(ts)
+
+        # Split extra tags
+        extra_non_repo: List[str] = []
+        extra_repo: List[str] = []
+        for tag in extra_list:
+            if not isinstance(tag, str):
+                continue
+            ts = tag.strip()
+            if not ts:
+                continue
+            if ts.lower().startswith('repo:'):
+                extra_repo.append(ts)
+            else:
+                if ts not in extra_non_repo:
+                    extra_non_repo.append(ts)
+
+        # Compose non-repo tags: previous + extra (deduplicated, order preserved)
+        composed_non_repo: List[str] = []
+        for ts in prev_non_repo + extra_non_repo:
+            if ts not in composed_non_repo:
+                composed_non_repo.append(ts)
+
+        # Choose repo tag: prefer extra last, else keep existing last
+        chosen_repo = extra_repo[-1] if extra_repo else (prev_repo[-1] if prev_repo else None)
+        return composed_non_repo + ([chosen_repo] if chosen_repo else [])
+    except Exception:
+        # Fallback: keep previous tags as-is on error
+        try:
+            return list(prev_tags or [])
+        except Exception:
+            return []
+
+
+def _fields_projection(fields: List[str], *always: str) -> Dict[str, int]:
+    """projection מרשימת שדות (fields=) בתוספת שדות שהרשימות תמיד צריכות"""
+    return dict.fromkeys(list(fields) + ["file_name", *always], 1)
+
+
+def _includes_code(projection: Optional[Dict[str, int]]) -> bool:
+    """האם projection מחזיר את code (ואז יש להשלים אותו מ-code_blobs בגרסאות ישנות)"""
+    if not projection:
+        return True
+    if any(projection.values()):
+        return bool(projection.get("code"))
+    return "code" not in projection
+
+
+def _transactions_unsupported(error: Exception) -> bool:
+    """שרת MongoDB בודד (לא replica set/mongos) אינו תומך בטרנזקציות"""
+    code = getattr(error, "code", None)
+    return code in (20, 263) or "Transaction numbers are only allowed" in str(error)
+
 
 class Repository:
     """CRUD נקי עבור אוספים במאגר הנתונים."""
 
+    # None = טרם נבדק; False = השרת לא תומך בטרנזקציות ונכתוב בלעדיהן
+    _transactions_supported: Optional[bool] = None
+
     def __init__(self, manager: DatabaseManager):
         self.manager = manager
 
+    def _latest(self):
+        """אוסף הגרסה האחרונה, אם ה-backfill שלו הושלם; אחרת None והרשימות נשארות על האגרגציה"""
+        coll = getattr(self.manager, "latest_collection", None)
+        if coll is None or not getattr(self.manager, "latest_ready", False):
+            return None
+        return coll
+
+    def _sync_latest(self, user_id: int, file_names: List[str], session: Any = None) -> None:
+        """עדכון code_snippets_latest אחרי כתיבה. בתוך טרנזקציה כשל מבטל את כל הכתיבה."""
+        coll = getattr(self.manager, "latest_collection", None)
+        if coll is None:
+            return
+        for name in dict.fromkeys(file_names):
+            try:
+                sync_latest(self.manager.collection, coll, user_id, name, session=session)
+            except Exception as e:
+                if session is not None:
+                    raise
+                logger.warning(f"עדכון code_snippets_latest נכשל עבור {name}: {e}")
+
+    def _run_in_transaction(self, operation):
+        """הרצת operation(session) בטרנזקציה כשהשרת תומך בכך (replica set), אחרת עם session=None"""
+        client = getattr(self.manager, "client", None)
+        if client is None or getattr(self.manager, "latest_collection", None) is None \
+                or Repository._transactions_supported is False:
+            return operation(None)
+        try:
+            with client.start_session() as session:
+                result = session.with_transaction(operation)
+            Repository._transactions_supported = True
+            return result
+        except Exception as e:
+            if Repository._transactions_supported is None and _transactions_unsupported(e):
+                Repository._transactions_supported = False
+                logger.info("MongoDB ללא תמיכה בטרנזקציות — code_snippets_latest יעודכן מיד אחרי הכתיבה")
+                return operation(None)
+            raise
+
+    def _approx_count(self, user_id: int, name: str, count) -> int:
+        """סה"כ לרשימה מדופדפת מתוך cache (מתאפס בכל כתיבה של המשתמש, מתרענן ברקע)"""
+        try:
+            key = f"approx_count:{cache.user_namespace(user_id)}:{name}"
+        except Exception:
+            return int(count() or 0)
+        return approximate_count(cache, key, count)
+
+    def _versions_by_ids(self, ids: List[Any], projection: Optional[Dict[str, int]] = None) -> List[Dict]:
+        """מסמכי גרסה לפי רשימת _id, בסדר הרשימה (שאילתת $in אחת)"""
+        if not ids:
+            return []
+        if projection and projection.get("code"):
+            projection = dict(projection, content_hash=1)
+        docs = self.manager.collection.find({"_id": {"$in": list(ids)}}, projection)
+        by_id = {d.get("_id"): d for d in docs if isinstance(d, dict)}
+        ordered = [by_id[i] for i in ids if i in by_id]
+        if _includes_code(projection):
+            self._hydrate(ordered)
+        return ordered
+
+    def _hydrate(self, docs: List[Dict]) -> List[Dict]:
+        """השלמת code לגרסאות ששמורות ב-code_blobs בלבד"""
+        blobs = getattr(self.manager, "blobs", None)
+        if blobs is None or not docs:
+            return docs
+        try:
+            return blobs.hydrate(docs)
+        except Exception as e:
+            logger.error(f"שגיאה בטעינת תוכן מ-code_blobs: {e}")
+            return docs
+
+    def _hydrate_one(self, doc: Optional[Dict]) -> Optional[Dict]:
+        if isinstance(doc, dict) and "code" not in doc and doc.get("content_hash"):
+            self._hydrate([doc])
+        return doc
+
+    def _snippet_refs(self, docs: List[Dict]) -> List[Dict]:
+        """עטיפת מסמכי מטא-דאטה ב-SnippetRef שטוען code לפי _id רק כשניגשים אליו"""
+        def _loader(doc_id: Any):
+            return lambda: (self._hydrate_one(
+                self.manager.collection.find_one({"_id": doc_id}, {"code": 1, "content_hash": 1})) or {}).get("code")
+        return [SnippetRef(d, _loader(d.get("_id"))) for d in docs if isinstance(d, dict)]
+
+    def _large_file_refs(self, docs: List[Dict]) -> List[Dict]:
+        def _loader(doc_id: Any):
+            return lambda: (self.manager.large_files_collection.find_one(
+                {"_id": doc_id}, {"content": 1}) or {}).get("content")
+        return [SnippetRef(d, _loader(d.get("_id")), body_field="content") for d in docs if isinstance(d, dict)]
+
+    def _archive_versions(self, superseded: List[Dict]) -> None:
+        """העברת התוכן של גרסאות שהוחלפו ל-code_blobs (ראו blob_store.archive_versions)"""
+        blobs = getattr(self.manager, "blobs", None)
+        if blobs is None:
+            return
+        try:
+            archive_versions(self.manager.collection, blobs, superseded)
+        except Exception as e:
+            logger.warning(f"העברת גרסאות ל-code_blobs נכשלה: {e}")
+
+    def _same_content(self, existing: Dict, snippet: CodeSnippet) -> bool:
+        return same_content(existing, snippet.code, snippet.programming_language, snippet.content_hash)
+
+    def _touch_unchanged(self, existing: Dict, snippet: CodeSnippet) -> bool:
+        """תוכן זהה לגרסה האחרונה: אין גרסה חדשה; תיאור/תגיות שהשתנו מתעדכנים במקום"""
+        changes: Dict[str, Any] = {}
+        if (snippet.description or "") != (existing.get("description") or ""):
+            changes["description"] = snippet.description
+        if list(snippet.tags or []) != list(existing.get("tags") or []):
+            changes["tags"] = list(snippet.tags or [])
+        if not changes:
+            return True
+        changes["updated_at"] = snippet.updated_at
+        key = {"user_id": snippet.user_id, "file_name": snippet.file_name,
+               "version": existing.get("version"), "is_active": True}
+
+        def _write(session):
+            res = self.manager.collection.update_one(key, {"$set": changes}, **_session_kwargs(session))
+            if res.modified_count:
+                self._sync_latest(snippet.user_id, [snippet.file_name], session)
+            return res
+
+        result = self._run_in_transaction(_write)
+        cache.invalidate_user_cache(snippet.user_id)
+        if getattr(result, "modified_count", 0):
+            # רשומת האינדקס שומרת את התגיות (מסנני חיפוש) — מתעדכנת גם בלי גרסה חדשה
+            self._update_search_index("index_file", snippet.user_id, asdict(snippet))
+        return True
+
+    def _update_search_index(self, action: str, *args) -> None:
+        """עדכון אינקרמנטלי של אינדקס החיפוש המתמשך; כשל לא יפיל את פעולת הכתיבה."""
+        try:
+            from search_engine import search_engine
+            getattr(search_engine, action)(*args)
+        except Exception as e:
+            logger.debug(f"search index {action} skipped: {e}")
+
+    def _prewarm_render(self, code: str, language: str) -> None:
+        """הדגשת תצוגת ה-web של קובץ שנשמר זה עתה ברקע (render_cache); כשל לא יפיל את השמירה."""
+        try:
+            from render_cache import prewarm
+            prewarm(code, language)
+        except Exception as e:
+            logger.debug(f"render prewarm skipped: {e}")
+
     def save_code_snippet(self, snippet: CodeSnippet) -> bool:
         try:
             # Normalize code before persisting
@@ -33,14 +306,34 @@ class Repository:
             except Exception:
                 pass
             existing = self.get_latest_version(snippet.user_id, snippet.file_name)
+            snippet.content_hash = content_hash(snippet.code)
+            snippet.updated_at = datetime.now(timezone.utc)
+            if existing and self._same_content(existing, snippet):
+                # שחזור/ייבוא של תוכן שלא השתנה לא יוצר גרסה נוספת
+                return self._touch_unchanged(existing, snippet)
             if existing:
                 snippet.version = existing['version'] + 1
-            snippet.updated_at = datetime.now(timezone.utc)
-            result = self.manager.collection.insert_one(asdict(snippet))
+            # מאפיינים מחושבים פעם אחת כאן, כדי שמסננים ומיון לא יפרסרו את הקוד שוב
+            try:
+                for key, value in compute_code_features(snippet.code, snippet.programming_language).items():
+                    setattr(snippet, key, value)
+                snippet.line_index = build_line_index(snippet.code)
+            except Exception as e:
+                logger.debug(f"code features skipped: {e}")
+            def _write(session):
+                res = self.manager.collection.insert_one(asdict(snippet), **_session_kwargs(session))
+                if res.inserted_id:
+                    self._sync_latest(snippet.user_id, [snippet.file_name], session)
+                return res
+
+            result = self._run_in_transaction(_write)
             if result.inserted_id:
+                if existing:
+                    self._archive_versions([existing])
+                # כולל את מפתחות האוטו-השלמה (כולם תחת דור ה-cache של המשתמש)
                 cache.invalidate_user_cache(snippet.user_id)
-                from autocomplete_manager import autocomplete
-                autocomplete.invalidate_cache(snippet.user_id)
+                self._update_search_index("index_file", snippet.user_id, asdict(snippet))
+                self._prewarm_render(snippet.code, snippet.programming_language)
                 return True
             return False
         except Exception as e:
@@ -64,58 +357,7 @@ class Repository:
                 prev_tags = list(existing.get('tags') or [])
             except Exception:
                 prev_tags = []
-        # Merge tags with special handling for repo:* —
-        # keep exactly one repo tag: prefer the last from extra_tags if present, otherwise keep the existing one
-        merged_tags: List[str] = []
-        try:
-            prev_list: List[str] = list(prev_tags or [])
-            extra_list: List[str] = list(extra_tags or [])
-
-            # Split previous tags
-            prev_non_repo: List[str] = []
-            prev_repo: List[str] = []
-            for tag in prev_list:
-                if not isinstance(tag, str):
-                    continue
-                ts = tag.strip()
-                if not ts:
-                    continue
-                if ts.lower().startswith('repo:'):
-                    prev_repo.append(ts)
-                else:
-                    if ts not in prev_non_repo:
-                        prev_non_repo.append(ts)
-
-            # Split extra tags
-            extra_non_repo: List[str] = []
-            extra_repo: List[str] = []
-            for tag in extra_list:
-                if not isinstance(tag, str):
-                    continue
-                ts = tag.strip()
-                if not ts:
-                    continue
-                if ts.lower().startswith('repo:'):
-                    extra_repo.append(ts)
-                else:
-                    if ts not in extra_non_repo:
-                        extra_non_repo.append(ts)
-
-            # Compose non-repo tags: previous + extra (deduplicated, order preserved)
-            composed_non_repo: List[str] = []
-            for ts in prev_non_repo + extra_non_repo:
-                if ts not in composed_non_repo:
-                    composed_non_repo.append(ts)
-
-            # Choose repo tag: prefer extra last, else keep existing last
-            chosen_repo = extra_repo[-1] if extra_repo else (prev_repo[-1] if prev_repo else None)
-            merged_tags = composed_non_repo + ([chosen_repo] if chosen_repo else [])
-        except Exception:
-            # Fallback: keep previous tags as-is on error
-            try:
-                merged_tags = list(prev_tags or [])
-            except Exception:
-                merged_tags = []
+        merged_tags = _merge_tags(prev_tags, extra_tags)
         # Normalize code before constructing snippet
         try:
             if config.NORMALIZE_CODE_ON_SAVE:
@@ -132,52 +374,393 @@ class Repository:
         )
         return self.save_code_snippet(snippet)
 
+    def save_files_bulk(self, user_id: int, items: List[Dict[str, Any]],
+                        extra_tags: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """שמירת קבצים רבים (ייבוא ריפו/שחזור גיבוי) עם save_file כסמנטיקה, באצוות.
+
+        `items` הם מילונים עם file_name, code ו-programming_language (ואופציונלית extra_tags
+        לקובץ). לכל אצווה: שאילתה אחת לגרסאות הקודמות, נרמול ב-thread pool, bulk_write
+        לא-מסודר, ואינוולידציית cache אחת בסוף.
+
+        מחזיר תוצאה לכל פריט לפי הסדר: {"file_name", "status", "version", "previous_tags"}
+        כאשר status הוא created / updated / unchanged / failed (ואז גם "error").
+        """
+        outcomes: List[Dict[str, Any]] = []
+        batch_size = max(1, int(getattr(config, "BULK_SAVE_BATCH_SIZE", 500) or 500))
+        for start in range(0, len(items or []), batch_size):
+            outcomes.extend(self._save_files_batch(user_id, items[start:start + batch_size], extra_tags))
+        # אינוולידציה אחת לכל הייבוא (רק אם משהו נכתב בפועל)
+        written = [o.pop("written", False) for o in outcomes]
+        if any(written):
+            cache.invalidate_user_cache(user_id)
+        return outcomes
+
+    def _prepare_bulk_item(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        """נרמול ומאפיינים לפריט אחד (רץ ב-thread pool)"""
+        code = item.get("code") or ""
+        try:
+            if config.NORMALIZE_CODE_ON_SAVE:
+                code = normalize_code(code)
+        except Exception:
+            pass
+        language = item.get("programming_language") or "text"
+        prepared = dict(item, code=code, programming_language=language, content_hash=content_hash(code))
+        try:
+            prepared.update(compute_code_features(code, language))
+            prepared["line_index"] = build_line_index(code)
+        except Exception as e:
+            logger.debug(f"code features skipped: {e}")
+        return prepared
+
+    def _save_files_batch(self, user_id: int, items: List[Dict[str, Any]],
+                          extra_tags: Optional[List[str]]) -> List[Dict[str, Any]]:
+        outcomes: List[Dict[str, Any]] = [
+            {"file_name": (it or {}).get("file_name"), "status": "failed", "version": None, "previous_tags": []}
+            for it in items
+        ]
+        valid = [i for i, it in enumerate(items) if isinstance(it, dict) and isinstance(it.get("file_name"), str)
+                 and it.get("file_name")]
+        for i in set(range(len(items))) - set(valid):
+            outcomes[i]["error"] = "invalid item"
+        # אותו שם פעמיים באצווה — הפריט האחרון קובע
+        last_index = {items[i]["file_name"]: i for i in valid}
+        for i in valid:
+            if last_index[items[i]["file_name"]] != i:
+                outcomes[i].update(status="failed", error="duplicate file_name in batch")
+        indices = sorted(last_index.values())
+        if not indices:
+            return outcomes
+
+        workers = max(1, min(int(getattr(config, "BULK_SAVE_WORKERS", 4) or 4), len(indices)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            prepared = dict(zip(indices, executor.map(self._prepare_bulk_item, [items[i] for i in indices])))
+
+        names = [items[i]["file_name"] for i in indices]
+        previous = self.get_latest_versions(user_id, names, {
+            "file_name": 1, "version": 1, "programming_language": 1, "description": 1,
+            "tags": 1, "content_hash": 1, "code": 1, "size_bytes": 1,
+        })
+        now = datetime.now(timezone.utc)
+        ops: List[Tuple[int, str, Any, Any]] = []
+        superseded: Dict[int, Dict] = {}
+        for i in indices:
+            item = prepared[i]
+            name = item["file_name"]
+            prev = previous.get(name) or {}
+            prev_tags = list(prev.get("tags") or [])
+            outcomes[i]["previous_tags"] = prev_tags
+            tags = _merge_tags(prev_tags, list(extra_tags or []) + list(item.get("extra_tags") or []))
+            description = prev.get("description") or ""
+            same = bool(prev) and (prev.get("programming_language") or "") == item["programming_language"] and (
+                prev.get("content_hash") == item["content_hash"] if prev.get("content_hash")
+                else prev.get("code") == item["code"]
+            )
+            if same:
+                outcomes[i].update(status="unchanged", version=prev.get("version"))
+                if tags != prev_tags:
+                    key = {"user_id": user_id, "file_name": name, "version": prev.get("version"), "is_active": True}
+                    ops.append((i, "update", key, {"$set": {"tags": tags, "updated_at": now}}))
+                continue
+            snippet = CodeSnippet(
+                user_id=user_id,
+                file_name=name,
+                code=item["code"],
+                programming_language=item["programming_language"],
+                description=description,
+                tags=tags,
+                version=int(prev.get("version") or 0) + 1,
+                updated_at=now,
+            )
+            for field_name in ("content_hash", "size_bytes", "line_count", "function_count", "class_count", "symbols",
+                               "line_index"):
+                setattr(snippet, field_name, item.get(field_name))
+            outcomes[i].update(status="updated" if prev else "created", version=snippet.version)
+            ops.append((i, "insert", asdict(snippet), None))
+            if prev:
+                superseded[i] = prev
+
+        failed = self._bulk_write_ops(ops)
+        for i, _, _, _ in ops:
+            if i in failed:
+                outcomes[i].update(status="failed", error=failed[i])
+                superseded.pop(i, None)
+            else:
+                outcomes[i]["written"] = True
+
+        written = [(i, doc) for i, kind, doc, _ in ops if kind == "insert" and i not in failed]
+        latest = getattr(self.manager, "latest_collection", None)
+        if latest is not None:
+            try:
+                sync_latest_many(latest, [doc for _, doc in written])
+                touched = [items[i]["file_name"] for i, kind, _, _ in ops if kind == "update" and i not in failed]
+                self._sync_latest(user_id, touched)
+            except Exception as e:
+                logger.warning(f"עדכון code_snippets_latest לאצווה נכשל: {e}")
+        self._archive_versions([dict(prev, user_id=user_id) for prev in superseded.values()])
+        for _, doc in written:
+            self._update_search_index("index_file", user_id, doc)
+        return outcomes
+
+    def _bulk_write_ops(self, ops: List[Tuple[int, str, Any, Any]]) -> Dict[int, str]:
+        """כתיבת insert/update של אצווה ב-bulk_write לא-מסודר; מחזיר שגיאה לפי אינדקס פריט"""
+        if not ops:
+            return {}
+        coll = self.manager.collection
+        failed: Dict[int, str] = {}
+        if InsertOne is not None and hasattr(coll, "bulk_write"):
+            write_ops = [InsertOne(doc) if kind == "insert" else UpdateOne(doc, update) for _, kind, doc, update in ops]
+            try:
+                coll.bulk_write(write_ops, ordered=False)
+            except BulkWriteError as e:
+                for err in (getattr(e, "details", None) or {}).get("writeErrors", []):
+                    failed[ops[int(err.get("index", 0))][0]] = str(err.get("errmsg") or "write failed")
+            except Exception as e:
+                logger.error(f"שגיאה בשמירה מרובה: {e}")
+                failed = {i: str(e) for i, _, _, _ in ops}
+            return failed
+        for i, kind, doc, update in ops:
+            try:
+                if kind == "insert":
+                    coll.insert_one(doc)
+                else:
+                    coll.update_one(doc, update)
+            except Exception as e:
+                failed[i] = str(e)
+        return failed
+
     @cached(expire_seconds=180, key_prefix="latest_version")
     def get_latest_version(self, user_id: int, file_name: str) -> Optional[Dict]:
         try:
-            return self.manager.collection.find_one(
+            return self._hydrate_one(self.manager.collection.find_one(
                 {"user_id": user_id, "file_name": file_name, "is_active": True},
                 sort=[("version", -1)],
-            )
+            ))
         except Exception as e:
             logger.error(f"שגיאה בקבלת גרסה אחרונה: {e}")
             return None
 
-    def get_file(self, user_id: int, file_name: str) -> Optional[Dict]:
+    def get_line_range(self, user_id: int, file_name: str, start_line: int, count: int) -> Optional[Dict]:
+        """השורות [start_line, start_line+count) (0-based) של הגרסה האחרונה, בלי לטעון את כל הקוד.
+
+        לפי line_index השמור נקרא רק טווח הבייטים של השורות ($substrBytes בצד השרת), כך
+        שדף N של קובץ ארוך עולה כמו הדף הראשון. מסמך ישן ללא אינדקס נטען במלואו פעם
+        אחת והאינדקס נשמר עליו. מחזיר content, total_lines, start_line, end_line
+        ו-programming_language, או None כשהקובץ לא קיים או שהטווח מחוץ לקובץ.
+        """
         try:
-            return self.manager.collection.find_one(
+            meta = self.manager.collection.find_one(
                 {"user_id": user_id, "file_name": file_name, "is_active": True},
+                {"line_index": 1, "line_count": 1, "size_bytes": 1, "programming_language": 1, "content_hash": 1},
                 sort=[("version", -1)],
             )
+            if not meta:
+                return None
+            index = parse_line_index(meta.get("line_index"))
+            if index is None or meta.get("size_bytes") is None or meta.get("line_count") is None:
+                code = self._code_by_id(meta.get("_id"))
+                lines = code.split("\n")
+                self._backfill_line_index(meta, code)
+                if not 0 <= start_line < len(lines):
+                    return None
+                content = "\n".join(lines[start_line:start_line + count])
+                total = len(lines)
+            else:
+                total = total_lines(meta.get("line_count"))
+                if not 0 <= start_line < total:
+                    return None
+                end = min(start_line + count, total)
+                start_byte, end_byte, skip = byte_span(index, int(meta["size_bytes"]), start_line, end)
+                content = take_lines(self._read_code_bytes(meta, start_byte, end_byte), skip, end - start_line)
+            return {
+                "content": content,
+                "total_lines": total,
+                "start_line": start_line,
+                "end_line": min(start_line + count, total),
+                "programming_language": meta.get("programming_language") or "text",
+            }
+        except Exception as e:
+            logger.error(f"שגיאה בקריאת טווח שורות: {e}")
+            return None
+
+    def _code_by_id(self, doc_id: Any) -> str:
+        doc = self._hydrate_one(self.manager.collection.find_one({"_id": doc_id}, {"code": 1, "content_hash": 1}))
+        code = (doc or {}).get("code")
+        return code if isinstance(code, str) else ""
+
+    def _read_code_bytes(self, meta: Dict, start_byte: int, end_byte: int) -> str:
+        """טווח בייטים מ-code של מסמך הגרסה; גרסה ששמורה רק ב-code_blobs (דחוסה) נטענת במלואה"""
+        rows = list(self.manager.collection.aggregate([
+            {"$match": {"_id": meta.get("_id"), "code": {"$exists": True}}},
+            {"$project": {"_id": 0, "part": {"$substrBytes": ["$code", start_byte, end_byte - start_byte]}}},
+        ]))
+        if rows and isinstance(rows[0].get("part"), str):
+            return rows[0]["part"]
+        data = self._code_by_id(meta.get("_id")).encode("utf-8", "surrogatepass")
+        return data[start_byte:end_byte].decode("utf-8", "surrogatepass")
+
+    def _backfill_line_index(self, meta: Dict, code: str) -> None:
+        try:
+            update: Dict[str, Any] = {"line_index": build_line_index(code)}
+            if meta.get("size_bytes") is None or meta.get("line_count") is None:
+                features = compute_code_features(code, meta.get("programming_language") or "")
+                update.update(size_bytes=features["size_bytes"], line_count=features["line_count"])
+            self.manager.collection.update_one({"_id": meta.get("_id")}, {"$set": update})
+        except Exception as e:
+            logger.debug(f"line index backfill skipped: {e}")
+
+    def get_latest_versions(self, user_id: int, file_names: List[str], projection: Optional[Dict[str, int]] = None) -> Dict[str, Dict]:
+        """הגרסה האחרונה של כל אחד מהקבצים המבוקשים באגרגציה אחת.
+
+        מחזיר מילון file_name -> מסמך. `projection` (שדות הכללה/החרגה) מוחל לפני ה-$group
+        כדי שלא לגרור שדות כבדים (כמו code) דרך האגרגציה.
+        """
+        names = [n for n in dict.fromkeys(file_names or []) if isinstance(n, str) and n]
+        if not names:
+            return {}
+        latest = self._latest()
+        if latest is not None:
+            return self._latest_versions_from_collection(latest, user_id, names, projection)
+        try:
+            pipeline: List[Dict[str, Any]] = [
+                {"$match": {"user_id": user_id, "is_active": True, "file_name": {"$in": names}}},
+                {"$sort": {"file_name": 1, "version": -1}},
+            ]
+            if projection:
+                stage = dict(projection)
+                # שדות הכרחיים לקיבוץ ולמיון
+                if any(v for v in stage.values()):
+                    stage.update({"file_name": 1, "version": 1})
+                    if stage.get("code"):
+                        stage["content_hash"] = 1
+                else:
+                    stage.pop("file_name", None)
+                    stage.pop("version", None)
+                pipeline.append({"$project": stage})
+            pipeline += [
+                {"$group": {"_id": "$file_name", "latest": {"$first": "$$ROOT"}}},
+                {"$replaceRoot": {"newRoot": "$latest"}},
+            ]
+            docs = [d for d in self.manager.collection.aggregate(pipeline, allowDiskUse=True)
+                    if isinstance(d, dict) and d.get("file_name")]
+            if _includes_code(projection):
+                self._hydrate(docs)
+            return {d["file_name"]: d for d in docs}
+        except Exception as e:
+            logger.error(f"שגיאה בקבלת גרסאות אחרונות: {e}")
+            return {}
+
+    def _latest_versions_from_collection(self, latest: Any, user_id: int, names: List[str],
+                                         projection: Optional[Dict[str, int]]) -> Dict[str, Dict]:
+        """get_latest_versions מעל code_snippets_latest: מטא-דאטה ישירות, תוכן דרך snippet_id"""
+        try:
+            wanted = [k for k, v in (projection or {}).items() if v]
+            metadata_only = bool(wanted) and all(k in LATEST_FIELDS for k in wanted)
+            flt = {"user_id": user_id, "is_active": True, "file_name": {"$in": names}}
+            if metadata_only:
+                fields = dict.fromkeys(wanted + ["file_name", "version", "snippet_id"], 1)
+                fields["_id"] = 0
+                return {d["file_name"]: as_listing_doc(d) for d in latest.find(flt, fields)}
+            pointers = [d.get("snippet_id") for d in latest.find(flt, {"_id": 0, "snippet_id": 1})]
+            stage = dict(projection or {})
+            if any(stage.values()):
+                stage.update({"file_name": 1, "version": 1})
+            docs = self._versions_by_ids(pointers, stage or None)
+            return {d["file_name"]: d for d in docs if d.get("file_name")}
+        except Exception as e:
+            logger.error(f"שגיאה בקבלת גרסאות אחרונות: {e}")
+            return {}
+
+    def sync_latest_snippet(self, user_id: int, file_name: str) -> bool:
+        """סנכרון code_snippets_latest לקובץ אחד אחרי כתיבה ישירה לאוסף (מחוץ ל-Repository)"""
+        coll = getattr(self.manager, "latest_collection", None)
+        if coll is None:
+            return False
+        try:
+            sync_latest(self.manager.collection, coll, user_id, file_name)
+            return True
+        except Exception as e:
+            logger.error(f"שגיאה בסנכרון code_snippets_latest: {e}")
+            return False
+
+    def rebuild_latest_collection(self, user_id: Optional[int] = None) -> int:
+        """בנייה מחדש של code_snippets_latest (למשתמש אחד או לכולם) מתוך code_snippets"""
+        coll = getattr(self.manager, "latest_collection", None)
+        if coll is None:
+            return 0
+        try:
+            coll.delete_many({"user_id": user_id} if user_id is not None else {})
+            return backfill_latest(self.manager.collection, coll, user_id=user_id)
+        except Exception as e:
+            logger.error(f"שגיאה בבניית code_snippets_latest: {e}")
+            return 0
+
+    def get_file(self, user_id: int, file_name: str) -> Optional[Dict]:
+        try:
+            return self._hydrate_one(self.manager.collection.find_one(
+                {"user_id": user_id, "file_name": file_name, "is_active": True},
+                sort=[("version", -1)],
+            ))
         except Exception as e:
             logger.error(f"שגיאה בקבלת קובץ: {e}")
             return None
 
     def get_all_versions(self, user_id: int, file_name: str) -> List[Dict]:
         try:
-            return list(self.manager.collection.find(
+            return self._hydrate(list(self.manager.collection.find(
                 {"user_id": user_id, "file_name": file_name, "is_active": True},
                 sort=[("version", -1)],
-            ))
+            )))
         except Exception as e:
             logger.error(f"שגיאה בקבלת כל הגרסאות: {e}")
             return []
 
     def get_version(self, user_id: int, file_name: str, version: int) -> Optional[Dict]:
         try:
-            return self.manager.collection.find_one(
+            return self._hydrate_one(self.manager.collection.find_one(
                 {"user_id": user_id, "file_name": file_name, "version": version, "is_active": True}
-            )
+            ))
         except Exception as e:
             logger.error(f"שגיאה בקבלת גרסה {version} עבור {file_name}: {e}")
             return None
 
-    @cached(expire_seconds=120, key_prefix="user_files")
-    def get_user_files(self, user_id: int, limit: int = 50) -> List[Dict]:
+    def get_user_files(self, user_id: int, limit: int = 50, fields: Optional[List[str]] = None) -> List[Dict]:
+        """הגרסאות האחרונות של קבצי המשתמש לפי updated_at יורד.
+
+        עם `fields` (למשל ["file_name", "tags"]) נשלפים רק השדות האלה (ו-file_name/_id)
+        והמסמכים מוחזרים כ-SnippetRef: code לא עובר ברשת אלא אם ניגשים אליו.
+        """
+        docs = self._user_file_docs(user_id, limit, fields)
+        if fields is not None and "code" not in fields:
+            # ה-cache שומר dict רגיל — העטיפה (עם ה-loader) נבנית מחדש בכל קריאה
+            return self._snippet_refs(docs)
+        return docs
+
+    @cached(expire_seconds=120, key_prefix="user_files", stale_ttl=60)
+    def _user_file_docs(self, user_id: int, limit: int = 50, fields: Optional[List[str]] = None) -> List[Dict]:
+        """מסמכי get_user_files כ-dict רגיל (מה שנשמר ב-cache)"""
+        lazy = fields is not None and "code" not in fields
         try:
+            latest = self._latest()
+            if latest is not None:
+                flt = {"user_id": user_id, "is_active": True}
+                if lazy and all(f in LATEST_FIELDS for f in fields):
+                    projection = _fields_projection(fields, "snippet_id")
+                    projection["_id"] = 0
+                    docs = latest.find(flt, projection).sort("updated_at", -1).limit(int(limit))
+                    return [as_listing_doc(d) for d in docs]
+                pointers = latest.find(flt, {"_id": 0, "snippet_id": 1}).sort("updated_at", -1).limit(int(limit))
+                ids = [d.get("snippet_id") for d in pointers]
+                if lazy:
+                    return self._versions_by_ids(ids, _fields_projection(fields))
+                return self._versions_by_ids(ids)
             pipeline = [
                 {"$match": {"user_id": user_id, "is_active": True}},
                 {"$sort": {"file_name": 1, "version": -1}},
+            ]
+            if lazy:
+                # ה-projection לפני הקיבוץ: code לא נטען לזיכרון של ה-pipeline כלל
+                pipeline.append({"$project": _fields_projection(fields, "version", "updated_at")})
+            pipeline += [
                 {"$group": {"_id": "$file_name", "latest": {"$first": "$$ROOT"}}},
                 {"$replaceRoot": {"newRoot": "$latest"}},
                 {"$sort": {"updated_at": -1}},
@@ -188,6 +771,131 @@ class Repository:
             logger.error(f"שגיאה בקבלת קבצי משתמש: {e}")
             return []
 
+    def find_file_names(self, user_id: int, languages: Optional[List[str]] = None, tags: Optional[List[str]] = None,
+                        date_from: Optional[datetime] = None, date_to: Optional[datetime] = None,
+                        min_size: Optional[int] = None, max_size: Optional[int] = None,
+                        has_functions: Optional[bool] = None, has_classes: Optional[bool] = None) -> List[str]:
+        """שמות הקבצים שהגרסה האחרונה שלהם עומדת במסננים — מחושב כולו בצד MongoDB.
+
+        משמש את מתכנן השאילתות של מנוע החיפוש כדי לצמצם מועמדים לפני פעולות על האינדקס.
+        """
+        latest_match: Dict[str, Any] = {}
+        if languages:
+            latest_match["programming_language"] = {"$in": list(languages)}
+        if tags:
+            latest_match["tags"] = {"$in": list(tags)}
+        if date_from or date_to:
+            date_range: Dict[str, Any] = {}
+            if date_from:
+                date_range["$gte"] = date_from
+            if date_to:
+                date_range["$lte"] = date_to
+            latest_match["updated_at"] = date_range
+        if min_size:
+            latest_match.setdefault("size", {})["$gte"] = int(min_size)
+        if max_size:
+            latest_match.setdefault("size", {})["$lte"] = int(max_size)
+        # מסמכים ישנים ללא מאפיינים (null) עוברים הלאה ונבדקים בצד המנוע
+        counters: List[Dict[str, Any]] = []
+        for field_name, wanted in (("function_count", has_functions), ("class_count", has_classes)):
+            if wanted is True:
+                counters.append({"$or": [{field_name: {"$gt": 0}}, {field_name: None}]})
+            elif wanted is False:
+                counters.append({field_name: {"$in": [0, None]}})
+        if counters:
+            latest_match["$and"] = counters
+        try:
+            latest = self._latest()
+            if latest is not None:
+                # כל השדות שמורים על מסמך ה-latest (size_bytes מחושב גם למסמכים ישנים ב-backfill)
+                flt: Dict[str, Any] = {"user_id": user_id, "is_active": True}
+                flt.update(latest_match)
+                if "size" in flt:
+                    flt["size_bytes"] = flt.pop("size")
+                docs = latest.find(flt, {"_id": 0, "file_name": 1})
+                return [d.get("file_name") for d in docs if isinstance(d, dict) and d.get("file_name")]
+            pipeline: List[Dict[str, Any]] = [
+                # נתמך ע"י user_active_file_latest_idx; code לא עובר את הקיבוץ
+                {"$match": {"user_id": user_id, "is_active": True}},
+                {"$sort": {"file_name": 1, "version": -1}},
+                {"$project": {
+                    "file_name": 1,
+                    "version": 1,
+                    "programming_language": 1,
+                    "tags": 1,
+                    "updated_at": 1,
+                    "function_count": 1,
+                    "class_count": 1,
+                    # גודל שמור; למסמכים ישנים מחושב מהקוד
+                    "size": {"$ifNull": ["$size_bytes", {"$strLenBytes": {"$ifNull": ["$code", ""]}}]},
+                }},
+                {"$group": {"_id": "$file_name", "latest": {"$first": "$$ROOT"}}},
+                {"$replaceRoot": {"newRoot": "$latest"}},
+                {"$match": latest_match},
+                {"$project": {"_id": 0, "file_name": 1}},
+            ]
+            docs = self.manager.collection.aggregate(pipeline, allowDiskUse=True)
+            return [d.get("file_name") for d in docs if isinstance(d, dict) and d.get("file_name")]
+        except Exception as e:
+            logger.error(f"find_file_names failed: {e}")
+            return []
+
+    def iter_user_files(self, user_id: int, projection: Optional[Dict[str, int]] = None, batch_size: int = 100):
+        """מעבר זורם (cursor) על הגרסאות האחרונות של קבצי המשתמש, מהחדש לישן.
+
+        בניגוד ל-get_user_files, התוצאות לא נטענות לזיכרון בבת אחת והקורא יכול
+        להפסיק לצרוך בכל שלב (ה-cursor נסגר אז גם בשרת). `projection` מוחל בשאילתה.
+        """
+        latest = self._latest()
+        if latest is not None:
+            yield from self._iter_latest_files(latest, user_id, projection, batch_size)
+            return
+        # בלי $group (שחוסם עד שכל הקבוצות נבנו): find ממוין לפי האינדקס
+        # user_id+is_active+updated_at, וכל קובץ מוחזר בפעם הראשונה שהוא מופיע — הגרסה
+        # שנכתבה אחרונה היא הגרסה האחרונה שלו
+        stage = dict(projection) if projection else None
+        if stage:
+            stage.update({"file_name": 1, "version": 1, "updated_at": 1})
+        cursor = None
+        try:
+            cursor = self.manager.collection.find({"user_id": user_id, "is_active": True}, stage) \
+                .sort("updated_at", -1).batch_size(max(1, int(batch_size)))
+            seen: set = set()
+            for doc in cursor:
+                name = doc.get("file_name")
+                if name in seen:
+                    continue
+                seen.add(name)
+                yield doc
+        except Exception as e:
+            logger.error(f"שגיאה במעבר על קבצי משתמש: {e}")
+        finally:
+            _close_cursor(cursor)
+
+    def _iter_latest_files(self, latest: Any, user_id: int, projection: Optional[Dict[str, int]], batch_size: int):
+        """מעבר על code_snippets_latest (מהחדש לישן) ושליפת מסמכי הגרסה באצוות לפי snippet_id"""
+        batch_size = max(1, int(batch_size))
+        stage = dict(projection) if projection else None
+        if stage:
+            stage.update({"file_name": 1, "version": 1, "updated_at": 1})
+        cursor = None
+        try:
+            cursor = latest.find(
+                {"user_id": user_id, "is_active": True}, {"_id": 0, "snippet_id": 1}
+            ).sort("updated_at", -1).batch_size(batch_size)
+            pointers: List[Any] = []
+            for doc in cursor:
+                pointers.append(doc.get("snippet_id"))
+                if len(pointers) >= batch_size:
+                    yield from self._versions_by_ids(pointers, stage)
+                    pointers = []
+            if pointers:
+                yield from self._versions_by_ids(pointers, stage)
+        except Exception as e:
+            logger.error(f"שגיאה במעבר על קבצי משתמש: {e}")
+        finally:
+            _close_cursor(cursor)
+
     @cached(expire_seconds=300, key_prefix="search_code")
     def search_code(self, user_id: int, query: str, programming_language: str = None, tags: List[str] = None, limit: int = 20) -> List[Dict]:
         try:
@@ -198,6 +906,22 @@ class Repository:
                 search_filter["programming_language"] = programming_language
             if tags:
                 search_filter["tags"] = {"$in": tags}
+            latest = self._latest()
+            if latest is not None:
+                # ההתאמות נבדקות מול הגרסה האחרונה בלבד של כל קובץ
+                matched = list(self.manager.collection.find(search_filter, {"_id": 1, "file_name": 1}))
+                if not matched:
+                    return []
+                pointers = latest.find(
+                    {
+                        "user_id": user_id,
+                        "is_active": True,
+                        "file_name": {"$in": list({d.get("file_name") for d in matched})},
+                        "snippet_id": {"$in": [d.get("_id") for d in matched]},
+                    },
+                    {"_id": 0, "snippet_id": 1},
+                ).sort("updated_at", -1).limit(int(limit))
+                return self._versions_by_ids([d.get("snippet_id") for d in pointers])
             pipeline = [
                 {"$match": search_filter},
                 {"$sort": {"file_name": 1, "version": -1}},
@@ -212,11 +936,25 @@ class Repository:
             return []
 
     @cached(expire_seconds=20, key_prefix="files_by_repo")
-    def get_user_files_by_repo(self, user_id: int, repo_tag: str, page: int = 1, per_page: int = 50) -> Tuple[List[Dict], int]:
-        """מחזיר קבצים לפי תגית ריפו עם דפדוף, וכן ספירת סה"כ קבצים (distinct לפי file_name)."""
+    def get_user_files_by_repo(self, user_id: int, repo_tag: str, page: int = 1, per_page: int = 50,
+                               after: Optional[str] = None) -> Tuple[List[Dict], int]:
+        """מחזיר קבצים לפי תגית ריפו עם דפדוף, וכן ספירת סה"כ קבצים (distinct לפי file_name).
+
+        `after` הוא cursor (pagination.cursor_for) של הפריט האחרון בעמוד הקודם: כשהוא
+        ניתן, העמוד נשלף לפי מפתח במקום skip, והסה"כ הוא ספירה משוערת מה-cache.
+        """
         try:
             skip = max(0, (page - 1) * per_page)
             match_stage = {"user_id": user_id, "is_active": True, "tags": repo_tag}
+            latest = self._latest()
+            if latest is not None:
+                cursor = latest.find(with_keyset(match_stage, after, id_field="snippet_id"), _LISTING_FIELDS) \
+                    .sort(keyset_sort(id_field="snippet_id"))
+                if not after:
+                    cursor = cursor.skip(skip)
+                total = self._approx_count(user_id, f"repo:{repo_tag}",
+                                           lambda: latest.count_documents(match_stage))
+                return [as_listing_doc(d) for d in cursor.limit(per_page)], total
 
             # שלוף פריטים בעמוד
             items_pipeline = [
@@ -224,7 +962,8 @@ class Repository:
                 {"$sort": {"file_name": 1, "version": -1}},
                 {"$group": {"_id": "$file_name", "latest": {"$first": "$$ROOT"}}},
                 {"$replaceRoot": {"newRoot": "$latest"}},
-                {"$sort": {"updated_at": -1}},
+                {"$match": with_keyset({}, after)},
+                {"$sort": {"updated_at": -1, "_id": -1}},
                 {"$project": {
                     "_id": 1,
                     "file_name": 1,
@@ -234,7 +973,7 @@ class Repository:
                     "tags": 1,
                     "code": 0,
                 }},
-                {"$skip": skip},
+                {"$skip": 0 if after else skip},
                 {"$limit": per_page},
             ]
             items = list(self.manager.collection.aggregate(items_pipeline, allowDiskUse=True))
@@ -253,16 +992,29 @@ class Repository:
             return [], 0
 
     @cached(expire_seconds=20, key_prefix="regular_files")
-    def get_regular_files_paginated(self, user_id: int, page: int = 1, per_page: int = 10) -> Tuple[List[Dict], int]:
+    def get_regular_files_paginated(self, user_id: int, page: int = 1, per_page: int = 10,
+                                    after: Optional[str] = None) -> Tuple[List[Dict], int]:
         """רשימת "שאר הקבצים" (ללא תגיות שמתחילות ב-"repo:") עם עימוד אמיתי וספירה.
 
         מחזיר מסמכים מגרסה אחרונה לכל `file_name`, עם שדות מטא־דאטה בלבד לתפריטים:
         _id, file_name, programming_language, updated_at, description, tags.
+        `after` — cursor של הפריט האחרון בעמוד הקודם (עימוד לפי מפתח, ללא skip).
         """
         try:
             req_page = max(1, int(page or 1))
             per_page = max(1, int(per_page or 10))
 
+            latest = self._latest()
+            if latest is not None:
+                match = dict(_NON_REPO_TAGS, user_id=user_id, is_active=True)
+                total = self._approx_count(user_id, "regular", lambda: latest.count_documents(match))
+                cursor = latest.find(with_keyset(match, after, id_field="snippet_id"), _LISTING_FIELDS) \
+                    .sort(keyset_sort(id_field="snippet_id"))
+                if not after:
+                    total_pages = (total + per_page - 1) // per_page if total > 0 else 1
+                    cursor = cursor.skip((min(req_page, total_pages) - 1) * per_page)
+                return [as_listing_doc(d) for d in cursor.limit(per_page)], total
+
             # ספירה (distinct לפי file_name לאחר סינון) — תחילה, כדי לאפשר עימוד מהודק ללא רה-פצ' של הקורא
             count_pipeline = [
                 {"$match": {"user_id": user_id, "is_active": True}},
@@ -300,7 +1052,8 @@ class Repository:
                         {"tags": {"$not": {"$elemMatch": {"$regex": "^repo:"}}}},
                     ]
                 }},
-                {"$sort": {"updated_at": -1}},
+                {"$match": with_keyset({}, after)},
+                {"$sort": {"updated_at": -1, "_id": -1}},
                 {"$project": {
                     "_id": 1,
                     "file_name": 1,
@@ -310,7 +1063,7 @@ class Repository:
                     "tags": 1,
                     "code": 0,
                 }},
-                {"$skip": skip},
+                {"$skip": 0 if after else skip},
                 {"$limit": per_page},
             ]
             items = list(self.manager.collection.aggregate(items_pipeline, allowDiskUse=True))
@@ -324,17 +1077,26 @@ class Repository:
             now = datetime.now(timezone.utc)
             ttl_days = int(getattr(config, 'RECYCLE_TTL_DAYS', 7) or 7)
             expires = now + timedelta(days=max(1, ttl_days))
-            result = self.manager.collection.update_many(
-                {"user_id": user_id, "file_name": file_name, "is_active": True},
-                {"$set": {
-                    "is_active": False,
-                    "updated_at": now,
-                    "deleted_at": now,
-                    "deleted_expires_at": expires,
-                }},
-            )
+
+            def _write(session):
+                res = self.manager.collection.update_many(
+                    {"user_id": user_id, "file_name": file_name, "is_active": True},
+                    {"$set": {
+                        "is_active": False,
+                        "updated_at": now,
+                        "deleted_at": now,
+                        "deleted_expires_at": expires,
+                    }},
+                    **_session_kwargs(session),
+                )
+                if res.modified_count > 0:
+                    self._sync_latest(user_id, [file_name], session)
+                return res
+
+            result = self._run_in_transaction(_write)
             if result.modified_count > 0:
                 cache.invalidate_user_cache(user_id)
+                self._update_search_index("remove_file", user_id, file_name)
                 return True
             return False
         except Exception as e:
@@ -359,6 +1121,10 @@ class Repository:
                 }},
             )
             cache.invalidate_user_cache(user_id)
+            if int(result.modified_count or 0) > 0:
+                self._sync_latest(user_id, list(set(file_names)))
+                for name in set(file_names):
+                    self._update_search_index("remove_file", user_id, name)
             return int(result.modified_count or 0)
         except Exception as e:
             logger.error(f"שגיאה במחיקה רכה מרובה: {e}")
@@ -371,10 +1137,14 @@ class Repository:
             expires = now + timedelta(days=max(1, ttl_days))
             # נאתר user_id לפני העדכון לצורך אינוולידציית cache אמינה
             user_id_for_invalidation: Optional[int] = None
+            file_name_for_sync: Optional[str] = None
             try:
-                pre_doc = self.manager.collection.find_one({"_id": ObjectId(file_id), "is_active": True}, {"user_id": 1})
+                pre_doc = self.manager.collection.find_one(
+                    {"_id": ObjectId(file_id), "is_active": True}, {"user_id": 1, "file_name": 1}
+                )
                 if isinstance(pre_doc, dict):
                     user_id_for_invalidation = pre_doc.get("user_id")
+                    file_name_for_sync = pre_doc.get("file_name")
             except Exception:
                 pass
             result = self.manager.collection.update_many(
@@ -388,6 +1158,8 @@ class Repository:
             )
             modified = int(getattr(result, 'modified_count', 0) or 0)
             if modified > 0 and user_id_for_invalidation is not None:
+                if file_name_for_sync:
+                    self._sync_latest(user_id_for_invalidation, [file_name_for_sync])
                 try:
                     cache.invalidate_user_cache(int(user_id_for_invalidation))
                 except Exception:
@@ -399,7 +1171,7 @@ class Repository:
 
     def get_file_by_id(self, file_id: str) -> Optional[Dict]:
         try:
-            return self.manager.collection.find_one({"_id": ObjectId(file_id)})
+            return self._hydrate_one(self.manager.collection.find_one({"_id": ObjectId(file_id)}))
         except Exception as e:
             logger.error(f"שגיאה בקבלת קובץ לפי _id: {e}")
             return None
@@ -438,11 +1210,22 @@ class Repository:
             if existing and new_name != old_name:
                 logger.warning(f"File {new_name} already exists for user {user_id}")
                 return False
-            result = self.manager.collection.update_many(
-                {"user_id": user_id, "file_name": old_name, "is_active": True},
-                {"$set": {"file_name": new_name, "updated_at": datetime.now(timezone.utc)}},
-            )
-            return bool(result.modified_count and result.modified_count > 0)
+
+            def _write(session):
+                res = self.manager.collection.update_many(
+                    {"user_id": user_id, "file_name": old_name, "is_active": True},
+                    {"$set": {"file_name": new_name, "updated_at": datetime.now(timezone.utc)}},
+                    **_session_kwargs(session),
+                )
+                if res.modified_count:
+                    self._sync_latest(user_id, [old_name, new_name], session)
+                return res
+
+            result = self._run_in_transaction(_write)
+            ok = bool(result.modified_count and result.modified_count > 0)
+            if ok:
+                self._update_search_index("rename_file", user_id, old_name, new_name)
+            return ok
         except Exception as e:
             logger.error(f"Error renaming file {old_name} to {new_name} for user {user_id}: {e}")
             return False
@@ -481,20 +1264,32 @@ class Repository:
             logger.error(f"שגיאה בקבלת קובץ גדול לפי ID: {e}")
             return None
 
-    def get_user_large_files(self, user_id: int, page: int = 1, per_page: int = 8) -> Tuple[List[Dict], int]:
+    def get_user_large_files(self, user_id: int, page: int = 1, per_page: int = 8,
+                             after: Optional[str] = None,
+                             fields: Optional[List[str]] = None) -> Tuple[List[Dict], int]:
+        """קבצים גדולים לפי created_at יורד. עם `after` (cursor של הפריט האחרון בעמוד
+        הקודם) העמוד נשלף לפי מפתח (created_at, _id) והסה"כ משוער מה-cache.
+        עם `fields` content לא נשלף והמסמכים מוחזרים כ-SnippetRef שטוען אותו לפי דרישה."""
+        lazy = fields is not None and "content" not in fields
         try:
-            skip = (page - 1) * per_page
-            total_count = self.manager.large_files_collection.count_documents({"user_id": user_id, "is_active": True})
-            cursor = self.manager.large_files_collection.find(
-                {"user_id": user_id, "is_active": True},
-                sort=[("created_at", -1)],
-            )
+            coll = self.manager.large_files_collection
+            match = {"user_id": user_id, "is_active": True}
+            if after:
+                skip = 0
+                total_count = self._approx_count(user_id, "large_files", lambda: coll.count_documents(match))
+            else:
+                skip = (page - 1) * per_page
+                total_count = coll.count_documents(match)
+            find_kwargs: Dict[str, Any] = {"sort": keyset_sort("created_at")}
+            if lazy:
+                find_kwargs["projection"] = _fields_projection(fields, "created_at")
+            cursor = coll.find(with_keyset(match, after, field="created_at"), **find_kwargs)
             # תמיכה ב-mocks שמחזירים list במקום Cursor
             if isinstance(cursor, list):
                 files = cursor[skip: skip + per_page]
             else:
                 files = list(cursor.skip(skip).limit(per_page))
-            return files, int(total_count)
+            return (self._large_file_refs(files) if lazy else files), int(total_count)
         except Exception as e:
             logger.error(f"שגיאה בקבלת קבצים גדולים: {e}")
             return [], 0
@@ -552,42 +1347,61 @@ class Repository:
             return False
 
     # --- Recycle bin operations ---
-    def list_deleted_files(self, user_id: int, page: int = 1, per_page: int = 20) -> Tuple[List[Dict], int]:
+    def list_deleted_files(self, user_id: int, page: int = 1, per_page: int = 20,
+                           after: Optional[str] = None) -> Tuple[List[Dict], int]:
+        """קבצים בסל המיחזור (רגילים וגדולים יחד) לפי deleted_at יורד.
+
+        מכל אוסף נשלפים רק page*per_page המסמכים הראשונים (או per_page אחרי `after`,
+        cursor של הפריט האחרון בעמוד הקודם) על אינדקס (deleted_at, _id), ומוזגים כאן.
+        """
         try:
-            # Combine soft-deleted regular and large files, sorted by deleted_at desc (then updated_at)
+            if page < 1:
+                page = 1
+            if per_page < 1:
+                per_page = 20
             match = {"user_id": user_id, "is_active": False}
-            # Fetch all and merge-sort in Python for simplicity and correctness across two collections
-            try:
-                reg_docs = list(self.manager.collection.find(match))
-            except Exception:
-                reg_docs = []
-            try:
-                large_docs = list(self.manager.large_files_collection.find(match))
-            except Exception:
-                large_docs = []
+            position = decode_cursor(after)
+            flt = with_keyset(match, after, field="deleted_at") if position is not None else match
+            # בעמוד N לפי מספר צריך את N*per_page הראשונים מכל אוסף; אחרי cursor מספיק עמוד אחד
+            depth = per_page if position is not None else page * per_page
+
+            truncated = []
 
-            def _key(doc: Dict[str, Any]):
-                dt = doc.get("deleted_at") or doc.get("updated_at") or doc.get("created_at")
-                # Normalize to sortable value; newer first, so we invert by using timestamp
+            def _top(coll) -> List[Dict[str, Any]]:
                 try:
-                    import datetime as _dt
-                    if isinstance(dt, _dt.datetime):
-                        return (dt, doc.get("updated_at") or dt)
+                    cursor = coll.find(flt)
+                    # תמיכה ב-mocks שמחזירים list במקום Cursor
+                    if isinstance(cursor, list):
+                        return list(cursor)
+                    docs = list(cursor.sort(keyset_sort("deleted_at")).limit(depth))
+                    truncated.append(len(docs) >= depth)
+                    return docs
                 except Exception:
-                    pass
-                return (None, None)
+                    return []
 
+            def _count(coll) -> int:
+                try:
+                    return int(coll.count_documents(match))
+                except Exception:
+                    return 0
+
+            reg_docs = _top(self.manager.collection)
+            large_docs = _top(self.manager.large_files_collection)
+
+            # אותו סדר (deleted_at, _id) של המיון במסד ושל ה-cursor — גם כשגרסאות חולקות deleted_at
             combined = reg_docs + large_docs
-            combined.sort(key=_key, reverse=True)
+            combined.sort(key=lambda doc: keyset_key(doc, "deleted_at"), reverse=True)
 
-            total = len(combined)
-            if page < 1:
-                page = 1
-            if per_page < 1:
-                per_page = 20
-            start = (page - 1) * per_page
-            end = start + per_page
-            return combined[start:end], int(total)
+            start = 0 if position is not None else (page - 1) * per_page
+            if position is None and not any(truncated):
+                # כל הסל נטען — הסה"כ ידוע בלי ספירה נוספת
+                total = len(combined)
+            else:
+                total = self._approx_count(
+                    user_id, "recycle",
+                    lambda: _count(self.manager.collection) + _count(self.manager.large_files_collection),
+                )
+            return combined[start:start + per_page], int(total)
         except Exception as e:
             logger.error(f"list_deleted_files failed: {e}")
             return [], 0
@@ -595,11 +1409,27 @@ class Repository:
     def restore_file_by_id(self, user_id: int, file_id: str) -> bool:
         try:
             now = datetime.now(timezone.utc)
-            res = self.manager.collection.update_many(
-                {"_id": ObjectId(file_id), "user_id": user_id, "is_active": False},
-                {"$set": {"is_active": True, "updated_at": now},
-                 "$unset": {"deleted_at": "", "deleted_expires_at": ""}},
-            )
+
+            restored: Dict[str, Any] = {}
+
+            def _write(session):
+                flt = {"_id": ObjectId(file_id), "user_id": user_id, "is_active": False}
+                result = self.manager.collection.update_many(
+                    flt,
+                    {"$set": {"is_active": True, "updated_at": now},
+                     "$unset": {"deleted_at": "", "deleted_expires_at": ""}},
+                    **_session_kwargs(session),
+                )
+                if int(result.modified_count or 0):
+                    # שם הקובץ נדרש רק כשמשהו שוחזר (סנכרון latest ואינדקס החיפוש)
+                    target = self.manager.collection.find_one(
+                        {"_id": ObjectId(file_id)}, {"file_name": 1}, **_session_kwargs(session))
+                    if isinstance(target, dict) and target.get("file_name"):
+                        restored["file_name"] = target["file_name"]
+                        self._sync_latest(user_id, [target["file_name"]], session)
+                return result
+
+            res = self._run_in_transaction(_write)
             modified = int(res.modified_count or 0)
             if modified == 0:
                 # Try large files collection
@@ -609,6 +1439,14 @@ class Repository:
                      "$unset": {"deleted_at": "", "deleted_expires_at": ""}},
                 )
                 modified += int(res2.modified_count or 0)
+            elif restored.get("file_name"):
+                # קובץ רגיל שוחזר — נעדכן את אינדקס החיפוש לפי הגרסה הפעילה האחרונה
+                try:
+                    latest = self.get_file(user_id, restored["file_name"])
+                    if latest:
+                        self._update_search_index("index_file", user_id, latest)
+                except Exception:
+                    pass
             if modified > 0:
                 cache.invalidate_user_cache(user_id)
                 return True
@@ -619,8 +1457,12 @@ class Repository:
 
     def purge_file_by_id(self, user_id: int, file_id: str) -> bool:
         try:
-            res = self.manager.collection.delete_many({"_id": ObjectId(file_id), "user_id": user_id, "is_active": False})
+            flt = {"_id": ObjectId(file_id), "user_id": user_id, "is_active": False}
+            target = self.manager.collection.find_one(flt, {"file_name": 1})
+            res = self.manager.collection.delete_many(flt)
             deleted = int(res.deleted_count or 0)
+            if deleted and isinstance(target, dict) and target.get("file_name"):
+                self._sync_latest(user_id, [target["file_name"]])
             if deleted == 0:
                 res2 = self.manager.large_files_collection.delete_many({"_id": ObjectId(file_id), "user_id": user_id, "is_active": False})
                 deleted += int(res2.deleted_count or 0)
@@ -636,9 +1478,11 @@ class Repository:
             return False
 
     def get_all_user_files_combined(self, user_id: int) -> Dict[str, List[Dict]]:
+        """רשימת מטא-דאטה של כל הקבצים; code/content נטענים רק אם ניגשים אליהם (SnippetRef)"""
         try:
-            regular_files = self.get_user_files(user_id, limit=100)
-            large_files, _ = self.get_user_large_files(user_id, page=1, per_page=100)
+            regular_files = self.get_user_files(user_id, limit=100, fields=_COMBINED_FIELDS)
+            large_files, _ = self.get_user_large_files(user_id, page=1, per_page=100,
+                                                       fields=_COMBINED_FIELDS + ["file_size", "lines_count"])
             return {"regular_files": regular_files, "large_files": large_files}
         except Exception as e:
             logger.error(f"שגיאה בקבלת כל הקבצים: {e}")
@@ -707,6 +1551,12 @@ class Repository:
     def get_user_file_names(self, user_id: int, limit: int = 1000) -> List[str]:
         """שמות קבצים אחרונים (distinct לפי file_name), ממוינים לפי updated_at של הגרסה האחרונה."""
         try:
+            latest = self._latest()
+            if latest is not None:
+                docs = latest.find(
+                    {"user_id": user_id, "is_active": True}, {"_id": 0, "file_name": 1}
+                ).sort("updated_at", -1).limit(max(1, int(limit or 1000)))
+                return [d.get("file_name") for d in docs if isinstance(d, dict) and d.get("file_name")]
             pipeline = [
                 {"$match": {"user_id": user_id, "is_active": True}},
                 {"$sort": {"file_name": 1, "version": -1}},
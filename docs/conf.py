@@ -64,7 +64,7 @@ autodoc_mock_imports = [
     # DB drivers and BSON
     'pymongo', 'motor', 'bson',
     # External services and heavy deps
-    'fuzzywuzzy', 'python_levenshtein', 'Levenshtein',
+    'rapidfuzz', 'fuzzywuzzy', 'python_levenshtein', 'Levenshtein',
     'redis', 'aioredis', 'celery', 'psutil', 'sentry_sdk',
     # Web frameworks and servers (not needed for docs)
     'flask', 'uvicorn', 'gunicorn', 'telegram', 'telegram.ext',
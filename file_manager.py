@@ -531,7 +531,7 @@ class BackupManager:
 
             if purge:
                 try:
-                    existing = db.get_user_files(user_id, limit=10000) or []
+                    existing = db.get_user_files(user_id, limit=10000, fields=["file_name"]) or []
                     for doc in existing:
                         try:
                             fname = doc.get('file_name')
@@ -542,6 +542,18 @@ class BackupManager:
                 except Exception as e:
                     results["errors"].append(f"purge listing failed: {e}")
 
+            # אם יש תגית repo:* — נשמור רק את האחרונה (היתר מסוננות בשכבת repo.save_file)
+            filtered_extra = list(extra_tags or [])
+            try:
+                repo_tags = [t for t in filtered_extra if isinstance(t, str) and t.strip().lower().startswith('repo:')]
+                if repo_tags:
+                    filtered_extra = [repo_tags[-1]] + [t for t in filtered_extra if not (isinstance(t, str) and t.strip().lower().startswith('repo:'))]
+            except Exception:
+                pass
+            # שמירה באצוות כשה-DB תומך בכך; אחרת קובץ-קובץ
+            save_bulk = getattr(db, 'save_files_bulk', None)
+            pending: List[Dict[str, Any]] = []
+
             with zipfile.ZipFile(backup_path, 'r') as zf:
                 names = [n for n in zf.namelist() if not n.endswith('/') and n != 'metadata.json']
                 for name in names:
@@ -557,16 +569,9 @@ class BackupManager:
                                 results["errors"].append(f"decode failed for {name}: {e}")
                                 continue
                         lang = detect_language_from_filename(name)
-                        # אם יש תגית repo:* — הוסף אותה רק עבור קבצים שנמצאים בשורש הריפו או תחת נתיב התואם לריפו
-                        filtered_extra = list(extra_tags or [])
-                        try:
-                            repo_tags = [t for t in filtered_extra if isinstance(t, str) and t.strip().lower().startswith('repo:')]
-                            # כלל זהיר: שמור את תג ה-repo רק אם הנתיב אינו כולל סלאשים רבים/או שהקובץ בשם שאינו גורף (index.html יכול להופיע בכל מקום) —
-                            # בפשטות: תמיד נאפשר, אבל נוסיף רק את תג ה-repo האחרון (אם קיים) והיתר נסנן למעלה בשכבת repo.save_file
-                            if repo_tags:
-                                filtered_extra = [repo_tags[-1]] + [t for t in filtered_extra if not (isinstance(t, str) and t.strip().lower().startswith('repo:'))]
-                        except Exception:
-                            pass
+                        if callable(save_bulk):
+                            pending.append({"file_name": name, "code": text, "programming_language": lang})
+                            continue
                         ok = db.save_file(user_id=user_id, file_name=name, code=text, programming_language=lang, extra_tags=filtered_extra)
                         if ok:
                             results["restored_files"] += 1
@@ -574,6 +579,14 @@ class BackupManager:
                             results["errors"].append(f"save failed for {name}")
                     except Exception as e:
                         results["errors"].append(f"restore failed for {name}: {e}")
+
+            if pending and callable(save_bulk):
+                for outcome in save_bulk(user_id, pending, extra_tags=filtered_extra):
+                    if outcome.get("status") == "failed":
+                        reason = f": {outcome['error']}" if outcome.get("error") else ""
+                        results["errors"].append(f"save failed for {outcome.get('file_name')}{reason}")
+                    else:
+                        results["restored_files"] += 1
         except Exception as e:
             results["errors"].append(str(e))
         return results
@@ -0,0 +1,112 @@
+"""
+התאמה מטושטשת משותפת (חיפוש + אוטו-השלמה)
+Shared fuzzy matching on top of rapidfuzz
+
+rapidfuzz מריץ את החישובים ב-C++ ומשחרר את ה-GIL, ו-`cdist` מחשב מטריצת ציונים
+באצווה אחת על פני כל הליבות. אם החבילה חסרה, נשתמש במימוש Python פשוט.
+"""
+
+import logging
+from typing import Iterable, List, Optional, Sequence, Set, Tuple
+
+try:
+    from rapidfuzz import fuzz as _rf_fuzz, process as _rf_process  # type: ignore
+    HAS_RAPIDFUZZ = True
+except Exception:  # rapidfuzz אינו חובה – נריץ עם מימוש fallback
+    _rf_fuzz = None  # type: ignore[assignment]
+    _rf_process = None  # type: ignore[assignment]
+    HAS_RAPIDFUZZ = False
+
+logger = logging.getLogger(__name__)
+
+
+def _fallback_ratio(a: str, b: str) -> float:
+    a = (a or "").lower()
+    b = (b or "").lower()
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 100.0
+    common = sum(1 for ch in set(a) if ch in b)
+    return 100.0 * common / max(len(set(a + b)), 1)
+
+
+def _fallback_partial_ratio(a: str, b: str) -> float:
+    a = (a or "").lower()
+    b = (b or "").lower()
+    if not a or not b:
+        return 0.0
+    if a in b or b in a:
+        return 100.0
+    # crude overlap measure
+    common = sum(1 for ch in set(a) if ch in b)
+    return 100.0 * common / max(len(set(a + b)), 1)
+
+
+def ratio(a: str, b: str) -> float:
+    """דמיון מלא בין שתי מחרוזות (0-100)"""
+    if HAS_RAPIDFUZZ:
+        return float(_rf_fuzz.ratio(a, b))
+    return _fallback_ratio(a, b)
+
+
+def partial_ratio(a: str, b: str) -> float:
+    """דמיון של המחרוזת הקצרה לחלון הטוב ביותר בארוכה (0-100)"""
+    if HAS_RAPIDFUZZ:
+        return float(_rf_fuzz.partial_ratio(a, b))
+    return _fallback_partial_ratio(a, b)
+
+
+def score_many(query: str, choices: Sequence[str], partial: bool = True) -> List[float]:
+    """ציון אחד לכל מחרוזת ב-choices, בחישוב אצווה אחד (cdist, כל הליבות)"""
+    if not choices:
+        return []
+    if HAS_RAPIDFUZZ:
+        scorer = _rf_fuzz.partial_ratio if partial else _rf_fuzz.ratio
+        try:
+            matrix = _rf_process.cdist([query], list(choices), scorer=scorer, workers=-1)
+            return [float(x) for x in matrix[0]]
+        except Exception as e:  # למשל numpy חסר בסביבה
+            logger.debug(f"cdist unavailable, scoring one by one: {e}")
+            return [float(scorer(query, c)) for c in choices]
+    fn = _fallback_partial_ratio if partial else _fallback_ratio
+    return [fn(query, c) for c in choices]
+
+
+def extract(query: str, choices: Iterable[str], limit: int = 5,
+            score_cutoff: float = 0) -> List[Tuple[str, int]]:
+    """ההתאמות הטובות ביותר כ-(בחירה, ציון שלם), בדומה ל-fuzzywuzzy.process.extract"""
+    choices = list(choices)
+    if not choices:
+        return []
+    if HAS_RAPIDFUZZ:
+        found = _rf_process.extract(
+            query, choices, scorer=_rf_fuzz.partial_ratio, limit=limit, score_cutoff=score_cutoff
+        )
+        return [(choice, int(round(score))) for choice, score, _idx in found]
+    scored = [(c, int(_fallback_partial_ratio(query, c))) for c in choices]
+    scored = [t for t in scored if t[1] >= score_cutoff]
+    scored.sort(key=lambda t: t[1], reverse=True)
+    return scored[:limit]
+
+
+def trigrams(text: str) -> Set[str]:
+    """טריגרמים של מחרוזת (באותיות קטנות); מחרוזת קצרה מוחזרת כפי שהיא"""
+    text = (text or "").lower()
+    if len(text) < 3:
+        return {text} if text else set()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def content_windows(query: str, text: str, grams: Optional[Set[str]] = None, max_windows: int = 200) -> List[str]:
+    """שורות בטקסט שמכילות לפחות טריגרם אחד של השאילתה (חלונות מועמדים לניקוד)"""
+    grams = grams if grams is not None else trigrams(query)
+    if not grams:
+        return []
+    windows: List[str] = []
+    for line in (text or "").lower().splitlines():
+        if line and any(g in line for g in grams):
+            windows.append(line)
+            if len(windows) >= max_windows:
+                break
+    return windows
@@ -14,7 +14,7 @@ import tempfile
 import shutil
 from html import escape
 from io import BytesIO
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 
 from github import Github, GithubException
 from github.InputGitTreeElement import InputGitTreeElement
@@ -581,6 +581,7 @@ class GitHubMenuHandler:
         updated = 0
         total_bytes = 0
         skipped = 0
+        pending: List[Dict[str, Any]] = []
         try:
             # קבלת קישור zipball עבור branch
             try:
@@ -651,24 +652,22 @@ class GitHubMenuHandler:
                                 continue
                         if total_bytes + len(raw) > IMPORT_MAX_TOTAL_BYTES:
                             continue
-                        if saved >= IMPORT_MAX_FILES:
+                        if len(pending) >= IMPORT_MAX_FILES:
                             continue
                         lang = detect_language_from_filename(rel_path)
-                        # בדוק אם קיים כבר עבור אותו ריפו (לפי תגית repo:)
-                        prev_doc = db.get_latest_version(user_id, rel_path)
-                        prev_tags = (prev_doc.get('tags') or []) if isinstance(prev_doc, dict) else []
-                        existed_for_repo = any((isinstance(t, str) and t == repo_tag) for t in prev_tags)
-                        ok = db.save_file(user_id=user_id, file_name=rel_path, code=text, programming_language=lang, extra_tags=[repo_tag, source_tag])
-                        if ok:
-                            if existed_for_repo:
-                                updated += 1
-                            else:
-                                saved += 1
-                            total_bytes += len(raw)
-                        else:
-                            skipped += 1
+                        pending.append({"file_name": rel_path, "code": text, "programming_language": lang})
+                        total_bytes += len(raw)
                     except Exception:
                         skipped += 1
+            # שמירה באצוות: שאילתה אחת לגרסאות קודמות, bulk_write ואינוולידציית cache אחת
+            for outcome in db.save_files_bulk(user_id, pending, extra_tags=[repo_tag, source_tag]):
+                if outcome.get("status") == "failed":
+                    skipped += 1
+                # קיים כבר עבור אותו ריפו (לפי תגית repo:) → עודכן; אחרת חדש
+                elif repo_tag in (outcome.get("previous_tags") or []):
+                    updated += 1
+                else:
+                    saved += 1
             await query.edit_message_text(
                 f"✅ ייבוא הושלם: {saved} חדשים, {updated} עודכנו, {skipped} דילוגים.\n"
                 f"🔖 תיוג: <code>{repo_tag}</code> (ו-<code>{source_tag}</code>)\n\n"
@@ -5569,6 +5568,7 @@ class GitHubMenuHandler:
         }
         try:
             res = db.collection.insert_one(doc)
+            db.sync_latest_snippet(user_id, file_name)
             context.user_data["pending_saved_file_id"] = str(res.inserted_id)
             # פתח את בדיקות ההעלאה (בחירת ענף/תיקייה ואישור)
             await self.show_pre_upload_check(update, context)
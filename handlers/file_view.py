@@ -17,7 +17,7 @@ from io import BytesIO
 from datetime import datetime, timezone
 from typing import List, Optional
 from html import escape as html_escape
-from utils import TelegramUtils
+from utils import AsyncUtils, TelegramUtils
 
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup
 from telegram.constants import ParseMode
@@ -140,7 +140,7 @@ async def handle_view_file(update, context: ContextTypes.DEFAULT_TYPE) -> int:
             try:
                 from database import db
                 user_id = update.effective_user.id
-                latest_doc = db.get_latest_version(user_id, file_name)
+                latest_doc = await AsyncUtils.aio_db(db).get_latest_version(user_id, file_name)
                 if latest_doc:
                     code = latest_doc.get('code', '') or ''
                     language = latest_doc.get('programming_language', language) or language
@@ -254,7 +254,7 @@ async def receive_new_code(update, context: ContextTypes.DEFAULT_TYPE) -> int:
         user_id = update.effective_user.id
         try:
             from database import db, CodeSnippet
-            doc = db.get_latest_version(user_id, file_name)
+            doc = await AsyncUtils.aio_db(db).get_latest_version(user_id, file_name)
             if not doc:
                 await update.message.reply_text("❌ הקובץ לא נמצא לעדכון הערה")
                 return ConversationHandler.END
@@ -265,7 +265,7 @@ async def receive_new_code(update, context: ContextTypes.DEFAULT_TYPE) -> int:
                 programming_language=doc.get('programming_language', 'text'),
                 description=("" if note_text.lower() == 'מחק' else note_text)[:280],
             )
-            ok = db.save_code_snippet(snippet)
+            ok = await AsyncUtils.aio_db(db).save_code_snippet(snippet)
             if ok:
                 await update.message.reply_text(
                     "✅ הערה עודכנה בהצלחה!",
@@ -295,7 +295,7 @@ async def receive_new_code(update, context: ContextTypes.DEFAULT_TYPE) -> int:
                 file_size=len(new_code.encode('utf-8')),
                 lines_count=len(new_code.split('\n')),
             )
-            success = db.save_large_file(updated_file)
+            success = await AsyncUtils.aio_db(db).save_large_file(updated_file)
             if success:
                 from utils import get_language_emoji
                 emoji = get_language_emoji(language)
@@ -339,7 +339,7 @@ async def receive_new_code(update, context: ContextTypes.DEFAULT_TYPE) -> int:
             return EDIT_CODE
         detected_language = code_service.detect_language(cleaned_code, file_name)
         from database import db
-        success = db.save_file(user_id, file_name, cleaned_code, detected_language)
+        success = await AsyncUtils.aio_db(db).save_file(user_id, file_name, cleaned_code, detected_language)
         if success:
             keyboard = [
                 [
@@ -353,7 +353,7 @@ async def receive_new_code(update, context: ContextTypes.DEFAULT_TYPE) -> int:
             ]
             reply_markup = InlineKeyboardMarkup(keyboard)
             from database import db as _db
-            last_version = _db.get_latest_version(user_id, file_name)
+            last_version = await AsyncUtils.aio_db(_db).get_latest_version(user_id, file_name)
             version_num = last_version.get('version', 1) if last_version else 1
             try:
                 if files_cache is not None and editing_file_index is not None and str(editing_file_index) in files_cache:
@@ -466,11 +466,11 @@ async def receive_new_name(update, context: ContextTypes.DEFAULT_TYPE) -> int:
         user_id = update.effective_user.id
         old_name = context.user_data.get('editing_file_name') or file_data.get('file_name')
         from database import db
-        success = db.rename_file(user_id, old_name, new_name)
+        success = await AsyncUtils.aio_db(db).rename_file(user_id, old_name, new_name)
         if success:
             # חשב fid עבור הכפתור 'הצג קוד' בהעדפת ID אם זמין
             try:
-                latest_doc = db.get_latest_version(user_id, new_name) or {}
+                latest_doc = await AsyncUtils.aio_db(db).get_latest_version(user_id, new_name) or {}
                 fid = str(latest_doc.get('_id') or '')
             except Exception:
                 fid = ''
@@ -526,7 +526,7 @@ async def handle_versions_history(update, context: ContextTypes.DEFAULT_TYPE) ->
             file_name = file_data.get('file_name')
         user_id = update.effective_user.id
         from database import db
-        versions = db.get_all_versions(user_id, file_name)
+        versions = await AsyncUtils.aio_db(db).get_all_versions(user_id, file_name)
         if not versions:
             await query.edit_message_text("📚 אין היסטוריית גרסאות לקובץ זה")
             return ConversationHandler.END
@@ -590,7 +590,7 @@ async def handle_download_file(update, context: ContextTypes.DEFAULT_TYPE) -> in
                 return ConversationHandler.END
             from database import db
             user_id = update.effective_user.id
-            latest = db.get_latest_version(user_id, file_name)
+            latest = await AsyncUtils.aio_db(db).get_latest_version(user_id, file_name)
             if not latest:
                 await query.edit_message_text("❌ לא נמצאה גרסה אחרונה לקובץ")
                 return ConversationHandler.END
@@ -668,7 +668,7 @@ async def handle_delete_file(update, context: ContextTypes.DEFAULT_TYPE) -> int:
         user_id = update.effective_user.id
         file_name = file_data.get('file_name')
         from database import db
-        success = db.delete_file(user_id, file_name)
+        success = await AsyncUtils.aio_db(db).delete_file(user_id, file_name)
         if success:
             keyboard = [[InlineKeyboardButton("🔙 לרשימת קבצים", callback_data="files")]]
             reply_markup = InlineKeyboardMarkup(keyboard)
@@ -740,12 +740,12 @@ async def handle_view_direct_file(update, context: ContextTypes.DEFAULT_TYPE) ->
         if token.startswith("id:"):
             file_id = token[3:]
             try:
-                doc = db.get_file_by_id(file_id)
+                doc = await AsyncUtils.aio_db(db).get_file_by_id(file_id)
             except Exception:
                 doc = None
             if not doc:
                 try:
-                    lf = db.get_large_file_by_id(file_id)
+                    lf = await AsyncUtils.aio_db(db).get_large_file_by_id(file_id)
                 except Exception:
                     lf = None
                 if lf:
@@ -767,11 +767,11 @@ async def handle_view_direct_file(update, context: ContextTypes.DEFAULT_TYPE) ->
                 file_data = doc
         else:
             file_name = token
-            file_data = db.get_latest_version(user_id, file_name)
+            file_data = await AsyncUtils.aio_db(db).get_latest_version(user_id, file_name)
         # תמיכה בקבצים גדולים: אם לא נמצא בקולקציה הרגילה, ננסה large_files
         if not file_data and file_name:
             try:
-                lf = db.get_large_file(user_id, file_name)
+                lf = await AsyncUtils.aio_db(db).get_large_file(user_id, file_name)
             except Exception:
                 lf = None
             if lf:
@@ -860,7 +860,7 @@ async def handle_edit_code_direct(update, context: ContextTypes.DEFAULT_TYPE) ->
         file_name = query.data.replace("edit_code_direct_", "")
         user_id = update.effective_user.id
         from database import db
-        file_data = db.get_latest_version(user_id, file_name)
+        file_data = await AsyncUtils.aio_db(db).get_latest_version(user_id, file_name)
         if not file_data:
             await query.edit_message_text("❌ שגיאה בזיהוי הקובץ")
             return ConversationHandler.END
@@ -887,7 +887,7 @@ async def handle_edit_name_direct(update, context: ContextTypes.DEFAULT_TYPE) ->
         file_name = query.data.replace("edit_name_direct_", "")
         user_id = update.effective_user.id
         from database import db
-        file_data = db.get_latest_version(user_id, file_name)
+        file_data = await AsyncUtils.aio_db(db).get_latest_version(user_id, file_name)
         if not file_data:
             await query.edit_message_text("❌ שגיאה בזיהוי הקובץ")
             return ConversationHandler.END
@@ -914,7 +914,7 @@ async def handle_edit_note_direct(update, context: ContextTypes.DEFAULT_TYPE) ->
         file_name = query.data.replace("edit_note_direct_", "")
         user_id = update.effective_user.id
         from database import db
-        file_data = db.get_latest_version(user_id, file_name)
+        file_data = await AsyncUtils.aio_db(db).get_latest_version(user_id, file_name)
         if not file_data:
             await query.edit_message_text("❌ לא נמצא הקובץ לעריכת הערה")
             return ConversationHandler.END
@@ -955,7 +955,7 @@ async def handle_clone(update, context: ContextTypes.DEFAULT_TYPE) -> int:
             tags = []
         user_id = update.effective_user.id
 
-        def _suggest_clone_name(name: str) -> str:
+        async def _suggest_clone_name(name: str) -> str:
             try:
                 dot = name.rfind('.')
                 stem = name[:dot] if dot > 0 else name
@@ -964,16 +964,16 @@ async def handle_clone(update, context: ContextTypes.DEFAULT_TYPE) -> int:
                 stem, ext = name, ''
             from database import db
             candidate = f"{stem} (copy){ext}"
-            exists = db.get_latest_version(user_id, candidate)
+            exists = await AsyncUtils.aio_db(db).get_latest_version(user_id, candidate)
             if not exists:
                 return candidate
             for i in range(2, 100):
                 candidate = f"{stem} (copy {i}){ext}"
-                if not db.get_latest_version(user_id, candidate):
+                if not await AsyncUtils.aio_db(db).get_latest_version(user_id, candidate):
                     return candidate
             return f"{stem} (copy {int(datetime.now(timezone.utc).timestamp())}){ext}"
 
-        new_name = _suggest_clone_name(original_name)
+        new_name = await _suggest_clone_name(original_name)
 
         from database import db, CodeSnippet
         snippet = CodeSnippet(
@@ -984,7 +984,7 @@ async def handle_clone(update, context: ContextTypes.DEFAULT_TYPE) -> int:
             description=description,
             tags=tags,
         )
-        ok = db.save_code_snippet(snippet)
+        ok = await AsyncUtils.aio_db(db).save_code_snippet(snippet)
         if ok:
             try:
                 # רענון חלקי של ה-cache המקומי אם זמין
@@ -1026,7 +1026,7 @@ async def handle_clone_direct(update, context: ContextTypes.DEFAULT_TYPE) -> int
         file_name = query.data.replace("clone_direct_", "")
         user_id = update.effective_user.id
         from database import db
-        file_data = db.get_latest_version(user_id, file_name)
+        file_data = await AsyncUtils.aio_db(db).get_latest_version(user_id, file_name)
         if not file_data:
             await query.edit_message_text("❌ הקובץ לא נמצא לשכפול")
             return ConversationHandler.END
@@ -1038,7 +1038,7 @@ async def handle_clone_direct(update, context: ContextTypes.DEFAULT_TYPE) -> int
         except Exception:
             tags = []
 
-        def _suggest_clone_name(name: str) -> str:
+        async def _suggest_clone_name(name: str) -> str:
             try:
                 dot = name.rfind('.')
                 stem = name[:dot] if dot > 0 else name
@@ -1046,15 +1046,15 @@ async def handle_clone_direct(update, context: ContextTypes.DEFAULT_TYPE) -> int
             except Exception:
                 stem, ext = name, ''
             candidate = f"{stem} (copy){ext}"
-            if not db.get_latest_version(user_id, candidate):
+            if not await AsyncUtils.aio_db(db).get_latest_version(user_id, candidate):
                 return candidate
             for i in range(2, 100):
                 candidate = f"{stem} (copy {i}){ext}"
-                if not db.get_latest_version(user_id, candidate):
+                if not await AsyncUtils.aio_db(db).get_latest_version(user_id, candidate):
                     return candidate
             return f"{stem} (copy {int(datetime.now(timezone.utc).timestamp())}){ext}"
 
-        new_name = _suggest_clone_name(file_name)
+        new_name = await _suggest_clone_name(file_name)
         # יצירת snippet לשמירה: העדפה למחלקה מה-DB, עם נפילה חכמה לאובייקט פשוט/שמירה ישירה
         try:
             from database import CodeSnippet  # type: ignore
@@ -1066,7 +1066,7 @@ async def handle_clone_direct(update, context: ContextTypes.DEFAULT_TYPE) -> int
                 description=description,
                 tags=tags,
             )
-            ok = db.save_code_snippet(snippet)
+            ok = await AsyncUtils.aio_db(db).save_code_snippet(snippet)
         except Exception:
             # סביבה בדיקות/סטאב: ננסה אובייקט דמוי‑snippet או נפילה לשמירה ישירה
             try:
@@ -1081,13 +1081,13 @@ async def handle_clone_direct(update, context: ContextTypes.DEFAULT_TYPE) -> int
                     snippet.tags = tags
                 except Exception:
                     pass
-                ok = db.save_code_snippet(snippet)
+                ok = await AsyncUtils.aio_db(db).save_code_snippet(snippet)
             except Exception:
-                ok = db.save_file(user_id, new_name, code, language)
+                ok = await AsyncUtils.aio_db(db).save_file(user_id, new_name, code, language)
         if ok:
             # חשב fid עבור הכפתור 'הצג קוד' בהעדפת ID אם זמין
             try:
-                latest_doc = db.get_latest_version(user_id, new_name) or {}
+                latest_doc = await AsyncUtils.aio_db(db).get_latest_version(user_id, new_name) or {}
                 fid = str(latest_doc.get('_id') or '')
             except Exception:
                 fid = ''
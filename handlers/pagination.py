@@ -1,7 +1,9 @@
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
 from telegram import InlineKeyboardButton
 
+from pagination import cursor_for
+
 
 def build_pagination_row(
     page: int,
@@ -28,3 +30,41 @@ def build_pagination_row(
         row.append(InlineKeyboardButton("➡️ הבא", callback_data=f"{callback_prefix}{page+1}"))
     return row or None
 
+
+
+def page_cursor(user_data: Dict[str, Any], store_key: str, page: int, scope: str = "") -> Optional[str]:
+    r"""Return the keyset cursor remembered for ``page`` (sequential navigation only).
+
+    callback_data is limited to 64 bytes, so cursors live in ``context.user_data``
+    under ``store_key`` as ``{page: cursor}`` rather than inside the button itself.
+    ``scope`` identifies the listing filter (for example a repo tag); cursors stored
+    for another scope are ignored, so an older message never reuses them.
+    """
+    cursors = user_data.get(store_key)
+    if not isinstance(cursors, dict) or page <= 1 or cursors.get("_scope", "") != scope:
+        return None
+    return cursors.get(str(page))
+
+
+def remember_page_cursor(
+    user_data: Dict[str, Any],
+    store_key: str,
+    page: int,
+    items: List[Dict[str, Any]],
+    field: str = "updated_at",
+    scope: str = "",
+) -> None:
+    r"""Store the cursor of the last item on ``page`` as the entry point of ``page + 1``.
+
+    Rendering page 1, or a page of another ``scope``, starts a fresh listing, so
+    older cursors are dropped.
+    """
+    cursors = user_data.get(store_key)
+    if page <= 1 or not isinstance(cursors, dict) or cursors.get("_scope", "") != scope:
+        cursors = {"_scope": scope} if scope else {}
+        user_data[store_key] = cursors
+    token = cursor_for(items[-1], field) if items else None
+    if token:
+        cursors[str(page + 1)] = token
+    else:
+        cursors.pop(str(page + 1), None)
@@ -16,6 +16,7 @@ from telegram import (
 from telegram.ext import ContextTypes
 
 from database import LargeFile, db
+from handlers.pagination import page_cursor, remember_page_cursor
 from utils import detect_language_from_filename, get_language_emoji
 
 logger = logging.getLogger(__name__)
@@ -31,8 +32,15 @@ class LargeFilesHandler:
         """מציג תפריט קבצים גדולים עם ניווט בין עמודים"""
         user_id = update.effective_user.id
         
-        # קבלת קבצים לעמוד הנוכחי
-        files, total_count = db.get_user_large_files(user_id, page, self.files_per_page)
+        # קבלת קבצים לעמוד הנוכחי — בדפדוף רציף ממשיכים מה-cursor של העמוד הקודם
+        after = page_cursor(context.user_data, 'lf_page_cursors', page)
+        files, total_count = [], 0
+        if after:
+            files, total_count = db.get_user_large_files(user_id, page, self.files_per_page, after=after)
+        if not files:
+            after = None
+            files, total_count = db.get_user_large_files(user_id, page, self.files_per_page)
+        remember_page_cursor(context.user_data, 'lf_page_cursors', page, files, field='created_at')
         
         if not files and page == 1:
             # אין קבצים בכלל
@@ -59,6 +67,9 @@ class LargeFilesHandler:
         
         # חישוב מספר עמודים
         total_pages = (total_count + self.files_per_page - 1) // self.files_per_page
+        if after:
+            # הסה"כ משוער — העמוד שהגענו אליו לפי cursor קיים בוודאות
+            total_pages = max(total_pages, page)
         
         # יצירת כפתורים לקבצים
         keyboard = []
@@ -9,10 +9,12 @@ from typing import Dict, List, Optional, Generator, Tuple
 from dataclasses import dataclass
 from database import db
 from cache_manager import cache, cached
+from cache_codec import register_type
 from html import escape as html_escape
 
 logger = logging.getLogger(__name__)
 
+@register_type  # חוזר מה-cache כ-FileChunk ולא כמחרוזת
 @dataclass
 class FileChunk:
     """חלק מקובץ גדול"""
@@ -23,6 +25,7 @@ class FileChunk:
     content: str
     total_chunks: int
     total_lines: int
+    programming_language: str = "text"
 
 class LazyLoader:
     """מנהל Lazy Loading לקבצים גדולים"""
@@ -74,19 +77,30 @@ class LazyLoader:
     
     @cached(expire_seconds=600, key_prefix="file_chunks")  # cache ל-10 דקות
     def get_file_chunk(self, user_id: int, file_name: str, chunk_index: int) -> Optional[FileChunk]:
-        """קבלת chunk ספציפי מקובץ"""
+        """קבלת chunk ספציפי מקובץ.
+
+        נקראות רק השורות של ה-chunk (לפי אינדקס השורות השמור על הגרסה, ראו
+        line_index), כך שדף N של קובץ ארוך עולה כמו הדף הראשון.
+        """
         try:
-            file_data = db.get_latest_version(user_id, file_name)
-            if not file_data:
+            if chunk_index < 0:
+                return None
+            start_line = chunk_index * self.chunk_size
+            lines = db.get_line_range(user_id, file_name, start_line, self.chunk_size)
+            if not lines:
                 return None
             
-            code = file_data['code']
-            chunks = self.create_chunks(code, file_name)
-            
-            if 0 <= chunk_index < len(chunks):
-                return chunks[chunk_index]
-            
-            return None
+            total_lines = lines['total_lines']
+            return FileChunk(
+                file_name=file_name,
+                chunk_index=chunk_index,
+                start_line=start_line + 1,  # 1-based indexing למשתמש
+                end_line=lines['end_line'],
+                content=lines['content'],
+                total_chunks=(total_lines + self.chunk_size - 1) // self.chunk_size,
+                total_lines=total_lines,
+                programming_language=lines.get('programming_language') or 'text',
+            )
             
         except Exception as e:
             logger.error(f"שגיאה בקבלת chunk: {e}")
@@ -260,12 +274,8 @@ class LazyLoader:
                 )
                 return
             
-            # קבלת מידע על הקובץ
-            file_data = db.get_latest_version(user_id, file_name)
-            programming_language = file_data.get('programming_language', 'text') if file_data else 'text'
-            
             # פורמט ההודעה
-            message = self.format_chunk_message(chunk, programming_language)
+            message = self.format_chunk_message(chunk, chunk.programming_language)
             
             # מקלדת ניווט
             keyboard = self.get_navigation_keyboard(chunk, user_id)
@@ -0,0 +1,84 @@
+"""
+אינדקס היסטים של שורות לגרסת קוד
+Compact line-offset index for ranged reads
+
+האינדקס מחושב פעם אחת בזמן השמירה ונשמר על מסמך הגרסה (שדה line_index), כך
+שדפדוף בקובץ גדול (LazyLoader) קורא מהמסד רק את טווח הבייטים של הדף המבוקש
+במקום לטעון ולפצל את כל הקובץ בכל לחיצה.
+
+הפורמט: מערך uint32 little-endian — האיבר הראשון הוא הצעד (stride), ואחריו
+היסט הבייטים (UTF-8) של תחילת כל שורה stride-ית: שורות 0, stride, 2*stride...
+עם צעד של 50 שורות קובץ של 50,000 שורות דורש כ-4KB.
+המודול משתמש בספרייה הסטנדרטית בלבד.
+"""
+
+import sys
+from array import array
+from typing import Optional, Tuple
+
+# תואם ל-LazyLoader.chunk_size, כך שכל דף מתחיל בדיוק בנקודת אינדקס
+LINE_INDEX_STRIDE = 50
+
+
+def _to_bytes(values: array) -> bytes:
+    if sys.byteorder != "little":
+        values = array("I", values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def build_line_index(code: str, stride: int = LINE_INDEX_STRIDE) -> bytes:
+    """בניית האינדקס הדחוס לקוד (ראו תיעוד המודול)"""
+    stride = max(1, int(stride))
+    data = (code or "").encode("utf-8", "surrogatepass")
+    values = array("I", [stride, 0])
+    pos, line = 0, 0
+    while True:
+        pos = data.find(b"\n", pos) + 1
+        if not pos:
+            break
+        line += 1
+        if line % stride == 0:
+            values.append(pos)
+    return _to_bytes(values)
+
+
+def parse_line_index(raw: Optional[bytes]) -> Optional[Tuple[int, array]]:
+    """(stride, offsets) מתוך הערך השמור, או None לערך חסר/פגום"""
+    if not isinstance(raw, (bytes, bytearray, memoryview)):
+        return None
+    raw = bytes(raw)
+    if len(raw) < 8 or len(raw) % 4:
+        return None
+    values = array("I")
+    values.frombytes(raw)
+    if sys.byteorder != "little":
+        values.byteswap()
+    stride = values[0]
+    if stride < 1:
+        return None
+    return stride, values[1:]
+
+
+def total_lines(line_count: Optional[int]) -> int:
+    """מספר השורות כפי ש-code.split('\\n') סופר (קוד ריק הוא שורה אחת ריקה)"""
+    return max(1, int(line_count or 0))
+
+
+def byte_span(index: Tuple[int, array], size_bytes: int, start_line: int, end_line: int) -> Tuple[int, int, int]:
+    """טווח הבייטים שמכסה את השורות [start_line, end_line) (0-based).
+
+    מחזיר (start_byte, end_byte, skip): הטווח מתחיל בנקודת האינדקס הקרובה שלפני
+    start_line, ו-skip הוא מספר השורות שיש לדלג עליהן בתחילתו (0 כשהגבול מיושר לצעד).
+    """
+    stride, offsets = index
+    anchor = min(start_line // stride, len(offsets) - 1)
+    start_byte = offsets[anchor]
+    end_anchor = -(-end_line // stride)
+    end_byte = offsets[end_anchor] if end_anchor < len(offsets) else size_bytes
+    return start_byte, max(start_byte, end_byte), start_line - anchor * stride
+
+
+def take_lines(text: str, skip: int, count: int) -> str:
+    """השורות [skip, skip+count) מתוך קטע שנקרא לפי byte_span"""
+    return "\n".join(text.split("\n")[skip:skip + count])
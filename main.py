@@ -49,6 +49,8 @@ from services import code_service as code_processor
 from bot_handlers import AdvancedBotHandlers  # still used by legacy code
 from conversation_handlers import MAIN_KEYBOARD, get_save_conversation_handler
 from activity_reporter import create_reporter
+from activity_buffer import activity_buffer
+from cache_coherence import start_cache_coherence
 from github_menu_handler import GitHubMenuHandler
 from backup_menu_handler import BackupMenuHandler
 from handlers.drive.menu import GoogleDriveMenuHandler
@@ -229,24 +231,13 @@ async def log_user_activity(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not update.effective_user:
         return
 
-    # דגימה להפחתת עומס: רק ~25% מהאירועים יעדכנו מיידית את ה-DB
+    # רישום הפעילות נצבר ב-activity_buffer ונכתב ב-bulk_write תקופתי — ללא דגימה
     try:
-        import random as _rnd
-        sampled = (_rnd.random() < 0.25)
-    except Exception:
-        sampled = True
-
-    # רישום בסיסי לגמרי מחוץ ל-try כדי לא לחסום את הפלואו
-    try:
-        # כדי לשמר ספי milestones, אם דוגמים — נכפיל את המשקל בהתאם להסתברות הדגימה
-        if sampled:
-            # p=0.25 -> weight=4; אם משתנה — נשאב מהקונפיג בעתיד
-            weight = 4
-            try:
-                user_stats.log_user(update.effective_user.id, update.effective_user.username, weight=weight)
-            except TypeError:
-                # תאימות לאחור לטסטים/סביבה ישנה ללא פרמטר weight
-                user_stats.log_user(update.effective_user.id, update.effective_user.username)
+        try:
+            user_stats.log_user(update.effective_user.id, update.effective_user.username, weight=1)
+        except TypeError:
+            # תאימות לאחור לטסטים/סביבה ישנה ללא פרמטר weight
+            user_stats.log_user(update.effective_user.id, update.effective_user.username)
     except Exception:
         pass
 
@@ -260,6 +251,11 @@ async def log_user_activity(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 return
             doc = users_collection.find_one({"user_id": user_id}, {"total_actions": 1, "milestones_sent": 1}) or {}
             total_actions = int(doc.get("total_actions") or 0)
+            # פעולות שעוד ממתינות ב-write-behind וטרם נכתבו
+            try:
+                total_actions += activity_buffer.pending_inc("users", {"user_id": user_id}, "total_actions")
+            except Exception:
+                pass
             already_sent = set(doc.get("milestones_sent") or [])
             milestones = [50, 100, 200, 500, 1000]
             pending = [m for m in milestones if m <= total_actions and m not in already_sent]
@@ -2222,6 +2218,19 @@ class CodeKeeperBot:
         await self.application.stop()
         await self.application.shutdown()
         
+        # כתיבת מוני פעילות שנצברו לפני סגירת החיבור
+        try:
+            activity_buffer.close()
+        except Exception:
+            pass
+        
+        # סגירת ה-pool של לקוח Redis האסינכרוני
+        try:
+            from cache_manager import cache as _cache
+            await _cache.aclose()
+        except Exception:
+            pass
+        
         # שחרור נעילה וסגירת חיבור למסד נתונים
         try:
             cleanup_mongo_lock()
@@ -2337,6 +2346,7 @@ def main() -> None:
     """
     Initializes and runs the bot after acquiring a lock.
     """
+    coherence = None
     try:
         # Initialize database first
         global db
@@ -2350,7 +2360,10 @@ def main() -> None:
 
         # --- המשך הקוד הקיים שלך ---
         logger.info("Lock acquired. Initializing CodeKeeperBot...")
-        
+
+        # ביטול cache ועדכון אינדקס החיפוש גם לכתיבות של ה-webapp / תהליכים אחרים
+        coherence = start_cache_coherence(db)
+
         bot = CodeKeeperBot()
         
         logger.info("Bot is starting to poll...")
@@ -2361,6 +2374,8 @@ def main() -> None:
         raise
     finally:
         logger.info("Bot polling stopped. Releasing lock and closing database connection.")
+        if coherence is not None:
+            coherence.stop()
         try:
             cleanup_mongo_lock()
         except Exception:
@@ -2411,6 +2426,20 @@ async def setup_bot_data(application: Application) -> None:  # noqa: D401
     else:
         logger.info("ℹ️ Skipping internal web server (disabled or missing PUBLIC_BASE_URL)")
 
+    # פינוי תקופתי (SCAN) של מפתחות cache מדורות משתמש שבוטלו — אופציונלי, כבוי כברירת מחדל
+    try:
+        sweep_interval = int(os.getenv("CACHE_SWEEP_INTERVAL_SECONDS", "0") or 0)
+        if sweep_interval > 0:
+            from cache_manager import cache as _cache
+
+            async def _sweep_cache_job(context: ContextTypes.DEFAULT_TYPE):
+                await asyncio.to_thread(_cache.sweep_stale_keys)
+            application.job_queue.run_repeating(
+                _sweep_cache_job, interval=sweep_interval, first=sweep_interval, name="cache_generation_sweeper"
+            )
+    except Exception as e:
+        logger.warning(f"Failed to schedule cache sweeper: {e}")
+
     # Reschedule Google Drive backup jobs for all users with an active schedule
     try:
         async def _reschedule_drive_jobs(context: ContextTypes.DEFAULT_TYPE):
@@ -0,0 +1,177 @@
+"""
+הגדרות האינדקסים של code_snippets ו-large_files ויועץ אינדקסים
+Index definitions and index advisor
+
+הסט המומלץ מוגדר כאן פעם אחת: DatabaseManager יוצר אותו בעלייה, ו-
+scripts/index_advisor.py משווה אליו את מה שקיים בפועל. LEGACY_INDEXES הם אינדקסים
+שנוצרו בעבר ואינם בסט: כל אחד מהם מיותר (קידומת של אינדקס אחר) או מתחיל בשדה
+שאף שאילתה לא מסננת לפיו בלי user_id — והם רק מייקרים כל שמירה.
+
+היועץ (advise) משלב את list_indexes עם $indexStats: אינדקסים ללא שימוש מאז
+עליית השרת, אינדקסים שמפתחם קידומת של אינדקס אחר, אינדקסים חסרים ואינדקסי legacy.
+המודול לא תלוי בחבילת database ולכן משמש גם את הסקריפט.
+"""
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    from pymongo import IndexModel, ASCENDING, DESCENDING, TEXT  # type: ignore
+except Exception:  # pymongo אינו זמין בסביבות בדיקה קלות
+    IndexModel = lambda *a, **k: None  # type: ignore  # noqa: E731
+    ASCENDING = 1  # type: ignore
+    DESCENDING = -1  # type: ignore
+    TEXT = "text"  # type: ignore
+
+IndexSpec = Tuple[List[Tuple[str, Any]], Dict[str, Any]]
+
+CODE_SNIPPETS_INDEXES: List[IndexSpec] = [
+    # גרסאות של קובץ (get_all_versions / get_version) ושמירה
+    ([("user_id", ASCENDING), ("file_name", ASCENDING), ("version", DESCENDING)], {}),
+    ([("created_at", DESCENDING)], {}),
+    # אינדקס משופר לתמיכה במיון file_name, version לאחר match על user_id,is_active
+    ([("user_id", ASCENDING), ("is_active", ASCENDING), ("file_name", ASCENDING), ("version", DESCENDING)],
+     {"name": "user_active_file_latest_idx"}),
+    ([("user_id", ASCENDING), ("programming_language", ASCENDING), ("created_at", DESCENDING)],
+     {"name": "user_lang_date_idx"}),
+    ([("user_id", ASCENDING), ("tags", ASCENDING), ("updated_at", DESCENDING)],
+     {"name": "user_tags_updated_idx"}),
+    ([("user_id", ASCENDING), ("is_active", ASCENDING), ("programming_language", ASCENDING)],
+     {"name": "user_active_lang_idx"}),
+    ([("user_id", ASCENDING), ("is_active", ASCENDING), ("updated_at", DESCENDING)],
+     {"name": "user_active_recent_idx"}),
+    # מאפיינים מחושבים מראש (code_features) — מסנני גודל/פונקציות ומיון לפי גודל
+    ([("user_id", ASCENDING), ("is_active", ASCENDING), ("size_bytes", ASCENDING)],
+     {"name": "user_active_size_idx"}),
+    ([("user_id", ASCENDING), ("symbols", ASCENDING)], {"name": "user_symbols_idx"}),
+    ([("code", TEXT), ("description", TEXT), ("file_name", TEXT)], {"name": "full_text_search_idx"}),
+    # סל המיחזור: עימוד לפי מפתח (deleted_at, _id)
+    ([("user_id", ASCENDING), ("is_active", ASCENDING), ("deleted_at", DESCENDING), ("_id", DESCENDING)],
+     {"name": "user_active_deleted_idx"}),
+    ([("deleted_expires_at", ASCENDING)], {"name": "deleted_ttl", "expireAfterSeconds": 0}),
+    # watermark של cache_coherence במצב polling (שינויים מכל המשתמשים לפי updated_at)
+    ([("updated_at", ASCENDING)], {"name": "updated_at_idx"}),
+]
+
+LARGE_FILES_INDEXES: List[IndexSpec] = [
+    ([("created_at", DESCENDING)], {}),
+    ([("user_id", ASCENDING), ("file_name", ASCENDING)], {}),
+    ([("user_id", ASCENDING), ("programming_language", ASCENDING), ("file_size", ASCENDING)],
+     {"name": "user_lang_size_idx"}),
+    # עימוד לפי מפתח (created_at, _id) ברשימה ו-(deleted_at, _id) בסל המיחזור
+    ([("user_id", ASCENDING), ("is_active", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+     {"name": "user_active_created_id_large_idx"}),
+    ([("user_id", ASCENDING), ("is_active", ASCENDING), ("deleted_at", DESCENDING), ("_id", DESCENDING)],
+     {"name": "user_active_deleted_large_idx"}),
+    ([("user_id", ASCENDING), ("tags", ASCENDING), ("file_size", DESCENDING)], {"name": "user_tags_size_idx"}),
+    ([("deleted_expires_at", ASCENDING)], {"name": "deleted_ttl", "expireAfterSeconds": 0}),
+    ([("updated_at", ASCENDING)], {"name": "updated_at_idx"}),
+]
+
+# אינדקסים שהוסרו מהסט ונמחקים ע"י scripts/index_advisor.py --apply
+LEGACY_INDEXES: Dict[str, List[str]] = {
+    "code_snippets": [
+        "user_id_1",               # קידומת של user_id_1_file_name_1_version_-1
+        "file_name_1",             # כל השאילתות מסננות גם לפי user_id
+        "programming_language_1",
+        "tags_1",
+        "lang_tags_date_idx",      # מתחיל בשפה — אין שאילתה חוצת-משתמשים לפי שפה/תגית
+    ],
+    "large_files": [
+        "user_id_1",               # קידומת של user_id_1_file_name_1
+        "file_name_1",
+        "programming_language_1",
+        "file_size_1",
+        "lines_count_1",
+        "lang_size_lines_idx",     # מתחיל בשפה — אין שאילתה שמשתמשת בו
+        "user_active_date_large_idx",  # קידומת של user_active_created_id_large_idx
+    ],
+}
+
+RECOMMENDED_INDEXES: Dict[str, List[IndexSpec]] = {
+    "code_snippets": CODE_SNIPPETS_INDEXES,
+    "large_files": LARGE_FILES_INDEXES,
+}
+
+
+def index_models(specs: Sequence[IndexSpec]) -> List[Any]:
+    return [IndexModel(keys, **options) for keys, options in specs]
+
+
+def index_name(spec: IndexSpec) -> str:
+    """שם האינדקס כפי ש-MongoDB יקבע (name מפורש, אחרת field_dir_field_dir)"""
+    keys, options = spec
+    return options.get("name") or "_".join(f"{field}_{direction}" for field, direction in keys)
+
+
+def describe_indexes(collection: Any) -> Dict[str, Dict[str, Any]]:
+    """האינדקסים הקיימים לפי שם: מפתח (רשימת (שדה, כיוון)) ואפשרויות"""
+    out: Dict[str, Dict[str, Any]] = {}
+    for info in collection.list_indexes():
+        info = dict(info)
+        key = info.get("key") or {}
+        out[info.get("name")] = dict(info, key=list(key.items()))
+    return out
+
+
+def index_usage(collection: Any) -> Dict[str, int]:
+    """מספר הפעולות שהשתמשו בכל אינדקס מאז עליית השרת ($indexStats; סכום על כל המארחים)"""
+    usage: Dict[str, int] = {}
+    for row in collection.aggregate([{"$indexStats": {}}]):
+        ops = int(((row.get("accesses") or {}).get("ops")) or 0)
+        usage[row.get("name")] = usage.get(row.get("name"), 0) + ops
+    return usage
+
+
+def _is_special(info: Dict[str, Any]) -> bool:
+    """אינדקס שיש לו תפקיד מעבר לחיפוש (ייחודיות, TTL, טקסט, חלקי) — לא מוחלף ע"י קידומת"""
+    return bool(
+        info.get("unique") or info.get("sparse") or "expireAfterSeconds" in info
+        or info.get("partialFilterExpression") or "textIndexVersion" in info
+        or any(direction in ("text", "2dsphere", "hashed") for _, direction in info.get("key") or [])
+    )
+
+
+def redundant_indexes(indexes: Dict[str, Dict[str, Any]]) -> List[Tuple[str, str]]:
+    """(אינדקס, האינדקס שמכסה אותו): המפתח הוא קידומת של מפתח אינדקס אחר (באותם כיוונים
+    או בכולם הפוכים), ולכן כל שאילתה שמשתמשת בו יכולה להשתמש באחר."""
+    found: List[Tuple[str, str]] = []
+    for name, info in indexes.items():
+        if name == "_id_" or _is_special(info):
+            continue
+        key = info.get("key") or []
+        flipped = [(f, -d) if isinstance(d, int) else (f, d) for f, d in key]
+        for other, other_info in indexes.items():
+            if other == name or other_info.get("partialFilterExpression") or other_info.get("sparse"):
+                continue
+            other_key = other_info.get("key") or []
+            if len(other_key) <= len(key):
+                continue
+            if other_key[:len(key)] in (key, flipped):
+                found.append((name, other))
+                break
+    return found
+
+
+def advise(collection: Any, collection_name: Optional[str] = None) -> Dict[str, Any]:
+    """דו"ח אינדקסים לאוסף: שימוש, לא-בשימוש, מיותרים, legacy, חסרים, ומה למחוק בהחלה"""
+    name = collection_name or getattr(collection, "name", "")
+    existing = describe_indexes(collection)
+    try:
+        usage = index_usage(collection)
+    except Exception:
+        usage = {}  # $indexStats דורש הרשאה/שרת תומך; הדו"ח ממשיך בלי נתוני שימוש
+    recommended = {index_name(spec) for spec in RECOMMENDED_INDEXES.get(name, [])}
+    legacy = [n for n in LEGACY_INDEXES.get(name, []) if n in existing]
+    redundant = redundant_indexes(existing)
+    unused = [n for n in existing if usage and n != "_id_" and usage.get(n, 0) == 0
+              and not _is_special(existing[n])]
+    drop = list(dict.fromkeys(legacy + [n for n, _ in redundant if n not in recommended]))
+    return {
+        "collection": name,
+        "usage": usage,
+        "unused": unused,
+        "redundant": redundant,
+        "legacy": legacy,
+        "missing": sorted(recommended - set(existing)) if recommended else [],
+        "drop": drop,
+    }
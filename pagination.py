@@ -0,0 +1,175 @@
+"""
+עימוד לפי מפתח (keyset/cursor pagination) לרשימות קבצים
+Keyset pagination helpers for file listings
+
+במקום skip (שסורק ומשליך את כל העמודים הקודמים) הרשימות ממשיכות מהפריט האחרון
+שהוצג: cursor אטום שמקודד את (שדה המיון, _id) של הפריט האחרון, והעמוד הבא הוא
+"כל מה שאחריו" בסדר (שדה המיון, _id) — על אינדקס תואם זו קפיצה ישירה.
+
+- encode_cursor/decode_cursor: מחרוזת base64url קצרה, בטוחה ל-URL.
+- keyset_filter/with_keyset: תנאי ה-$or של "אחרי ה-cursor" ומיזוגו עם match קיים.
+- approximate_count: סה"כ לתצוגה ("עמוד X מתוך Y") מתוך cache, עם רענון ברקע
+  כשהערך מתיישן — כך שדפדוף לא מריץ count_documents בכל עמוד.
+המודול לא תלוי בחבילת database ולכן משמש גם את ה-webapp.
+"""
+
+import base64
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    from bson import ObjectId  # type: ignore
+except Exception:  # bson אינו זמין בסביבות בדיקה קלות
+    ObjectId = None  # type: ignore[assignment]
+
+logger = logging.getLogger(__name__)
+
+try:
+    # כמה זמן נשמרת ספירה משוערת ב-cache
+    APPROX_COUNT_TTL = max(1, int(os.getenv("PAGINATION_COUNT_TTL", "600")))
+    # אחרי כמה שניות ספירה נחשבת מתיישנת ומרועננת ברקע
+    APPROX_COUNT_REFRESH = max(1, int(os.getenv("PAGINATION_COUNT_REFRESH", "60")))
+except Exception:
+    APPROX_COUNT_TTL = 600
+    APPROX_COUNT_REFRESH = 60
+
+_refreshing: set = set()
+_refresh_lock = threading.Lock()
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return {"d": value.isoformat()}
+    if ObjectId is not None and isinstance(value, ObjectId):
+        return {"o": str(value)}
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "d" in value:
+            return datetime.fromisoformat(value["d"])
+        if "o" in value:
+            return ObjectId(value["o"]) if ObjectId is not None else value["o"]
+    return value
+
+
+def encode_cursor(sort_value: Any, doc_id: Any) -> str:
+    """cursor אטום לפריט האחרון בעמוד: (ערך שדה המיון, _id)"""
+    raw = json.dumps([_encode_value(sort_value), _encode_value(doc_id)], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: Optional[str]) -> Optional[Tuple[Any, Any]]:
+    """פענוח cursor; None עבור ערך ריק או פגום (הקורא חוזר לעמוד הראשון)"""
+    if not token:
+        return None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        sort_value, doc_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return _decode_value(sort_value), _decode_value(doc_id)
+    except Exception:
+        logger.warning("cursor עימוד לא תקין — חוזרים לעמוד הראשון")
+        return None
+
+
+def cursor_for(doc: Optional[Dict[str, Any]], field: str = "updated_at", id_field: str = "_id") -> Optional[str]:
+    """cursor שממשיך אחרי המסמך הנתון (בדרך כלל האחרון בעמוד)"""
+    if not isinstance(doc, dict) or doc.get(id_field) is None:
+        return None
+    return encode_cursor(doc.get(field), doc.get(id_field))
+
+
+def keyset_filter(position: Tuple[Any, Any], field: str = "updated_at", id_field: str = "_id",
+                  direction: int = -1) -> Dict[str, Any]:
+    """תנאי "אחרי המיקום" למיון [(field, direction), (id_field, direction)].
+
+    ב-MongoDB ערכי null קטנים מכל ערך: במיון יורד הם בסוף, ובעולה — בהתחלה.
+    """
+    sort_value, doc_id = position
+    op = "$lt" if direction < 0 else "$gt"
+    if sort_value is None:
+        same = {field: None, id_field: {op: doc_id}}
+        return same if direction < 0 else {"$or": [same, {field: {"$ne": None}}]}
+    clauses: List[Dict[str, Any]] = [
+        {field: {op: sort_value}},
+        {field: sort_value, id_field: {op: doc_id}},
+    ]
+    if direction < 0:
+        clauses.append({field: None})
+    return {"$or": clauses}
+
+
+def with_keyset(match: Dict[str, Any], after: Optional[str], field: str = "updated_at",
+                id_field: str = "_id", direction: int = -1) -> Dict[str, Any]:
+    """match בתוספת תנאי ה-cursor (אם יש). $and כדי לא לדרוס $or קיים ב-match."""
+    position = decode_cursor(after)
+    if position is None:
+        return match
+    return {"$and": [match, keyset_filter(position, field, id_field, direction)]}
+
+
+def keyset_sort(field: str = "updated_at", id_field: str = "_id", direction: int = -1) -> List[Tuple[str, int]]:
+    return [(field, direction), (id_field, direction)]
+
+
+def keyset_key(doc: Dict[str, Any], field: str = "updated_at", id_field: str = "_id") -> Tuple[bool, Any, str]:
+    """מפתח מיון בזיכרון שתואם ל-keyset_sort (עם reverse=True כשהמיון יורד), למיזוג רשימות.
+
+    null קטן מכל ערך כמו ב-MongoDB; _id מושווה כמחרוזת — סדר ה-hex של ObjectId זהה לסדר שלו.
+    """
+    value = doc.get(field)
+    return value is not None, value, str(doc.get(id_field))
+
+
+def approximate_count(cache: Any, key: str, count: Callable[[], int]) -> int:
+    """ספירה מתוך cache. ערך מתיישן מוחזר מיד ומרוענן בת'רד רקע; ערך חסר נספר עכשיו.
+
+    `key` צריך לכלול את ה-namespace של המשתמש (cache.user_namespace) כדי שכל כתיבה,
+    שמקדמת את הדור, תגרום לספירה מדויקת בבקשה הבאה.
+    """
+    entry = None
+    try:
+        entry = cache.get(key)
+    except Exception:
+        entry = None
+    now = time.time()
+    if isinstance(entry, dict) and "count" in entry:
+        if now - float(entry.get("at") or 0) >= APPROX_COUNT_REFRESH:
+            _refresh_in_background(cache, key, count)
+        return int(entry["count"])
+    return _store_count(cache, key, count)
+
+
+def _store_count(cache: Any, key: str, count: Callable[[], int]) -> int:
+    total = int(count() or 0)
+    try:
+        cache.set(key, {"count": total, "at": time.time()}, APPROX_COUNT_TTL)
+    except Exception:
+        pass
+    return total
+
+
+def _refresh_in_background(cache: Any, key: str, count: Callable[[], int]) -> None:
+    with _refresh_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+    def _run() -> None:
+        try:
+            _store_count(cache, key, count)
+        except Exception as e:
+            logger.warning(f"רענון ספירה משוערת נכשל ({key}): {e}")
+        finally:
+            with _refresh_lock:
+                _refreshing.discard(key)
+
+    threading.Thread(target=_run, name="approx-count-refresh", daemon=True).start()
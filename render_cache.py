@@ -0,0 +1,245 @@
+"""
+cache לתוצרי הדגשת תחביר, משותף לבוט, ל-webapp ולשרת השיתוף
+Content-hash keyed render cache for syntax highlighting
+
+המפתח הוא hash של התוכן ושל פרמטרי התצוגה — (sha256(code), lexer, formatter,
+אפשרויות, ערכת צבעים, גרסת Pygments) — ולא הקוד עצמו, כך שהמפתח קצר וקבוע
+ואותו קובץ שמוצג בבוט, ב-webapp ובקישור שיתוף מודגש פעם אחת בלבד.
+
+- כש-Redis פעיל התוצר נשמר דרך cache_manager (דחוס ב-zlib מעל CACHE_COMPRESS_MIN_BYTES,
+  עם שכבת זיכרון מקומית לפני Redis).
+- בלי Redis — קבצים דחוסים בתיקייה (RENDER_CACHE_DIR) עם תקציב בייטים ופינוי LRU
+  לפי זמן גישה; התיקייה משותפת לכל תהליכי ה-webapp על אותה מכונה.
+- prewarm מדגיש ברקע את תצוגת ה-web של קובץ שנשמר זה עתה, כדי שהצפייה הראשונה
+  אחרי עריכה לא תחכה ל-Pygments.
+"""
+
+import functools
+import hashlib
+import json
+import logging
+import os
+import queue
+import tempfile
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, Optional
+
+import pygments
+from pygments import highlight
+from pygments.formatters import HtmlFormatter
+from pygments.lexers import TextLexer, get_lexer_by_name, guess_lexer
+
+from cache_manager import cache
+
+logger = logging.getLogger(__name__)
+
+try:
+    RENDER_CACHE_TTL = max(1, int(os.getenv("RENDER_CACHE_TTL", "86400")))
+    RENDER_CACHE_DIR = os.getenv("RENDER_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "code_keeper_render_cache")
+    # תקציב התיקייה (0 = ללא cache בדיסק)
+    RENDER_CACHE_DISK_MAX_BYTES = max(0, int(os.getenv("RENDER_CACHE_DISK_MAX_BYTES", str(64 * 1024 * 1024))))
+except Exception:
+    RENDER_CACHE_TTL = 86400
+    RENDER_CACHE_DIR = os.path.join(tempfile.gettempdir(), "code_keeper_render_cache")
+    RENDER_CACHE_DISK_MAX_BYTES = 64 * 1024 * 1024
+
+KEY_PREFIX = "render"
+# תצוגת הקוד ב-webapp (view_file, public_share) ובשרת השיתוף
+WEB_THEME = "github-dark"
+WEB_VIEW_OPTIONS: Dict[str, Any] = {"linenos": True, "cssclass": "source", "lineanchors": "line", "anchorlinenos": True}
+# קבצים גדולים מזה לא מוצגים ב-webapp ולכן גם לא מחוממים
+PREWARM_MAX_BYTES = 1024 * 1024
+_PREWARM_QUEUE_SIZE = 64
+
+
+def render_key(code: str, lexer: str, formatter: str, theme: str, options: Optional[Dict[str, Any]] = None) -> str:
+    """מפתח cache לתוצר הדגשה: hash של התוכן ושל פרמטרי התצוגה"""
+    digest = hashlib.sha256(code.encode("utf-8", "surrogatepass")).hexdigest()
+    spec = json.dumps([lexer, formatter, theme, sorted((options or {}).items()), pygments.__version__],
+                      sort_keys=True, default=str)
+    return f"{KEY_PREFIX}:{digest}:{hashlib.sha256(spec.encode('utf-8')).hexdigest()[:16]}"
+
+
+class DiskRenderStore:
+    """תוצרים דחוסים בתיקייה, עם תקציב בייטים ופינוי הישנים ביותר (mtime = גישה אחרונה)"""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total: Optional[int] = None
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".z")
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as fh:
+                data = fh.read()
+            os.utime(path)
+            return zlib.decompress(data).decode("utf-8")
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.debug(f"render cache: קריאה מהדיסק נכשלה ({path}): {e}")
+            return None
+
+    def set(self, key: str, html: str) -> bool:
+        data = zlib.compress(html.encode("utf-8"), 6)
+        if len(data) > self.max_bytes:
+            return False
+        path = self._path(key)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as fh:
+                fh.write(data)
+            os.replace(tmp, path)
+        except Exception as e:
+            logger.debug(f"render cache: כתיבה לדיסק נכשלה ({path}): {e}")
+            return False
+        with self._lock:
+            if self._total is None:
+                self._total = self._scan_total()
+            else:
+                self._total += len(data)
+            if self._total > self.max_bytes:
+                self._total = self._evict()
+        return True
+
+    def _entries(self):
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".z"):
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    yield entry.path, st.st_size, st.st_mtime
+
+    def _scan_total(self) -> int:
+        return sum(size for _path, size, _mtime in self._entries())
+
+    def _evict(self) -> int:
+        """מחיקת הקבצים שלא נקראו הכי הרבה זמן עד 90% מהתקציב; מחזיר את הגודל שנותר.
+
+        סורק את התיקייה מחדש, כך שגם קבצים של תהליכים אחרים נספרים.
+        """
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        total = sum(size for _path, size, _mtime in entries)
+        target = int(self.max_bytes * 0.9)
+        for path, size, _mtime in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                total -= size
+            except Exception as e:
+                logger.debug(f"render cache: מחיקה נכשלה ({path}): {e}")
+        return total
+
+
+class RenderCache:
+    """get_or_render: תוצר מה-cache (Redis/זיכרון, או דיסק בלי Redis), אחרת רינדור ושמירה"""
+
+    def __init__(self, cache_manager: Any = cache, disk: Optional[DiskRenderStore] = None,
+                 ttl: int = RENDER_CACHE_TTL):
+        self.cache = cache_manager
+        self.disk = disk
+        self.ttl = ttl
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.cache.get(key)
+        if isinstance(value, str):
+            return value
+        if self.disk is not None and not self.cache.is_enabled:
+            value = self.disk.get(key)
+            if value is not None:
+                # שכבת הזיכרון המקומית חוסכת את הקריאה מהדיסק בצפייה הבאה
+                self.cache.set(key, value, self.ttl)
+            return value
+        return None
+
+    def set(self, key: str, html: str) -> None:
+        self.cache.set(key, html, self.ttl)
+        if self.disk is not None and not self.cache.is_enabled:
+            self.disk.set(key, html)
+
+    def get_or_render(self, code: str, lexer: str, formatter: str, theme: str,
+                      options: Optional[Dict[str, Any]], render: Callable[[], str]) -> str:
+        key = render_key(code, lexer, formatter, theme, options)
+        html = self.get(key)
+        if html is None:
+            html = render()
+            self.set(key, html)
+        return html
+
+
+render_cache = RenderCache(disk=DiskRenderStore(RENDER_CACHE_DIR, RENDER_CACHE_DISK_MAX_BYTES)
+                           if RENDER_CACHE_DISK_MAX_BYTES else None)
+
+
+def resolve_lexer(code: str, language: str) -> Any:
+    """lexer לפי שם השפה, אחרת לפי התוכן, אחרת טקסט"""
+    try:
+        return get_lexer_by_name(language, stripall=True)
+    except Exception:
+        try:
+            return guess_lexer(code)
+        except Exception:
+            return TextLexer()
+
+
+def highlight_html(code: str, language: str, theme: str = WEB_THEME, **options: Any) -> str:
+    """HTML מודגש (HtmlFormatter) דרך ה-render cache; ברירת המחדל היא תצוגת ה-web"""
+    options = options or dict(WEB_VIEW_OPTIONS)
+    language = (language or "text").lower()
+    return render_cache.get_or_render(
+        code, language, "html", theme, options,
+        lambda: highlight(code, resolve_lexer(code, language), HtmlFormatter(style=theme, **options)),
+    )
+
+
+@functools.lru_cache(maxsize=32)
+def style_css(theme: str = WEB_THEME, selector: str = ".source") -> str:
+    """CSS של ערכת הצבעים (תלוי רק בערכה ובסלקטור)"""
+    return HtmlFormatter(style=theme).get_style_defs(selector)
+
+
+_prewarm_queue: "queue.Queue[tuple]" = queue.Queue(maxsize=_PREWARM_QUEUE_SIZE)
+_prewarm_thread: Optional[threading.Thread] = None
+_prewarm_lock = threading.Lock()
+
+
+def _prewarm_worker() -> None:
+    while True:
+        code, language = _prewarm_queue.get()
+        try:
+            started = time.perf_counter()
+            highlight_html(code, language)
+            logger.debug(f"render cache: חומם ({len(code)} תווים, {(time.perf_counter() - started) * 1000:.0f}ms)")
+        except Exception as e:
+            logger.debug(f"render cache: חימום נכשל: {e}")
+        finally:
+            _prewarm_queue.task_done()
+
+
+def prewarm(code: str, language: str) -> bool:
+    """תזמון הדגשה ברקע של תצוגת ה-web לקובץ שנשמר; False אם דולג (גדול/תור מלא)"""
+    global _prewarm_thread
+    if not code or len(code.encode("utf-8", "surrogatepass")) > PREWARM_MAX_BYTES:
+        return False
+    with _prewarm_lock:
+        if _prewarm_thread is None:
+            _prewarm_thread = threading.Thread(target=_prewarm_worker, name="render-prewarm", daemon=True)
+            _prewarm_thread.start()
+    try:
+        _prewarm_queue.put_nowait((code, language))
+        return True
+    except queue.Full:
+        return False
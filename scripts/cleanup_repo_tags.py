@@ -23,6 +23,9 @@ from typing import List
 
 from pymongo import MongoClient
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from snippets_latest import LATEST_COLLECTION_NAME, sync_latest  # noqa: E402
+
 
 def normalize_tags(tags: List[str]) -> List[str]:
     if not isinstance(tags, list):
@@ -67,6 +70,7 @@ def main() -> int:
     total = 0
     changed = 0
     index_cleared = 0
+    changed_names = set()
     for doc in cursor:
         total += 1
         tags = doc.get('tags') or []
@@ -83,6 +87,11 @@ def main() -> int:
             changed += 1
             if args.apply:
                 coll.update_one({'_id': doc['_id']}, {'$set': {'tags': new_tags, 'updated_at': datetime.now(timezone.utc)}})
+                changed_names.add(fname)
+
+    # Keep the latest-version listing collection in sync with the rewritten tags
+    for fname in changed_names:
+        sync_latest(coll, db[LATEST_COLLECTION_NAME], user_id, fname)
 
     print(f"Scanned: {total} docs; Changed: {changed}; Index cleared: {index_cleared}; Apply: {args.apply}")
     return 0
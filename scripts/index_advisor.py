@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Index advisor: report unused/redundant indexes and apply the recommended index set.
+
+- Uses $indexStats (ops since the last server restart) and list_indexes
+- Flags indexes whose key is a prefix of another index (redundant)
+- Flags legacy indexes that are no longer part of the recommended set
+  (mongo_indexes.py) and recommended indexes that are missing
+
+Usage:
+  python scripts/index_advisor.py                      # report only (dry-run)
+  python scripts/index_advisor.py --apply              # create missing, drop legacy/redundant
+  python scripts/index_advisor.py --apply --drop-unused
+  python scripts/index_advisor.py --collection code_snippets_latest
+
+Env:
+  MONGODB_URL (required)
+  DATABASE_NAME (default: code_keeper_bot)
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+from typing import Any, Dict, List
+
+from pymongo import MongoClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mongo_indexes import RECOMMENDED_INDEXES, advise, index_models, index_name  # noqa: E402
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"== {report['collection']}")
+    usage = report["usage"]
+    if usage:
+        for name, ops in sorted(usage.items(), key=lambda kv: kv[1]):
+            print(f"  {ops:>10}  {name}")
+    else:
+        print("  ($indexStats unavailable — usage unknown)")
+    for name, covered_by in report["redundant"]:
+        print(f"  redundant: {name} (prefix of {covered_by})")
+    for name in report["unused"]:
+        print(f"  unused since restart: {name}")
+    for name in report["legacy"]:
+        print(f"  legacy: {name}")
+    for name in report["missing"]:
+        print(f"  missing: {name}")
+
+
+def apply(coll: Any, report: Dict[str, Any], drop_unused: bool) -> List[str]:
+    actions: List[str] = []
+    specs = RECOMMENDED_INDEXES.get(report["collection"])
+    if specs and report["missing"]:
+        coll.create_indexes(index_models(specs))
+        actions.append(f"created {', '.join(report['missing'])}")
+    drop = list(report["drop"])
+    if drop_unused:
+        keep = {index_name(spec) for spec in specs or []}
+        drop += [n for n in report["unused"] if n not in drop and n not in keep]
+    for name in drop:
+        coll.drop_index(name)
+        actions.append(f"dropped {name}")
+    return actions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Report and apply the recommended MongoDB index set")
+    parser.add_argument('--collection', action='append',
+                        help='Collection to analyze (repeatable; default: code_snippets, large_files)')
+    parser.add_argument('--apply', action='store_true', help='Apply changes (otherwise dry-run)')
+    parser.add_argument('--drop-unused', action='store_true',
+                        help='With --apply, also drop non-recommended indexes with zero ops since restart')
+    args = parser.parse_args()
+
+    mongo_url = os.getenv('MONGODB_URL')
+    if not mongo_url:
+        print('ERROR: MONGODB_URL is not set', file=sys.stderr)
+        return 2
+    db_name = os.getenv('DATABASE_NAME', 'code_keeper_bot')
+
+    client = MongoClient(mongo_url)
+    db = client[db_name]
+    for name in args.collection or list(RECOMMENDED_INDEXES):
+        coll = db[name]
+        report = advise(coll, name)
+        print_report(report)
+        if args.apply:
+            for action in apply(coll, report, args.drop_unused):
+                print(f"  -> {action}")
+        elif report["drop"] or report["missing"]:
+            print("  (dry-run; pass --apply to create missing and drop legacy/redundant indexes)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
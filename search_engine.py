@@ -3,18 +3,26 @@
 Advanced Search Engine for Code Snippets
 """
 
+import bisect
+import heapq
 import logging
 import math
+import multiprocessing
+import os
 import re
+from array import array
 from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeout
 from dataclasses import dataclass, field
 from datetime import datetime, timedelta, timezone
 from enum import Enum
 from typing import Any, Dict, List, Optional, Set, Tuple, cast
 
-from fuzzywuzzy import fuzz, process
+import fuzzy_matcher
+from code_features import compute_code_features
 
 from services import code_service as code_processor
+from search_workers import regex_scan_batch
 from config import config
 from database import db
 
@@ -66,19 +74,451 @@ class SearchResult:
     matches: List[Dict[str, Any]] = field(default_factory=list)
     snippet_preview: str = ""
     highlight_ranges: List[Tuple[int, int]] = field(default_factory=list)
+    content_loaded: bool = True  # False כאשר התוצאה נבנתה ממטא-דאטה בלבד (התוכן ייטען בעצלות)
+    # מאפיינים שמורים מהמסמך (code_features); None למסמכים ישנים — יחושבו מהתוכן
+    size_bytes: Optional[int] = None
+    function_count: Optional[int] = None
+    class_count: Optional[int] = None
+
+# חיפוש זורם (regex/תוכן): גודל אצווה מה-cursor, תקציב זמן לכל אצווה ומספר תהליכים
+STREAM_BATCH_SIZE = 50
+REGEX_TIMEOUT_SECONDS = float(os.getenv('SEARCH_REGEX_TIMEOUT', '5') or 5)
+REGEX_WORKERS = max(1, min(4, os.cpu_count() or 1))
+
+_regex_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _regex_mp_context():
+    """forkserver (או spawn): fork מתוך תהליך הבוט מרובה ה-threads עלול לרשת נעילות תפוסות.
+    search_workers מייבא רק את הספרייה הסטנדרטית, כך שהפעלת תהליך נקי זולה."""
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def _get_regex_pool() -> Optional[ProcessPoolExecutor]:
+    global _regex_pool
+    if _regex_pool is None:
+        try:
+            _regex_pool = ProcessPoolExecutor(max_workers=REGEX_WORKERS, mp_context=_regex_mp_context())
+        except Exception as e:
+            logger.warning(f"לא ניתן ליצור מאגר תהליכים לחיפוש regex: {e}")
+            return None
+    return _regex_pool
+
+
+def _reset_regex_pool():
+    """החלפת מאגר התהליכים (למשל אחרי חריגת זמן של backtracking קטסטרופלי).
+
+    shutdown לא עוצר תהליך שכבר תקוע בתוך ביטוי רגולרי, ולכן תהליכי העבודה של המאגר
+    הישן מסתיימים בכוח; חיפושים הבאים רצים במאגר חדש.
+    """
+    global _regex_pool
+    pool, _regex_pool = _regex_pool, None
+    if pool is not None:
+        processes = list((getattr(pool, "_processes", None) or {}).values())
+        try:
+            pool.shutdown(wait=False, cancel_futures=True)
+        except Exception as e:
+            logger.debug(f"סגירת מאגר ה-regex נכשלה: {e}")
+        for process in processes:
+            try:
+                process.terminate()
+            except Exception as e:
+                logger.debug(f"עצירת תהליך regex נכשלה: {e}")
+    _get_regex_pool()
+
+
+def _stricter(pick, first: Any, second: Any) -> Any:
+    """הגבול המחמיר מבין שני גבולות טווח (pick=max לגבול תחתון, min לעליון); None = ללא גבול"""
+    values = [v for v in (first, second) if v is not None]
+    return pick(values) if values else None
+
+
+def _has_pushdown(filters: SearchFilter) -> bool:
+    """האם יש במסנן תנאי שנדחף לשליפת שמות הקבצים במסד"""
+    return bool(filters.languages or filters.tags or filters.date_from or filters.date_to or filters.min_size or
+                filters.max_size or filters.has_functions is not None or filters.has_classes is not None)
+
+
+def _iter_batches(docs, size: int):
+    batch: List[Dict[str, Any]] = []
+    for doc in docs:
+        batch.append(doc)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# חיפוש מטושטש: סף ציון ומספר מרבי של קבצים שתוכנם נטען לניקוד חלונות
+FUZZY_MIN_SCORE = 60
+FUZZY_MAX_CONTENT_CANDIDATES = 100
+
+# שדות מטא-דאטה בלבד לבניית תוצאות מהאינדקס (ללא code)
+_RESULT_FIELDS = {
+    "file_name": 1,
+    "programming_language": 1,
+    "tags": 1,
+    "created_at": 1,
+    "updated_at": 1,
+    "version": 1,
+    "size_bytes": 1,
+    "function_count": 1,
+    "class_count": 1,
+}
+
+# מרווח ביטחון לסטיית שעונים בין תהליכים בעת סנכרון דלתא מהאינדקס המתמשך
+_SYNC_SKEW = timedelta(seconds=5)
+
+
+def _index_collection():
+    """קולקציית האינדקס המתמשך (None אם אינה זמינה)"""
+    return getattr(db, 'search_index_collection', None)
+
+
+# פרמטרי BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def _pack_varints(values) -> bytes:
+    """קידוד רשימת מספרים אי-שליליים כ-varint (ייצוג קומפקטי לאחסון)"""
+    out = bytearray()
+    for value in values:
+        while value >= 0x80:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+    return bytes(out)
+
+
+def _unpack_varints(data: bytes) -> array:
+    """פענוח רצף varint למערך מספרים"""
+    out = array('I')
+    value = shift = 0
+    for byte in data or b'':
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        out.append(value)
+        value = shift = 0
+    return out
+
+
+def _decode_positions(data: bytes) -> array:
+    """פענוח מיקומים שנשמרו כהפרשים (delta) ל-varint"""
+    positions = _unpack_varints(data)
+    for i in range(1, len(positions)):
+        positions[i] += positions[i - 1]
+    return positions
+
+
+def build_index_entry(user_id: int, file_data: Dict[str, Any]) -> Dict[str, Any]:
+    """בניית רשומת אינדקס לקובץ בודד (ללא התוכן עצמו)
+
+    לכל מילה נשמרים תדירות (tfs) ומיקומי טוקנים (positions) במערכים מקבילים
+    ל-words, מקודדים כ-varint לצורך דירוג BM25 ושאילתות ביטוי.
+    """
+
+    code = file_data.get('code') or ''
+    language = file_data.get('programming_language') or 'text'
+    term_positions: Dict[str, List[int]] = defaultdict(list)
+    doc_length = 0
+    for pos, token in enumerate(re.findall(r'\b\w+\b', code.lower())):
+        if len(token) >= 2:
+            term_positions[token].append(pos)
+            doc_length += 1
+    words = sorted(term_positions)
+    positions = []
+    for word in words:
+        plist = term_positions[word]
+        positions.append(_pack_varints([plist[0]] + [b - a for a, b in zip(plist, plist[1:])]))
+    try:
+        functions = sorted({
+            str(func['name']).lower()
+            for func in code_processor.extract_functions(code, language)
+            if func.get('name')
+        })
+    except Exception:
+        functions = []
+    return {
+        "user_id": user_id,
+        "file_name": file_data['file_name'],
+        "words": words,
+        "tfs": _pack_varints(len(term_positions[w]) for w in words),
+        "positions": positions,
+        "doc_length": doc_length,
+        "functions": functions,
+        "programming_language": language,
+        "tags": [str(t).lower() for t in (file_data.get('tags') or [])],
+        "is_active": True,
+        "indexed_at": datetime.now(timezone.utc),
+    }
+
+
+# ב-tombstone נשאר רק המפתח והסימון; רשימות המונחים (עיקר נפח הרשומה) נמחקות
+_TOMBSTONE_DROPPED_FIELDS = ("words", "tfs", "positions", "doc_length", "functions", "tags")
+
+
+class TermDictionary:
+    """מילון מונחים: מערך ממוין (bisect) לקידומות + מפת טריגרמים להתאמות פנימיות"""
+
+    def __init__(self, ngrams: bool = False):
+        self._terms: Set[str] = set()
+        self._sorted: List[str] = []
+        self._dirty = False
+        self._ngrams = ngrams
+        self._trigrams: Dict[str, Set[str]] = defaultdict(set)
+        # מונחים קצרים מטריגרם (1-2 תווים) — אין להם טריגרמים, ולכן נסרקים בנפרד
+        self._short: Set[str] = set()
+
+    @staticmethod
+    def _grams(term: str) -> Set[str]:
+        return {term[i:i + 3] for i in range(len(term) - 2)}
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+    def add(self, term: str):
+        if term in self._terms:
+            return
+        self._terms.add(term)
+        self._dirty = True
+        if self._ngrams:
+            if len(term) < 3:
+                self._short.add(term)
+            for gram in self._grams(term):
+                self._trigrams[gram].add(term)
+
+    def discard(self, term: str):
+        if term not in self._terms:
+            return
+        self._terms.discard(term)
+        self._dirty = True
+        if self._ngrams:
+            self._short.discard(term)
+            for gram in self._grams(term):
+                terms = self._trigrams.get(gram)
+                if terms is not None:
+                    terms.discard(term)
+                    if not terms:
+                        del self._trigrams[gram]
+
+    def clear(self):
+        self._terms.clear()
+        self._sorted = []
+        self._dirty = False
+        self._trigrams.clear()
+        self._short.clear()
+
+    def _ensure_sorted(self) -> List[str]:
+        # מיון עצל: עדכונים אינקרמנטליים רבים מתנקזים למיון אחד בשאילתה הבאה
+        if self._dirty:
+            self._sorted = sorted(self._terms)
+            self._dirty = False
+        return self._sorted
+
+    def with_prefix(self, prefix: str, limit: Optional[int] = None) -> List[str]:
+        """כל המונחים שמתחילים בקידומת — O(log V + התאמות)"""
+        terms = self._ensure_sorted()
+        out: List[str] = []
+        pos = bisect.bisect_left(terms, prefix)
+        while pos < len(terms) and terms[pos].startswith(prefix):
+            out.append(terms[pos])
+            if limit is not None and len(out) >= limit:
+                break
+            pos += 1
+        return out
+
+    def containing(self, fragment: str) -> Set[str]:
+        """כל המונחים שמכילים את המקטע (קידומת או התאמה פנימית)"""
+        if not self._ngrams:
+            return set(self.with_prefix(fragment))
+        if len(fragment) < 3:
+            # מקטע קצר מטריגרם: סריקה על מפתחות הטריגרמים (קטנה בהרבה מאוצר המילים)
+            # ועל המונחים הקצרים, שאין להם טריגרמים
+            out: Set[str] = {term for term in self._short if fragment in term}
+            for gram, terms in self._trigrams.items():
+                if fragment in gram:
+                    out.update(terms)
+            return out
+        postings = [self._trigrams.get(gram) for gram in self._grams(fragment)]
+        if any(p is None for p in postings):
+            return set()
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for p in postings[1:]:
+            candidates &= p
+            if not candidates:
+                return set()
+        return {t for t in candidates if fragment in t}
+
 
 class SearchIndex:
-    """אינדקס חיפוש לביצועים טובים יותר"""
+    """אינדקס חיפוש לביצועים טובים יותר
+
+    האינדקס בזיכרון הוא עותק של רשומות `search_index` ב-MongoDB (רשומה לכל קובץ).
+    הרשומות מתעדכנות בשמירה/מחיקה/שינוי שם/שחזור, וכל תהליך מושך רק דלתאות.
+    """
     
     def __init__(self):
         self.word_index: Dict[str, Set[str]] = defaultdict(set)  # מילה -> קבצים
         self.function_index: Dict[str, Set[str]] = defaultdict(set)  # פונקציה -> קבצים
         self.language_index: Dict[str, Set[str]] = defaultdict(set)  # שפה -> קבצים
         self.tag_index: Dict[str, Set[str]] = defaultdict(set)  # תגית -> קבצים
+        self.documents: Dict[str, Dict[str, Any]] = {}  # קובץ -> רשומת האינדקס שלו
+        # סטטיסטיקות BM25: אורך כל מסמך (בטוקנים) וסכום האורכים
+        self.doc_lengths: Dict[str, int] = {}
+        self.total_length = 0
+        # מילוני מונחים לחיפוש קידומות/מקטעים ללא סריקת כל אוצר המילים
+        self.word_terms = TermDictionary(ngrams=True)
+        self.function_terms = TermDictionary(ngrams=True)
+        self.language_terms = TermDictionary()
+        self.tag_terms = TermDictionary()
+        self.loaded = False
         self.last_update = datetime.min.replace(tzinfo=timezone.utc)
+        self.last_sync = datetime.min.replace(tzinfo=timezone.utc)
+
+    def add_entry(self, entry: Dict[str, Any]):
+        """הוספה/החלפה של רשומת קובץ באינדקס שבזיכרון"""
+        
+        file_key = f"{entry['user_id']}:{entry['file_name']}"
+        self.remove_file(file_key)
+        entry = dict(entry)
+        words = entry.get('words') or []
+        # רשומות ישנות ללא תדירויות: tf=1 לכל מילה
+        tfs = _unpack_varints(entry['tfs']) if entry.get('tfs') else array('I', [1] * len(words))
+        entry['tfs'] = tfs if len(tfs) == len(words) else array('I', [1] * len(words))
+        doc_length = int(entry.get('doc_length') or sum(entry['tfs']))
+        self.documents[file_key] = entry
+        self.doc_lengths[file_key] = doc_length
+        self.total_length += doc_length
+        for postings, dictionary, terms in self._term_groups(entry):
+            for term in terms:
+                postings[term].add(file_key)
+                dictionary.add(term)
+        self.last_update = datetime.now(timezone.utc)
+
+    def remove_file(self, file_key: str):
+        """הסרת קובץ מהאינדקס שבזיכרון"""
+        
+        entry = self.documents.pop(file_key, None)
+        if not entry:
+            return
+        self.total_length -= self.doc_lengths.pop(file_key, 0)
+        for postings, dictionary, terms in self._term_groups(entry):
+            for term in terms:
+                files = postings.get(term)
+                if files is None:
+                    continue
+                files.discard(file_key)
+                if not files:
+                    del postings[term]
+                    dictionary.discard(term)
+        self.last_update = datetime.now(timezone.utc)
+
+    def _term_slot(self, file_key: str, term: str) -> int:
+        """מיקום המילה במערכים המקבילים של המסמך (-1 אם אינה קיימת)"""
+        entry = self.documents.get(file_key)
+        if not entry:
+            return -1
+        words = entry.get('words') or []
+        i = bisect.bisect_left(words, term)
+        return i if i < len(words) and words[i] == term else -1
+
+    def term_frequency(self, file_key: str, term: str) -> int:
+        i = self._term_slot(file_key, term)
+        return int(self.documents[file_key]['tfs'][i]) if i >= 0 else 0
+
+    def term_positions(self, file_key: str, term: str) -> Optional[array]:
+        """מיקומי המילה במסמך, או None אם לא נשמרו מיקומים (רשומה ישנה)"""
+        i = self._term_slot(file_key, term)
+        positions = self.documents[file_key].get('positions') if i >= 0 else None
+        if not positions or i >= len(positions):
+            return None
+        return _decode_positions(positions[i])
+
+    def bm25(self, term: str, file_key: str) -> float:
+        """ניקוד BM25 של מילה בודדת במסמך"""
+        tf = self.term_frequency(file_key, term)
+        if tf <= 0:
+            return 0.0
+        n_docs = len(self.documents)
+        df = len(self.word_index.get(term) or ())
+        idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+        avg_len = (self.total_length / n_docs) if n_docs else 1.0
+        norm = 1.0 - BM25_B + BM25_B * (self.doc_lengths.get(file_key, 0) / (avg_len or 1.0))
+        return idf * (tf * (BM25_K1 + 1.0)) / (tf + BM25_K1 * norm)
+
+    def has_phrase(self, file_key: str, terms: List[str]) -> bool:
+        """האם המילים מופיעות ברצף במסמך (ללא מיקומים: די בהופעת כולן)"""
+        position_lists = []
+        for term in terms:
+            if self._term_slot(file_key, term) < 0:
+                return False
+            position_lists.append(self.term_positions(file_key, term))
+        if any(p is None for p in position_lists):
+            return True
+        later = [set(p) for p in position_lists[1:]]
+        return any(
+            all((start + offset + 1) in positions for offset, positions in enumerate(later))
+            for start in position_lists[0]
+        )
+
+    def _term_groups(self, entry: Dict[str, Any]):
+        return (
+            (self.word_index, self.word_terms, entry.get('words') or []),
+            (self.function_index, self.function_terms, entry.get('functions') or []),
+            (self.language_index, self.language_terms, [entry.get('programming_language') or 'text']),
+            (self.tag_index, self.tag_terms, entry.get('tags') or []),
+        )
+
+    def load(self, user_id: int):
+        """טעינת האינדקס מהאחסון המתמשך; בנייה חד-פעמית אם עדיין לא קיים"""
+        
+        started = datetime.now(timezone.utc)
+        coll = _index_collection()
+        entries: List[Dict[str, Any]] = []
+        if coll is not None:
+            try:
+                entries = list(coll.find({"user_id": user_id, "is_active": True}, {"_id": 0}))
+            except Exception as e:
+                logger.warning(f"טעינת אינדקס חיפוש נכשלה עבור משתמש {user_id}: {e}")
+        if not entries:
+            # מילוי ראשוני (backfill) — מתבצע פעם אחת בלבד, לאחר מכן הכל אינקרמנטלי
+            self.rebuild_index(user_id)
+        else:
+            for entry in entries:
+                self.add_entry(entry)
+            logger.info(f"אינדקס נטען: {len(self.documents)} קבצים, {len(self.word_index)} מילים")
+        self.loaded = True
+        self.last_sync = started
+
+    def sync(self, user_id: int):
+        """משיכת שינויים שבוצעו מאז הסנכרון האחרון (גם מתהליכים אחרים)"""
+        
+        coll = _index_collection()
+        if coll is None:
+            return
+        started = datetime.now(timezone.utc)
+        try:
+            changed = coll.find(
+                {"user_id": user_id, "indexed_at": {"$gt": self.last_sync - _SYNC_SKEW}},
+                {"_id": 0},
+            )
+            for entry in changed:
+                if entry.get('is_active', True):
+                    self.add_entry(entry)
+                else:
+                    self.remove_file(f"{user_id}:{entry['file_name']}")
+            self.last_sync = started
+        except Exception as e:
+            logger.warning(f"סנכרון אינדקס חיפוש נכשל עבור משתמש {user_id}: {e}")
         
     def rebuild_index(self, user_id: int):
-        """בניית האינדקס מחדש"""
+        """בניית האינדקס מחדש ושמירתו באחסון המתמשך"""
         
         logger.info(f"בונה אינדקס חיפוש עבור משתמש {user_id}")
         
@@ -87,41 +527,40 @@ class SearchIndex:
         self.function_index.clear()
         self.language_index.clear()
         self.tag_index.clear()
+        self.documents.clear()
+        self.doc_lengths.clear()
+        self.total_length = 0
+        for dictionary in (self.word_terms, self.function_terms, self.language_terms, self.tag_terms):
+            dictionary.clear()
         
         # קבלת כל הקבצים
         files = db.get_user_files(user_id, limit=10000)
+        coll = _index_collection()
         
         for file_data in files:
-            file_key = f"{user_id}:{file_data['file_name']}"
-            content = file_data['code'].lower()
-            
-            # אינדקס מילים
-            words = re.findall(r'\b\w+\b', content)
-            for word in set(words):
-                if len(word) >= 2:  # רק מילים של 2+ תווים
-                    self.word_index[word].add(file_key)
-            
-            # אינדקס פונקציות
-            functions = code_processor.extract_functions(
-                file_data['code'], file_data['programming_language']
-            )
-            for func in functions:
-                self.function_index[func['name'].lower()].add(file_key)
-            
-            # אינדקס שפות
-            self.language_index[file_data['programming_language']].add(file_key)
-            
-            # אינדקס תגיות
-            for tag in file_data.get('tags', []):
-                self.tag_index[tag.lower()].add(file_key)
+            entry = build_index_entry(user_id, file_data)
+            self.add_entry(entry)
+            if coll is not None:
+                try:
+                    coll.update_one(
+                        {"user_id": user_id, "file_name": entry['file_name']},
+                        {"$set": entry},
+                        upsert=True,
+                    )
+                except Exception as e:
+                    logger.warning(f"שמירת רשומת אינדקס נכשלה: {e}")
         
         self.last_update = datetime.now(timezone.utc)
         logger.info(f"אינדקס נבנה: {len(self.word_index)} מילים, {len(self.function_index)} פונקציות")
     
     def should_rebuild(self, max_age_minutes: int = 30) -> bool:
         """בדיקה אם צריך לבנות אינדקס מחדש"""
-        age = datetime.now(timezone.utc) - self.last_update
-        return age.total_seconds() > (max_age_minutes * 60)
+        return not self.loaded
+
+    def should_sync(self, interval_seconds: int = 10) -> bool:
+        """בדיקה אם עבר מספיק זמן מאז הסנכרון האחרון"""
+        age = datetime.now(timezone.utc) - self.last_sync
+        return age.total_seconds() > interval_seconds
 
 class AdvancedSearchEngine:
     """מנוע חיפוש מתקדם"""
@@ -141,10 +580,69 @@ class AdvancedSearchEngine:
             self.indexes[user_id] = SearchIndex()
         
         index = self.indexes[user_id]
-        if index.should_rebuild():
-            index.rebuild_index(user_id)
+        if not index.loaded:
+            index.load(user_id)
+        elif index.should_sync():
+            index.sync(user_id)
         
         return index
+
+    # ===== עדכון אינקרמנטלי של האינדקס המתמשך (נקרא מה-Repository) =====
+    def index_file(self, user_id: int, file_data: Dict[str, Any]):
+        """עדכון רשומת האינדקס של קובץ לאחר שמירה/שחזור"""
+        
+        entry = build_index_entry(user_id, file_data)
+        coll = _index_collection()
+        if coll is not None:
+            coll.update_one(
+                {"user_id": user_id, "file_name": entry['file_name']},
+                {"$set": entry},
+                upsert=True,
+            )
+        index = self.indexes.get(user_id)
+        if index is not None and index.loaded:
+            index.add_entry(entry)
+
+    def remove_file(self, user_id: int, file_name: str):
+        """סימון קובץ כמחוק באינדקס (tombstone כדי שתהליכים אחרים יסתנכרנו)"""
+        
+        coll = _index_collection()
+        if coll is not None:
+            coll.update_one(
+                {"user_id": user_id, "file_name": file_name},
+                {"$set": {"is_active": False, "indexed_at": datetime.now(timezone.utc)},
+                 "$unset": {field: "" for field in _TOMBSTONE_DROPPED_FIELDS}},
+            )
+        index = self.indexes.get(user_id)
+        if index is not None:
+            index.remove_file(f"{user_id}:{file_name}")
+
+    def rename_file(self, user_id: int, old_name: str, new_name: str):
+        """העברת רשומת האינדקס לשם הקובץ החדש"""
+        
+        if old_name == new_name:
+            return
+        coll = _index_collection()
+        entry: Optional[Dict[str, Any]] = None
+        if coll is not None:
+            entry = coll.find_one({"user_id": user_id, "file_name": old_name, "is_active": True}, {"_id": 0})
+        index = self.indexes.get(user_id)
+        if entry is None and index is not None:
+            entry = index.documents.get(f"{user_id}:{old_name}")
+        self.remove_file(user_id, old_name)
+        if not entry:
+            return
+        entry = dict(entry, file_name=new_name, is_active=True, indexed_at=datetime.now(timezone.utc))
+        if isinstance(entry.get('tfs'), array):
+            entry['tfs'] = _pack_varints(entry['tfs'])
+        if coll is not None:
+            coll.update_one(
+                {"user_id": user_id, "file_name": new_name},
+                {"$set": entry},
+                upsert=True,
+            )
+        if index is not None and index.loaded:
+            index.add_entry(entry)
     
     def search(self, user_id: int, query: str, search_type: SearchType = SearchType.TEXT,
                filters: Optional[SearchFilter] = None, sort_order: SortOrder = SortOrder.RELEVANCE,
@@ -158,19 +656,34 @@ class AdvancedSearchEngine:
             # קבלת האינדקס
             index = self.get_index(user_id)
             
+            # שאילתה מובנית (lang:/tag:/date:/size:/func:, AND/OR/NOT) — דרך מתכנן השאילתות
+            if search_type == SearchType.TEXT and query_parser.is_structured(query):
+                planned = self._planned_search(user_id, query, index, filters, sort_order, limit)
+                if planned is not None:
+                    return planned
+            
             # ביצוע החיפוש לפי סוג
+            # בדירוג לפי רלוונטיות ללא מסננים אפשר לעצור אחרי top-k
+            top_k = limit if (not filters and sort_order == SortOrder.RELEVANCE) else None
+            # חיפוש זורם (מהחדש לישן) עוצר אחרי limit קבצים תואמים כשאין מסננים
+            stream_limit = limit if (not filters and sort_order in (SortOrder.RELEVANCE, SortOrder.DATE_DESC)) else None
             if search_type == SearchType.TEXT:
-                candidates = self._text_search(query, index, user_id)
+                candidates = self._text_search(query, index, user_id, limit=top_k)
             elif search_type == SearchType.REGEX:
-                candidates = self._regex_search(query, user_id)
+                candidates = self._regex_search(query, user_id, limit=stream_limit)
             elif search_type == SearchType.FUZZY:
                 candidates = self._fuzzy_search(query, index, user_id)
             elif search_type == SearchType.FUNCTION:
                 candidates = self._function_search(query, index, user_id)
             elif search_type == SearchType.CONTENT:
-                candidates = self._content_search(query, user_id)
+                candidates = self._content_search(query, user_id, limit=stream_limit)
             else:
-                candidates = self._text_search(query, index, user_id)
+                candidates = self._text_search(query, index, user_id, limit=top_k)
+            
+            # מסננים/מיון לפי מאפיינים משתמשים בשדות השמורים; תוכן נטען רק למסמכים ישנים בלעדיהם
+            if (filters and self._filters_need_content(filters)) or \
+                    sort_order in (SortOrder.SIZE_ASC, SortOrder.SIZE_DESC):
+                self._load_missing_features(user_id, candidates)
             
             # החלת מסננים
             if filters:
@@ -179,17 +692,140 @@ class AdvancedSearchEngine:
             # מיון
             candidates = self._sort_results(candidates, sort_order)
             
-            # הגבלת תוצאות
-            return candidates[:limit]
+            # הגבלת תוצאות — התוכן נטען רק לתוצאות שמוחזרות
+            results = candidates[:limit]
+            self._load_content(user_id, results)
+            return results
             
         except Exception as e:
             logger.error(f"שגיאה בחיפוש: {e}")
             return []
     
-    def _text_search(self, query: str, index: SearchIndex, user_id: int) -> List[SearchResult]:
-        """חיפוש טקסט רגיל"""
+    def _planned_search(self, user_id: int, query: str, index: SearchIndex,
+                        filters: Optional[SearchFilter], sort_order: SortOrder,
+                        limit: int) -> Optional[List[SearchResult]]:
+        """ביצוע שאילתה מובנית כפעולות קבוצה על posting lists
+
+        1. מסננים סלקטיביים (שפה/תגית/תאריך/גודל) נדחפים ל-$match ב-MongoDB ורצים ראשונים.
+        2. עץ AND/OR/NOT מחושב כחיתוך/איחוד/הפרש של קבוצות מתוך האינדקס, בתוך המועמדים.
+        3. רק הקבצים ששרדו מדורגים (BM25) ונשלפים.
+        מחזיר None כשבשאילתה אין לא תוכנית ולא מסנן תקין — הקורא ממשיך לחיפוש טקסט רגיל.
+        """
+        
+        parsed = query_parser.parse_query(query)
+        pushed: SearchFilter = parsed['filters']
+        if not parsed['plan'] and not _has_pushdown(pushed):
+            return None
+        # תגיות מהממשק כשגם בשאילתה יש תגיות: AND בין שתי הרשימות (נבדק בשליפה נפרדת)
+        required_tags: List[str] = []
+        if filters:
+            # מסנני השאילתה ומסנני הממשק מצטרפים ב-AND
+            if filters.languages and pushed.languages:
+                # לקובץ יש שפה אחת — AND הוא חיתוך הרשימות, וחיתוך ריק אומר שאין תוצאות
+                wanted = {lang.lower() for lang in filters.languages}
+                pushed.languages = [lang for lang in pushed.languages if lang.lower() in wanted]
+                if not pushed.languages:
+                    return []
+            elif filters.languages:
+                pushed.languages = list(filters.languages)
+            if filters.tags and pushed.tags:
+                required_tags = list(filters.tags)
+            elif filters.tags:
+                pushed.tags = list(filters.tags)
+            pushed.date_from = _stricter(max, pushed.date_from, filters.date_from)
+            pushed.date_to = _stricter(min, pushed.date_to, filters.date_to)
+            pushed.min_size = _stricter(max, pushed.min_size, filters.min_size)
+            pushed.max_size = _stricter(min, pushed.max_size, filters.max_size)
+            pushed.has_functions = filters.has_functions
+            pushed.has_classes = filters.has_classes
+        
+        prefix = f"{user_id}:"
+        if _has_pushdown(pushed):
+            names = db.find_file_names(
+                user_id,
+                languages=pushed.languages or None,
+                tags=pushed.tags or None,
+                date_from=pushed.date_from,
+                date_to=pushed.date_to,
+                min_size=pushed.min_size,
+                max_size=pushed.max_size,
+                has_functions=pushed.has_functions,
+                has_classes=pushed.has_classes,
+            )
+            if required_tags:
+                names = set(names) & set(db.find_file_names(user_id, tags=required_tags))
+            universe = {f"{prefix}{name}" for name in names}
+        else:
+            universe = {key for key in index.documents if key.startswith(prefix)}
+        
+        plan = parsed['plan']
+        matched = self._evaluate_plan(plan, index, universe) if plan else set(universe)
+        if not matched:
+            return []
         
-        # ניתוח השאילתה
+        # דירוג: BM25 של המונחים החיוביים בשאילתה
+        positive = [w for w in (t.lower() for t in parsed['terms']) if w not in self.stop_words and len(w) >= 2]
+        ranked = sorted(
+            ((sum(index.bm25(w, key) for w in positive), key) for key in matched),
+            reverse=True,
+        )
+        candidates = self._hydrate_results(user_id, ranked, query)
+        
+        # מסננים שנותרו (לא ניתנים לדחיפה): פונקציות/מחלקות/תבנית שם
+        if filters and (filters.has_functions is not None or filters.has_classes is not None or filters.file_pattern):
+            residual = SearchFilter(
+                has_functions=filters.has_functions,
+                has_classes=filters.has_classes,
+                file_pattern=filters.file_pattern,
+            )
+            if self._filters_need_content(residual):
+                self._load_missing_features(user_id, candidates)
+            candidates = self._apply_filters(candidates, residual)
+        if sort_order in (SortOrder.SIZE_ASC, SortOrder.SIZE_DESC):
+            self._load_missing_features(user_id, candidates)
+        candidates = self._sort_results(candidates, sort_order)
+        results = candidates[:limit]
+        self._load_content(user_id, results)
+        return results
+    
+    def _evaluate_plan(self, node: Tuple[Any, ...], index: SearchIndex, universe: Set[str]) -> Set[str]:
+        """חישוב צומת בעץ השאילתה כקבוצת מפתחות קבצים (מוגבלת ל-universe)"""
+        
+        ops = query_parser.operators
+        kind = node[0]
+        if kind == 'term':
+            files: Set[str] = set()
+            for term in index.word_terms.containing(node[1]):
+                files.update(index.word_index.get(term) or ())
+            return files & universe
+        if kind == 'func':
+            files = set()
+            for func_name in index.function_terms.containing(node[1]):
+                files.update(index.function_index.get(func_name) or ())
+            return files & universe
+        if kind == 'and':
+            # x AND NOT y מחושב כהפרש, בלי לבנות את המשלים של y
+            left = self._evaluate_plan(node[1], index, universe)
+            if node[2][0] == 'not':
+                return ops['NOT'](self._evaluate_plan(node[2][1], index, universe), left)
+            return ops['AND'](left, self._evaluate_plan(node[2], index, universe))
+        if kind == 'or':
+            return ops['OR'](self._evaluate_plan(node[1], index, universe),
+                             self._evaluate_plan(node[2], index, universe))
+        if kind == 'not':
+            return ops['NOT'](self._evaluate_plan(node[1], index, universe), universe)
+        return set()
+    
+    def _text_search(self, query: str, index: SearchIndex, user_id: int,
+                     limit: Optional[int] = None) -> List[SearchResult]:
+        """חיפוש טקסט רגיל עם דירוג BM25 ותמיכה בביטויים במרכאות"""
+        
+        # ניתוח השאילתה: ביטויים במרכאות + מילים בודדות
+        phrases = [
+            [w for w in re.findall(r'\b\w+\b', phrase.lower()) if len(w) >= 2]
+            for phrase in re.findall(r'"([^"]+)"', query)
+        ]
+        phrases = [p for p in phrases if len(p) > 1]
         query_words = [word.lower() for word in re.findall(r'\b\w+\b', query)
                       if word.lower() not in self.stop_words and len(word) >= 2]
         
@@ -197,96 +833,184 @@ class AdvancedSearchEngine:
             return []
         
         # מציאת קבצים מתאימים
-        file_scores = defaultdict(float)
+        file_scores: Dict[str, float] = defaultdict(float)
         
         for word in query_words:
-            matching_files = index.word_index.get(word, set())
+            word_scores: Dict[str, float] = {}
+            for file_key in index.word_index.get(word) or ():
+                word_scores[file_key] = index.bm25(word, file_key)  # התאמה מדויקת
             
-            # חיפוש חלקי (prefix matching)
-            for indexed_word, files in index.word_index.items():
-                if indexed_word.startswith(word) or word in indexed_word:
-                    matching_files.update(files)
+            # חיפוש חלקי (קידומת/מקטע) דרך מילון המונחים — ניקוד מופחת, המקסימום לכל קובץ
+            for indexed_word in index.word_terms.containing(word):
+                if indexed_word == word:
+                    continue
+                for file_key in index.word_index.get(indexed_word) or ():
+                    if file_key in index.word_index.get(word, ()):
+                        continue
+                    partial = 0.5 * index.bm25(indexed_word, file_key)
+                    if partial > word_scores.get(file_key, 0.0):
+                        word_scores[file_key] = partial
             
-            # הוספת ניקוד
-            for file_key in matching_files:
-                if word in index.word_index and file_key in index.word_index[word]:
-                    file_scores[file_key] += 2.0  # התאמה מדויקת
-                else:
-                    file_scores[file_key] += 1.0  # התאמה חלקית
-        
-        # יצירת תוצאות
-        results = []
-        for file_key, score in file_scores.items():
-            if score > 0:
-                user_id_str, file_name = file_key.split(':', 1)
-                if int(user_id_str) == user_id:
-                    file_data = db.get_latest_version(user_id, file_name)
-                    if file_data:
-                        result = self._create_search_result(file_data, query, score)
-                        results.append(result)
-        
-        return results
+            for file_key, score in word_scores.items():
+                file_scores[file_key] += score
+        
+        # ביטויים: נשמרים רק קבצים שבהם המילים מופיעות ברצף
+        for phrase in phrases:
+            file_scores = {
+                key: score for key, score in file_scores.items()
+                if index.has_phrase(key, phrase)
+            }
+        
+        # בחירת top-k בעזרת heap — ללא מיון ויצירת תוצאה לכל מועמד
+        ranked = [(score, key) for key, score in file_scores.items() if score > 0]
+        if limit is not None:
+            ranked = heapq.nlargest(limit, ranked)
+        else:
+            ranked.sort(reverse=True)
+        
+        # יצירת תוצאות (מטא-דאטה בשליפה אחת; התוכן נטען רק לתוצאות המוחזרות)
+        return self._hydrate_results(user_id, ranked, query)
     
-    def _regex_search(self, pattern: str, user_id: int) -> List[SearchResult]:
-        """חיפוש עם ביטויים רגולריים"""
+    def _stream_files(self, user_id: int):
+        """מעבר זורם על קבצי המשתמש עם השדות הנחוצים לבניית תוצאה"""
+        return db.iter_user_files(
+            user_id,
+            projection=dict(_RESULT_FIELDS, code=1),
+            batch_size=STREAM_BATCH_SIZE,
+        )
+    
+    def _regex_search(self, pattern: str, user_id: int, limit: Optional[int] = None) -> List[SearchResult]:
+        """חיפוש עם ביטויים רגולריים
+
+        הקבצים נקראים מ-cursor באצוות ונסרקים במאגר תהליכים עם תקציב זמן לדפוס,
+        שמגן גם מפני backtracking קטסטרופלי. הסריקה נעצרת אחרי limit קבצים תואמים.
+        """
         
+        flags = re.IGNORECASE | re.MULTILINE
         try:
-            compiled_pattern = re.compile(pattern, re.IGNORECASE | re.MULTILINE)
+            re.compile(pattern, flags)
         except re.error as e:
             logger.error(f"דפוס regex לא תקין: {e}")
             return []
         
-        files = db.get_user_files(user_id, limit=1000)
-        results = []
+        results: List[SearchResult] = []
+        pool = _get_regex_pool()
+        in_flight: List[Tuple[Dict[str, Dict[str, Any]], Any]] = []
         
-        for file_data in files:
-            content = file_data['code']
-            matches = list(compiled_pattern.finditer(content))
-            
-            if matches:
-                score = len(matches)
-                result = self._create_search_result(file_data, pattern, score)
-                
-                # הוספת מידע על ההתאמות
-                result.matches = [
-                    {
-                        "start": match.start(),
-                        "end": match.end(),
-                        "text": match.group(),
-                        "line": content[:match.start()].count('\n') + 1
-                    }
-                    for match in matches[:10]  # מקסימום 10 התאמות
-                ]
-                
+        def _collect(by_name: Dict[str, Dict[str, Any]], hits) -> bool:
+            for file_name, count, matches in hits:
+                result = self._create_search_result(by_name[file_name], pattern, count)
+                result.matches = matches  # מקסימום 10 התאמות
                 results.append(result)
+                if limit is not None and len(results) >= limit:
+                    return True
+            return False
+        
+        try:
+            for batch in _iter_batches(self._stream_files(user_id), STREAM_BATCH_SIZE):
+                by_name = {doc['file_name']: doc for doc in batch}
+                payload = [(doc['file_name'], doc.get('code') or '') for doc in batch]
+                if pool is None:
+                    if _collect(by_name, regex_scan_batch(pattern, flags, payload)):
+                        break
+                    continue
+                in_flight.append((by_name, pool.submit(regex_scan_batch, pattern, flags, payload)))
+                # שמירה על סדר ה-cursor: אוספים את האצווה הוותיקה כשהתור מלא.
+                # תקציב הזמן הוא לכל אצווה, כך שקורפוס גדול אך תמים אינו נחשב חריגה
+                if len(in_flight) >= REGEX_WORKERS * 2:
+                    by_name, future = in_flight.pop(0)
+                    if _collect(by_name, future.result(timeout=REGEX_TIMEOUT_SECONDS)):
+                        break
+            else:
+                while in_flight:
+                    by_name, future = in_flight.pop(0)
+                    if _collect(by_name, future.result(timeout=REGEX_TIMEOUT_SECONDS)):
+                        break
+        except FuturesTimeout:
+            logger.warning(f"אצוות regex חרגה מ-{REGEX_TIMEOUT_SECONDS} שניות — מוחזרות תוצאות חלקיות")
+            _reset_regex_pool()
+        except Exception as e:
+            logger.error(f"שגיאה בחיפוש regex: {e}")
+            _reset_regex_pool()
+        finally:
+            for _, future in in_flight:
+                future.cancel()
         
         return results
     
     def _fuzzy_search(self, query: str, index: SearchIndex, user_id: int) -> List[SearchResult]:
-        """חיפוש מטושטש (fuzzy)"""
-        
-        files = db.get_user_files(user_id, limit=1000)
-        results = []
-        
-        for file_data in files:
-            # חיפוש מטושטש בשם הקובץ
-            name_ratio = fuzz.partial_ratio(query.lower(), file_data['file_name'].lower())
-            
-            # חיפוש מטושטש בתוכן
-            content_ratio = fuzz.partial_ratio(query.lower(), file_data['code'].lower())
-            
-            # חיפוש מטושטש בתגיות
-            tags_text = ' '.join(file_data.get('tags', []))
-            tags_ratio = fuzz.partial_ratio(query.lower(), tags_text.lower())
-            
-            # ניקוד משולב
-            max_ratio = max(name_ratio, content_ratio, tags_ratio)
-            
-            if max_ratio >= 60:  # סף מינימלי
-                score = max_ratio / 100.0
-                result = self._create_search_result(file_data, query, score)
-                results.append(result)
+        """חיפוש מטושטש (fuzzy)
+
+        שמות ותגיות מנוקדים ישירות מהאינדקס. לתוכן נבחרים מועמדים לפי חפיפת טריגרמים
+        עם אוצר המילים, ורק עבורם נטען הקוד ומנוקדות השורות הרלוונטיות — הכל בקריאות
+        אצווה של rapidfuzz.
+        """
+        
+        query_lower = query.lower().strip()
+        prefix = f"{user_id}:"
+        keys = [key for key in index.documents if key.startswith(prefix)]
+        if not query_lower or not keys:
+            return []
         
+        scores: Dict[str, float] = {}
+        
+        # חיפוש מטושטש בשמות הקבצים
+        names = [index.documents[key]['file_name'].lower() for key in keys]
+        for key, ratio in zip(keys, fuzzy_matcher.score_many(query_lower, names)):
+            scores[key] = ratio
+        
+        # חיפוש מטושטש בתגיות
+        tagged = [(key, ' '.join(index.documents[key].get('tags') or [])) for key in keys]
+        tagged = [(key, text) for key, text in tagged if text]
+        for (key, _), ratio in zip(tagged, fuzzy_matcher.score_many(query_lower, [t for _, t in tagged])):
+            scores[key] = max(scores[key], ratio)
+        
+        # סינון מוקדם לתוכן: חפיפת טריגרמים של מילות השאילתה עם מילים באינדקס
+        grams: Set[str] = set()
+        for word in re.findall(r'\w+', query_lower):
+            grams |= fuzzy_matcher.trigrams(word)
+        overlap: Counter = Counter()
+        for gram in grams:
+            files_with_gram: Set[str] = set()
+            for term in index.word_terms.containing(gram):
+                files_with_gram.update(index.word_index.get(term) or ())
+            overlap.update(files_with_gram)
+        min_overlap = max(1, int(len(grams) * 0.3))
+        candidates = [
+            key for key, n in overlap.most_common(FUZZY_MAX_CONTENT_CANDIDATES)
+            if n >= min_overlap and scores.get(key, 0) < 100
+        ]
+        
+        # חיפוש מטושטש בתוכן: החלון (שורה) הטוב ביותר בכל קובץ מועמד
+        loaded: Dict[str, Dict[str, Any]] = {}
+        if candidates:
+            loaded = db.get_latest_versions(
+                user_id,
+                [index.documents[key]['file_name'] for key in candidates],
+                projection={"file_name": 1, "code": 1},
+            )
+            owners: List[str] = []
+            windows: List[str] = []
+            for key in candidates:
+                doc = loaded.get(index.documents[key]['file_name'])
+                for window in fuzzy_matcher.content_windows(query_lower, (doc or {}).get('code') or '', grams):
+                    owners.append(key)
+                    windows.append(window)
+            for key, ratio in zip(owners, fuzzy_matcher.score_many(query_lower, windows)):
+                if ratio > scores[key]:
+                    scores[key] = ratio
+        
+        # ניקוד משולב
+        ranked = sorted(
+            ((ratio / 100.0, key) for key, ratio in scores.items() if ratio >= FUZZY_MIN_SCORE),
+            reverse=True,
+        )
+        results = self._hydrate_results(user_id, ranked, query)
+        for result in results:
+            doc = loaded.get(result.file_name)
+            if doc is not None:
+                result.content = doc.get('code') or ''
+                result.content_loaded = True
         return results
     
     def _function_search(self, query: str, index: SearchIndex, user_id: int) -> List[SearchResult]:
@@ -296,34 +1020,23 @@ class AdvancedSearchEngine:
         file_scores = defaultdict(float)
         
         # חיפוש בשמות פונקציות
-        for func_name, files in index.function_index.items():
-            if query_lower in func_name:
-                similarity = fuzz.ratio(query_lower, func_name) / 100.0
-                for file_key in files:
-                    file_scores[file_key] += similarity * 2.0
+        for func_name in index.function_terms.containing(query_lower):
+            similarity = fuzzy_matcher.ratio(query_lower, func_name) / 100.0
+            for file_key in index.function_index.get(func_name) or ():
+                file_scores[file_key] += similarity * 2.0
         
         # יצירת תוצאות
-        results = []
-        for file_key, score in file_scores.items():
-            if score > 0:
-                user_id_str, file_name = file_key.split(':', 1)
-                if int(user_id_str) == user_id:
-                    file_data = db.get_latest_version(user_id, file_name)
-                    if file_data:
-                        result = self._create_search_result(file_data, query, score)
-                        results.append(result)
-        
-        return results
+        ranked = sorted(((score, key) for key, score in file_scores.items() if score > 0), reverse=True)
+        return self._hydrate_results(user_id, ranked, query)
     
-    def _content_search(self, query: str, user_id: int) -> List[SearchResult]:
-        """חיפוש מלא בתוכן"""
+    def _content_search(self, query: str, user_id: int, limit: Optional[int] = None) -> List[SearchResult]:
+        """חיפוש מלא בתוכן (זורם, נעצר אחרי limit קבצים תואמים)"""
         
-        files = db.get_user_files(user_id, limit=1000)
         results = []
         
         query_lower = query.lower()
         
-        for file_data in files:
+        for file_data in self._stream_files(user_id):
             content = file_data['code']
             content_lower = content.lower()
             
@@ -349,9 +1062,18 @@ class AdvancedSearchEngine:
                     result.highlight_ranges = [(relative_start, relative_end)]
                 
                 results.append(result)
+                if limit is not None and len(results) >= limit:
+                    break
         
         return results
     
+    @staticmethod
+    def _filters_need_content(filters: SearchFilter) -> bool:
+        return bool(
+            filters.min_size or filters.max_size or
+            filters.has_functions is not None or filters.has_classes is not None
+        )
+    
     def _apply_filters(self, results: List[SearchResult], filters: SearchFilter) -> List[SearchResult]:
         """החלת מסננים על התוצאות"""
         
@@ -375,25 +1097,27 @@ class AdvancedSearchEngine:
                 continue
             
             # מסנן גודל
-            content_size = len(result.content)
-            
-            if filters.min_size and content_size < filters.min_size:
-                continue
-            
-            if filters.max_size and content_size > filters.max_size:
-                continue
+            if filters.min_size or filters.max_size:
+                content_size = self._result_size(result)
+                
+                if filters.min_size and content_size < filters.min_size:
+                    continue
+                
+                if filters.max_size and content_size > filters.max_size:
+                    continue
             
             # מסנן פונקציות
             if filters.has_functions is not None:
-                functions = code_processor.extract_functions(result.content, result.programming_language)
-                has_functions = len(functions) > 0
+                self._ensure_features(result)
+                has_functions = (result.function_count or 0) > 0
                 
                 if filters.has_functions != has_functions:
                     continue
             
             # מסנן מחלקות
             if filters.has_classes is not None:
-                has_classes = 'class ' in result.content.lower()
+                self._ensure_features(result)
+                has_classes = (result.class_count or 0) > 0
                 
                 if filters.has_classes != has_classes:
                     continue
@@ -426,25 +1150,81 @@ class AdvancedSearchEngine:
             return sorted(results, key=lambda x: x.file_name.lower(), reverse=True)
         
         elif sort_order == SortOrder.SIZE_DESC:
-            return sorted(results, key=lambda x: len(x.content), reverse=True)
+            return sorted(results, key=self._result_size, reverse=True)
         
         elif sort_order == SortOrder.SIZE_ASC:
-            return sorted(results, key=lambda x: len(x.content))
+            return sorted(results, key=self._result_size)
         
         return results
     
+    def _hydrate_results(self, user_id: int, ranked: List[Tuple[float, str]], query: str) -> List[SearchResult]:
+        """בניית תוצאות ממפתחות אינדקס מדורגים — שליפה מרוכזת אחת, ללא תוכן"""
+        
+        names: List[str] = []
+        scores: Dict[str, float] = {}
+        for score, file_key in ranked:
+            user_id_str, file_name = file_key.split(':', 1)
+            if int(user_id_str) == user_id and file_name not in scores:
+                names.append(file_name)
+                scores[file_name] = score
+        if not names:
+            return []
+        docs = db.get_latest_versions(user_id, names, projection=_RESULT_FIELDS)
+        return [
+            self._create_search_result(docs[name], query, scores[name])
+            for name in names if name in docs
+        ]
+    
+    def _load_content(self, user_id: int, results: List[SearchResult]):
+        """טעינה עצלה של התוכן לתוצאות שנבנו ממטא-דאטה בלבד (שליפה מרוכזת אחת)"""
+        
+        pending = [r for r in results if not r.content_loaded]
+        if not pending:
+            return
+        docs = db.get_latest_versions(user_id, [r.file_name for r in pending],
+                                      projection={"file_name": 1, "code": 1})
+        for result in pending:
+            doc = docs.get(result.file_name)
+            if doc is not None:
+                result.content = doc.get('code') or ''
+                result.content_loaded = True
+    
+    def _load_missing_features(self, user_id: int, results: List[SearchResult]):
+        """טעינת תוכן רק לתוצאות ממסמכים ישנים שאין עליהם מאפיינים שמורים"""
+        
+        self._load_content(user_id, [r for r in results if r.size_bytes is None])
+    
+    @staticmethod
+    def _ensure_features(result: SearchResult):
+        """השלמת מאפיינים חסרים מהתוכן (מסמכים שנשמרו לפני חישוב המאפיינים)"""
+        
+        if result.size_bytes is None:
+            features = compute_code_features(result.content, result.programming_language)
+            result.size_bytes = features['size_bytes']
+            result.function_count = features['function_count']
+            result.class_count = features['class_count']
+    
+    @classmethod
+    def _result_size(cls, result: SearchResult) -> int:
+        cls._ensure_features(result)
+        return result.size_bytes or 0
+    
     def _create_search_result(self, file_data: Dict, query: str, score: float) -> SearchResult:
         """יצירת אובייקט תוצאת חיפוש"""
         
         return SearchResult(
             file_name=file_data['file_name'],
-            content=file_data['code'],
+            content=file_data.get('code') or '',
             programming_language=file_data['programming_language'],
             tags=file_data.get('tags', []),
             created_at=file_data['created_at'],
             updated_at=file_data['updated_at'],
             version=file_data['version'],
-            relevance_score=score
+            relevance_score=score,
+            content_loaded='code' in file_data,
+            size_bytes=file_data.get('size_bytes'),
+            function_count=file_data.get('function_count'),
+            class_count=file_data.get('class_count'),
         )
     
     def suggest_completions(self, user_id: int, partial_query: str, limit: int = 10) -> List[str]:
@@ -454,27 +1234,16 @@ class AdvancedSearchEngine:
             return []
         
         index = self.get_index(user_id)
+        prefix = partial_query.lower()
         suggestions = []
         
-        # השלמות מאינדקס המילים
-        for word in index.word_index.keys():
-            if word.startswith(partial_query.lower()):
-                suggestions.append(word)
-        
-        # השלמות משמות פונקציות
-        for func_name in index.function_index.keys():
-            if func_name.startswith(partial_query.lower()):
-                suggestions.append(func_name)
-        
-        # השלמות משפות
-        for lang in index.language_index.keys():
-            if lang.startswith(partial_query.lower()):
-                suggestions.append(lang)
+        # השלמות מאינדקס המילים, שמות פונקציות ושפות (חיפוש בינארי על מילון ממוין)
+        suggestions.extend(index.word_terms.with_prefix(prefix))
+        suggestions.extend(index.function_terms.with_prefix(prefix))
+        suggestions.extend(index.language_terms.with_prefix(prefix))
         
         # השלמות מתגיות
-        for tag in index.tag_index.keys():
-            if tag.startswith(partial_query.lower()):
-                suggestions.append(f"#{tag}")
+        suggestions.extend(f"#{tag}" for tag in index.tag_terms.with_prefix(prefix))
         
         # מיון והגבלה
         suggestions = list(set(suggestions))
@@ -525,6 +1294,11 @@ class AdvancedSearchEngine:
 class SearchQueryParser:
     """מפרש שאילתות חיפוש מתקדמות"""
     
+    # אופרטורים מזוהים רק באותיות גדולות, כדי ש-"not found" יישאר חיפוש טקסט
+    OPERATORS = ('AND', 'OR', 'NOT')
+    # מפתחות מסננים מוכרים; key:value אחר (std::vector, http://...) נשאר מונח חיפוש
+    FILTER_KEYS = ('lang', 'tag', 'func', 'size', 'date')
+    
     def __init__(self):
         # בנייה בטוחה של מפת אופרטורים ומסננים כדי למנוע AttributeError בזמן build של RTD
         ops: Dict[str, Any] = {}
@@ -556,58 +1330,110 @@ class SearchQueryParser:
             terms: List[str]
             filters: SearchFilter
             operators: List[str]
+            plan: Any
         parsed: _Parsed = {
             'terms': [],
             'filters': SearchFilter(),
-            'operators': []
+            'operators': [],
+            'plan': None,
         }
         
-        # פרסור בסיסי (לצורך ההדגמה)
+        # טוקנים לתוכנית: מונחים, func: ואופרטורים. שאר המסננים נדחפים ל-SearchFilter
+        plan_tokens: List[Tuple[Any, ...]] = []
         tokens = query.split()
         
         for token in tokens:
-            if ':' in token:
+            key, sep, value = token.partition(':')
+            if sep and key.lower() in self.FILTER_KEYS:
                 # זה מסנן
-                key, value = token.split(':', 1)
-                self._apply_filter(parsed['filters'], key, value)
-            elif token.upper() in ['AND', 'OR', 'NOT']:
-                parsed['operators'].append(token.upper())
+                if key.lower() == 'func':
+                    if value:
+                        plan_tokens.append(('func', value.lower()))
+                else:
+                    self._apply_filter(parsed['filters'], key.lower(), value)
+            elif token in self.OPERATORS:
+                parsed['operators'].append(token)
+                plan_tokens.append(('op', token))
             else:
-                parsed['terms'].append(token)
-        
-        from typing import cast, Dict, Any
+                # מילה רגילה (גם std::vector או http://x.com): המילים שבה, ב-AND מרומז
+                words = [w for w in re.findall(r'\w+', token.lower()) if len(w) >= 2]
+                parsed['terms'].extend(words)
+                if words:
+                    node: Tuple[Any, ...] = ('term', words[0])
+                    for word in words[1:]:
+                        node = ('and', node, ('term', word))
+                    plan_tokens.append(node)
+        
+        parsed['plan'] = self._build_plan(plan_tokens)
         return cast(Dict[str, Any], parsed)
     
+    @classmethod
+    def is_structured(cls, query: str) -> bool:
+        """האם השאילתה כוללת מסנן מוכר (lang:/tag:/...) או אופרטור באותיות גדולות"""
+        return any(t in cls.OPERATORS or (':' in t and t.partition(':')[0].lower() in cls.FILTER_KEYS)
+                   for t in query.split())
+    
+    def _build_plan(self, tokens: List[Tuple[Any, ...]]) -> Optional[Tuple[Any, ...]]:
+        """בניית עץ ביצוע: NOT קודם ל-AND (גם מרומז בין מונחים), ו-AND קודם ל-OR"""
+        
+        pos = 0
+        
+        def peek() -> Optional[Tuple[Any, ...]]:
+            return tokens[pos] if pos < len(tokens) else None
+        
+        def parse_or():
+            nonlocal pos
+            node = parse_and()
+            while peek() == ('op', 'OR'):
+                pos += 1
+                right = parse_and()
+                node = ('or', node, right) if node and right else (node or right)
+            return node
+        
+        def parse_and():
+            nonlocal pos
+            node = parse_not()
+            while peek() is not None and peek() != ('op', 'OR'):
+                if peek() == ('op', 'AND'):
+                    pos += 1
+                    continue
+                right = parse_not()
+                node = ('and', node, right) if node and right else (node or right)
+            return node
+        
+        def parse_not():
+            nonlocal pos
+            tok = peek()
+            if tok is None or tok == ('op', 'OR'):
+                return None
+            pos += 1
+            if tok == ('op', 'NOT'):
+                operand = parse_not()
+                return ('not', operand) if operand else None
+            if tok[0] == 'op':  # AND תלוי באוויר
+                return None
+            return tok
+        
+        return parse_or()
+    
     def _apply_filter(self, filters: SearchFilter, key: str, value: str):
         """החלת מסנן"""
         
-        if key == 'lang':
-            filters.languages.append(value)
-        elif key == 'tag':
-            filters.tags.append(value)
-        elif key == 'size':
-            # פרסור size:>100, size:<50, size:100-500
-            if value.startswith('>'):
-                filters.min_size = int(value[1:])
-            elif value.startswith('<'):
-                filters.max_size = int(value[1:])
-            elif '-' in value:
-                min_val, max_val = value.split('-')
-                filters.min_size = int(min_val)
-                filters.max_size = int(max_val)
-        # ועוד מסננים...
+        handler = self.operators.get(f"{key}:")
+        if handler is not None:
+            handler(filters, value)
 
-    # ===== Stubs בטוחים לאופרטורים כדי למנוע AttributeError בזמן build =====
-    def _and_operator(self, left: Any, right: Any) -> Any:
-        raise NotImplementedError("_and_operator is not implemented yet")
+    # ===== אופרטורים על posting lists (קבוצות מפתחות קבצים) =====
+    def _and_operator(self, left: Set[str], right: Set[str]) -> Set[str]:
+        return left & right
 
-    def _or_operator(self, left: Any, right: Any) -> Any:
-        raise NotImplementedError("_or_operator is not implemented yet")
+    def _or_operator(self, left: Set[str], right: Set[str]) -> Set[str]:
+        return left | right
 
-    def _not_operator(self, operand: Any) -> Any:
-        raise NotImplementedError("_not_operator is not implemented yet")
+    def _not_operator(self, operand: Set[str], universe: Optional[Set[str]] = None) -> Set[str]:
+        return set(universe or ()) - operand
 
-    # מסננים אופציונליים (stubs) — אם ייקראו בבנייה, יעלו שגיאה ברורה
+    # ===== מסננים לפי מפתח (lang:/tag:/func:/size:/date:) =====
     def _language_filter(self, filters: SearchFilter, value: str) -> None:
         filters.languages.append(value)
 
@@ -619,22 +1445,47 @@ class SearchQueryParser:
         filters.tags.append(f"func:{value}")
 
     def _size_filter(self, filters: SearchFilter, value: str) -> None:
-        if value.startswith('>'):
-            filters.min_size = int(value[1:])
-        elif value.startswith('<'):
-            filters.max_size = int(value[1:])
-        elif '-' in value:
-            min_val, max_val = value.split('-')
-            filters.min_size = int(min_val)
-            filters.max_size = int(max_val)
+        """size:>100 / size:<50 / size:100-500"""
+        try:
+            if value.startswith('>'):
+                filters.min_size = int(value[1:])
+            elif value.startswith('<'):
+                filters.max_size = int(value[1:])
+            elif '-' in value:
+                min_val, max_val = value.split('-')
+                filters.min_size = int(min_val)
+                filters.max_size = int(max_val)
+        except ValueError:
+            logger.debug(f"מסנן גודל לא תקין: {value}")
 
     def _date_filter(self, filters: SearchFilter, value: str) -> None:
-        # Stub: פירוש תאריך בסיסי — שומר לסינון מאוחר יותר בצד המנוע אם ימומש
+        """date:2024 / date:2024-05 / date:2024-05-01 / date:>2024-01-01 / date:<2024-06 / date:7d"""
+        
+        def _parse(text: str) -> Tuple[datetime, datetime]:
+            parts = [int(p) for p in text.split('-')]
+            if len(parts) == 1:
+                start = datetime(parts[0], 1, 1, tzinfo=timezone.utc)
+                end = datetime(parts[0] + 1, 1, 1, tzinfo=timezone.utc)
+            elif len(parts) == 2:
+                start = datetime(parts[0], parts[1], 1, tzinfo=timezone.utc)
+                end = datetime(parts[0] + (parts[1] // 12), parts[1] % 12 + 1, 1, tzinfo=timezone.utc)
+            else:
+                start = datetime(parts[0], parts[1], parts[2], tzinfo=timezone.utc)
+                end = start + timedelta(days=1)
+            return start, end - timedelta(microseconds=1)
+        
         try:
-            # תאריכים מוחלטים או יחסיים ימומשו בהמשך
-            pass
-        except Exception:
-            pass
+            value = value.strip().lower()
+            if value.endswith('d') and value[:-1].isdigit():
+                filters.date_from = datetime.now(timezone.utc) - timedelta(days=int(value[:-1]))
+            elif value.startswith('>'):
+                filters.date_from = _parse(value[1:])[1]
+            elif value.startswith('<'):
+                filters.date_to = _parse(value[1:])[0]
+            else:
+                filters.date_from, filters.date_to = _parse(value)
+        except (ValueError, IndexError):
+            logger.debug(f"מסנן תאריך לא תקין: {value}")
 
 # יצירת אינסטנס גלובלי
 search_engine = AdvancedSearchEngine()
@@ -0,0 +1,40 @@
+"""
+פונקציות עבודה לחיפוש בתהליכים נפרדים
+Worker functions for process-pool search
+
+המודול אינו מייבא דבר מעבר לספרייה הסטנדרטית, כך שתהליכי העבודה
+לא טוענים את מסד הנתונים, Redis או תלויות כבדות אחרות.
+"""
+
+import re
+from typing import Any, Dict, List, Tuple
+
+
+def regex_scan_batch(pattern: str, flags: int, batch: List[Tuple[str, str]],
+                     max_matches: int = 10) -> List[Tuple[str, int, List[Dict[str, Any]]]]:
+    """סריקת אצוות קבצים עם ביטוי רגולרי.
+
+    מחזיר (file_name, מספר התאמות, עד max_matches התאמות ראשונות) לכל קובץ עם התאמה.
+    מספרי השורות מחושבים באופן אינקרמנטלי (ספירת '\\n' רק בין התאמות עוקבות).
+    """
+    compiled = re.compile(pattern, flags)
+    out: List[Tuple[str, int, List[Dict[str, Any]]]] = []
+    for file_name, content in batch:
+        count = 0
+        matches: List[Dict[str, Any]] = []
+        line = 1
+        last = 0
+        for match in compiled.finditer(content):
+            count += 1
+            if len(matches) < max_matches:
+                line += content.count('\n', last, match.start())
+                last = match.start()
+                matches.append({
+                    "start": match.start(),
+                    "end": match.end(),
+                    "text": match.group(),
+                    "line": line,
+                })
+        if count:
+            out.append((file_name, count, matches))
+    return out
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from typing import Optional
 
@@ -5,6 +6,7 @@ from aiohttp import web
 from html import escape as html_escape
 
 from integrations import code_sharing
+from render_cache import highlight_html, style_css
 
 logger = logging.getLogger(__name__)
 
@@ -29,6 +31,13 @@ def create_app() -> web.Application:
         code = data.get("code", "")
         file_name = data.get("file_name", "snippet.txt")
         language = data.get("language", "text")
+        try:
+            # אותו render cache כמו ה-webapp; Pygments רץ מחוץ ל-event loop
+            body = await asyncio.to_thread(highlight_html, code, language)
+            css = style_css()
+        except Exception as e:
+            logger.warning(f"share_view highlight failed: {e}")
+            body, css = f"<pre>{html_escape(code)}</pre>", ""
         html = f"""
 <!DOCTYPE html>
 <html lang="he">
@@ -42,12 +51,15 @@ def create_app() -> web.Application:
     h1 {{ font-size: 18px; }}
     .meta {{ color: #57606a; margin-bottom: 8px; }}
     a {{ color: #58a6ff; }}
+    .source {{ background: #0d1117; border-radius: 8px; overflow: auto; }}
+    .source pre {{ white-space: pre; padding: 0 8px; border-radius: 0; }}
+    {css}
   </style>
   </head>
   <body>
     <h1>📄 {file_name}</h1>
     <div class="meta">שפה: {language}</div>
-    <pre>{html_escape(code)}</pre>
+    {body}
   </body>
 </html>
 """
@@ -0,0 +1,197 @@
+"""
+אוסף "גרסה אחרונה" של קטעי קוד (code_snippets_latest)
+Materialized latest-version collection for code snippets
+
+מסמך אחד לכל (user_id, file_name) עם המטא-דאטה של הגרסה האחרונה בלבד (ללא code),
+ומצביע `snippet_id` למסמך הגרסה ב-code_snippets. רשימות קבצים הופכות לשאילתות
+find().sort().skip().limit() על אינדקס, במקום $group על כל הגרסאות של כל הקבצים.
+
+- קבצים פעילים: מסמך הגרסה הפעילה האחרונה (is_active=True).
+- קבצים שנמחקו רכות: הגרסה האחרונה עם is_active=False (נדרש לסטטיסטיקות "כל הזמנים").
+- קבצים שנמחקו לצמיתות: אין מסמך.
+
+האוסף מתעדכן אחרי כל כתיבה עם sync_latest, ומתמלא פעם אחת מהנתונים הקיימים עם
+backfill_latest. המודול לא תלוי בחבילת database ולכן משמש גם את ה-webapp.
+"""
+
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+try:
+    from pymongo import ReplaceOne, UpdateOne  # type: ignore
+except Exception:  # pymongo אינו זמין בסביבות בדיקה קלות
+    ReplaceOne = UpdateOne = None  # type: ignore[assignment]
+
+from code_features import compute_code_features
+
+logger = logging.getLogger(__name__)
+
+LATEST_COLLECTION_NAME = "code_snippets_latest"
+# מסמך ב-db.migrations שמסמן שה-backfill הושלם וניתן לקרוא מהאוסף
+MIGRATION_ID = "code_snippets_latest"
+
+# שדות שמועתקים ממסמך הגרסה (ללא code)
+LATEST_FIELDS = (
+    "user_id",
+    "file_name",
+    "version",
+    "programming_language",
+    "description",
+    "tags",
+    "created_at",
+    "updated_at",
+    "is_active",
+    "deleted_at",
+    "deleted_expires_at",
+    "is_archive",
+    "size_bytes",
+    "line_count",
+    "function_count",
+    "class_count",
+    "symbols",
+)
+
+_SOURCE_PROJECTION = {name: 1 for name in LATEST_FIELDS}
+
+# מסמכים ישנים נשמרו בלי is_active — הם פעילים (כמו בשאילתות {'is_active': {'$exists': False}} של ה-webapp)
+_ACTIVE_FILTER = {"$or": [{"is_active": True}, {"is_active": {"$exists": False}}]}
+
+
+def _session_kwargs(session: Any) -> Dict[str, Any]:
+    return {"session": session} if session is not None else {}
+
+
+def latest_doc_from(version_doc: Dict[str, Any]) -> Dict[str, Any]:
+    """בניית מסמך latest ממסמך גרסה"""
+    doc = {name: version_doc[name] for name in LATEST_FIELDS if name in version_doc}
+    doc["snippet_id"] = version_doc.get("_id")
+    doc["is_active"] = version_doc.get("is_active", True) is True
+    return doc
+
+
+def as_listing_doc(latest_doc: Dict[str, Any]) -> Dict[str, Any]:
+    """מסמך latest בצורה של מסמך גרסה לרשימות (_id = מזהה הגרסה)"""
+    doc = dict(latest_doc)
+    doc["_id"] = doc.pop("snippet_id", doc.get("_id"))
+    return doc
+
+
+def sync_latest(collection: Any, latest_collection: Any, user_id: int, file_name: str,
+                session: Any = None) -> Optional[Dict[str, Any]]:
+    """חישוב מחדש של מסמך latest לקובץ אחד מתוך code_snippets (שתי קריאות find_one על אינדקס)"""
+    kwargs = _session_kwargs(session)
+    key = {"user_id": user_id, "file_name": file_name}
+    source = collection.find_one(dict(key, **_ACTIVE_FILTER), _SOURCE_PROJECTION, sort=[("version", -1)], **kwargs)
+    if source is None:
+        source = collection.find_one(key, _SOURCE_PROJECTION, sort=[("version", -1)], **kwargs)
+    if source is None:
+        latest_collection.delete_one(key, **kwargs)
+        return None
+    if source.get("size_bytes") is None:
+        # מסמך ישן ללא מאפיינים שמורים — נחשב אותם מהקוד פעם אחת
+        with_code = collection.find_one({"_id": source.get("_id")}, {"code": 1}, **kwargs) or {}
+        code = with_code.get("code")
+        source.update(compute_code_features(code if isinstance(code, str) else "",
+                                            source.get("programming_language") or ""))
+    doc = latest_doc_from(source)
+    latest_collection.replace_one(key, doc, upsert=True, **kwargs)
+    return doc
+
+
+def sync_latest_many(latest_collection: Any, version_docs: List[Dict[str, Any]]) -> None:
+    """עדכון latest ממסמכי גרסה חדשים שכבר נכתבו (עם _id ומאפיינים) — כתיבה אחת לכל האצווה"""
+    docs = [latest_doc_from(d) for d in version_docs]
+    if not docs:
+        return
+    if ReplaceOne is not None and hasattr(latest_collection, "bulk_write"):
+        latest_collection.bulk_write(
+            [ReplaceOne({"user_id": d.get("user_id"), "file_name": d.get("file_name")}, d, upsert=True) for d in docs],
+            ordered=False,
+        )
+        return
+    for d in docs:
+        latest_collection.replace_one({"user_id": d.get("user_id"), "file_name": d.get("file_name")}, d, upsert=True)
+
+
+# code כמחרוזת (מסמכים ישנים עלולים להכיל ערך אחר או לא להכיל code בכלל)
+_CODE_AS_STRING = {"$cond": [{"$eq": [{"$type": "$code"}, "string"]}, "$code", ""]}
+
+
+def backfill_pipeline(user_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    """אגרגציה חד-פעמית: הגרסה האחרונה (פעילה אם יש) לכל קובץ, בלי לגרור את code דרך ה-$group"""
+    match: Dict[str, Any] = {"user_id": user_id} if user_id is not None else {}
+    code = _CODE_AS_STRING
+    project: Dict[str, Any] = {name: 1 for name in LATEST_FIELDS}
+    project.update({
+        "_id": 0,
+        "snippet_id": "$_id",
+        "size_bytes": {"$ifNull": ["$size_bytes", {"$strLenBytes": code}]},
+        "line_count": {"$ifNull": ["$line_count", {
+            "$cond": [{"$gt": [{"$strLenCP": code}, 0]}, {"$size": {"$split": [code, "\n"]}}, 0]
+        }]},
+    })
+    return [
+        {"$match": match},
+        # is_active חסר (מסמך ישן) נחשב פעיל
+        {"$addFields": {"is_active": {"$or": [
+            {"$eq": ["$is_active", True]}, {"$eq": [{"$type": "$is_active"}, "missing"]},
+        ]}}},
+        # is_active יורד: גרסה פעילה קודמת לגרסה שנמחקה
+        {"$sort": {"user_id": 1, "file_name": 1, "is_active": -1, "version": -1}},
+        {"$project": project},
+        {"$group": {"_id": {"user_id": "$user_id", "file_name": "$file_name"}, "latest": {"$first": "$$ROOT"}}},
+        {"$replaceRoot": {"newRoot": "$latest"}},
+    ]
+
+
+def backfill_latest(collection: Any, latest_collection: Any, user_id: Optional[int] = None,
+                    batch_size: int = 500) -> int:
+    """מילוי האוסף מהנתונים הקיימים; מחזיר כמה מסמכים נכתבו.
+
+    הכתיבה היא $setOnInsert בלבד, כך שמסמך שכבר סונכרן ע"י כתיבה חדשה יותר לא יידרס
+    בתמונת מצב ישנה של ה-backfill (בטוח להריץ במקביל לתעבורה רגילה).
+    """
+    written = 0
+    ops: List[Any] = []
+    use_bulk = UpdateOne is not None and hasattr(latest_collection, "bulk_write")
+
+    def _flush() -> int:
+        if not ops:
+            return 0
+        if use_bulk:
+            result = latest_collection.bulk_write(ops, ordered=False)
+            count = int(getattr(result, "upserted_count", 0) or 0)
+        else:
+            count = 0
+            for flt, update in ops:
+                latest_collection.update_one(flt, update, upsert=True)
+                count += 1
+        ops.clear()
+        return count
+
+    for doc in collection.aggregate(backfill_pipeline(user_id), allowDiskUse=True, batchSize=batch_size):
+        key = {"user_id": doc.get("user_id"), "file_name": doc.get("file_name")}
+        update = {"$setOnInsert": doc}
+        ops.append(UpdateOne(key, update, upsert=True) if use_bulk else (key, update))
+        if len(ops) >= batch_size:
+            written += _flush()
+    written += _flush()
+    return written
+
+
+def is_latest_ready(db: Any) -> bool:
+    """האם ה-backfill הושלם (אפשר לקרוא רשימות מהאוסף)"""
+    try:
+        return db.migrations.find_one({"_id": MIGRATION_ID}) is not None
+    except Exception as e:
+        logger.debug(f"latest readiness check failed: {e}")
+        return False
+
+
+def mark_latest_ready(db: Any) -> None:
+    db.migrations.update_one(
+        {"_id": MIGRATION_ID},
+        {"$set": {"completed_at": datetime.now(timezone.utc)}},
+        upsert=True,
+    )
@@ -0,0 +1,78 @@
+import types
+from datetime import datetime, timezone
+
+import activity_buffer as ab
+
+
+class _Coll:
+    def __init__(self):
+        self.bulks = []
+        self.updates = []
+
+    def bulk_write(self, ops, ordered=True):
+        self.bulks.append((ops, ordered))
+
+    def update_one(self, flt, update, upsert=False):
+        self.updates.append((flt, update, upsert))
+
+
+def _buffer():
+    buf = ab.WriteBehindBuffer(interval=3600)
+    buf._ensure_started = lambda: None  # ללא ת'רד רקע בבדיקה
+    return buf
+
+
+def test_upserts_are_coalesced_per_key_and_flushed_in_one_bulk(monkeypatch):
+    monkeypatch.setattr(ab, "UpdateOne", lambda flt, update, upsert: (flt, update, upsert))
+    users = _Coll()
+    buf = _buffer()
+    buf.register("users", lambda: users)
+    t1 = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    t2 = datetime(2025, 1, 2, tzinfo=timezone.utc)
+    for ts, day in ((t2, "2025-01-02"), (t1, "2025-01-01"), (t2, "2025-01-02")):
+        buf.upsert("users", {"user_id": 1}, inc={"total_actions": 1}, set_fields={"username": day},
+                   max_fields={"last_at": ts}, add_to_set={"usage_days": day}, set_on_insert={"first_seen": day})
+    buf.upsert("users", {"user_id": 2}, inc={"total_actions": 4})
+    assert buf.pending_inc("users", {"user_id": 1}, "total_actions") == 3
+
+    assert buf.flush() == 2
+    (ops, ordered), = users.bulks
+    assert ordered is False
+    flt, update, upsert = ops[0]
+    assert flt == {"user_id": 1} and upsert is True
+    assert update == {
+        "$inc": {"total_actions": 3},
+        "$set": {"username": "2025-01-02"},
+        "$max": {"last_at": t2},
+        "$setOnInsert": {"first_seen": "2025-01-02"},
+        "$addToSet": {"usage_days": {"$each": ["2025-01-02", "2025-01-01"]}},
+    }
+    assert buf.pending_inc("users", {"user_id": 1}, "total_actions") == 0 and buf.flush() == 0
+
+
+def test_flush_without_bulk_write_and_skips_missing_collection(monkeypatch):
+    monkeypatch.setattr(ab, "UpdateOne", None)
+    coll = _Coll()
+    buf = _buffer()
+    buf.register("a", lambda: coll)
+    buf.register("off", lambda: None)
+    buf.upsert("a", {"_id": "s"}, inc={"n": 1})
+    buf.upsert("off", {"_id": "s"}, inc={"n": 1})
+    buf.upsert("unknown", {"_id": "s"}, inc={"n": 1})
+    buf.close()
+    assert coll.updates == [({"_id": "s"}, {"$inc": {"n": 1}}, True)] and buf.flushed_ops == 1
+
+
+def test_log_user_goes_through_the_buffer(monkeypatch):
+    monkeypatch.setenv("BOT_TOKEN", "dummy")
+    monkeypatch.setenv("MONGODB_URL", "mongodb://localhost:27017/test")
+    monkeypatch.setenv("DISABLE_DB", "1")
+    import user_stats as us
+
+    calls = []
+    monkeypatch.setattr(us.activity_buffer, "upsert", lambda *a, **k: calls.append((a, k)))
+    us.user_stats.log_user(5, "dana", weight=2)
+    (args, kwargs), (day_args, day_kwargs) = calls
+    assert args == ("users", {"user_id": 5}) and kwargs["inc"] == {"total_actions": 2}
+    assert kwargs["set_fields"]["username"] == "dana" and "add_to_set" not in kwargs
+    assert day_args[0] == "user_daily_activity" and day_kwargs["inc"] == {"actions": 2}
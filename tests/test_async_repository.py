@@ -0,0 +1,111 @@
+import asyncio
+import threading
+import types
+
+import pytest
+
+
+class _AsyncCursor(list):
+    def sort(self, keys, direction=1):
+        keys = keys if isinstance(keys, list) else [(keys, direction)]
+        docs = list(self)
+        for field, order in reversed(keys):
+            docs.sort(key=lambda d: d.get(field), reverse=order == -1)
+        return _AsyncCursor(docs)
+
+    def skip(self, n):
+        return _AsyncCursor(self[n:])
+
+    def limit(self, n):
+        return _AsyncCursor(self[:n])
+
+    async def to_list(self, length=None):
+        return list(self) if length is None else list(self[:length])
+
+
+class _MotorColl:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def _match(self, flt):
+        return [dict(d) for d in self.docs if all(d.get(k) == v for k, v in flt.items())]
+
+    async def find_one(self, flt, sort=None):
+        docs = self._match(flt)
+        if sort:
+            docs = _AsyncCursor(docs).sort(sort)
+        return docs[0] if docs else None
+
+    def find(self, flt, projection=None, sort=None):
+        cursor = _AsyncCursor(self._match(flt))
+        return cursor.sort(sort) if sort else cursor
+
+
+class _MotorDB:
+    def __init__(self, code_snippets):
+        self.code_snippets = code_snippets
+        self.large_files = _MotorColl([])
+
+    def __getitem__(self, name):
+        return _MotorColl([])
+
+
+@pytest.fixture
+def async_mod(monkeypatch):
+    monkeypatch.setenv("BOT_TOKEN", "dummy")
+    monkeypatch.setenv("MONGODB_URL", "mongodb://localhost:27017/test")
+    monkeypatch.setenv("DISABLE_DB", "1")
+    from database import async_repository
+    return async_repository
+
+
+def _sync_repo(calls):
+    class SyncRepo:
+        def save_file(self, user_id, file_name, code, language, extra_tags=None):
+            calls.append((file_name, threading.current_thread() is threading.main_thread()))
+            return True
+
+        def _hydrate(self, docs):
+            for d in docs:
+                d["code"] = f"blob:{d['content_hash']}"
+            return docs
+
+    return SyncRepo()
+
+
+def test_async_repository_reads_with_motor_and_offloads_the_rest(async_mod):
+    calls = []
+    versions = [
+        {"_id": 1, "user_id": 61, "file_name": "a.py", "version": 1, "is_active": True, "content_hash": "h1"},
+        {"_id": 2, "user_id": 61, "file_name": "a.py", "version": 2, "is_active": True, "code": "x = 2\n"},
+    ]
+    manager = types.SimpleNamespace(latest_ready=False, _get_repo=lambda: _sync_repo(calls))
+    repo = async_mod.AsyncRepository(manager, _MotorDB(_MotorColl(versions)))
+
+    async def _run():
+        latest = await repo.get_latest_version(61, "a.py")
+        old = await repo.get_version(61, "a.py", 1)
+        saved = await repo.save_file(61, "b.py", "print(1)", "python")
+        return latest, old, saved
+
+    latest, old, saved = asyncio.run(_run())
+    assert latest["version"] == 2 and latest["code"] == "x = 2\n"
+    # גרסה מאורכבת מושלמת מ-code_blobs דרך ה-Repository הסינכרוני
+    assert old["code"] == "blob:h1"
+    # מתודה ללא מימוש Motor רצה ב-thread ולא על הלולאה
+    assert saved is True and calls == [("b.py", False)]
+
+
+def test_async_database_without_motor_client_runs_sync_manager_in_thread(async_mod):
+    seen = []
+
+    class Manager:
+        client = None
+
+        def get_snippet(self, user_id, file_name):
+            seen.append(threading.current_thread() is threading.main_thread())
+            return {"file_name": file_name}
+
+    facade = async_mod.AsyncDatabase(Manager())
+    assert asyncio.run(facade.get_snippet(1, "a.py")) == {"file_name": "a.py"}
+    assert seen == [False] and facade._get_repo() is None
@@ -0,0 +1,182 @@
+import types
+
+import pytest
+
+import blob_store
+from blob_store import BlobStore, content_hash
+
+
+class FakeBlobs:
+    def __init__(self):
+        self.docs = {}
+
+    def find_one(self, flt, projection=None):
+        doc = self.docs.get(flt.get("_id"))
+        return dict(doc) if doc else None
+
+    def find(self, flt, projection=None):
+        return [dict(self.docs[i]) for i in flt["_id"]["$in"] if i in self.docs]
+
+    def update_one(self, flt, update, upsert=False):
+        self.docs.setdefault(flt["_id"], dict(update["$setOnInsert"], _id=flt["_id"]))
+
+
+def _source(n):
+    return "".join(f"def handler_{i}(event, context):\n    return {{'status': {i}}}\n\n" for i in range(n))
+
+
+def test_put_is_content_addressed_and_round_trips():
+    store = BlobStore(FakeBlobs())
+    code = _source(50)
+    digest = store.put(code)
+    assert digest == content_hash(code)
+    assert store.put(code) == digest and len(store.collection.docs) == 1
+    assert store.get(digest) == code
+
+
+def test_successive_versions_are_small_deltas_against_a_keyframe():
+    store = BlobStore(FakeBlobs())
+    base = _source(200)
+    first = store.put(base)
+    second = store.put(base + "# tweak\n", base_hash=first)
+    doc = store.collection.docs[second]
+    assert doc["keyframe"] == first and doc["depth"] == 1
+    assert len(doc["data"]) < len(store.collection.docs[first]["data"]) / 4
+    assert store.get_many([first, second]) == {first: base, second: base + "# tweak\n"}
+
+
+def test_keyframe_is_refreshed_after_interval(monkeypatch):
+    monkeypatch.setattr(blob_store, "KEYFRAME_INTERVAL", 3)
+    store = BlobStore(FakeBlobs())
+    code = _source(100)
+    digest = store.put(code)
+    depths = []
+    for i in range(4):
+        code += f"# edit {i}\n"
+        digest = store.put(code, base_hash=digest)
+        depths.append(store.collection.docs[digest]["depth"])
+    assert depths == [1, 2, 0, 1]
+    assert store.get(digest) == code
+
+
+def test_hydrate_fills_code_only_for_archived_versions():
+    store = BlobStore(FakeBlobs())
+    digest = store.put("print('old')\n")
+    docs = [{"version": 1, "content_hash": digest}, {"version": 2, "code": "print('new')\n"}]
+    store.hydrate(docs)
+    assert [d["code"] for d in docs] == ["print('old')\n", "print('new')\n"]
+
+
+@pytest.fixture
+def repo_with_blobs(monkeypatch):
+    monkeypatch.setenv("BOT_TOKEN", "dummy")
+    monkeypatch.setenv("MONGODB_URL", "mongodb://localhost:27017/test")
+    monkeypatch.setenv("DISABLE_DB", "1")
+    from database.repository import Repository
+
+    class Versions:
+        def __init__(self):
+            self.docs = []
+
+        def _match(self, doc, flt):
+            for key, cond in flt.items():
+                value = doc.get(key)
+                if isinstance(cond, dict):
+                    if "$lt" in cond and not (value is not None and value < cond["$lt"]):
+                        return False
+                    if "$ne" in cond and value == cond["$ne"]:
+                        return False
+                    if "$exists" in cond and (key in doc) != cond["$exists"]:
+                        return False
+                elif value != cond:
+                    return False
+            return True
+
+        def find_one(self, flt, projection=None, sort=None, **kwargs):
+            docs = [d for d in self.docs if self._match(d, flt)]
+            docs.sort(key=lambda d: d.get("version", 0), reverse=True)
+            return dict(docs[0]) if docs else None
+
+        def aggregate(self, pipeline):
+            match = pipeline[0]["$match"]
+            latest = {}
+            for d in self.docs:
+                if d["user_id"] == match["user_id"] and d["file_name"] in match["file_name"]["$in"] \
+                        and "code" not in d and d.get("content_hash"):
+                    if d["version"] > latest.get(d["file_name"], {}).get("version", 0):
+                        latest[d["file_name"]] = d
+            return [{"_id": name, "content_hash": d["content_hash"]} for name, d in latest.items()]
+
+        def insert_one(self, doc, **kwargs):
+            doc = dict(doc, _id=f"id{len(self.docs)}")
+            self.docs.append(doc)
+            return types.SimpleNamespace(inserted_id=doc["_id"])
+
+        def update_one(self, flt, update, **kwargs):
+            for d in self.docs:
+                if self._match(d, flt):
+                    d.update(update.get("$set", {}))
+                    for key in update.get("$unset", {}):
+                        d.pop(key, None)
+                    return types.SimpleNamespace(modified_count=1)
+            return types.SimpleNamespace(modified_count=0)
+
+    mgr = types.SimpleNamespace(collection=Versions(), blobs=BlobStore(FakeBlobs()),
+                                large_files_collection=None, db=types.SimpleNamespace())
+    repo = Repository(mgr)
+    monkeypatch.setattr(repo, "get_latest_version",
+                        lambda user_id, file_name: mgr.collection.find_one(
+                            {"user_id": user_id, "file_name": file_name, "is_active": True}))
+    return repo
+
+
+def test_save_archives_previous_version_and_skips_unchanged(repo_with_blobs):
+    from database.models import CodeSnippet
+    repo = repo_with_blobs
+    versions = repo.manager.collection
+
+    assert repo.save_code_snippet(CodeSnippet(user_id=1, file_name="a.py", code="x = 1\n", programming_language="python"))
+    assert repo.save_code_snippet(CodeSnippet(user_id=1, file_name="a.py", code="x = 2\n", programming_language="python"))
+    assert [d["version"] for d in versions.docs] == [1, 2]
+    assert "code" not in versions.docs[0] and versions.docs[0]["content_hash"] == content_hash("x = 1\n")
+
+    # תוכן זהה — אין גרסה חדשה, רק עדכון תיאור/תגיות במקום (ורשומת אינדקס החיפוש)
+    indexed = []
+    repo._update_search_index = lambda action, *args: indexed.append((action, args[1]["tags"]))
+    assert repo.save_code_snippet(CodeSnippet(user_id=1, file_name="a.py", code="x = 2\n",
+                                              programming_language="python", description="same", tags=["t"]))
+    assert len(versions.docs) == 2 and versions.docs[1]["description"] == "same"
+    assert indexed == [("index_file", ["t"])]
+
+    assert repo.get_version(1, "a.py", 1)["code"] == "x = 1\n"
+
+
+def test_webapp_save_archives_previous_version_and_skips_unchanged(repo_with_blobs, monkeypatch):
+    from pathlib import Path
+    monkeypatch.syspath_prepend(str(Path(__file__).resolve().parents[1] / "webapp"))
+    import app as webapp
+
+    monkeypatch.setattr(webapp, "sync_latest_snippet", lambda db, user_id, file_name: None)
+    monkeypatch.setattr(webapp, "prewarm_render", lambda code, language: None)
+    versions = repo_with_blobs.manager.collection
+    blobs = repo_with_blobs.manager.blobs.collection
+    index_updates = []
+    search_index = types.SimpleNamespace(update_one=lambda flt, update: index_updates.append(update["$set"]["tags"]))
+    db = type("DB", (), {"code_snippets": versions, "search_index": search_index,
+                         "__getitem__": lambda self, name: blobs})()
+
+    def save(code, version, description="", tags=()):
+        prev = versions.find_one({"user_id": 1, "file_name": "w.py", "is_active": True})
+        doc = dict(user_id=1, file_name="w.py", code=code, programming_language="python",
+                   description=description, tags=list(tags), version=version, is_active=True)
+        return webapp.save_snippet_version(db, doc, prev)
+
+    assert save("x = 1\n", 1) and save("x = 2\n", 2)
+    assert "code" not in versions.docs[0] and versions.docs[0]["content_hash"] == content_hash("x = 1\n")
+    assert versions.docs[1]["content_hash"] == content_hash("x = 2\n") and versions.docs[1]["line_index"]
+    assert save("x = 2\n", 3, description="same") == versions.docs[1]["_id"]
+    assert len(versions.docs) == 2 and versions.docs[1]["description"] == "same"
+    assert index_updates == []
+    assert save("x = 2\n", 3, description="same", tags=["Web"]) == versions.docs[1]["_id"]
+    assert index_updates == [["web"]]
+    assert repo_with_blobs.get_version(1, "w.py", 1)["code"] == "x = 1\n"
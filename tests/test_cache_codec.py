@@ -0,0 +1,107 @@
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+import pytest
+
+import cache_codec
+
+
+@cache_codec.register_type
+@dataclass
+class _Chunk:
+    name: str
+    at: datetime
+
+
+class _ObjectId:
+    """מחקה את bson.ObjectId (bson אינו מותקן בכל סביבה)"""
+
+    def __init__(self, value):
+        self.binary = bytes.fromhex(value) if isinstance(value, str) else value
+
+    def __str__(self):
+        return self.binary.hex()
+
+    def __eq__(self, other):
+        return isinstance(other, _ObjectId) and other.binary == self.binary
+
+
+_ObjectId.__name__ = "ObjectId"
+
+
+@pytest.fixture(params=["json", "msgpack"])
+def codec(request, monkeypatch):
+    monkeypatch.setattr(cache_codec, "ObjectId", _ObjectId)
+    if request.param == "json":
+        monkeypatch.setattr(cache_codec, "msgpack", None)
+    else:
+        pytest.importorskip("msgpack")
+    return cache_codec
+
+
+def test_values_round_trip_with_their_types(codec):
+    at = datetime(2025, 3, 4, 5, 6, 7, tzinfo=timezone.utc)
+    oid = _ObjectId("65f0c0ffee00000000000001")
+    value = {"_id": oid, "updated_at": at, "tags": ["a", "b"], "raw": b"\x00\x01",
+             "chunk": _Chunk("x.py", at), "n": 3, "none": None}
+
+    got = codec.loads(codec.dumps(value))
+
+    assert got == value
+    assert isinstance(got["updated_at"], datetime) and got["updated_at"].tzinfo is not None
+    assert isinstance(got["chunk"], _Chunk)
+
+
+def test_large_values_are_compressed_and_legacy_json_still_reads(codec, monkeypatch):
+    monkeypatch.setattr(codec, "CACHE_COMPRESS_MIN_BYTES", 100)
+    value = {"code": "print('hello')\n" * 200}
+    raw = codec.dumps(value)
+    assert raw[:1] == codec.TAG_ZLIB and len(raw) < 500
+    assert codec.loads(raw) == value
+    assert codec.loads('{"v": 1}') == {"v": 1}
+    assert codec.loads(b'["a.py"]') == ["a.py"]
+
+
+def test_unsupported_values_and_key_args_are_rejected(codec):
+    with pytest.raises(codec.UnsupportedType):
+        codec.dumps({"obj": object()})
+    with pytest.raises(codec.UnsupportedType):
+        codec.key_part(object())
+
+
+def test_key_parts_are_canonical_and_long_args_hashed():
+    assert cache_codec.key_part({"b": 1, "a": [1, 2]}) == cache_codec.key_part({"a": [1, 2], "b": 1})
+    long = cache_codec.key_part("x" * 500)
+    assert long.startswith("#") and len(long) == 25
+    assert long == cache_codec.key_part("x" * 500) != cache_codec.key_part("y" * 500)
+
+
+def test_cached_keys_skip_self_and_are_shared_between_instances(monkeypatch):
+    import cache_manager as cm
+
+    monkeypatch.setenv("REDIS_URL", "")
+    monkeypatch.setattr(cm, "redis", None, raising=False)
+    mgr = cm.CacheManager()
+    monkeypatch.setattr(cm, "cache", mgr)
+    calls = {"n": 0}
+
+    class Repo:
+        @cm.cached(expire_seconds=60, key_prefix="latest_version")
+        def get_latest_version(self, user_id, file_name):
+            calls["n"] += 1
+            return {"file_name": file_name, "updated_at": datetime(2025, 1, 1, tzinfo=timezone.utc)}
+
+        @cm.cached(expire_seconds=60, key_prefix="by_obj")
+        def by_obj(self, obj):
+            calls["n"] += 1
+            return calls["n"]
+
+    first = Repo().get_latest_version(3, "a.py")
+    second = Repo().get_latest_version(3, "a.py")
+    assert calls["n"] == 1
+    assert second == first and isinstance(second["updated_at"], datetime)
+    keys = [k for part in mgr.local._partitions.values() for k in part]
+    assert len(keys) == 1 and " at 0x" not in keys[0] and ":u3.g0:" in keys[0]
+
+    # ארגומנט ללא ייצוג יציב — בלי cache, בלי לזהם את מרחב המפתחות
+    assert Repo().by_obj(object()) == 2 and Repo().by_obj(object()) == 3
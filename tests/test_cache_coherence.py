@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta, timezone
+
+import cache_coherence as cc
+
+
+class _Cursor(list):
+    def sort(self, field, direction):
+        return _Cursor(sorted(self, key=lambda d: d[field], reverse=direction < 0))
+
+    def limit(self, n):
+        return _Cursor(self[:n])
+
+
+class _Coll:
+    def __init__(self, docs=None):
+        self.docs = list(docs or [])
+
+    def find(self, flt, projection=None):
+        since = flt["updated_at"]["$gte"]
+        return _Cursor(d for d in self.docs if d["updated_at"] >= since)
+
+
+class _DB(dict):
+    def watch(self, *a, **k):
+        error = Exception("The $changeStream stage is only supported on replica sets")
+        error.code = 40573
+        raise error
+
+
+T0 = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def _listener(db, events):
+    listener = cc.ChangeListener(db, events.extend, collections=["code_snippets"], mode="poll")
+    listener._watermarks["code_snippets"] = T0
+    return listener
+
+
+def test_poll_advances_watermark_without_replaying_same_timestamp_docs():
+    coll = _Coll([
+        {"_id": 1, "user_id": 7, "file_name": "a.py", "is_active": True, "updated_at": T0},
+        {"_id": 2, "user_id": 8, "file_name": "b.py", "is_active": True, "updated_at": T0 + timedelta(seconds=1)},
+    ])
+    events = []
+    listener = _listener(_DB(code_snippets=coll), events)
+
+    assert listener.poll_once() == 2
+    assert [e["user_id"] for e in events] == [7, 8]
+    # אותו timestamp של הכתיבה האחרונה — לא נשלח שוב; מסמך חדש באותו timestamp כן
+    assert listener.poll_once() == 0
+    coll.docs.append({"_id": 3, "user_id": 9, "file_name": "c.py", "updated_at": T0 + timedelta(seconds=1)})
+    assert listener.poll_once() == 1
+    assert events[-1]["user_id"] == 9
+
+
+def test_unsupported_change_stream_falls_back_to_polling():
+    listener = cc.ChangeListener(_DB(code_snippets=_Coll()), lambda events: None,
+                                 collections=["code_snippets"], mode="auto", poll_interval=0.01)
+    listener._watermarks["code_snippets"] = T0
+    listener.poll_once = listener.stop  # סבב polling אחד ויציאה
+    listener._run()
+    assert listener.active_mode == "poll"
+
+
+def test_event_from_change_uses_pre_image_for_deletes():
+    change = {"operationType": "delete", "ns": {"coll": "code_snippets"},
+              "fullDocumentBeforeChange": {"user_id": 5, "file_name": "x.py", "is_active": True}}
+    event = cc.event_from_change(change)
+    assert event["user_id"] == 5 and event["is_active"] is False
+    assert cc.event_from_change({"operationType": "delete", "ns": {"coll": "code_snippets"}}) is None
+
+
+def test_apply_changes_invalidates_once_and_skips_fresh_index_entries():
+    class _Cache:
+        def __init__(self):
+            self.invalidated = []
+
+        def invalidate_user_cache(self, user_id):
+            self.invalidated.append(user_id)
+
+    class _Search:
+        def __init__(self):
+            self.indexed, self.removed = [], []
+
+        def index_file(self, user_id, doc):
+            self.indexed.append((user_id, doc["file_name"]))
+
+        def remove_file(self, user_id, file_name):
+            self.removed.append((user_id, file_name))
+
+    class _Index:
+        def find_one(self, flt, projection=None):
+            if flt["file_name"] == "own.py":
+                return {"indexed_at": T0 + timedelta(seconds=5), "is_active": True}
+            return None
+
+    class _Manager:
+        search_index_collection = _Index()
+
+        def get_latest_version(self, user_id, file_name):
+            return {"user_id": user_id, "file_name": file_name}
+
+    def ev(file_name, active=True, collection="code_snippets"):
+        return {"collection": collection, "op": "update", "user_id": 1, "file_name": file_name,
+                "is_active": active, "updated_at": T0}
+
+    cache, search = _Cache(), _Search()
+    cc.apply_changes([ev("web.py"), ev("own.py"), ev("gone.py", active=False), ev("big.bin", collection="large_files")],
+                     cache, search, _Manager())
+
+    assert cache.invalidated == [1]
+    assert search.indexed == [(1, "web.py")]
+    assert search.removed == [(1, "gone.py")]
+
+
+def test_start_is_noop_without_database_client():
+    class _NoDB:
+        client = None
+
+    assert cc.start_cache_coherence(_NoDB()) is None
@@ -0,0 +1,180 @@
+import types
+
+
+def _manager(monkeypatch, **env):
+    import cache_manager as cm
+    monkeypatch.setenv('REDIS_URL', '')
+    for k, v in env.items():
+        monkeypatch.setenv(k, v)
+    monkeypatch.setattr(cm, 'redis', None, raising=False)
+    return cm, cm.CacheManager()
+
+
+def test_local_tier_is_fallback_without_redis(monkeypatch):
+    cm, mgr = _manager(monkeypatch)
+    assert mgr.is_enabled is False
+    assert mgr.set("latest_version:f:1:a.py", {"v": 1}, 60) is True
+    got = mgr.get("latest_version:f:1:a.py")
+    assert got == {"v": 1}
+    got["v"] = 2  # שינוי אצל הקורא לא משנה את הערך השמור
+    assert mgr.get("latest_version:f:1:a.py") == {"v": 1}
+    assert mgr.get("latest_version:f:1:b.py") is None
+    stats = mgr.get_stats()["prefixes"]["latest_version"]
+    assert stats["local_hits"] == 2 and stats["misses"] == 1 and stats["entries"] == 1
+
+
+def test_local_tier_lru_byte_budget_and_ttl(monkeypatch):
+    cm, _ = _manager(monkeypatch)
+    clock = {"now": 100.0}
+    monkeypatch.setattr(cm.time, "monotonic", lambda: clock["now"])
+    local = cm.LocalCache(max_entries=2, max_bytes=1000, prefix_limits={"big": (10, 12)})
+    local.set("p:a", "1", 10)
+    local.set("p:b", "2", 10)
+    assert local.get("p:a") == "1"  # a הופך לאחרון בשימוש
+    local.set("p:c", "3", 10)
+    assert local.get("p:b") is None and local.get("p:a") == "1"
+    local.set("big:x", "123456", 10)
+    local.set("big:y", "123456", 10)
+    local.set("big:z", "123456", 10)
+    assert local.get("big:x") is None and local.get("big:z") == "123456"
+    assert local.set("big:huge", "x" * 20, 10) is False
+    clock["now"] += 11
+    assert local.get("p:a") is None
+    stats = local.stats()
+    assert stats["p"]["evictions"] == 1 and stats["p"]["expirations"] == 1
+    assert stats["big"]["evictions"] == 1 and stats["big"]["bytes"] == 12
+
+
+def test_local_tier_fronts_redis(monkeypatch):
+    cm, mgr = _manager(monkeypatch)
+
+    class FakeRedis:
+        def __init__(self):
+            self.data = {}
+            self.gets = 0
+        def get(self, key):
+            self.gets += 1
+            return self.data.get(key)
+        def setex(self, key, ttl, value):
+            self.data[key] = value
+            return True
+        def keys(self, pattern):
+            return [k for k in self.data if cm.fnmatch.fnmatchcase(k, pattern)]
+        def delete(self, *keys):
+            return sum(1 for k in keys if self.data.pop(k, None) is not None)
+
+    fake = FakeRedis()
+    fake.data["user_files:f:7"] = '["a.py"]'
+    mgr.redis_client = fake
+    mgr.is_enabled = True
+
+    calls = {"n": 0}
+
+    @cm.cached(expire_seconds=60, key_prefix="user_files")
+    def _load(uid):
+        calls["n"] += 1
+        return ["x"]
+    monkeypatch.setattr(cm, "cache", mgr)
+
+    assert mgr.get("user_files:f:7") == ["a.py"]
+    assert mgr.get("user_files:f:7") == ["a.py"]
+    assert fake.gets == 1  # הקריאה השנייה נענתה מהזיכרון המקומי
+    assert _load(8) == ["x"] and _load(8) == ["x"] and calls["n"] == 1
+    assert mgr.delete_pattern("user_files:*") == 2
+    assert mgr.get("user_files:f:7") is None
+    stats = mgr.get_prefix_stats()["user_files"]
+    assert stats["redis_hits"] == 1 and stats["local_hits"] == 2
+
+
+def test_user_generation_invalidation_without_redis(monkeypatch):
+    cm, mgr = _manager(monkeypatch)
+    monkeypatch.setattr(cm, "cache", mgr)
+    calls = {"n": 0}
+
+    class Repo:
+        @cm.cached(expire_seconds=60, key_prefix="user_files")
+        def get_user_files(self, user_id, limit=50):
+            calls["n"] += 1
+            return [calls["n"]]
+
+    repo = Repo()
+    assert repo.get_user_files(12) == [1] and repo.get_user_files(12) == [1]
+    assert repo.get_user_files(123) == [2]
+    assert repo.get_user_files(user_id=12) == [3]  # kwargs -> מפתח שונה, אך באותו דור
+    # ביטול משתמש 12 לא נוגע במשתמש 123 (בניגוד לתבנית *:12:* הישנה)
+    assert mgr.invalidate_user_cache(12) == 2
+    assert mgr.get_generation(12) == 1 and mgr.get_generation(123) == 0
+    assert repo.get_user_files(12) == [4]
+    assert repo.get_user_files(123) == [2]
+
+
+def test_generation_counter_in_redis_and_sweeper(monkeypatch):
+    cm, mgr = _manager(monkeypatch)
+
+    class FakeRedis:
+        def __init__(self):
+            self.data = {}
+            self.incrs = 0
+        def get(self, key):
+            return self.data.get(key)
+        def mget(self, keys):
+            return [self.data.get(k) for k in keys]
+        def setex(self, key, ttl, value):
+            self.data[key] = value
+            return True
+        def incr(self, key):
+            self.incrs += 1
+            self.data[key] = str(int(self.data.get(key) or 0) + 1)
+            return int(self.data[key])
+        def scan(self, cursor=0, match=None, count=None):
+            # כמו SCAN: מפתח שקיים לאורך כל הסריקה מוחזר גם אם אחרים נמחקו בינתיים
+            self.seen = getattr(self, "seen", set()) | set(self.data)
+            keys = sorted(self.seen)
+            page = keys[cursor:cursor + count]
+            nxt = cursor + count if cursor + count < len(keys) else 0
+            return nxt, [k for k in page if k in self.data and cm.fnmatch.fnmatchcase(k, match)]
+        def delete(self, *keys):
+            return sum(1 for k in keys if self.data.pop(k, None) is not None)
+        def keys(self, pattern):
+            raise AssertionError("KEYS must not be used for invalidation")
+
+    fake = FakeRedis()
+    mgr.redis_client = fake
+    mgr.is_enabled = True
+    monkeypatch.setattr(cm, "cache", mgr)
+
+    @cm.cached(expire_seconds=60, key_prefix="latest_version")
+    def latest(user_id, name):
+        return {"name": name}
+
+    latest(5, "a.py")
+    latest(6, "a.py")
+    old_key = [k for k in fake.data if ":u5.g0:" in k]
+    assert len(old_key) == 1
+    mgr.invalidate_user_cache(5)
+    assert fake.incrs == 1 and fake.data["cache_gen:u5"] == "1"
+    latest(5, "a.py")
+    assert any(":u5.g1:" in k for k in fake.data)
+    assert mgr.sweep_stale_keys() == 1
+    assert old_key[0] not in fake.data
+    assert any(":u6.g0:" in k for k in fake.data)
+
+    # מרחב מפתחות גדול מ-max_keys: הריצה הבאה ממשיכה מה-cursor ולא מתחילה שוב מההתחלה
+    for i in range(20):
+        latest(6, f"g{i:02d}.py")  # מפתחות עדכניים שממוינים לפני אלו של משתמש 7
+        latest(7, f"f{i:02d}.py")
+    mgr.invalidate_user_cache(7)
+    removed = [mgr.sweep_stale_keys(max_keys=5, batch_size=5) for _ in range(10)]
+    assert sum(removed) == 20 and not any(":u7.g0:" in k for k in fake.data)
+
+
+def test_user_keys_without_redis_live_only_a_generation_ttl(monkeypatch):
+    cm, mgr = _manager(monkeypatch, CACHE_GENERATION_TTL='2')
+    clock = {"now": 100.0}
+    monkeypatch.setattr(cm.time, "monotonic", lambda: clock["now"])
+    user_key = f"user_files:{mgr.user_namespace(7)}:50"
+    mgr.set(user_key, ["a.py"], 300)
+    mgr.set("render:abc", "<pre/>", 300)
+    clock["now"] += 3  # כתיבה מתהליך אחר אינה מקדמת את הדור המקומי
+    assert mgr.get(user_key) is None
+    assert mgr.get("render:abc") == "<pre/>"
@@ -0,0 +1,233 @@
+import asyncio
+import threading
+import time
+
+
+def _manager(monkeypatch):
+    import cache_manager as cm
+    monkeypatch.setenv('REDIS_URL', '')
+    monkeypatch.setattr(cm, 'redis', None, raising=False)
+    mgr = cm.CacheManager()
+    monkeypatch.setattr(cm, 'cache', mgr)
+    return cm, mgr
+
+
+def test_concurrent_misses_compute_once(monkeypatch):
+    cm, _ = _manager(monkeypatch)
+    calls = {"n": 0}
+    release = threading.Event()
+
+    @cm.cached(expire_seconds=60, key_prefix="user_files")
+    def load(user_id):
+        calls["n"] += 1
+        release.wait(5)
+        return [{"file_name": "a.py"}]
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(load(1))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    time.sleep(0.1)
+    release.set()
+    for t in threads:
+        t.join(5)
+
+    assert calls["n"] == 1
+    assert results == [[{"file_name": "a.py"}]] * 5
+    results[0][0]["file_name"] = "changed"  # כל ממתין קיבל עותק משלו
+    assert results[1][0]["file_name"] == "a.py"
+
+
+def test_waits_for_value_computed_by_another_process(monkeypatch):
+    cm, mgr = _manager(monkeypatch)
+
+    class LockedRedis:
+        """תהליך אחר מחזיק בנעילה ושומר את הערך אחרי רגע"""
+
+        def __init__(self):
+            self.data = {}
+            self.gets = 0
+
+        def set(self, key, value, nx=False, px=None):
+            return False
+
+        def get(self, key):
+            self.gets += 1
+            if self.gets >= 3:
+                return cm.cache_codec.dumps(["from-other"])
+            return None
+
+        def setex(self, key, ttl, value):
+            self.data[key] = value
+            return True
+
+    mgr.redis_client = LockedRedis()
+    mgr.is_enabled = True
+    monkeypatch.setattr(cm, "_LOCK_POLL_SECONDS", 0.001)
+    calls = {"n": 0}
+
+    @cm.cached(expire_seconds=60, key_prefix="p")
+    def load(name):
+        calls["n"] += 1
+        return ["mine"]
+
+    assert load("a") == ["from-other"] and calls["n"] == 0
+
+
+def test_sync_call_on_event_loop_thread_does_not_wait_for_lock(monkeypatch):
+    cm, mgr = _manager(monkeypatch)
+
+    class LockedRedis:
+        """תהליך אחר מחזיק בנעילה ולא שומר ערך"""
+
+        def set(self, key, value, nx=False, px=None):
+            return False
+
+        def get(self, key):
+            return None
+
+        def setex(self, key, ttl, value):
+            return True
+
+    mgr.redis_client = LockedRedis()
+    mgr.is_enabled = True
+    monkeypatch.setattr(cm, "CACHE_LOCK_WAIT_MS", 2000)
+
+    @cm.cached(expire_seconds=60, key_prefix="p")
+    def load(name):
+        return [name]
+
+    async def handler():
+        # handler של הבוט שקורא למתודת repository סינכרונית
+        started = time.monotonic()
+        return load("a"), time.monotonic() - started
+
+    result, elapsed = asyncio.run(handler())
+    assert result == ["a"] and elapsed < 0.5
+
+
+def test_stale_value_is_served_while_refreshing_in_background(monkeypatch):
+    cm, _ = _manager(monkeypatch)
+    clock = {"now": 1000.0}
+    monkeypatch.setattr(cm.time, "time", lambda: clock["now"])
+    calls = {"n": 0}
+    refreshed = threading.Event()
+
+    @cm.cached(expire_seconds=10, key_prefix="p", stale_ttl=30)
+    def load(name):
+        calls["n"] += 1
+        if calls["n"] > 1:
+            refreshed.set()
+        return calls["n"]
+
+    assert load("a") == 1
+    assert load("a") == 1 and calls["n"] == 1
+    clock["now"] += 11  # פג, אבל בתוך stale_ttl
+    assert load("a") == 1  # הערך הקודם מיד
+    assert refreshed.wait(5)
+    for _ in range(50):
+        if not cm._refreshing:
+            break
+        time.sleep(0.01)
+    assert load("a") == 2 and calls["n"] == 2
+
+
+def test_async_concurrent_misses_compute_once(monkeypatch):
+    cm, _ = _manager(monkeypatch)
+    calls = {"n": 0}
+
+    @cm.async_cached(expire_seconds=60, key_prefix="p")
+    async def load(user_id):
+        calls["n"] += 1
+        await asyncio.sleep(0.05)
+        return {"n": calls["n"]}
+
+    async def _run():
+        return await asyncio.gather(*(load(7) for _ in range(4)))
+
+    assert asyncio.run(_run()) == [{"n": 1}] * 4
+    assert calls["n"] == 1
+
+
+class _FakeAsyncRedis:
+    def __init__(self, delay=0.0):
+        self.data = {}
+        self.delay = delay
+        self.mgets = 0
+
+    async def mget(self, keys):
+        self.mgets += 1
+        await asyncio.sleep(self.delay)
+        return [self.data.get(k) for k in keys]
+
+    async def get(self, key):
+        await asyncio.sleep(self.delay)
+        return self.data.get(key)
+
+    async def set(self, key, value, nx=False, px=None):
+        if nx and key in self.data:
+            return False
+        self.data[key] = value
+        return True
+
+    async def eval(self, script, numkeys, key, token):
+        return 1 if self.data.pop(key, None) == token else 0
+
+    def pipeline(self, transaction=True):
+        fake, queued = self, []
+
+        class _Pipe:
+            def setex(self, key, ttl, value):
+                queued.append((key, value))
+
+            async def execute(self):
+                await asyncio.sleep(fake.delay)
+                for key, value in queued:
+                    fake.data[key] = value
+                return [True] * len(queued)
+        return _Pipe()
+
+
+def _async_manager(monkeypatch, fake):
+    cm, mgr = _manager(monkeypatch)
+    mgr.is_enabled = True
+    mgr.async_timeout = 0.05
+    monkeypatch.setattr(mgr, "_async_client", lambda: fake)
+    return cm, mgr
+
+
+def test_async_path_pipelines_and_reads_many(monkeypatch):
+    fake = _FakeAsyncRedis()
+    cm, mgr = _async_manager(monkeypatch, fake)
+
+    async def _run():
+        assert await mgr.aset_many({"p:a": [1], "p:b": {"x": 2}}, 60) is True
+        mgr.local.clear()
+        got = await mgr.aget_many(["p:a", "p:b", "p:c"])
+        again = await mgr.aget_many(["p:a", "p:b"])  # מהזיכרון המקומי
+        return got, again
+
+    got, again = asyncio.run(_run())
+    assert got == {"p:a": [1], "p:b": {"x": 2}} and again == got
+    assert fake.mgets == 1
+
+
+def test_slow_redis_degrades_to_miss_without_blocking(monkeypatch):
+    fake = _FakeAsyncRedis(delay=1.0)
+    cm, mgr = _async_manager(monkeypatch, fake)
+    calls = {"n": 0}
+
+    @cm.async_cached(expire_seconds=60, key_prefix="slow")
+    async def load(name):
+        calls["n"] += 1
+        return [name]
+
+    async def _run():
+        started = time.monotonic()
+        result = await load("a")
+        return result, time.monotonic() - started
+
+    result, elapsed = asyncio.run(_run())
+    assert result == ["a"] and calls["n"] == 1
+    assert elapsed < 0.5
+    assert mgr.get_prefix_stats()["slow"]["redis_timeouts"] >= 1
@@ -0,0 +1,82 @@
+import types
+from datetime import datetime, timedelta, timezone
+
+import daily_activity
+from daily_activity import day_start, migrate_usage_days
+
+
+def test_day_start_is_utc_midnight():
+    moment = datetime(2025, 3, 4, 23, 30, tzinfo=timezone(timedelta(hours=-2)))
+    assert day_start(moment) == datetime(2025, 3, 5, tzinfo=timezone.utc)
+    assert day_start(datetime(2025, 3, 4, 12)) == datetime(2025, 3, 4, tzinfo=timezone.utc)
+
+
+class _Users:
+    def __init__(self, docs):
+        self.docs = docs
+        self.unset = []
+
+    def find(self, flt, projection=None):
+        return [d for d in self.docs if "usage_days" in d]
+
+    def update_many(self, flt, update):
+        self.unset.extend(flt["user_id"]["$in"])
+
+
+class _Daily:
+    def __init__(self):
+        self.upserts = []
+
+    def update_one(self, flt, update, upsert=False):
+        self.upserts.append((flt["user_id"], flt["day"].date().isoformat(), update))
+
+
+def test_migrate_usage_days_writes_one_doc_per_day_and_drops_arrays(monkeypatch):
+    monkeypatch.setattr(daily_activity, "UpdateOne", None)
+    users = _Users([
+        {"user_id": 1, "usage_days": ["2025-01-01", "2025-01-02", "bad"]},
+        {"user_id": 2, "usage_days": []},
+        {"user_id": 3},
+    ])
+    daily = _Daily()
+    assert migrate_usage_days(users, daily, batch_size=1) == 2
+    assert [u[:2] for u in daily.upserts] == [(1, "2025-01-01"), (1, "2025-01-02")]
+    assert daily.upserts[0][2] == {"$setOnInsert": {"actions": 1}}
+    assert users.unset == [1, 2]
+
+
+def test_weekly_stats_joins_names_only_for_active_users(monkeypatch):
+    monkeypatch.setenv("BOT_TOKEN", "dummy")
+    monkeypatch.setenv("MONGODB_URL", "mongodb://localhost:27017/test")
+    monkeypatch.setenv("DISABLE_DB", "1")
+    import user_stats as us
+
+    pipelines = []
+
+    class Daily:
+        def aggregate(self, pipeline):
+            pipelines.append(pipeline)
+            if pipeline[-1] == {"$count": "n"}:
+                return [{"n": 2}]
+            return [{"_id": 1, "days": 2, "actions": 9}, {"_id": 2, "days": 3, "actions": 4}]
+
+        def count_documents(self, flt):
+            return 1 if flt["day"] == day_start() else 0
+
+    class Users:
+        def find(self, flt, projection=None):
+            assert flt == {"user_id": {"$in": [1, 2]}}
+            return [{"user_id": 1, "username": "a", "total_actions": 50}]
+
+        def count_documents(self, flt):
+            return 10
+
+    monkeypatch.setattr(us, "mongodb", types.SimpleNamespace(daily_activity_collection=Daily(),
+                                                             db=types.SimpleNamespace(users=Users())))
+    weekly = us.user_stats.get_weekly_stats()
+    assert weekly == [
+        {"username": "User_2", "days": 3, "total_actions": 0},
+        {"username": "a", "days": 2, "total_actions": 50},
+    ]
+    assert pipelines[0][0]["$match"]["day"]["$gte"] == day_start(datetime.now(timezone.utc) - timedelta(days=7))
+    assert us.user_stats.get_all_time_stats() == {"total_users": 10, "active_today": 1, "active_week": 2}
@@ -0,0 +1,109 @@
+import types
+
+import pytest
+
+import line_index
+
+
+@pytest.fixture(autouse=True)
+def _env(monkeypatch):
+    monkeypatch.setenv("BOT_TOKEN", "dummy")
+    monkeypatch.setenv("MONGODB_URL", "mongodb://localhost:27017/test")
+    monkeypatch.setenv("DISABLE_DB", "1")
+
+
+def _code(lines=173):
+    # שורות באורכים שונים, כולל תווים רב-בתיים
+    return "\n".join(f"שורה {i} " + "x" * (i % 7) + ("é" if i % 3 else "") for i in range(lines))
+
+
+def test_byte_span_slices_match_full_split():
+    code = _code()
+    data = code.encode("utf-8")
+    lines = code.split("\n")
+    index = line_index.parse_line_index(line_index.build_line_index(code, stride=50))
+    assert index[0] == 50 and len(index[1]) == 4
+    for size in (50, 17):  # מיושר לצעד ולא מיושר
+        for start in range(0, len(lines), size):
+            end = min(start + size, len(lines))
+            a, b, skip = line_index.byte_span(index, len(data), start, end)
+            part = data[a:b].decode("utf-8")
+            assert line_index.take_lines(part, skip, end - start) == "\n".join(lines[start:end])
+    assert line_index.parse_line_index(None) is None and line_index.parse_line_index(b"\x01") is None
+
+
+class _Collection:
+    """מסמך גרסה אחד; שומר אילו שדות נטענו"""
+
+    def __init__(self, doc):
+        self.doc = doc
+        self.projections = []
+        self.updates = []
+
+    def find_one(self, flt, projection=None, sort=None):
+        self.projections.append(projection)
+        return {k: v for k, v in self.doc.items() if projection is None or k == "_id" or projection.get(k)}
+
+    def aggregate(self, pipeline):
+        start, length = pipeline[1]["$project"]["part"]["$substrBytes"][1:]
+        return [{"part": self.doc["code"].encode("utf-8")[start:start + length].decode("utf-8")}]
+
+    def update_one(self, flt, update):
+        self.updates.append(update)
+        self.doc.update(update["$set"])
+
+
+def _repo(doc):
+    from database.repository import Repository
+    coll = _Collection(doc)
+    return Repository(types.SimpleNamespace(collection=coll, db=types.SimpleNamespace())), coll
+
+
+def test_line_range_reads_only_the_requested_bytes():
+    from code_features import compute_code_features
+
+    code = _code(5000)
+    doc = dict(_id="v1", user_id=1, file_name="big.py", programming_language="python", code=code,
+               line_index=line_index.build_line_index(code), **compute_code_features(code, "python"))
+    repo, coll = _repo(doc)
+
+    got = repo.get_line_range(1, "big.py", 4950, 50)
+
+    assert got["content"] == "\n".join(code.split("\n")[4950:5000])
+    assert got["total_lines"] == 5000 and got["end_line"] == 5000 and got["programming_language"] == "python"
+    assert not any(p and p.get("code") for p in coll.projections)
+    assert repo.get_line_range(1, "big.py", 5000, 50) is None
+
+
+def test_legacy_version_is_read_once_and_backfilled():
+    code = _code(120)
+    repo, coll = _repo(dict(_id="v1", user_id=1, file_name="old.py", programming_language="python", code=code))
+
+    got = repo.get_line_range(1, "old.py", 100, 50)
+
+    assert got["content"] == "\n".join(code.split("\n")[100:]) and got["total_lines"] == 120
+    assert coll.updates and coll.doc["line_count"] == 120
+    assert repo.get_line_range(1, "old.py", 50, 50)["content"] == "\n".join(code.split("\n")[50:100])
+    assert len(coll.updates) == 1
+
+
+def test_lazy_loader_returns_chunk_from_line_range(monkeypatch):
+    import cache_manager as cm
+    import lazy_loader as ll
+
+    monkeypatch.setenv("REDIS_URL", "")
+    monkeypatch.setattr(cm, "redis", None, raising=False)
+    monkeypatch.setattr(cm, "cache", cm.CacheManager())
+    calls = []
+
+    def get_line_range(user_id, file_name, start_line, count):
+        calls.append((start_line, count))
+        return {"content": "b", "total_lines": 120, "start_line": start_line,
+                "end_line": min(start_line + count, 120), "programming_language": "python"}
+
+    monkeypatch.setattr(ll, "db", types.SimpleNamespace(get_line_range=get_line_range))
+    chunk = ll.LazyLoader().get_file_chunk(1, "f.py", 2)
+
+    assert isinstance(chunk, ll.FileChunk)
+    assert (chunk.start_line, chunk.end_line, chunk.total_chunks) == (101, 120, 3)
+    assert chunk.programming_language == "python" and calls == [(100, 50)]
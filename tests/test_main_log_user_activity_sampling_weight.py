@@ -3,7 +3,7 @@ import pytest
 
 
 @pytest.mark.asyncio
-async def test_log_user_activity_sampling_weight(monkeypatch):
+async def test_log_user_activity_records_every_call_with_weight_one(monkeypatch):
     # stub database module for main import
     db_mod = types.ModuleType("database")
     class _CodeSnippet: pass
@@ -19,13 +19,13 @@ async def test_log_user_activity_sampling_weight(monkeypatch):
     from main import log_user_activity
     import user_stats as user_stats_mod
 
-    # force sampled=True and capture weight
+    # אין יותר דגימה: גם כשהגרלה הייתה "מפספסת", כל קריאה נרשמת (נצברת ב-activity_buffer)
     import random as _rnd
-    monkeypatch.setattr(_rnd, "random", lambda: 0.0)
+    monkeypatch.setattr(_rnd, "random", lambda: 0.99)
 
-    captured = {"weight": None}
+    captured = []
     def _log_user(uid, uname=None, weight: int = 1):
-        captured["weight"] = weight
+        captured.append(weight)
     monkeypatch.setattr(user_stats_mod.user_stats, "log_user", _log_user)
 
     # prevent milestone scheduling
@@ -41,4 +41,5 @@ async def test_log_user_activity_sampling_weight(monkeypatch):
             return types.SimpleNamespace(id=1, username="u")
 
     await log_user_activity(Upd(), Ctx())
-    assert captured["weight"] == 4
+    await log_user_activity(Upd(), Ctx())
+    assert captured == [1, 1]
@@ -0,0 +1,144 @@
+import types
+
+import pytest
+
+import mongo_indexes
+from mongo_indexes import LEGACY_INDEXES, RECOMMENDED_INDEXES, advise, index_name, redundant_indexes
+
+
+@pytest.fixture
+def profiler_mod(monkeypatch):
+    monkeypatch.setenv("BOT_TOKEN", "dummy")
+    monkeypatch.setenv("MONGODB_URL", "mongodb://localhost:27017/test")
+    monkeypatch.setenv("DISABLE_DB", "1")
+    from database import profiler
+    return profiler
+
+
+def _info(name, key, **opts):
+    return dict(opts, name=name, key=dict(key))
+
+
+class _IndexedColl:
+    def __init__(self, name, infos, usage):
+        self.name = name
+        self.infos = infos
+        self.usage = usage
+
+    def list_indexes(self):
+        return list(self.infos)
+
+    def aggregate(self, pipeline):
+        assert pipeline == [{"$indexStats": {}}]
+        return [{"name": n, "accesses": {"ops": ops}} for n, ops in self.usage.items()]
+
+
+def test_recommended_set_drops_legacy_and_has_no_prefix_redundancy():
+    for name, specs in RECOMMENDED_INDEXES.items():
+        names = {index_name(spec) for spec in specs}
+        assert not names & set(LEGACY_INDEXES[name])
+        infos = {index_name(s): dict(s[1], key=list(s[0])) for s in specs}
+        assert redundant_indexes(infos) == []
+    assert index_name(([("user_id", 1), ("file_name", 1), ("version", -1)], {})) == "user_id_1_file_name_1_version_-1"
+
+
+def test_advise_reports_unused_redundant_legacy_and_missing(monkeypatch):
+    monkeypatch.setitem(mongo_indexes.RECOMMENDED_INDEXES, "things", [
+        ([("user_id", 1), ("file_name", 1)], {}),
+        ([("user_id", 1), ("created_at", -1)], {"name": "user_created_idx"}),
+    ])
+    monkeypatch.setitem(mongo_indexes.LEGACY_INDEXES, "things", ["lang_idx"])
+    coll = _IndexedColl("things", [
+        _info("_id_", [("_id", 1)]),
+        _info("user_id_1", [("user_id", 1)]),
+        _info("user_id_1_file_name_1", [("user_id", 1), ("file_name", 1)]),
+        _info("lang_idx", [("lang", 1), ("size", -1)]),
+        _info("ttl", [("expires", 1)], expireAfterSeconds=0),
+        _info("file_unique", [("user_id", 1)], unique=True),
+    ], {"_id_": 0, "user_id_1": 5, "user_id_1_file_name_1": 9, "lang_idx": 0, "ttl": 0, "file_unique": 0})
+
+    report = advise(coll)
+    assert report["redundant"] == [("user_id_1", "user_id_1_file_name_1")]
+    # ייחודי/TTL/_id לא נחשבים "לא בשימוש" — יש להם תפקיד מעבר לחיפוש
+    assert report["unused"] == ["lang_idx"]
+    assert report["legacy"] == ["lang_idx"] and report["missing"] == ["user_created_idx"]
+    assert report["drop"] == ["lang_idx", "user_id_1"]
+
+
+class _Cursor(list):
+    def __init__(self, docs, explains):
+        super().__init__(docs)
+        self.explains = explains
+        self.sorts = []
+
+    def sort(self, *a):
+        self.sorts.append(a)
+        return self
+
+    def limit(self, n):
+        return self
+
+    def explain(self):
+        self.explains.append(1)
+        return {"queryPlanner": {"winningPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN",
+                                                                                  "indexName": "user_idx"}}},
+                "executionStats": {"nReturned": 2, "totalDocsExamined": 2, "totalKeysExamined": 2}}
+
+
+class _Coll:
+    name = "code_snippets"
+
+    def __init__(self):
+        self.explains = []
+        self.commands = []
+        self.database = types.SimpleNamespace(command=self._command)
+
+    def _command(self, cmd):
+        self.commands.append(cmd)
+        return {"stages": [{"$cursor": {"queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}},
+                                        "executionStats": {"nReturned": 1, "totalDocsExamined": 50}}}]}
+
+    def find(self, flt, projection=None):
+        self.cursor = _Cursor([{"a": 1}, {"a": 2}], self.explains)
+        return self.cursor
+
+    def find_one(self, flt, projection=None, sort=None):
+        return {"a": 1}
+
+    def aggregate(self, pipeline, **kwargs):
+        return iter([{"n": 1}])
+
+    def update_one(self, *a, **k):
+        return "ok"
+
+
+def test_profiled_collection_records_latency_and_explain_per_call_site(profiler_mod):
+    profiler = profiler_mod.QueryProfiler(explain_limit=1)
+    coll = profiler_mod.ProfiledCollection(_Coll(), profiler)
+    for _ in range(3):
+        assert [d["a"] for d in coll.find({"user_id": 1}).sort("x", -1).limit(5)] == [1, 2]
+    list(coll.aggregate([{"$match": {"lang": "py"}}], allowDiskUse=True))
+    assert coll.update_one({"a": 1}, {"$set": {"b": 1}}) == "ok"
+
+    rows = {r["op"]: r for r in profiler.report()}
+    assert rows["find"]["calls"] == 3 and rows["find"]["explained"] == 1
+    assert rows["find"]["indexes"] == ["user_idx"] and rows["find"]["examined_per_returned"] == 1.0
+    assert rows["find"]["site"].startswith("test_mongo_indexes.py:")
+    assert rows["aggregate"]["indexes"] == ["COLLSCAN"] and rows["aggregate"]["examined_per_returned"] == 50.0
+    assert coll._collection.commands[0]["explain"]["pipeline"] == [{"$match": {"lang": "py"}}]
+    assert rows["update_one"]["explained"] == 0 and rows["update_one"]["examined_per_returned"] is None
+    assert "plan=COLLSCAN examined/returned=50.0" in profiler.format_report()
+    # מאפיינים שאינם פעולות עוברים ישירות לאוסף
+    assert coll.name == "code_snippets"
+
+
+def test_summarize_explain_without_stats(profiler_mod):
+    assert profiler_mod.summarize_explain({}) == {"indexes": [], "docs_examined": 0, "keys_examined": 0, "returned": 0}
+
+
+def test_find_one_explain_keeps_the_sort(profiler_mod):
+    profiler = profiler_mod.QueryProfiler(explain_limit=1)
+    coll = profiler_mod.ProfiledCollection(_Coll(), profiler)
+    assert coll.find_one({"user_id": 1}, sort=[("version", -1)]) == {"a": 1}
+    assert coll._collection.cursor.sorts == [([("version", -1)],)]
+    assert {r["op"]: r for r in profiler.report()}["find_one"]["explained"] == 1
@@ -0,0 +1,159 @@
+import time
+import types
+from datetime import datetime, timezone
+
+import pytest
+
+import pagination
+from pagination import approximate_count, cursor_for, decode_cursor, encode_cursor, keyset_filter, with_keyset
+
+
+def test_cursor_round_trips_datetime_and_id():
+    ts = datetime(2025, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+    token = encode_cursor(ts, "abc")
+    assert "=" not in token
+    assert decode_cursor(token) == (ts, "abc")
+    assert decode_cursor(cursor_for({"_id": 7, "updated_at": None})) == (None, 7)
+    assert decode_cursor("not-a-cursor") is None and decode_cursor(None) is None
+
+
+def test_keyset_filter_orders_ties_by_id_and_nulls_last():
+    flt = keyset_filter((5, "b"))
+    assert flt == {"$or": [{"updated_at": {"$lt": 5}}, {"updated_at": 5, "_id": {"$lt": "b"}}, {"updated_at": None}]}
+    assert keyset_filter((None, "b")) == {"updated_at": None, "_id": {"$lt": "b"}}
+    asc = keyset_filter((5, "b"), "file_name", "snippet_id", direction=1)
+    assert asc == {"$or": [{"file_name": {"$gt": 5}}, {"file_name": 5, "snippet_id": {"$gt": "b"}}]}
+    # $or קיים ב-match לא נדרס
+    match = {"$or": [{"tags": []}], "user_id": 1}
+    assert with_keyset(match, encode_cursor(5, "b"))["$and"][0] is match
+    assert with_keyset(match, None) is match
+
+
+class _Cache:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, expire_seconds=300):
+        self.data[key] = value
+        return True
+
+
+def test_approximate_count_serves_cached_value_and_refreshes_stale_in_background(monkeypatch):
+    cache = _Cache()
+    calls = []
+
+    def _count():
+        calls.append(1)
+        return 10 + len(calls)
+
+    assert approximate_count(cache, "k", _count) == 11
+    assert approximate_count(cache, "k", _count) == 11 and len(calls) == 1
+
+    cache.data["k"]["at"] = time.time() - pagination.APPROX_COUNT_REFRESH - 1
+    started = []
+    monkeypatch.setattr(pagination.threading, "Thread",
+                        lambda target, **kw: types.SimpleNamespace(start=lambda: started.append(target)))
+    # ערך מתיישן מוחזר מיד; הרענון רץ ברקע ונרשם פעם אחת בלבד
+    assert approximate_count(cache, "k", _count) == 11
+    assert approximate_count(cache, "k", _count) == 11
+    assert len(started) == 1
+    started[0]()
+    assert cache.data["k"]["count"] == 12
+    assert approximate_count(cache, "k", _count) == 12
+
+
+@pytest.fixture
+def repo_cls(monkeypatch):
+    monkeypatch.setenv("BOT_TOKEN", "dummy")
+    monkeypatch.setenv("MONGODB_URL", "mongodb://localhost:27017/test")
+    monkeypatch.setenv("DISABLE_DB", "1")
+    from database.repository import Repository
+    return Repository
+
+
+def _match(doc, flt):
+    for key, cond in flt.items():
+        if key in ("$and", "$or"):
+            results = [_match(doc, f) for f in cond]
+            if not (all(results) if key == "$and" else any(results)):
+                return False
+            continue
+        value = doc.get(key)
+        if isinstance(cond, dict):
+            if "$lt" in cond and not (value is not None and value < cond["$lt"]):
+                return False
+        elif value != cond:
+            return False
+    return True
+
+
+class _Cursor(list):
+    def sort(self, keys):
+        docs = list(self)
+        for field, order in reversed(keys):
+            docs.sort(key=lambda d: d.get(field), reverse=order == -1)
+        return _Cursor(docs)
+
+    def limit(self, n):
+        return _Cursor(self[:n])
+
+
+class _Coll:
+    def __init__(self, docs):
+        self.docs = docs
+        self.counts = 0
+
+    def find(self, flt):
+        return _Cursor(d for d in self.docs if _match(d, flt))
+
+    def count_documents(self, flt):
+        self.counts += 1
+        return len([d for d in self.docs if _match(d, flt)])
+
+
+def test_list_deleted_files_pages_by_cursor_across_collections(repo_cls):
+    def _ts(n):
+        return datetime(2025, 1, n, tzinfo=timezone.utc)
+
+    regular = _Coll([{"_id": f"r{n}", "user_id": 41, "is_active": False, "deleted_at": _ts(n)} for n in (1, 3, 5, 7)])
+    large = _Coll([{"_id": f"l{n}", "user_id": 41, "is_active": False, "deleted_at": _ts(n)} for n in (2, 4, 6)])
+    repo = repo_cls(types.SimpleNamespace(collection=regular, large_files_collection=large))
+
+    first, total = repo.list_deleted_files(41, page=1, per_page=3)
+    assert [d["_id"] for d in first] == ["r7", "l6", "r5"] and total == 7
+    second, total = repo.list_deleted_files(41, page=2, per_page=3, after=cursor_for(first[-1], "deleted_at"))
+    assert [d["_id"] for d in second] == ["l4", "r3", "l2"] and total == 7
+    # הספירה נשמרה ב-cache — עמוד נוסף לא סופר מחדש
+    counted = regular.counts
+    third, _ = repo.list_deleted_files(41, page=3, per_page=3, after=cursor_for(second[-1], "deleted_at"))
+    assert [d["_id"] for d in third] == ["r1"] and regular.counts == counted
+
+
+def test_list_deleted_files_ties_on_deleted_at_follow_the_id_order(repo_cls):
+    when = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    # כל הגרסאות של קובץ שנמחק חולקות deleted_at אחד
+    regular = _Coll([{"_id": f"a{n}", "user_id": 41, "is_active": False, "deleted_at": when,
+                      "updated_at": datetime(2024, 1, 5 - n, tzinfo=timezone.utc)} for n in (1, 2, 3, 4)])
+    large = _Coll([])
+    repo = repo_cls(types.SimpleNamespace(collection=regular, large_files_collection=large))
+
+    first, _ = repo.list_deleted_files(41, page=1, per_page=2)
+    second, _ = repo.list_deleted_files(41, page=2, per_page=2, after=cursor_for(first[-1], "deleted_at"))
+    assert [d["_id"] for d in first + second] == ["a4", "a3", "a2", "a1"]
+
+
+def test_page_cursors_are_scoped_to_their_listing():
+    from handlers.pagination import page_cursor, remember_page_cursor
+
+    user_data = {}
+    now = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    remember_page_cursor(user_data, "by_repo_page_cursors", 1, [{"_id": "a", "updated_at": now}], scope="repo:me/a")
+    assert page_cursor(user_data, "by_repo_page_cursors", 2, scope="repo:me/a")
+    # הודעה ישנה של ריפו אחר לא משתמשת ב-cursor של הריפו הנוכחי
+    assert page_cursor(user_data, "by_repo_page_cursors", 2, scope="repo:me/b") is None
+    remember_page_cursor(user_data, "by_repo_page_cursors", 2, [{"_id": "b", "updated_at": now}], scope="repo:me/b")
+    assert page_cursor(user_data, "by_repo_page_cursors", 2, scope="repo:me/a") is None
+    assert page_cursor(user_data, "by_repo_page_cursors", 3, scope="repo:me/b")
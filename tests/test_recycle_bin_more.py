@@ -91,6 +91,8 @@ def test_repository_delete_by_id_and_large_files(monkeypatch):
         def delete_many(self, flt):
             self.deleted = flt
             return types.SimpleNamespace(deleted_count=1)
+        def find_one(self, *a, **k):
+            return {"_id": "z", "file_name": "z.py"}
         def count_documents(self, *a, **k):
             return 1
         def aggregate(self, *a, **k):
@@ -60,6 +60,10 @@ def test_repository_restore_and_purge_paths(monkeypatch):
         def __init__(self):
             self.update_calls = []
             self.delete_calls = []
+            self.find_calls = []
+        def find_one(self, flt, *a, **k):
+            self.find_calls.append(flt)
+            return {"_id": flt.get("_id"), "file_name": "r.py"}
         def update_many(self, flt, upd):
             self.update_calls.append((flt, upd))
             return types.SimpleNamespace(modified_count=1)
@@ -82,6 +86,8 @@ def test_repository_restore_and_purge_paths(monkeypatch):
     oid = str(ObjectId())
     ok = repo.restore_file_by_id(user_id=5, file_id=oid)
     assert ok is True
+    # שם הקובץ נשלף פעם אחת בלבד, אחרי שהשחזור עדכן מסמך
+    assert len([f for f in repo.manager.collection.find_calls if "_id" in f]) == 1
 
     # purge path
     ok2 = repo.purge_file_by_id(user_id=5, file_id=str(ObjectId()))
@@ -279,7 +279,9 @@ async def test_regular_files_page_second(monkeypatch):
     mod.DatabaseManager = _DatabaseManager
 
     items = [{"_id": f"i{n}", "file_name": f"b{n}.py", "programming_language": "python", "updated_at": dt.datetime.now(dt.timezone.utc)} for n in range(10)]
-    def _get(uid, page, per_page):
+    calls = []
+    def _get(uid, page, per_page, after=None):
+        calls.append((page, after))
         if page == 2:
             start = 10
             it = [{"_id": f"i{start+n}", "file_name": f"b{start+n}.py", "programming_language": "python", "updated_at": dt.datetime.now(dt.timezone.utc)} for n in range(3)]
@@ -310,6 +312,9 @@ async def test_regular_files_page_second(monkeypatch):
     cache = ctx.user_data.get('files_cache')
     assert cache is not None
     assert any(k == '10' for k in cache.keys())
+    # העמוד השני ממשיך מה-cursor של הפריט האחרון בעמוד הראשון (ללא skip)
+    from pagination import cursor_for
+    assert calls[-1] == (2, cursor_for(items[-1], "updated_at"))
 
 
 @pytest.mark.asyncio
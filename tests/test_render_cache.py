@@ -0,0 +1,81 @@
+import os
+import random
+
+
+def _manager(monkeypatch):
+    import cache_manager as cm
+    monkeypatch.setenv('REDIS_URL', '')
+    monkeypatch.setattr(cm, 'redis', None, raising=False)
+    return cm.CacheManager()
+
+
+def test_key_is_short_content_hash_and_covers_view_options():
+    import render_cache as rc
+
+    code = "x = 1\n" * 50000
+    key = rc.render_key(code, "python", "html", "github-dark", {"linenos": True})
+    assert len(key) < 120 and key.startswith("render:")
+    assert key == rc.render_key(code, "python", "html", "github-dark", {"linenos": True})
+    assert key != rc.render_key(code, "python", "html", "monokai", {"linenos": True})
+    assert key != rc.render_key(code, "python", "html", "github-dark", {"linenos": False})
+    assert key != rc.render_key(code + " ", "python", "html", "github-dark", {"linenos": True})
+
+
+def test_renders_once_and_shares_through_disk_without_redis(monkeypatch, tmp_path):
+    import render_cache as rc
+
+    disk = rc.DiskRenderStore(str(tmp_path), 1024 * 1024)
+    calls = {"n": 0}
+
+    def render():
+        calls["n"] += 1
+        return "<span>print</span>"
+
+    first = rc.RenderCache(_manager(monkeypatch), disk)
+    assert first.get_or_render("print(1)", "python", "html", "github-dark", {}, render) == "<span>print</span>"
+    assert first.get_or_render("print(1)", "python", "html", "github-dark", {}, render) == "<span>print</span>"
+    # תהליך אחר (זיכרון מקומי ריק) קורא מהדיסק
+    other = rc.RenderCache(_manager(monkeypatch), disk)
+    assert other.get_or_render("print(1)", "python", "html", "github-dark", {}, render) == "<span>print</span>"
+    assert calls["n"] == 1
+
+
+def test_disk_store_evicts_least_recently_read(tmp_path):
+    import render_cache as rc
+
+    # תוכן אקראי כדי שהדחיסה לא תקטין אותו לכמעט כלום
+    def blob(seed):
+        rnd = random.Random(seed)
+        return "".join(rnd.choice("abcdefghijklmnopqrstuvwxyz0123456789") for _ in range(2000))
+
+    size = len(rc.zlib.compress(blob(1).encode(), 6))
+    disk = rc.DiskRenderStore(str(tmp_path), int(size * 2.5))
+    disk.set("a", blob(1))
+    disk.set("b", blob(2))
+    os.utime(disk._path("a"), (1, 1))
+    os.utime(disk._path("b"), (2, 2))
+    assert disk.get("a") == blob(1)  # a נקרא עכשיו — b הוא הישן ביותר
+    disk.set("c", blob(3))
+    assert disk.get("b") is None
+    assert disk.get("a") == blob(1) and disk.get("c") == blob(3)
+    assert sum(f.stat().st_size for f in tmp_path.iterdir()) <= size * 2.5
+
+
+def test_highlight_html_uses_cache(monkeypatch):
+    import render_cache as rc
+
+    mgr = _manager(monkeypatch)
+    monkeypatch.setattr(rc, "render_cache", rc.RenderCache(mgr, None))
+    calls = {"n": 0}
+    real = rc.highlight
+
+    def counting(*args):
+        calls["n"] += 1
+        return real(*args)
+
+    monkeypatch.setattr(rc, "highlight", counting)
+    html = rc.highlight_html("def f():\n    return 1\n", "python")
+    assert 'class="source' in html and "linenos" in html
+    assert rc.highlight_html("def f():\n    return 1\n", "python") == html
+    assert calls["n"] == 1
+    assert ".source" in rc.style_css()
@@ -47,6 +47,8 @@ def test_purge_file_by_id_invalidate_exception(monkeypatch):
     import database.repository as repo_mod
 
     class Coll:
+        def find_one(self, *_a, **_k):
+            return None
         def delete_many(self, *_a, **_k):
             return types.SimpleNamespace(deleted_count=0)
     class LColl:
@@ -262,3 +262,51 @@ def test_get_all_user_files_combined(monkeypatch):
     repo = Repository(Mgr())
     out = repo.get_all_user_files_combined(1)
     assert isinstance(out, dict) and "regular_files" in out and "large_files" in out
+
+
+def test_get_latest_versions_single_aggregation_with_projection():
+    from database.repository import Repository
+
+    class Coll:
+        def __init__(self):
+            self.pipelines = []
+        def aggregate(self, pipeline, **_k):
+            self.pipelines.append(pipeline)
+            return [{"file_name": "a.py", "version": 3}, {"file_name": "b.py", "version": 1}]
+
+    coll = Coll()
+    mgr = types.SimpleNamespace(collection=coll, large_files_collection=Coll())
+    repo = Repository(mgr)
+    out = repo.get_latest_versions(5, ["a.py", "b.py", "a.py"], projection={"tags": 1})
+    assert set(out) == {"a.py", "b.py"}
+    assert len(coll.pipelines) == 1
+    pipeline = coll.pipelines[0]
+    assert pipeline[0]["$match"]["file_name"] == {"$in": ["a.py", "b.py"]}
+    project = [st["$project"] for st in pipeline if "$project" in st][0]
+    assert project == {"tags": 1, "file_name": 1, "version": 1}
+    assert repo.get_latest_versions(5, []) == {}
+
+
+def test_save_code_snippet_stores_precomputed_features(monkeypatch):
+    from database.repository import Repository
+    from database.models import CodeSnippet
+
+    class Coll:
+        def __init__(self):
+            self.inserted = []
+        def find_one(self, *_a, **_k):
+            return None
+        def insert_one(self, doc):
+            self.inserted.append(doc)
+            return types.SimpleNamespace(inserted_id="x")
+
+    coll = Coll()
+    repo = Repository(types.SimpleNamespace(collection=coll, large_files_collection=Coll()))
+    monkeypatch.setattr(repo, "_update_search_index", lambda *a, **k: None)
+    code = "class Box:\n    def open(self):\n        return 'שלום'\n"
+    assert repo.save_code_snippet(CodeSnippet(user_id=1, file_name="box.py", code=code, programming_language="python"))
+    doc = coll.inserted[0]
+    assert doc["size_bytes"] == len(code.encode("utf-8"))
+    assert doc["line_count"] == 4
+    assert doc["function_count"] == 1 and doc["class_count"] == 1
+    assert doc["symbols"] == ["open", "Box"]
@@ -7,6 +7,8 @@ def test_restore_and_purge_large_files(monkeypatch):
 
     # Collections: none in regular, present in large
     class Reg:
+        def find_one(self, *a, **k):
+            return None
         def update_many(self, *a, **k):
             return types.SimpleNamespace(modified_count=0)
         def delete_many(self, *a, **k):
@@ -0,0 +1,103 @@
+import types
+import zipfile
+
+import pytest
+
+
+@pytest.fixture
+def bulk_repo(monkeypatch):
+    monkeypatch.setenv("BOT_TOKEN", "dummy")
+    monkeypatch.setenv("MONGODB_URL", "mongodb://localhost:27017/test")
+    monkeypatch.setenv("DISABLE_DB", "1")
+    from database import repository as repo_mod
+
+    class Coll:
+        def __init__(self):
+            self.inserted = []
+            self.updated = []
+
+        def insert_one(self, doc, **kwargs):
+            if doc["file_name"] == "boom.py":
+                raise RuntimeError("write failed")
+            self.inserted.append(doc)
+            return types.SimpleNamespace(inserted_id=len(self.inserted))
+
+        def update_one(self, flt, update, **kwargs):
+            self.updated.append((flt, update))
+            return types.SimpleNamespace(modified_count=1)
+
+    invalidations = []
+    monkeypatch.setattr(repo_mod.cache, "invalidate_user_cache", lambda uid: invalidations.append(uid) or 0)
+    mgr = types.SimpleNamespace(collection=Coll(), large_files_collection=None, db=types.SimpleNamespace())
+    repo = repo_mod.Repository(mgr)
+    previous = {
+        "old.py": {"file_name": "old.py", "version": 2, "programming_language": "python",
+                   "code": "a = 1", "tags": ["repo:me/app", "keep"], "description": "d"},
+        "same.py": {"file_name": "same.py", "version": 5, "programming_language": "python",
+                    "code": "b = 2", "tags": ["repo:me/app"]},
+    }
+    calls = []
+
+    def _latest_versions(user_id, names, projection=None):
+        calls.append(list(names))
+        return {n: dict(previous[n]) for n in names if n in previous}
+
+    monkeypatch.setattr(repo, "get_latest_versions", _latest_versions)
+    return repo, mgr.collection, invalidations, calls
+
+
+def test_save_files_bulk_reports_per_file_outcomes(bulk_repo):
+    repo, coll, invalidations, calls = bulk_repo
+    items = [
+        {"file_name": "new.py", "code": "print(1)", "programming_language": "python"},
+        {"file_name": "old.py", "code": "a = 2", "programming_language": "python"},
+        {"file_name": "same.py", "code": "b = 2", "programming_language": "python"},
+        {"file_name": "boom.py", "code": "x", "programming_language": "python"},
+        {"code": "no name"},
+    ]
+    outcomes = repo.save_files_bulk(7, items, extra_tags=["repo:me/app", "source:github"])
+
+    assert [o["status"] for o in outcomes] == ["created", "updated", "unchanged", "failed", "failed"]
+    assert outcomes[1]["version"] == 3 and outcomes[1]["previous_tags"] == ["repo:me/app", "keep"]
+    assert calls == [["new.py", "old.py", "same.py", "boom.py"]]
+    # גרסה חדשה שומרת תיאור ותגיות קודמות וממזגת את התגיות החדשות
+    old_doc = next(d for d in coll.inserted if d["file_name"] == "old.py")
+    assert old_doc["description"] == "d" and old_doc["tags"] == ["keep", "source:github", "repo:me/app"]
+    assert old_doc["content_hash"] and old_doc["size_bytes"] == 5
+    # תוכן זהה עם תגית חדשה — עדכון במקום, בלי גרסה
+    assert [flt["file_name"] for flt, _ in coll.updated] == ["same.py"]
+    assert invalidations == [7]
+
+
+def test_save_files_bulk_last_duplicate_wins(bulk_repo):
+    repo, coll, invalidations, _ = bulk_repo
+    outcomes = repo.save_files_bulk(7, [
+        {"file_name": "a.py", "code": "1", "programming_language": "python"},
+        {"file_name": "a.py", "code": "2", "programming_language": "python"},
+    ])
+    assert [o["status"] for o in outcomes] == ["failed", "created"]
+    assert [d["code"] for d in coll.inserted] == ["2"]
+
+
+def test_restore_from_backup_uses_bulk_save(monkeypatch, tmp_path):
+    zpath = tmp_path / "bkp.zip"
+    with zipfile.ZipFile(zpath, "w") as zf:
+        zf.writestr("a.py", "print(1)")
+        zf.writestr("b.py", "print(2)")
+        zf.writestr("metadata.json", "{}")
+
+    calls = []
+
+    class _DBStub:
+        def save_files_bulk(self, user_id, items, extra_tags=None):
+            calls.append((user_id, [it["file_name"] for it in items], list(extra_tags or [])))
+            return [{"file_name": it["file_name"], "status": "failed" if it["file_name"] == "b.py" else "created",
+                     "error": "boom"} for it in items]
+
+    import sys
+    monkeypatch.setitem(sys.modules, "database", types.SimpleNamespace(db=_DBStub()))
+    from file_manager import backup_manager
+    res = backup_manager.restore_from_backup(user_id=1, backup_path=str(zpath), purge=False,
+                                             extra_tags=["repo:A", "repo:B"])
+    assert calls == [(1, ["a.py", "b.py"], ["repo:B"])]
+    assert res["restored_files"] == 1 and res["errors"] == ["save failed for b.py: boom"]
@@ -0,0 +1,389 @@
+import sys
+import types
+
+import pytest
+
+
+class _FakeIndexColl:
+    """קולקציה בזיכרון שתומכת בתת-הקבוצה ש-search_engine משתמש בה."""
+
+    def __init__(self):
+        self.docs = {}
+
+    @staticmethod
+    def _match(doc, flt):
+        for k, v in flt.items():
+            if isinstance(v, dict) and "$gt" in v:
+                if not (doc.get(k) is not None and doc.get(k) > v["$gt"]):
+                    return False
+            elif doc.get(k) != v:
+                return False
+        return True
+
+    def find(self, flt, projection=None):
+        return [dict(d) for d in self.docs.values() if self._match(d, flt)]
+
+    def find_one(self, flt, projection=None):
+        res = self.find(flt)
+        return res[0] if res else None
+
+    def update_one(self, flt, upd, upsert=False):
+        key = (flt["user_id"], flt["file_name"])
+        doc = self.docs.get(key)
+        if doc is None:
+            if not upsert:
+                return types.SimpleNamespace(modified_count=0)
+            doc = dict(flt)
+        doc.update(upd.get("$set", {}))
+        for k in upd.get("$unset", {}):
+            doc.pop(k, None)
+        self.docs[(doc["user_id"], doc["file_name"])] = doc
+        return types.SimpleNamespace(modified_count=1)
+
+
+@pytest.fixture
+def engine_mod(monkeypatch):
+    import search_engine as se
+    coll = _FakeIndexColl()
+    calls = {"user_files": 0}
+
+    def _get_user_files(user_id, limit=50):
+        calls["user_files"] += 1
+        return [{"file_name": "a.py", "code": "def alpha(): return beta", "programming_language": "python", "tags": ["Web"]}]
+
+    fake_db = types.SimpleNamespace(search_index_collection=coll, get_user_files=_get_user_files)
+    monkeypatch.setattr(se, "db", fake_db)
+    monkeypatch.setattr(se.code_processor, "extract_functions", lambda code, lang: [{"name": "alpha"}])
+    return se, coll, calls
+
+
+def test_backfill_once_then_load_from_store(engine_mod):
+    se, coll, calls = engine_mod
+    eng = se.AdvancedSearchEngine()
+    idx = eng.get_index(1)
+    assert "1:a.py" in idx.word_index["alpha"]
+    assert "1:a.py" in idx.tag_index["web"]
+    assert (1, "a.py") in coll.docs
+    # תהליך אחר טוען מהאחסון ללא בנייה מחדש
+    other = se.AdvancedSearchEngine()
+    other.get_index(1)
+    assert calls["user_files"] == 1
+
+
+def test_incremental_index_remove_and_rename(engine_mod):
+    se, coll, _ = engine_mod
+    eng = se.AdvancedSearchEngine()
+    idx = eng.get_index(1)
+    eng.index_file(1, {"file_name": "b.py", "code": "gamma delta", "programming_language": "python"})
+    assert "1:b.py" in idx.word_index["gamma"]
+
+    eng.rename_file(1, "b.py", "c.py")
+    assert "gamma" in idx.word_index and idx.word_index["gamma"] == {"1:c.py"}
+    assert coll.docs[(1, "b.py")]["is_active"] is False
+
+    eng.remove_file(1, "c.py")
+    assert "gamma" not in idx.word_index
+    assert set(coll.docs[(1, "c.py")]) == {"user_id", "file_name", "programming_language", "is_active", "indexed_at"}
+    assert "1:c.py" not in idx.documents
+
+
+def test_sync_pulls_changes_from_other_process(engine_mod):
+    se, coll, _ = engine_mod
+    reader = se.AdvancedSearchEngine()
+    writer = se.AdvancedSearchEngine()
+    idx = reader.get_index(1)
+    writer.index_file(1, {"file_name": "z.py", "code": "zeta", "programming_language": "python"})
+    writer.remove_file(1, "a.py")
+    idx.sync(1)
+    assert idx.word_index["zeta"] == {"1:z.py"}
+    assert "1:a.py" not in idx.documents
+
+
+def test_term_dictionary_prefix_and_infix(engine_mod):
+    se, _, _ = engine_mod
+    d = se.TermDictionary(ngrams=True)
+    for t in ["connect", "connection", "reconnect", "disconnect", "cache", "co"]:
+        d.add(t)
+    assert d.with_prefix("conn") == ["connect", "connection"]
+    assert d.containing("nnec") == {"connect", "connection", "reconnect", "disconnect"}
+    assert d.containing("co") >= {"co", "connect", "reconnect"}
+    d.discard("reconnect")
+    assert "reconnect" not in d.containing("nnec")
+    assert d.with_prefix("zz") == []
+    # מונחים של 2 תווים נמצאים גם לפי מקטע פנימי שאינו קידומת
+    d.add("ab")
+    assert d.containing("b") == {"ab"}
+    d.discard("ab")
+    assert d.containing("b") == set()
+
+
+def test_text_search_does_not_mutate_postings(engine_mod, monkeypatch):
+    se, _, _ = engine_mod
+    eng = se.AdvancedSearchEngine()
+    idx = eng.get_index(1)
+    eng.index_file(1, {"file_name": "b.py", "code": "alphabet", "programming_language": "python"})
+    monkeypatch.setattr(se.db, "get_latest_versions", lambda uid, names, projection=None: {}, raising=False)
+    eng._text_search("alpha", idx, 1)
+    assert idx.word_index["alpha"] == {"1:a.py"}
+    assert eng.suggest_completions(1, "alp") == ["alpha", "alphabet"]
+
+
+def test_bm25_ranking_phrase_and_top_k(engine_mod, monkeypatch):
+    se, _, _ = engine_mod
+    eng = se.AdvancedSearchEngine()
+    idx = eng.get_index(1)
+    docs = {
+        "many.py": "cache cache cache get",
+        "once.py": "cache get set delete update insert " * 3,
+        "phrase.py": "get cache now",
+    }
+    for name, code in docs.items():
+        eng.index_file(1, {"file_name": name, "code": code, "programming_language": "python"})
+    assert idx.term_frequency("1:many.py", "cache") == 3
+    assert list(idx.term_positions("1:many.py", "cache")) == [0, 1, 2]
+
+    bulk_calls = []
+
+    def _latest_many(uid, names, projection=None):
+        bulk_calls.append((list(names), dict(projection or {})))
+        out = {}
+        for name in names:
+            doc = {"file_name": name, "programming_language": "python",
+                   "tags": [], "created_at": None, "updated_at": None, "version": 1}
+            if (projection or {}).get("code"):
+                doc["code"] = docs.get(name, "")
+            out[name] = doc
+        return out
+    monkeypatch.setattr(se.db, "get_latest_versions", _latest_many, raising=False)
+
+    ranked = eng._text_search("cache", idx, 1)
+    assert ranked[0].file_name == "many.py"
+    assert len(bulk_calls) == 1 and "code" not in bulk_calls[0][1]
+    assert not ranked[0].content_loaded
+    top = eng._text_search("cache", idx, 1, limit=1)
+    assert [r.file_name for r in top] == ["many.py"]
+    phrase = eng._text_search('"get cache"', idx, 1)
+    assert [r.file_name for r in phrase] == ["phrase.py"]
+
+    # search() טוען תוכן רק לתוצאות המוחזרות
+    bulk_calls.clear()
+    results = eng.search(1, "cache", limit=1)
+    assert [r.file_name for r in results] == ["many.py"]
+    assert results[0].content == docs["many.py"]
+    assert bulk_calls[-1][0] == ["many.py"]
+
+
+def test_regex_scan_batch_incremental_lines():
+    from search_workers import regex_scan_batch
+    hits = regex_scan_batch(r"foo", 0, [("a.py", "foo\nx\nfoo foo\n"), ("b.py", "bar")])
+    assert len(hits) == 1
+    name, count, matches = hits[0]
+    assert name == "a.py" and count == 3
+    assert [m["line"] for m in matches] == [1, 3, 3]
+
+
+@pytest.mark.parametrize("use_pool", [False, True])
+def test_regex_and_content_search_stream_with_early_stop(engine_mod, monkeypatch, use_pool):
+    se, _, _ = engine_mod
+    docs = [
+        {"file_name": f"f{i}.py", "code": f"line\nneedle {i}\n", "programming_language": "python",
+         "tags": [], "created_at": None, "updated_at": None, "version": 1}
+        for i in range(7)
+    ]
+    consumed = {"n": 0}
+
+    def _iter(uid, projection=None, batch_size=100):
+        assert "code" in projection
+        for d in docs:
+            consumed["n"] += 1
+            yield d
+    monkeypatch.setattr(se.db, "iter_user_files", _iter, raising=False)
+    monkeypatch.setattr(se, "STREAM_BATCH_SIZE", 2)
+    if not use_pool:
+        monkeypatch.setattr(se, "_get_regex_pool", lambda: None)
+    eng = se.AdvancedSearchEngine()
+
+    results = eng._regex_search(r"needle \d", 1, limit=3)
+    assert [r.file_name for r in results] == ["f0.py", "f1.py", "f2.py"]
+    assert results[0].matches[0]["line"] == 2
+
+    consumed["n"] = 0
+    found = eng._content_search("needle", 1, limit=2)
+    assert [r.file_name for r in found] == ["f0.py", "f1.py"]
+    assert consumed["n"] == 2
+
+
+def test_regex_timeout_terminates_the_stuck_worker(engine_mod, monkeypatch):
+    se, _, _ = engine_mod
+    docs = [{"file_name": "evil.py", "code": "a" * 40 + "!", "programming_language": "python",
+             "tags": [], "created_at": None, "updated_at": None, "version": 1}]
+    monkeypatch.setattr(se.db, "iter_user_files", lambda uid, projection=None, batch_size=100: iter(docs),
+                        raising=False)
+    monkeypatch.setattr(se, "REGEX_TIMEOUT_SECONDS", 1.0)
+    se._reset_regex_pool()
+    pool = se._get_regex_pool()
+    assert pool._mp_context.get_start_method() in ("forkserver", "spawn")
+
+    stuck = []
+    reset = se._reset_regex_pool
+
+    def _spy():
+        stuck.extend(pool._processes.values())
+        reset()
+    monkeypatch.setattr(se, "_reset_regex_pool", _spy)
+
+    assert se.AdvancedSearchEngine()._regex_search(r"(a+)+$", 1) == []
+    assert stuck and se._get_regex_pool() is not pool
+    for process in stuck:
+        process.join(timeout=5)
+        assert not process.is_alive()
+
+
+def test_fuzzy_search_prefilters_content_candidates(engine_mod, monkeypatch):
+    se, _, _ = engine_mod
+    eng = se.AdvancedSearchEngine()
+    idx = eng.get_index(1)
+    codes = {
+        "net.py": "def connect_database():\n    return pool\n",
+        "other.py": "print('zzz')\n",
+    }
+    for name, code in codes.items():
+        eng.index_file(1, {"file_name": name, "code": code, "programming_language": "python"})
+    requested = []
+
+    def _latest_many(uid, names, projection=None):
+        requested.append((list(names), dict(projection or {})))
+        out = {}
+        for name in names:
+            doc = {"file_name": name, "programming_language": "python", "tags": [],
+                   "created_at": None, "updated_at": None, "version": 1}
+            if (projection or {}).get("code"):
+                doc["code"] = codes.get(name, "")
+            out[name] = doc
+        return out
+    monkeypatch.setattr(se.db, "get_latest_versions", _latest_many, raising=False)
+
+    results = eng._fuzzy_search("connect_databse", idx, 1)
+    assert [r.file_name for r in results] == ["net.py"]
+    # רק המועמד שחולק טריגרמים עם השאילתה נטען לניקוד תוכן
+    assert requested[0][0] == ["net.py"]
+    assert results[0].content_loaded
+
+
+def test_query_parser_plan_and_date_filter(engine_mod):
+    se, _, _ = engine_mod
+    parser = se.SearchQueryParser()
+    parsed = parser.parse_query("lang:python date:2024-05 alpha beta OR gamma NOT delta")
+    assert parsed["filters"].languages == ["python"]
+    assert parsed["filters"].date_from.month == 5 and parsed["filters"].date_to.month == 5
+    assert parsed["plan"] == (
+        "or",
+        ("and", ("term", "alpha"), ("term", "beta")),
+        ("and", ("term", "gamma"), ("not", ("term", "delta"))),
+    )
+    assert parser._not_operator({"a"}, {"a", "b"}) == {"b"}
+    assert parser.is_structured("tag:web x") and not parser.is_structured("plain words")
+
+
+def test_unknown_keys_and_lowercase_operators_stay_text(engine_mod, monkeypatch):
+    se, _, _ = engine_mod
+    parser = se.SearchQueryParser()
+    assert not any(parser.is_structured(q) for q in ("std::vector", "http://x.com", "not found"))
+    assert parser.is_structured("size:big") and parser.is_structured("x NOT y")
+    assert parser.parse_query("lang:cpp std::vector")["plan"] == ("and", ("term", "std"), ("term", "vector"))
+    assert parser.parse_query("size:big")["plan"] is None
+
+    eng = se.AdvancedSearchEngine()
+    eng.get_index(1)
+    for name, code in {"vec.cpp": "std vector push", "other.py": "unrelated"}.items():
+        eng.index_file(1, {"file_name": name, "code": code, "programming_language": "python"})
+    monkeypatch.setattr(se.db, "get_latest_versions", lambda uid, names, projection=None: {
+        n: {"file_name": n, "programming_language": "python", "tags": [], "created_at": None,
+            "updated_at": None, "version": 1, "code": ""} for n in names}, raising=False)
+    # מסנן לא תקין ללא תוכנית — חיפוש טקסט רגיל ולא כל הקבצים
+    assert [r.file_name for r in eng.search(1, "size:big")] == []
+    assert sorted(r.file_name for r in eng.search(1, "NOT unrelated")) == ["a.py", "vec.cpp"]
+
+
+def test_planned_search_pushes_filters_down(engine_mod, monkeypatch):
+    se, _, _ = engine_mod
+    eng = se.AdvancedSearchEngine()
+    idx = eng.get_index(1)
+    for name, code in {"web.py": "route test", "api.py": "route handler", "js.py": "route"}.items():
+        eng.index_file(1, {"file_name": name, "code": code, "programming_language": "python"})
+    pushed = {}
+
+    def _find_names(uid, **kw):
+        pushed.update(kw)
+        return ["web.py", "api.py", "a.py"]
+    monkeypatch.setattr(se.db, "find_file_names", _find_names, raising=False)
+    monkeypatch.setattr(se.db, "get_latest_versions", lambda uid, names, projection=None: {
+        n: {"file_name": n, "programming_language": "python", "tags": [], "created_at": None,
+            "updated_at": None, "version": 1, "code": ""} for n in names}, raising=False)
+
+    results = eng.search(1, "lang:python route NOT test")
+    assert pushed["languages"] == ["python"]
+    assert [r.file_name for r in results] == ["api.py"]
+
+
+def test_query_and_ui_filters_combine_with_and(engine_mod, monkeypatch):
+    se, _, _ = engine_mod
+    eng = se.AdvancedSearchEngine()
+    eng.get_index(1)
+    for name in ("web.py", "api.py"):
+        eng.index_file(1, {"file_name": name, "code": "route", "programming_language": "python"})
+    calls = []
+
+    def _find_names(uid, **kw):
+        calls.append(kw)
+        return ["web.py"] if kw.get("tags") == ["api"] else ["web.py", "api.py"]
+    monkeypatch.setattr(se.db, "find_file_names", _find_names, raising=False)
+    monkeypatch.setattr(se.db, "get_latest_versions", lambda uid, names, projection=None: {
+        n: {"file_name": n, "programming_language": "python", "tags": [], "created_at": None,
+            "updated_at": None, "version": 1, "code": ""} for n in names}, raising=False)
+
+    # lang:js מהשאילתה ו-python מהממשק — אין קובץ בשתי השפות
+    assert eng.search(1, "lang:js route", filters=se.SearchFilter(languages=["python"])) == []
+    assert calls == []
+    eng.search(1, "lang:js route", filters=se.SearchFilter(languages=["python", "JS"]))
+    assert calls[-1]["languages"] == ["js"]
+    # תגיות: הקובץ צריך תגית מהשאילתה וגם תגית מהממשק
+    calls.clear()
+    results = eng.search(1, "tag:web route", filters=se.SearchFilter(tags=["api"]))
+    assert [c["tags"] for c in calls] == [["web"], ["api"]]
+    assert [r.file_name for r in results] == ["web.py"]
+
+
+def test_filters_and_size_sort_use_stored_features(engine_mod, monkeypatch):
+    se, _, _ = engine_mod
+    eng = se.AdvancedSearchEngine()
+    idx = eng.get_index(1)
+    for name in ("big.py", "small.py", "old.py"):
+        eng.index_file(1, {"file_name": name, "code": "shared", "programming_language": "python"})
+    stored = {
+        "big.py": {"size_bytes": 900, "function_count": 3, "class_count": 0},
+        "small.py": {"size_bytes": 10, "function_count": 0, "class_count": 0},
+    }
+    legacy_code = "def f():\n    pass\n"
+    content_requests = []
+
+    def _latest_many(uid, names, projection=None):
+        if (projection or {}).get("code"):
+            content_requests.append(list(names))
+        out = {}
+        for name in names:
+            doc = {"file_name": name, "programming_language": "python", "tags": [],
+                   "created_at": None, "updated_at": None, "version": 1}
+            doc.update(stored.get(name, {}))
+            if (projection or {}).get("code"):
+                doc["code"] = legacy_code if name == "old.py" else "x"
+            out[name] = doc
+        return out
+    monkeypatch.setattr(se.db, "get_latest_versions", _latest_many, raising=False)
+
+    results = eng.search(1, "shared", filters=se.SearchFilter(has_functions=True),
+                         sort_order=se.SortOrder.SIZE_DESC)
+    assert [r.file_name for r in results] == ["big.py", "old.py"]
+    # תוכן נטען לפני הסינון רק למסמך הישן ללא מאפיינים
+    assert content_requests[0] == ["old.py"]
+    assert results[1].size_bytes == len(legacy_code)
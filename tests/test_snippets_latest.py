@@ -0,0 +1,288 @@
+import types
+
+import pytest
+
+import snippets_latest
+from snippets_latest import backfill_latest, sync_latest
+
+
+def _matches(doc, flt):
+    for key, cond in flt.items():
+        if key == "$and":
+            if not all(_matches(doc, f) for f in cond):
+                return False
+            continue
+        if key == "$or":
+            if not any(_matches(doc, f) for f in cond):
+                return False
+            continue
+        value = doc.get(key)
+        if isinstance(cond, dict):
+            if "$exists" in cond and (key in doc) != bool(cond["$exists"]):
+                return False
+            if "$lt" in cond and not (value is not None and value < cond["$lt"]):
+                return False
+            if "$in" in cond and value not in cond["$in"] and not (
+                isinstance(value, list) and set(value) & set(cond["$in"])
+            ):
+                return False
+            if "$gt" in cond and not (value is not None and value > cond["$gt"]):
+                return False
+        elif isinstance(value, list):
+            if cond not in value:
+                return False
+        elif value != cond:
+            return False
+    return True
+
+
+class _Cursor(list):
+    def sort(self, key, direction=1):
+        keys = key if isinstance(key, list) else [(key, direction)]
+        docs = list(self)
+        for field, order in reversed(keys):
+            docs.sort(key=lambda d: d.get(field), reverse=order == -1)
+        return _Cursor(docs)
+
+    def skip(self, n):
+        return _Cursor(self[n:])
+
+    def limit(self, n):
+        return _Cursor(self[:n])
+
+    def batch_size(self, n):
+        return self
+
+
+class FakeColl:
+    def __init__(self, docs=None):
+        self.docs = [dict(d) for d in (docs or [])]
+
+    def find_one(self, flt, projection=None, sort=None, **kwargs):
+        docs = [d for d in self.docs if _matches(d, flt)]
+        if sort:
+            key, direction = sort[0]
+            docs.sort(key=lambda d: d.get(key), reverse=direction == -1)
+        return dict(docs[0]) if docs else None
+
+    def find(self, flt=None, projection=None, **kwargs):
+        return _Cursor(dict(d) for d in self.docs if _matches(d, flt or {}))
+
+    def count_documents(self, flt):
+        return len(self.find(flt))
+
+    def replace_one(self, flt, doc, upsert=False, **kwargs):
+        self.docs = [d for d in self.docs if not _matches(d, flt)]
+        self.docs.append(dict(doc))
+
+    def update_one(self, flt, update, upsert=False, **kwargs):
+        if not self.find(flt):
+            self.docs.append(dict(update["$setOnInsert"]))
+
+    def delete_one(self, flt, **kwargs):
+        for i, d in enumerate(self.docs):
+            if _matches(d, flt):
+                del self.docs[i]
+                return
+
+
+@pytest.fixture
+def repository_cls(monkeypatch):
+    monkeypatch.setenv("BOT_TOKEN", "dummy")
+    monkeypatch.setenv("MONGODB_URL", "mongodb://localhost:27017/test")
+    monkeypatch.setenv("DISABLE_DB", "1")
+    from database.repository import Repository
+    return Repository
+
+
+def _version(_id, name, version, active=True, code="x = 1\n", **extra):
+    doc = {"_id": _id, "user_id": 1, "file_name": name, "version": version, "code": code,
+           "programming_language": "python", "is_active": active, "updated_at": version}
+    doc.update(extra)
+    return doc
+
+
+def test_sync_latest_upserts_latest_active_version_without_code():
+    coll = FakeColl([_version("a1", "a.py", 1), _version("a2", "a.py", 2, code="def f():\n    pass\n")])
+    latest = FakeColl()
+    doc = sync_latest(coll, latest, 1, "a.py")
+    assert doc["snippet_id"] == "a2" and doc["version"] == 2
+    assert "code" not in latest.docs[0]
+    # מסמך ישן ללא מאפיינים — מחושבים מהקוד
+    assert doc["size_bytes"] > 0 and doc["function_count"] == 1
+
+
+def test_sync_latest_keeps_soft_deleted_and_drops_purged():
+    coll = FakeColl([_version("a1", "a.py", 1, active=False)])
+    latest = FakeColl()
+    sync_latest(coll, latest, 1, "a.py")
+    assert latest.docs == [dict(latest.docs[0], is_active=False)]
+    coll.docs = []
+    assert sync_latest(coll, latest, 1, "a.py") is None
+    assert latest.docs == []
+
+
+def test_legacy_version_without_is_active_stays_listed():
+    legacy = _version("a1", "a.py", 1)
+    del legacy["is_active"]
+    coll = FakeColl([legacy])
+    latest = FakeColl()
+    assert sync_latest(coll, latest, 1, "a.py")["is_active"] is True
+    # גם ה-backfill ממפה is_active חסר לפעיל לפני המיון
+    stage = snippets_latest.backfill_pipeline(1)[1]["$addFields"]["is_active"]
+    assert {"$eq": [{"$type": "$is_active"}, "missing"]} in stage["$or"]
+
+
+def test_backfill_without_bulk_write_uses_set_on_insert():
+    class Source(FakeColl):
+        def aggregate(self, pipeline, **kwargs):
+            return [{"user_id": 1, "file_name": "a.py", "snippet_id": "a2", "version": 2}]
+
+    latest = FakeColl([{"user_id": 1, "file_name": "a.py", "snippet_id": "a3", "version": 3}])
+    assert backfill_latest(Source(), latest) == 1
+    # מסמך שסונכרן כבר לא נדרס ע"י תמונת המצב של ה-backfill
+    assert latest.docs[0]["snippet_id"] == "a3"
+
+
+def test_repository_lists_from_latest_collection_when_ready(repository_cls):
+    coll = FakeColl([
+        _version("a1", "a.py", 1, updated_at=1),
+        _version("b1", "b.py", 1, updated_at=5, tags=["repo:me/app"]),
+        _version("c1", "c.py", 1, active=False, updated_at=9),
+    ])
+    latest = FakeColl()
+    for name in ("a.py", "b.py", "c.py"):
+        sync_latest(coll, latest, 1, name)
+
+    def _no_aggregate(*a, **k):
+        raise AssertionError("aggregation should not run once latest is ready")
+
+    coll.aggregate = _no_aggregate
+    mgr = types.SimpleNamespace(collection=coll, latest_collection=latest, latest_ready=True,
+                                large_files_collection=FakeColl(), db=types.SimpleNamespace())
+    repo = repository_cls(mgr)
+
+    assert [d["_id"] for d in repo.get_user_files(1)] == ["b1", "a1"]
+    assert repo.get_user_file_names(1) == ["b.py", "a.py"]
+    items, total = repo.get_user_files_by_repo(1, "repo:me/app")
+    assert total == 1 and items[0]["_id"] == "b1" and "code" not in items[0]
+    versions = repo.get_latest_versions(1, ["a.py", "c.py"], {"file_name": 1, "size_bytes": 1})
+    assert list(versions) == ["a.py"] and versions["a.py"]["size_bytes"] > 0
+
+
+def test_repository_falls_back_to_aggregation_until_backfill_done(repository_cls):
+    mgr = types.SimpleNamespace(collection=FakeColl(), latest_collection=FakeColl(), latest_ready=False)
+    assert repository_cls(mgr)._latest() is None
+    assert snippets_latest.is_latest_ready(types.SimpleNamespace()) is False
+
+
+def test_iter_user_files_without_latest_streams_and_closes_cursor(repository_cls):
+    class _ClosingCursor(_Cursor):
+        closed = False
+
+        def sort(self, key, direction=1):
+            out = _ClosingCursor(super().sort(key, direction))
+            state["cursor"] = out
+            return out
+
+        def close(self):
+            _ClosingCursor.closed = True
+
+    class _Coll(FakeColl):
+        def find(self, flt=None, projection=None, **kwargs):
+            return _ClosingCursor(super().find(flt, projection, **kwargs))
+
+    state = {}
+    coll = _Coll([
+        _version("a1", "a.py", 1, updated_at=1), _version("a2", "a.py", 2, updated_at=4),
+        _version("b1", "b.py", 1, updated_at=3), _version("c1", "c.py", 1, updated_at=2),
+    ])
+    repo = repository_cls(types.SimpleNamespace(collection=coll, latest_collection=None, latest_ready=False))
+
+    assert [d["_id"] for d in repo.iter_user_files(1)] == ["a2", "b1", "c1"]
+    stream = repo.iter_user_files(1)
+    assert next(stream)["_id"] == "a2"
+    stream.close()  # הקורא עצר מוקדם
+    assert _ClosingCursor.closed
+
+
+def test_repository_pages_latest_collection_by_cursor(repository_cls):
+    from pagination import cursor_for
+
+    coll = FakeColl([_version(f"s{n}", f"f{n}.py", 1, updated_at=n % 3, tags=["repo:me/app"], user_id=52)
+                     for n in range(7)])
+    latest = FakeColl()
+    for n in range(7):
+        sync_latest(coll, latest, 52, f"f{n}.py")
+    mgr = types.SimpleNamespace(collection=coll, latest_collection=latest, latest_ready=True)
+    repo = repository_cls(mgr)
+
+    seen, after = [], None
+    for _ in range(4):
+        items, total = repo.get_user_files_by_repo(52, "repo:me/app", per_page=3, after=after)
+        seen.extend(d["_id"] for d in items)
+        after = cursor_for(items[-1]) if items else None
+        assert total == 7
+    # ערכי updated_at חוזרים — שובר השוויון snippet_id מבטיח שאין כפילויות או דילוגים
+    assert seen == ["s5", "s2", "s4", "s1", "s6", "s3", "s0"]
+
+
+def test_get_user_files_with_fields_returns_lazy_refs(repository_cls):
+    from database import SnippetRef
+
+    class _ProjectingColl(FakeColl):
+        def __init__(self, docs=None):
+            super().__init__(docs)
+            self.projections = []
+            self.loads = 0
+
+        def find(self, flt=None, projection=None, **kwargs):
+            self.projections.append(projection)
+            docs = super().find(flt, projection, **kwargs)
+            if projection and any(projection.values()):
+                # המיון בשרת קודם ל-projection; כאן שדה המיון נשמר כדי שהמיון המדומה יעבוד
+                keep = [k for k, v in projection.items() if v] + ["updated_at"]
+                docs = _Cursor({k: d[k] for k in keep if k in d} for d in docs)
+            return docs
+
+        def find_one(self, flt, projection=None, sort=None, **kwargs):
+            if projection == {"code": 1, "content_hash": 1}:
+                self.loads += 1
+            return super().find_one(flt, projection, sort, **kwargs)
+
+    coll = _ProjectingColl([
+        _version("a1", "a.py", 1, updated_at=1, tags=["x"]),
+        _version("b1", "b.py", 1, updated_at=5, tags=["y"]),
+    ])
+    latest = _ProjectingColl()
+    for name in ("a.py", "b.py"):
+        sync_latest(coll, latest, 1, name)
+    latest.projections.clear()
+    mgr = types.SimpleNamespace(collection=coll, latest_collection=latest, latest_ready=True)
+    repo = repository_cls(mgr)
+
+    refs = repo.get_user_files(1, fields=["tags"])
+    assert [r["file_name"] for r in refs] == ["b.py", "a.py"] and refs[0]["tags"] == ["y"]
+    assert all(isinstance(r, SnippetRef) and not r.loaded for r in refs)
+    assert "code" not in latest.projections[-1] and coll.loads == 0
+    # code נטען רק בגישה, פעם אחת
+    assert refs[1]["code"] == coll.docs[0]["code"] and refs[1].get("code") == refs[1].code
+    assert coll.loads == 1 and "code" not in refs[0]
+
+    # קריאה חוזרת מגיעה מה-cache (שם נשמר dict רגיל) — ועדיין מקבלים SnippetRef עם loader
+    finds = len(latest.projections)
+    again = repo.get_user_files(1, fields=["tags"])
+    assert len(latest.projections) == finds
+    assert all(isinstance(r, SnippetRef) for r in again)
+    assert again[0]["code"] == coll.docs[1]["code"]
+
+
+def test_snippet_ref_missing_body_behaves_like_missing_key():
+    from database import SnippetRef
+
+    ref = SnippetRef({"file_name": "a.py"}, loader=lambda: None)
+    assert ref.get("code", "") == "" and ref.get("file_name") == "a.py"
+    with pytest.raises(KeyError):
+        ref["code"]
+    large = SnippetRef({"file_name": "big.txt"}, loader=lambda: "data", body_field="content")
+    assert large["content"] == "data" and large.loaded and large.code == "data"
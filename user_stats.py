@@ -4,6 +4,8 @@ from datetime import datetime, timedelta, timezone
 from collections import defaultdict
 import logging
 from database import db as mongodb
+from activity_buffer import activity_buffer
+from daily_activity import DAILY_ACTIVITY_COLLECTION_NAME, activity_by_user, count_active_users, day_start
 
 logger = logging.getLogger(__name__)
 
@@ -13,71 +15,57 @@ class UserStats:
         pass
     
     def log_user(self, user_id, username=None, weight: int = 1):
-        """רישום משתמש ב-MongoDB עם משקל לדגימה (weight)."""
+        """רישום פעילות משתמש (עם משקל weight) דרך activity_buffer.
+
+        העדכון לא נכתב מיד: פעולות של אותו משתמש מאוחדות ל-upsert אחד שנכתב
+        ב-bulk_write תקופתי (ראו activity_buffer). הוא כולל גם את מה ש-save_user כתב.
+        """
         try:
-            # שמור או עדכן משתמש ב-MongoDB
-            mongodb.save_user(user_id, username)
-            
-            # עדכן את הזמן האחרון שהמשתמש היה פעיל
-            users_collection = mongodb.db.users
-            today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-            
-            # עדכון המשתמש עם פעילות אחרונה
-            users_collection.update_one(
+            now = datetime.now(timezone.utc)
+            today = now.strftime("%Y-%m-%d")
+            activity_buffer.upsert(
+                "users",
                 {"user_id": user_id},
-                {
-                    "$set": {
-                        "last_seen": today,
-                        "username": username if username else f"User_{user_id}",
-                        "updated_at": datetime.now(timezone.utc)
-                    },
-                    "$inc": {
-                        "total_actions": max(1, int(weight or 1))
-                    },
-                    "$addToSet": {
-                        "usage_days": today
-                    },
-                    "$setOnInsert": {
-                        "first_seen": today,
-                        "created_at": datetime.now(timezone.utc)
-                    }
+                set_fields={
+                    "last_seen": today,
+                    "username": username if username else f"User_{user_id}",
+                    "updated_at": now,
+                    "last_activity": now,
                 },
-                upsert=True
+                inc={"total_actions": max(1, int(weight or 1))},
+                set_on_insert={"first_seen": today, "created_at": now},
+            )
+            # ימי שימוש: מונה לכל (user_id, day) במקום מערך usage_days שגדל לנצח
+            activity_buffer.upsert(
+                DAILY_ACTIVITY_COLLECTION_NAME,
+                {"user_id": user_id, "day": day_start(now)},
+                inc={"actions": max(1, int(weight or 1))},
             )
         except Exception as e:
             logger.error(f"Error logging user: {e}")
     
     def get_weekly_stats(self):
-        """סטטיסטיקת שבוע אחרון מ-MongoDB"""
+        """סטטיסטיקת שבוע אחרון: אגרגציה על user_daily_activity וטעינת שמות למשתמשים הפעילים בלבד"""
         try:
-            users_collection = mongodb.db.users
             week_ago = datetime.now(timezone.utc) - timedelta(days=7)
-            # השוואת ימים תתבצע לפי אובייקטי date כדי להימנע מהשוואת naive מול aware
-            week_ago_date = week_ago.date()
-            
-            # מצא משתמשים פעילים בשבוע האחרון
+            rows = activity_by_user(mongodb.daily_activity_collection, week_ago)
+            if not rows:
+                return []
+            users = {
+                u.get("user_id"): u
+                for u in mongodb.db.users.find(
+                    {"user_id": {"$in": [r["user_id"] for r in rows]}},
+                    {"user_id": 1, "username": 1, "total_actions": 1},
+                )
+            }
             active_users = []
-            
-            # שאילתה למשתמשים שהיו פעילים בשבוע האחרון
-            users = users_collection.find({
-                "updated_at": {"$gte": week_ago}
-            })
-            
-            for user in users:
-                # חשב כמה ימים המשתמש היה פעיל
-                usage_days = user.get("usage_days", [])
-                # הפוך מחרוזות תאריך (YYYY-MM-DD) ל-date והשווה ל-week_ago_date
-                recent_days = [
-                    day for day in usage_days
-                    if datetime.strptime(day, "%Y-%m-%d").date() >= week_ago_date
-                ]
-                
-                if recent_days:
-                    active_users.append({
-                        "username": user.get("username", f"User_{user['user_id']}"),
-                        "days": len(recent_days),
-                        "total_actions": user.get("total_actions", 0)
-                    })
+            for row in rows:
+                user = users.get(row["user_id"]) or {}
+                active_users.append({
+                    "username": user.get("username") or f"User_{row['user_id']}",
+                    "days": row["days"],
+                    "total_actions": user.get("total_actions", 0)
+                })
             
             return sorted(active_users, key=lambda x: (x["days"], x["total_actions"]), reverse=True)
         except Exception as e:
@@ -88,19 +76,16 @@ class UserStats:
         """סטטיסטיקות כלליות מ-MongoDB"""
         try:
             users_collection = mongodb.db.users
+            daily = mongodb.daily_activity_collection
             
             # סה"כ משתמשים
             total_users = users_collection.count_documents({})
             
-            # פעילים היום
-            today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-            active_today = users_collection.count_documents({"last_seen": today})
+            # פעילים היום: מסמך יומי אחד לכל משתמש פעיל
+            active_today = daily.count_documents({"day": day_start()})
             
             # פעילים השבוע
-            week_ago = datetime.now(timezone.utc) - timedelta(days=7)
-            active_week = users_collection.count_documents({
-                "updated_at": {"$gte": week_ago}
-            })
+            active_week = count_active_users(daily, datetime.now(timezone.utc) - timedelta(days=7))
             
             return {
                 "total_users": total_users,
@@ -115,5 +100,12 @@ class UserStats:
                 "active_week": 0
             }
 
+def _users_collection():
+    return mongodb.db.users if getattr(mongodb, "db", None) is not None else None
+
+
+activity_buffer.register("users", _users_collection)
+activity_buffer.register(DAILY_ACTIVITY_COLLECTION_NAME, lambda: getattr(mongodb, "daily_activity_collection", None))
+
 # יצירת אובייקט סטטיסטיקות גלובלי
 user_stats = UserStats()
\ No newline at end of file
@@ -602,6 +602,43 @@ class AsyncUtils:
         
         return results
 
+    @staticmethod
+    def aio_db(db: Any) -> Any:
+        """גישה ל-db מתוך handler בלי לחסום את לולאת asyncio: `await AsyncUtils.aio_db(db).get_file(...)`.
+
+        מחזיר את db.aio (Motor, ראו database/async_repository) כשקיים; אחרת (למשל stub
+        בבדיקות) עטיפה שמריצה כל מתודה סינכרונית ב-thread.
+        """
+        facade = getattr(db, "aio", None)
+        if getattr(type(facade), "is_async_facade", False) is True:
+            return facade
+        return ThreadedProxy(db)
+
+
+class ThreadedProxy:
+    """עטיפה אסינכרונית לאובייקט סינכרוני: כל קריאה למתודה רצה ב-thread (asyncio.to_thread)"""
+
+    is_async_facade = True
+
+    def __init__(self, target: Any):
+        self._target = target
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+
+        @wraps(attr)
+        async def _call(*args, **kwargs):
+            result = await asyncio.to_thread(attr, *args, **kwargs)
+            # stubs אסינכרוניים מחזירים coroutine — ממתינים לו בלולאה
+            if asyncio.iscoroutine(result):
+                result = await result
+            return result
+
+        return _call
+
+
 class PerformanceUtils:
     """כלים למדידת ביצועים"""
     
@@ -15,9 +15,7 @@ from typing import Optional, Dict, Any, List
 
 from flask import Flask, render_template, jsonify, request, session, redirect, url_for, send_file, abort, Response
 from pymongo import MongoClient, DESCENDING
-from pygments import highlight
-from pygments.lexers import get_lexer_by_name, guess_lexer
-from pygments.formatters import HtmlFormatter
+from pygments.lexers import guess_lexer
 from bson import ObjectId
 import requests
 from datetime import timedelta
@@ -33,6 +31,17 @@ if ROOT_DIR not in sys.path:
 
 # נרמול טקסט/קוד לפני שמירה (הסרת תווים נסתרים, כיווניות, אחידות שורות)
 from utils import normalize_code  # noqa: E402
+# רשימות מהירות מאוסף הגרסה האחרונה (code_snippets_latest)
+from snippets_latest import LATEST_COLLECTION_NAME, as_listing_doc, is_latest_ready, sync_latest  # noqa: E402
+# תוכן גרסאות ישנות (מאגר לפי hash)
+from blob_store import BLOB_COLLECTION_NAME, BlobStore, archive_versions, content_hash, same_content  # noqa: E402
+# מאפייני קוד ואינדקס שורות מחושבים בשמירה (כמו בבוט)
+from code_features import compute_code_features  # noqa: E402
+from line_index import build_line_index  # noqa: E402
+# עימוד לפי מפתח וספירות משוערות (משותף עם הבוט)
+from pagination import approximate_count, cursor_for, keyset_sort, with_keyset  # noqa: E402
+from cache_manager import cache  # noqa: E402
+from render_cache import highlight_html, prewarm as prewarm_render, style_css  # noqa: E402
 
 # יצירת האפליקציה
 app = Flask(__name__)
@@ -120,6 +129,80 @@ def inject_globals():
  
 
 
+def hydrate_snippet(db, file):
+    """גרסה ישנה ששמורה ב-code_blobs בלבד — השלמת code מתוך ה-blob"""
+    if isinstance(file, dict) and 'code' not in file and file.get('content_hash'):
+        try:
+            file['code'] = BlobStore(db[BLOB_COLLECTION_NAME]).get(file['content_hash']) or ''
+        except Exception as e:
+            print(f"Failed to load code blob: {e}")
+            file['code'] = ''
+    return file
+
+
+def sync_latest_snippet(db, user_id, file_name) -> None:
+    """עדכון code_snippets_latest אחרי כתיבה לקובץ; כשל לא מפיל את הבקשה.
+
+    מקדם גם את דור ה-cache של המשתמש, כדי שרשימות וספירות משוערות (גם בבוט) יתרעננו.
+    """
+    try:
+        sync_latest(db.code_snippets, db[LATEST_COLLECTION_NAME], user_id, file_name)
+    except Exception as e:
+        print(f"Failed to sync {LATEST_COLLECTION_NAME}: {e}")
+    try:
+        cache.invalidate_user_cache(user_id)
+    except Exception:
+        pass
+
+
+def refresh_search_index_tags(db, user_id, file_name, tags) -> None:
+    """עדכון התגיות ברשומת אינדקס החיפוש (משמשות לסינון); indexed_at מתקדם כדי שהבוט יסתנכרן"""
+    try:
+        db.search_index.update_one(
+            {'user_id': user_id, 'file_name': file_name, 'is_active': True},
+            {'$set': {'tags': [str(t).lower() for t in (tags or [])], 'indexed_at': datetime.now(timezone.utc)}},
+        )
+    except Exception as e:
+        print(f"Failed to refresh search index tags: {e}")
+
+
+def save_snippet_version(db, doc, prev):
+    """שמירת גרסה מה-webapp באותו מסלול של הבוט; מחזיר את _id של הגרסה הפעילה או None בכשל.
+
+    תוכן זהה לגרסה האחרונה (prev) לא יוצר גרסה חדשה — תיאור/תגיות מתעדכנים במקום.
+    אחרת נשמרת גרסה עם content_hash, מאפייני קוד ואינדקס שורות, והגרסה הקודמת עוברת ל-code_blobs.
+    """
+    code = doc.get('code') or ''
+    language = doc.get('programming_language') or ''
+    doc['content_hash'] = content_hash(code)
+    if prev and same_content(prev, code, language, doc['content_hash']):
+        changes = {k: doc.get(k) for k in ('description', 'tags') if doc.get(k) != prev.get(k)}
+        if changes:
+            changes['updated_at'] = doc.get('updated_at')
+            db.code_snippets.update_one({'_id': prev['_id']}, {'$set': changes})
+            sync_latest_snippet(db, doc['user_id'], doc['file_name'])
+            if 'tags' in changes:
+                refresh_search_index_tags(db, doc['user_id'], doc['file_name'], changes['tags'])
+        return prev.get('_id')
+    try:
+        doc.update(compute_code_features(code, language))
+        doc['line_index'] = build_line_index(code)
+    except Exception as e:
+        print(f"Code features skipped: {e}")
+    res = db.code_snippets.insert_one(doc)
+    inserted_id = getattr(res, 'inserted_id', None)
+    if not inserted_id:
+        return None
+    sync_latest_snippet(db, doc['user_id'], doc['file_name'])
+    if prev:
+        try:
+            archive_versions(db.code_snippets, BlobStore(db[BLOB_COLLECTION_NAME]), [prev])
+        except Exception as e:
+            print(f"Failed to archive previous version: {e}")
+    prewarm_render(code, language)
+    return inserted_id
+
+
 def get_db():
     """מחזיר חיבור למסד הנתונים"""
     global client, db
@@ -170,6 +253,24 @@ def ensure_recent_opens_indexes() -> None:
         # אין להפיל את השרת במקרה של בעיית DB בתחילת חיים
         pass
 
+# --- מוכנות code_snippets_latest, נבדקת פעם בדקה לכל היותר לכל תהליך ---
+_latest_ready = False
+_latest_ready_checked_at = 0.0
+_LATEST_READY_RECHECK_SECONDS = 60
+
+
+def latest_ready(db) -> bool:
+    """האם ה-backfill של code_snippets_latest הושלם; True נשמר לכל חיי התהליך (כמו DatabaseManager.latest_ready)."""
+    global _latest_ready, _latest_ready_checked_at
+    if _latest_ready:
+        return True
+    now = time.monotonic()
+    if _latest_ready_checked_at and now - _latest_ready_checked_at < _LATEST_READY_RECHECK_SECONDS:
+        return False
+    _latest_ready_checked_at = now
+    _latest_ready = is_latest_ready(db)
+    return _latest_ready
+
 # (הוסר שימוש ב-before_first_request; ראה הקריאה בתוך get_db למניעת שגיאה בפלאסק 3)
 
 def get_internal_share(share_id: str) -> Optional[Dict[str, Any]]:
@@ -812,8 +913,26 @@ def files():
             # נחזיר מוקדם תבנית שמחכה ל-files_list שנבנה מטבלת recent_opens
             pass
     
+    # "כל הקבצים" / "שאר הקבצים": מסמך אחד לכל קובץ באוסף הגרסה האחרונה, כשה-backfill שלו הושלם
+    use_latest = category_filter in ('', 'other') and latest_ready(db)
+    if use_latest:
+        latest_query = {'user_id': user_id, 'is_active': True, 'size_bytes': {'$gt': 0}}
+        if language_filter:
+            latest_query['programming_language'] = language_filter
+        extra_conditions = query['$and'][1:]
+        if extra_conditions:
+            latest_query['$and'] = extra_conditions
+
     # ספירת סך הכל (אם לא חושב כבר)
-    if not category_filter:
+    if use_latest:
+        # ספירה משוערת מה-cache (מתאפסת בכל כתיבה של המשתמש) במקום count_documents בכל עמוד
+        count_key = hashlib.sha1(json.dumps(latest_query, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16]
+        total_count = approximate_count(
+            cache,
+            f"approx_count:{cache.user_namespace(user_id)}:web_files:{count_key}",
+            lambda: db[LATEST_COLLECTION_NAME].count_documents(latest_query),
+        )
+    elif not category_filter:
         # "כל הקבצים": ספירה distinct לפי שם קובץ לאחר סינון (תוכן >0)
         count_pipeline = [
             {'$match': query},
@@ -1028,7 +1147,19 @@ def files():
                              bot_username=BOT_USERNAME_CLEAN)
 
     # אם לא עשינו aggregation כבר (בקטגוריות large/other) — עבור all נשתמש גם באגרגציה
-    if not category_filter:
+    next_cursor = None
+    if use_latest:
+        # עימוד לפי מפתח: "הבא" ממשיך מ-(שדה המיון, snippet_id) של הפריט האחרון, בלי skip
+        after = (request.args.get('after') or '').strip() or None
+        latest_cursor = db[LATEST_COLLECTION_NAME].find(
+            with_keyset(latest_query, after, sort_field, 'snippet_id', sort_order)
+        ).sort(keyset_sort(sort_field, 'snippet_id', sort_order))
+        if not after:
+            latest_cursor = latest_cursor.skip((page - 1) * per_page)
+        files_cursor = [as_listing_doc(d) for d in latest_cursor.limit(per_page)]
+        if len(files_cursor) == per_page:
+            next_cursor = cursor_for(files_cursor[-1], sort_field)
+    elif not category_filter:
         sort_dir = -1 if sort_by.startswith('-') else 1
         sort_field_local = sort_by.lstrip('-')
         pipeline = [
@@ -1093,6 +1224,13 @@ def files():
         lang_raw = (file.get('programming_language') or '').lower() or 'text'
         # Fallback: אם שמור כ-text אבל הסיומת היא .md – נתייג כ-markdown לתצוגה
         lang_display = 'markdown' if (lang_raw in {'', 'text'} and fname.lower().endswith('.md')) else lang_raw
+        # מסמכי latest לא מכילים code — הגודל ומספר השורות שמורים עליהם
+        if 'code' not in file and file.get('size_bytes') is not None:
+            size_bytes = int(file.get('size_bytes') or 0)
+            line_count = int(file.get('line_count') or 0)
+        else:
+            size_bytes = len(code_str.encode('utf-8'))
+            line_count = len(code_str.splitlines())
         files_list.append({
             'id': str(file['_id']),
             'file_name': fname,
@@ -1100,8 +1238,8 @@ def files():
             'icon': get_language_icon(lang_display),
             'description': file.get('description', ''),
             'tags': file.get('tags', []),
-            'size': format_file_size(len(code_str.encode('utf-8'))),
-            'lines': len(code_str.splitlines()),
+            'size': format_file_size(size_bytes),
+            'lines': line_count,
             'created_at': format_datetime_display(file.get('created_at')),
             'updated_at': format_datetime_display(file.get('updated_at'))
         })
@@ -1122,6 +1260,9 @@ def files():
     
     # חישוב עמודים
     total_pages = (total_count + per_page - 1) // per_page
+    if use_latest and request.args.get('after') and files_list:
+        # הסה"כ משוער — העמוד שהגענו אליו לפי cursor קיים בוודאות
+        total_pages = max(total_pages, page)
     
     return render_template('files.html',
                          user=session['user_data'],
@@ -1136,6 +1277,7 @@ def files():
                          total_pages=total_pages,
                          has_prev=page > 1,
                          has_next=page < total_pages,
+                         next_cursor=next_cursor,
                          bot_username=BOT_USERNAME_CLEAN)
 
 @app.route('/file/<file_id>')
@@ -1146,10 +1288,10 @@ def view_file(file_id):
     user_id = session['user_id']
     
     try:
-        file = db.code_snippets.find_one({
+        file = hydrate_snippet(db, db.code_snippets.find_one({
             '_id': ObjectId(file_id),
             'user_id': user_id
-        })
+        }))
     except:
         abort(404)
     
@@ -1228,24 +1370,9 @@ def view_file(file_id):
                              highlighted_code='<div class="alert alert-warning" style="text-align: center; padding: 3rem;"><i class="fas fa-lock" style="font-size: 3rem; margin-bottom: 1rem;"></i><br>קובץ בינארי - לא ניתן להציג את התוכן<br><br>ניתן להוריד את הקובץ בלבד</div>',
                              syntax_css='')
     
-    try:
-        lexer = get_lexer_by_name(language, stripall=True)
-    except:
-        try:
-            lexer = guess_lexer(code)
-        except:
-            lexer = get_lexer_by_name('text')
-    
-    formatter = HtmlFormatter(
-        style='github-dark',
-        linenos=True,
-        cssclass='source',
-        lineanchors='line',
-        anchorlinenos=True
-    )
-    
-    highlighted_code = highlight(code, lexer, formatter)
-    css = formatter.get_style_defs('.source')
+    # הדגשה דרך ה-render cache (לפי hash של התוכן; מחומם כבר בשמירה)
+    highlighted_code = highlight_html(code, language)
+    css = style_css()
     
     file_data = {
         'id': str(file['_id']),
@@ -1275,7 +1402,7 @@ def edit_file_page(file_id):
     db = get_db()
     user_id = session['user_id']
     try:
-        file = db.code_snippets.find_one({'_id': ObjectId(file_id), 'user_id': user_id})
+        file = hydrate_snippet(db, db.code_snippets.find_one({'_id': ObjectId(file_id), 'user_id': user_id}))
     except Exception:
         file = None
     if not file:
@@ -1455,9 +1582,9 @@ def edit_file_page(file_id):
                     'is_active': True,
                 }
                 try:
-                    res = db.code_snippets.insert_one(new_doc)
-                    if res and getattr(res, 'inserted_id', None):
-                        return redirect(url_for('view_file', file_id=str(res.inserted_id)))
+                    saved_id = save_snippet_version(db, new_doc, prev)
+                    if saved_id:
+                        return redirect(url_for('view_file', file_id=str(saved_id)))
                     error = 'שמירת הקובץ נכשלה'
                 except Exception as _e:
                     error = f'שמירת הקובץ נכשלה: {_e}'
@@ -1499,10 +1626,10 @@ def download_file(file_id):
     user_id = session['user_id']
     
     try:
-        file = db.code_snippets.find_one({
+        file = hydrate_snippet(db, db.code_snippets.find_one({
             '_id': ObjectId(file_id),
             'user_id': user_id
-        })
+        }))
     except:
         abort(404)
     
@@ -1561,10 +1688,10 @@ def html_preview(file_id):
     db = get_db()
     user_id = session['user_id']
     try:
-        file = db.code_snippets.find_one({
+        file = hydrate_snippet(db, db.code_snippets.find_one({
             '_id': ObjectId(file_id),
             'user_id': user_id
-        })
+        }))
     except Exception:
         abort(404)
     if not file:
@@ -1590,10 +1717,10 @@ def raw_html(file_id):
     db = get_db()
     user_id = session['user_id']
     try:
-        file = db.code_snippets.find_one({
+        file = hydrate_snippet(db, db.code_snippets.find_one({
             '_id': ObjectId(file_id),
             'user_id': user_id
-        })
+        }))
     except Exception:
         abort(404)
     if not file:
@@ -1650,10 +1777,10 @@ def md_preview(file_id):
     db = get_db()
     user_id = session['user_id']
     try:
-        file = db.code_snippets.find_one({
+        file = hydrate_snippet(db, db.code_snippets.find_one({
             '_id': ObjectId(file_id),
             'user_id': user_id
-        })
+        }))
     except Exception:
         abort(404)
     if not file:
@@ -1687,10 +1814,10 @@ def create_public_share(file_id):
         db = get_db()
         user_id = session['user_id']
         try:
-            file = db.code_snippets.find_one({
+            file = hydrate_snippet(db, db.code_snippets.find_one({
                 '_id': ObjectId(file_id),
                 'user_id': user_id
-            })
+            }))
         except Exception:
             return jsonify({'ok': False, 'error': 'קובץ לא נמצא'}), 404
 
@@ -1944,10 +2071,10 @@ def upload_file_web():
                     'is_active': True,
                 }
                 try:
-                    res = db.code_snippets.insert_one(doc)
+                    saved_id = save_snippet_version(db, doc, prev)
                 except Exception as _e:
-                    res = None
-                if res and getattr(res, 'inserted_id', None):
+                    saved_id = None
+                if saved_id:
                     return redirect(url_for('files'))
                 error = 'שמירת הקובץ נכשלה'
         except Exception as e:
@@ -2171,23 +2298,27 @@ def api_public_stats():
 
         # Total distinct snippets (user_id+file_name), with non-empty code, including deleted (soft-deleted)
         try:
-            pipeline = [
-                {"$match": {"code": {"$type": "string"}}},
-                {"$addFields": {
-                    "code_size": {
-                        "$cond": {
-                            "if": {"$eq": [{"$type": "$code"}, "string"]},
-                            "then": {"$strLenBytes": "$code"},
-                            "else": 0,
+            if latest_ready(db):
+                # code_snippets_latest שומר מסמך לכל קובץ, כולל קבצים שנמחקו רכות
+                total_snippets = int(db[LATEST_COLLECTION_NAME].count_documents({"size_bytes": {"$gt": 0}}))
+            else:
+                pipeline = [
+                    {"$match": {"code": {"$type": "string"}}},
+                    {"$addFields": {
+                        "code_size": {
+                            "$cond": {
+                                "if": {"$eq": [{"$type": "$code"}, "string"]},
+                                "then": {"$strLenBytes": "$code"},
+                                "else": 0,
+                            }
                         }
-                    }
-                }},
-                {"$match": {"code_size": {"$gt": 0}}},
-                {"$group": {"_id": {"user_id": "$user_id", "file_name": "$file_name"}}},
-                {"$count": "count"},
-            ]
-            res = list(db.code_snippets.aggregate(pipeline, allowDiskUse=True))
-            total_snippets = int(res[0]["count"]) if res else 0
+                    }},
+                    {"$match": {"code_size": {"$gt": 0}}},
+                    {"$group": {"_id": {"user_id": "$user_id", "file_name": "$file_name"}}},
+                    {"$count": "count"},
+                ]
+                res = list(db.code_snippets.aggregate(pipeline, allowDiskUse=True))
+                total_snippets = int(res[0]["count"]) if res else 0
         except Exception:
             total_snippets = 0
 
@@ -2237,18 +2368,9 @@ def public_share(share_id):
         }
         return render_template('md_preview.html', user={}, file=file_data, md_code=code, bot_username=BOT_USERNAME_CLEAN, is_public=True)
 
-    # ברירת מחדל: תצוגת קוד (כמו קודם)
-    try:
-        lexer = get_lexer_by_name(language, stripall=True)
-    except Exception:
-        try:
-            lexer = guess_lexer(code)
-        except Exception:
-            from pygments.lexers import TextLexer
-            lexer = TextLexer()
-    formatter = HtmlFormatter(style='github-dark', linenos=True, cssclass='source', lineanchors='line', anchorlinenos=True)
-    highlighted_code = highlight(code, lexer, formatter)
-    css = formatter.get_style_defs('.source')
+    # ברירת מחדל: תצוגת קוד (כמו קודם), דרך ה-render cache
+    highlighted_code = highlight_html(code, language)
+    css = style_css()
 
     size = len(code.encode('utf-8'))
     lines = len(code.split('\n'))